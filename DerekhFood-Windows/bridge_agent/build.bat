@@ -35,6 +35,7 @@ pyinstaller --noconfirm --onefile --windowed ^
     --hidden-import bridge_agent.config ^
     --hidden-import bridge_agent.bridge_client ^
     --hidden-import bridge_agent.spooler_monitor ^
+    --hidden-import bridge_agent.escpos ^
     --hidden-import bridge_agent.text_extractor ^
     --hidden-import bridge_agent.simulador ^
     --hidden-import bridge_agent.ui ^
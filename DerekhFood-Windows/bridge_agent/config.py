@@ -19,7 +19,7 @@ DEFAULT_CONFIG = {
     "ignorar_prefixo": "Derekh_",
     "auto_criar_pedido": True,
     "codepage": "CP860",
-    "poll_interval": 0.2,
+    "rescan_interval": 5.0,  # varredura de segurança; a captura é por notificação do spooler
     "auto_start": False,
 }
 
@@ -285,7 +285,7 @@ def main():
     monitor = SpoolerMonitor(
         impressoras=config["impressoras_monitorar"],
         ignorar_prefixo=config.get("ignorar_prefixo", "Derekh_"),
-        poll_interval=config.get("poll_interval", 2.0),
+        rescan_interval=config.get("rescan_interval", 5.0),
         on_job_captured=on_job_captured,
     )
 
@@ -6,27 +6,37 @@ Detecta novos jobs de impressão e captura os bytes brutos.
 Requer pywin32 no Windows.
 
 Estratégia para capturar bytes de impressão:
-1. Polling rápido (0.3s) via EnumJobs
+1. Notificação de mudança do spooler (FindFirstPrinterChangeNotification):
+   a thread dorme até um job ser adicionado/escrito, sem polling. Uma
+   varredura de segurança roda a cada `rescan_interval` segundos
 2. Ao detectar job novo: PAUSAR imediatamente (SetJob JOB_CONTROL_PAUSE)
-3. Ler o arquivo .SPL direto do disco (C:\\Windows\\System32\\spool\\PRINTERS\\)
+3. Quando o job termina de spoolar, ler o arquivo .SPL inteiro, em blocos,
+   direto do disco (C:\\Windows\\System32\\spool\\PRINTERS\\)
 4. RESUMIR o job (o spooler imprime normalmente na impressora real)
 
 Importante: win32print.ReadPrinter() NÃO lê o conteúdo do spool — ele lê respostas
 de impressoras bidirecionais. Para capturar bytes enviados à impressora, o único
 caminho confiável é ler o arquivo .SPL diretamente do disco enquanto o job está
 pausado no spool.
+
+O acesso ao spooler fica atrás de SpoolerBackend: Win32Spooler em produção e
+MemorySpooler (em memória) para rodar o caminho de captura inteiro no Linux.
 """
 
 import os
+import queue
 import threading
 import time
 import logging
-from typing import Callable, Set, List, Optional
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 logger = logging.getLogger("bridge_agent.spooler")
 
 try:
     import win32print
+    import win32event
     HAS_WIN32 = True
 except ImportError:
     HAS_WIN32 = False
@@ -39,149 +49,504 @@ SPOOL_DIR = os.path.join(
     "System32", "spool", "PRINTERS"
 )
 
+# winspool.h
+JOB_STATUS_PAUSED = 0x0001
+JOB_STATUS_SPOOLING = 0x0008
+JOB_CONTROL_PAUSE = 1
+JOB_CONTROL_RESUME = 2
+PRINTER_CHANGE_ADD_JOB = 0x0100
+PRINTER_CHANGE_SET_JOB = 0x0200
+PRINTER_CHANGE_WRITE_JOB = 0x0800
+
+READ_CHUNK = 64 * 1024
+# Job ainda spoolando / .SPL incompleto: reverifica nesse intervalo até o prazo
+RETRY_PENDENTE_SEGUNDOS = 0.05
+PRAZO_CAPTURA_SEGUNDOS = 10.0
+
+
+class JanelaJobs:
+    """
+    Chaves de jobs já vistos, com TTL e tamanho máximo.
+    O Windows recicla JobIds, então a chave não pode valer para sempre.
+    """
+
+    def __init__(self, max_itens: int = 5000, ttl: float = 3600.0):
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self._itens: "OrderedDict[str, float]" = OrderedDict()
+
+    def __contains__(self, chave: str) -> bool:
+        expira = self._itens.get(chave)
+        if expira is None:
+            return False
+        if expira < time.monotonic():
+            del self._itens[chave]
+            return False
+        return True
+
+    def __len__(self) -> int:
+        return len(self._itens)
+
+    def adicionar(self, chave: str):
+        self._itens[chave] = time.monotonic() + self.ttl
+        self._itens.move_to_end(chave)
+        while len(self._itens) > self.max_itens:
+            self._itens.popitem(last=False)
+
+    def podar(self) -> int:
+        """Remove chaves expiradas (as mais antigas ficam no início)."""
+        agora = time.monotonic()
+        removidas = 0
+        while self._itens:
+            chave, expira = next(iter(self._itens.items()))
+            if expira >= agora:
+                break
+            del self._itens[chave]
+            removidas += 1
+        return removidas
+
+
+# ==================== BACKENDS ====================
+
+class SpoolerBackend(ABC):
+    """Acesso ao spooler usado pelo SpoolerMonitor."""
+
+    @abstractmethod
+    def abrir(self, impressoras: List[str]):
+        """Abre as impressoras e registra as notificações de mudança."""
+        pass
+
+    @abstractmethod
+    def aguardar_mudanca(self, timeout: float) -> List[str]:
+        """Bloqueia até alguma impressora mudar. Retorna as que mudaram ([] = timeout)."""
+        pass
+
+    @abstractmethod
+    def listar_jobs(self, impressora: str) -> List[Dict[str, Any]]:
+        """Jobs na fila: dicts com JobId, pDocument, Status e Size."""
+        pass
+
+    @abstractmethod
+    def pausar(self, impressora: str, job_id: int) -> bool:
+        """Pausa o job no spooler. False se não conseguiu."""
+        pass
+
+    @abstractmethod
+    def retomar(self, impressora: str, job_id: int):
+        """Libera um job pausado."""
+        pass
+
+    @abstractmethod
+    def ler_job(self, impressora: str, job_id: int, tamanho: int = 0) -> Optional[bytes]:
+        """Bytes completos do job, ou None se ainda não dá para ler tudo."""
+        pass
+
+    def acordar(self):
+        """Interrompe um aguardar_mudanca() em andamento (usado no stop)."""
+        pass
+
+    def fechar(self):
+        pass
+
+
+class Win32Spooler(SpoolerBackend):
+    """Spooler do Windows via pywin32 (handles mantidos abertos entre eventos)."""
+
+    FILTRO = PRINTER_CHANGE_ADD_JOB | PRINTER_CHANGE_SET_JOB | PRINTER_CHANGE_WRITE_JOB
+
+    def __init__(self, spool_dir: str = SPOOL_DIR):
+        self.spool_dir = spool_dir
+        self._handles: Dict[str, Any] = {}
+        self._notificacoes: List[Tuple[str, Any]] = []
+        self._parar = win32event.CreateEvent(None, True, False, None)
+
+    def abrir(self, impressoras: List[str]):
+        self.fechar()
+        win32event.ResetEvent(self._parar)
+        for nome in impressoras:
+            try:
+                handle = win32print.OpenPrinter(nome)
+            except Exception as e:
+                logger.error(f"Não foi possível abrir impressora '{nome}': {e}")
+                continue
+            self._handles[nome] = handle
+            try:
+                notificacao = win32print.FindFirstPrinterChangeNotification(handle, self.FILTRO, 0, None)
+                self._notificacoes.append((nome, notificacao))
+            except Exception as e:
+                logger.warning(f"Notificação indisponível para '{nome}' — só varredura periódica: {e}")
+
+    def _rearmar(self, notificacao):
+        try:
+            win32print.FindNextPrinterChangeNotification(notificacao, None)
+        except Exception as e:
+            logger.debug(f"FindNextPrinterChangeNotification: {e}")
+
+    def aguardar_mudanca(self, timeout: float) -> List[str]:
+        # Índice 0 é o evento de parada; sem notificações vira um sleep interrompível
+        handles = [self._parar] + [n for _, n in self._notificacoes]
+        r = win32event.WaitForMultipleObjects(handles, False, int(timeout * 1000))
+        if r == win32event.WAIT_TIMEOUT or r == win32event.WAIT_OBJECT_0:
+            return []
+        idx = r - win32event.WAIT_OBJECT_0 - 1
+        if not 0 <= idx < len(self._notificacoes):
+            raise OSError(f"WaitForMultipleObjects retornou {r}")
+
+        nome, notificacao = self._notificacoes[idx]
+        self._rearmar(notificacao)
+        mudaram = [nome]
+        # Outras impressoras sinalizadas ao mesmo tempo
+        for outro_nome, outra in self._notificacoes[idx + 1:]:
+            if win32event.WaitForSingleObject(outra, 0) == win32event.WAIT_OBJECT_0:
+                self._rearmar(outra)
+                mudaram.append(outro_nome)
+        return mudaram
+
+    def listar_jobs(self, impressora: str) -> List[Dict[str, Any]]:
+        handle = self._handles.get(impressora)
+        if handle is None:
+            return []
+        return list(win32print.EnumJobs(handle, 0, 255, 2))
+
+    def pausar(self, impressora: str, job_id: int) -> bool:
+        try:
+            win32print.SetJob(self._handles[impressora], job_id, 0, None, JOB_CONTROL_PAUSE)
+            return True
+        except Exception as e:
+            logger.debug(f"Não foi possível pausar job #{job_id}: {e}")
+            return False
+
+    def retomar(self, impressora: str, job_id: int):
+        try:
+            win32print.SetJob(self._handles[impressora], job_id, 0, None, JOB_CONTROL_RESUME)
+        except Exception as e:
+            logger.debug(f"Não foi possível resumir job #{job_id}: {e}")
+
+    def acordar(self):
+        win32event.SetEvent(self._parar)
+
+    def ler_job(self, impressora: str, job_id: int, tamanho: int = 0) -> Optional[bytes]:
+        """Lê o .SPL do job (<job_id com 5 dígitos>.SPL) em blocos até o fim."""
+        spool_file = os.path.join(self.spool_dir, f"{job_id:05d}.SPL")
+        partes = []
+        try:
+            with open(spool_file, "rb") as f:
+                while True:
+                    bloco = f.read(READ_CHUNK)
+                    if not bloco:
+                        break
+                    partes.append(bloco)
+        except (FileNotFoundError, PermissionError):
+            # Ainda não criado / spooler com o arquivo aberto — tenta de novo
+            return None
+        dados = b"".join(partes)
+        if not dados or len(dados) < tamanho:
+            return None
+        return dados
+
+    def fechar(self):
+        for _, notificacao in self._notificacoes:
+            try:
+                win32print.FindClosePrinterChangeNotification(notificacao)
+            except Exception:
+                pass
+        for handle in self._handles.values():
+            try:
+                win32print.ClosePrinter(handle)
+            except Exception:
+                pass
+        self._notificacoes = []
+        self._handles = {}
+
+
+class MemorySpooler(SpoolerBackend):
+    """
+    Spooler em memória (Linux/testes): fila de jobs, spool escrito em partes e
+    notificações de mudança, com a mesma interface do Win32Spooler.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._jobs: Dict[str, Dict[int, Dict[str, Any]]] = {}
+        self._mudancas: set = set()
+        self._proximo_id = 1
+        self.pausados: List[int] = []
+        self.retomados: List[int] = []
+        self.chamadas_listar = 0
+
+    def abrir(self, impressoras: List[str]):
+        with self._cond:
+            for nome in impressoras:
+                self._jobs.setdefault(nome, {})
+
+    def _mudou(self, impressora: str):
+        self._mudancas.add(impressora)
+        self._cond.notify_all()
+
+    def enviar(self, impressora: str, dados: bytes = b"", documento: str = "Documento",
+               spooling: bool = False) -> int:
+        """Adiciona um job. Com spooling=True os bytes chegam depois via escrever()."""
+        with self._cond:
+            job_id = self._proximo_id
+            self._proximo_id += 1
+            self._jobs.setdefault(impressora, {})[job_id] = {
+                "JobId": job_id, "pDocument": documento,
+                "Status": JOB_STATUS_SPOOLING if spooling else 0,
+                "dados": bytearray(dados),
+            }
+            self._mudou(impressora)
+            return job_id
+
+    def escrever(self, impressora: str, job_id: int, dados: bytes, fim: bool = False):
+        with self._cond:
+            job = self._jobs[impressora][job_id]
+            job["dados"] += dados
+            if fim:
+                job["Status"] &= ~JOB_STATUS_SPOOLING
+            self._mudou(impressora)
+
+    def remover(self, impressora: str, job_id: int):
+        with self._cond:
+            self._jobs[impressora].pop(job_id, None)
+            self._mudou(impressora)
+
+    def acordar(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def aguardar_mudanca(self, timeout: float) -> List[str]:
+        with self._cond:
+            if not self._mudancas:
+                self._cond.wait(timeout)
+            mudaram = sorted(self._mudancas)
+            self._mudancas.clear()
+            return mudaram
+
+    def listar_jobs(self, impressora: str) -> List[Dict[str, Any]]:
+        with self._cond:
+            self.chamadas_listar += 1
+            return [
+                {"JobId": j["JobId"], "pDocument": j["pDocument"], "Status": j["Status"], "Size": len(j["dados"])}
+                for j in self._jobs.get(impressora, {}).values()
+            ]
+
+    def pausar(self, impressora: str, job_id: int) -> bool:
+        with self._cond:
+            self._jobs[impressora][job_id]["Status"] |= JOB_STATUS_PAUSED
+            self.pausados.append(job_id)
+            return True
+
+    def retomar(self, impressora: str, job_id: int):
+        with self._cond:
+            job = self._jobs[impressora].get(job_id)
+            if job:
+                job["Status"] &= ~JOB_STATUS_PAUSED
+            self.retomados.append(job_id)
+
+    def ler_job(self, impressora: str, job_id: int, tamanho: int = 0) -> Optional[bytes]:
+        with self._cond:
+            job = self._jobs.get(impressora, {}).get(job_id)
+            if not job or len(job["dados"]) < tamanho:
+                return None
+            return bytes(job["dados"]) or None
+
+
+# ==================== MONITOR ====================
 
 class SpoolerMonitor:
-    """Monitora o spooler de impressão do Windows por polling."""
+    """Monitora o spooler de impressão por notificação de mudança."""
 
     def __init__(
         self,
         impressoras: List[str],
         ignorar_prefixo: str = "Derekh_",
-        poll_interval: float = 0.2,
+        rescan_interval: float = 5.0,
         on_job_captured: Optional[Callable[[str, bytes], None]] = None,
+        backend: Optional[SpoolerBackend] = None,
+        max_jobs_vistos: int = 5000,
+        ttl_jobs_vistos: float = 3600.0,
     ):
         self.impressoras = impressoras
         self.ignorar_prefixo = ignorar_prefixo
-        self.poll_interval = poll_interval
+        self.rescan_interval = rescan_interval
         self.on_job_captured = on_job_captured
-        self._seen_jobs: Set[str] = set()
+        self.backend = backend
+        self._seen_jobs = JanelaJobs(max_jobs_vistos, ttl_jobs_vistos)
+        # job_key → {"impressora", "job_id", "pausado", "desde"}: detectados, ainda sem bytes
+        self._pendentes: Dict[str, Dict[str, Any]] = {}
+        # Entrega ao callback (HTTP ao servidor) fora da thread de captura
+        self._entregas: "queue.Queue[Optional[Tuple[str, bytes]]]" = queue.Queue()
         self._running = False
         self._thread: Optional[threading.Thread] = None
+        self._entrega_thread: Optional[threading.Thread] = None
+        self.stats = {"capturados": 0, "ignorados": 0, "falhas": 0, "ultima_latencia_ms": 0.0}
 
     def start(self):
         """Inicia o monitor em thread daemon."""
-        if not HAS_WIN32:
-            logger.error("Não é possível iniciar monitor — pywin32 não instalado")
-            return
+        if self.backend is None:
+            if not HAS_WIN32:
+                logger.error("Não é possível iniciar monitor — pywin32 não instalado")
+                return
+            self.backend = Win32Spooler()
 
         if self._running:
             return
 
         self._running = True
-        self._thread = threading.Thread(target=self._poll_loop, daemon=True)
+        self._entrega_thread = threading.Thread(target=self._entrega_loop, daemon=True)
+        self._entrega_thread.start()
+        self._thread = threading.Thread(target=self._monitor_loop, daemon=True)
         self._thread.start()
         logger.info(f"Monitor iniciado — {len(self.impressoras)} impressora(s)")
 
     def stop(self):
         """Para o monitor."""
         self._running = False
+        if self.backend:
+            self.backend.acordar()
         if self._thread:
             self._thread.join(timeout=5)
+        self._entregas.put(None)
+        if self._entrega_thread:
+            self._entrega_thread.join(timeout=5)
+        if self.backend:
+            self.backend.fechar()
         logger.info("Monitor parado")
 
-    def _poll_loop(self):
-        """Loop principal de polling do spooler."""
-        while self._running:
-            try:
-                for printer_name in self.impressoras:
-                    self._check_printer(printer_name)
-            except Exception as e:
-                logger.error(f"Erro no poll loop: {e}")
-            time.sleep(self.poll_interval)
-
-    def _check_printer(self, printer_name: str):
-        """Verifica jobs de uma impressora específica."""
+    def _monitor_loop(self):
+        """Dorme até o spooler notificar mudança; varre só as impressoras afetadas."""
         try:
-            handle = win32print.OpenPrinter(printer_name)
-            try:
-                jobs = win32print.EnumJobs(handle, 0, 100, 1)
-                for job in jobs:
-                    job_id = job.get("JobId", 0)
-                    doc_name = job.get("pDocument", "") or ""
-                    job_key = f"{printer_name}:{job_id}"
-
-                    # Já processado?
-                    if job_key in self._seen_jobs:
-                        continue
-
-                    self._seen_jobs.add(job_key)
-
-                    # Ignorar impressões do próprio Derekh (printer_agent)
-                    if self.ignorar_prefixo and doc_name.startswith(self.ignorar_prefixo):
-                        logger.debug(f"Ignorando job do Derekh: {doc_name}")
-                        continue
-
-                    logger.info(f"Novo job detectado: [{printer_name}] #{job_id} '{doc_name}'")
-
-                    # ─── PAUSAR o job IMEDIATAMENTE para ter tempo de ler o spool ───
-                    # Sem pausar, o spooler envia os bytes para a impressora e deleta
-                    # o arquivo .SPL antes de conseguirmos ler.
-                    pausado = False
-                    try:
-                        win32print.SetJob(handle, job_id, 0, None, win32print.JOB_CONTROL_PAUSE)
-                        pausado = True
-                    except Exception as e:
-                        logger.debug(f"Não foi possível pausar job #{job_id}: {e}")
-
-                    # Ler bytes direto do arquivo .SPL
-                    raw_bytes = self._read_job_data(job_id)
-
-                    # Resumir o job (deixar o spooler enviar à impressora normalmente)
-                    if pausado:
-                        try:
-                            win32print.SetJob(handle, job_id, 0, None, win32print.JOB_CONTROL_RESUME)
-                        except Exception as e:
-                            logger.debug(f"Não foi possível resumir job #{job_id}: {e}")
-
-                    if raw_bytes:
-                        logger.info(f"Job #{job_id} capturado — {len(raw_bytes)} bytes")
-                        if self.on_job_captured:
-                            self.on_job_captured(printer_name, raw_bytes)
-                    else:
-                        logger.warning(f"Job #{job_id} detectado mas não foi possível ler bytes do spool")
-
-            finally:
-                win32print.ClosePrinter(handle)
-
+            self.backend.abrir(self.impressoras)
         except Exception as e:
-            logger.debug(f"Erro ao verificar impressora '{printer_name}': {e}")
-
-    def _read_job_data(self, job_id: int) -> Optional[bytes]:
-        """Lê os bytes brutos do arquivo .SPL do job no spool do Windows.
-
-        O Windows guarda os arquivos em C:\\Windows\\System32\\spool\\PRINTERS\\
-        com nome <job_id zero-padded 5 digits>.SPL.
+            logger.error(f"Erro ao abrir impressoras: {e}")
 
-        Tentativas com retry porque o arquivo pode ainda estar sendo escrito.
-        """
-        spool_file = os.path.join(SPOOL_DIR, f"{job_id:05d}.SPL")
+        alvo = list(self.impressoras)
+        while self._running:
+            for printer_name in alvo:
+                try:
+                    self._check_printer(printer_name)
+                except Exception as e:
+                    logger.debug(f"Erro ao verificar impressora '{printer_name}': {e}")
 
-        for attempt in range(20):  # até 1s total (20 x 50ms)
-            if os.path.exists(spool_file):
+            # Job ainda spoolando: reverifica logo, mesmo sem notificação
+            timeout = RETRY_PENDENTE_SEGUNDOS if self._pendentes else self.rescan_interval
+            try:
+                mudaram = self.backend.aguardar_mudanca(timeout)
+            except Exception as e:
+                logger.error(f"Erro aguardando notificação do spooler: {e} — reabrindo")
+                time.sleep(1)
                 try:
-                    with open(spool_file, "rb") as f:
-                        data = f.read()
-                    if data:
-                        return data
-                except PermissionError:
-                    # Spooler ainda tem o arquivo aberto — aguardar
+                    self.backend.abrir(self.impressoras)
+                except Exception:
                     pass
-                except Exception as e:
-                    logger.debug(f"Erro lendo {spool_file}: {e}")
-            time.sleep(0.05)
+                mudaram = []
+
+            if mudaram:
+                alvo = [p for p in self.impressoras if p in mudaram]
+            elif self._pendentes:
+                alvo = sorted({p["impressora"] for p in self._pendentes.values()})
+            else:
+                # Timeout sem nada pendente: varredura de segurança
+                alvo = list(self.impressoras)
 
-        logger.warning(f"Spool file não encontrado ou vazio: {spool_file}")
-        return None
+    def _check_printer(self, printer_name: str):
+        """Verifica jobs de uma impressora específica."""
+        jobs = self.backend.listar_jobs(printer_name)
+        presentes = set()
+        for job in jobs:
+            job_id = job.get("JobId", 0)
+            job_key = f"{printer_name}:{job_id}"
+            presentes.add(job_key)
+
+            # Já processado?
+            if job_key in self._seen_jobs:
+                continue
+
+            pendente = self._pendentes.get(job_key)
+            if pendente is None:
+                doc_name = job.get("pDocument", "") or ""
+                # Ignorar impressões do próprio Derekh (printer_agent)
+                if self.ignorar_prefixo and doc_name.startswith(self.ignorar_prefixo):
+                    logger.debug(f"Ignorando job do Derekh: {doc_name}")
+                    self._seen_jobs.adicionar(job_key)
+                    self.stats["ignorados"] += 1
+                    continue
+
+                logger.info(f"Novo job detectado: [{printer_name}] #{job_id} '{doc_name}'")
+                # ─── PAUSAR o job IMEDIATAMENTE para ter tempo de ler o spool ───
+                # Sem pausar, o spooler envia os bytes para a impressora e deleta
+                # o arquivo .SPL antes de conseguirmos ler.
+                pendente = {
+                    "impressora": printer_name,
+                    "job_id": job_id,
+                    "pausado": self.backend.pausar(printer_name, job_id),
+                    "desde": time.monotonic(),
+                }
+                self._pendentes[job_key] = pendente
+
+            self._tentar_capturar(job_key, pendente, job)
+
+        # Pendentes que sumiram da fila (cancelados antes da captura)
+        for job_key in [k for k, p in self._pendentes.items()
+                        if p["impressora"] == printer_name and k not in presentes]:
+            logger.warning(f"Job {job_key} saiu da fila antes de ser capturado")
+            del self._pendentes[job_key]
+            self._seen_jobs.adicionar(job_key)
+            self.stats["falhas"] += 1
+
+    def _tentar_capturar(self, job_key: str, pendente: Dict[str, Any], job: Dict[str, Any]):
+        """Captura o job quando ele termina de spoolar; até lá fica pendente."""
+        printer_name, job_id = pendente["impressora"], pendente["job_id"]
+        decorrido = time.monotonic() - pendente["desde"]
+        no_prazo = decorrido < PRAZO_CAPTURA_SEGUNDOS
+
+        raw_bytes = None
+        if not (job.get("Status", 0) & JOB_STATUS_SPOOLING) or not no_prazo:
+            raw_bytes = self.backend.ler_job(printer_name, job_id, job.get("Size") or 0)
+            if raw_bytes is None and no_prazo:
+                return
+        else:
+            return
+
+        del self._pendentes[job_key]
+        self._seen_jobs.adicionar(job_key)
+
+        # Resumir o job (deixar o spooler enviar à impressora normalmente)
+        if pendente["pausado"]:
+            self.backend.retomar(printer_name, job_id)
+
+        if raw_bytes:
+            latencia_ms = (time.monotonic() - pendente["desde"]) * 1000
+            self.stats["capturados"] += 1
+            self.stats["ultima_latencia_ms"] = round(latencia_ms, 1)
+            logger.info(f"Job #{job_id} capturado — {len(raw_bytes)} bytes em {latencia_ms:.0f}ms")
+            self._entregas.put((printer_name, raw_bytes))
+        else:
+            self.stats["falhas"] += 1
+            logger.warning(f"Job #{job_id} detectado mas não foi possível ler bytes do spool")
+
+    def _entrega_loop(self):
+        """Entrega jobs capturados ao callback, em ordem, sem travar a captura."""
+        while True:
+            item = self._entregas.get()
+            if item is None:
+                break
+            if not self.on_job_captured:
+                continue
+            try:
+                self.on_job_captured(*item)
+            except Exception as e:
+                logger.error(f"Erro processando job capturado: {e}")
 
     @property
     def is_running(self) -> bool:
         return self._running
 
     def limpar_historico(self):
-        """Limpa set de jobs vistos (para evitar crescimento infinito)."""
-        if len(self._seen_jobs) > 10000:
-            self._seen_jobs.clear()
-            logger.info("Histórico de jobs limpo")
+        """Remove jobs vistos expirados (o conjunto já é limitado por tamanho)."""
+        removidos = self._seen_jobs.podar()
+        if removidos:
+            logger.debug(f"{removidos} job(s) expirados do histórico")
 
 
 def listar_impressoras() -> List[str]:
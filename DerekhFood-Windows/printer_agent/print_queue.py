@@ -3,6 +3,16 @@
 """
 Fila de impressão com SQLite para idempotência e retry.
 Garante que pedidos não são impressos em duplicata.
+
+- SQLite em WAL com synchronous=NORMAL: leitura não bloqueia escrita e o
+  commit não espera fsync a cada transição de estado
+- Consumidores dormem numa Condition e acordam no enqueue (sem polling)
+- Fila por impressora: cada impressora tem seu consumidor, mantendo a ordem
+  FIFO dela enquanto impressoras diferentes imprimem em paralelo
+- Transições em lote: todos os setores de um pedido entram numa transação,
+  e concluir um job já assume o próximo da mesma impressora no mesmo commit
+- Retry com backoff exponencial: job que falhou só volta a ser assumido
+  depois de proximo_tentativa (impressora sem papel não vira loop quente)
 """
 
 import sqlite3
@@ -10,8 +20,7 @@ import json
 import time
 import threading
 import logging
-from typing import Optional, List
-from pathlib import Path
+from typing import Optional, List, Tuple
 
 from .config import get_app_dir
 
@@ -20,16 +29,21 @@ logger = logging.getLogger("printer_agent.queue")
 # Tempo em segundos para purgar registros antigos (7 dias)
 PURGE_AGE_SECONDS = 7 * 24 * 3600
 MAX_RETRIES = 3
+RETRY_BACKOFF_SECONDS = 5  # espera antes da 2ª tentativa; dobra a cada falha
 
 
 class PrintQueue:
     """Fila de impressão persistente com SQLite."""
 
-    def __init__(self):
+    def __init__(self, db_path: Optional[str] = None):
         self._lock = threading.Lock()
-        db_path = get_app_dir() / "print_queue.db"
-        self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        # Compartilha o lock da conexão: quem espera job libera o SQLite
+        self._novo_job = threading.Condition(self._lock)
+        db_path = db_path or str(get_app_dir() / "print_queue.db")
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
         self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
         self._init_db()
         self._purge_old()
 
@@ -45,6 +59,7 @@ class PrintQueue:
                 tentativas INTEGER DEFAULT 0,
                 reimpressao INTEGER DEFAULT 0,
                 criado_em REAL NOT NULL,
+                proximo_tentativa REAL DEFAULT 0,
                 UNIQUE(pedido_id, impressora) ON CONFLICT IGNORE
             );
 
@@ -56,8 +71,17 @@ class PrintQueue:
             );
 
             CREATE INDEX IF NOT EXISTS idx_jobs_status ON print_jobs(status);
+            CREATE INDEX IF NOT EXISTS idx_jobs_impressora ON print_jobs(impressora, status, id);
             CREATE INDEX IF NOT EXISTS idx_history_pedido ON print_history(pedido_id, impressora);
         """)
+        # Bancos criados antes do backoff
+        colunas = {r["name"] for r in self._conn.execute("PRAGMA table_info(print_jobs)")}
+        if "proximo_tentativa" not in colunas:
+            self._conn.execute("ALTER TABLE print_jobs ADD COLUMN proximo_tentativa REAL DEFAULT 0")
+        # Jobs que ficaram 'imprimindo' quando o agente caiu voltam para a fila
+        cur = self._conn.execute("UPDATE print_jobs SET status = 'pendente' WHERE status = 'imprimindo'")
+        if cur.rowcount:
+            logger.warning(f"{cur.rowcount} job(s) interrompido(s) voltaram para a fila")
         self._conn.commit()
 
     def _purge_old(self):
@@ -86,73 +110,150 @@ class PrintQueue:
         reimpressao: bool = False,
     ) -> bool:
         """Adiciona job na fila. Retorna True se adicionado, False se duplicata."""
-        # Verificar idempotência (exceto reimpressão)
-        if not reimpressao and self.ja_impresso(pedido_id, impressora):
-            logger.info(f"Pedido {pedido_id} já impresso em {impressora} — ignorando")
-            return False
+        return bool(self.enqueue_lote(pedido_id, [(impressora, dados)], reimpressao))
 
-        with self._lock:
-            if reimpressao:
-                # Remover job anterior se existir
-                self._conn.execute(
-                    "DELETE FROM print_jobs WHERE pedido_id = ? AND impressora = ?",
+    def enqueue_lote(
+        self,
+        pedido_id: int,
+        jobs: List[Tuple[str, dict]],
+        reimpressao: bool = False,
+    ) -> List[str]:
+        """
+        Enfileira os jobs de um pedido [(impressora, dados), ...] numa única
+        transação e acorda os consumidores. Retorna as impressoras com job novo.
+        """
+        enfileiradas = []
+        agora = time.time()
+        with self._novo_job:
+            for impressora, dados in jobs:
+                if reimpressao:
+                    # Remover job anterior se existir
+                    self._conn.execute(
+                        "DELETE FROM print_jobs WHERE pedido_id = ? AND impressora = ?",
+                        (pedido_id, impressora)
+                    )
+                elif self._conn.execute(
+                    "SELECT 1 FROM print_history WHERE pedido_id = ? AND impressora = ?",
                     (pedido_id, impressora)
-                )
+                ).fetchone():
+                    logger.info(f"Pedido {pedido_id} já impresso em {impressora} — ignorando")
+                    continue
 
-            try:
-                self._conn.execute(
+                cur = self._conn.execute(
                     "INSERT INTO print_jobs (pedido_id, impressora, dados_json, reimpressao, criado_em) VALUES (?, ?, ?, ?, ?)",
-                    (pedido_id, impressora, json.dumps(dados), 1 if reimpressao else 0, time.time())
+                    (pedido_id, impressora, json.dumps(dados), 1 if reimpressao else 0, agora)
                 )
-                self._conn.commit()
-                logger.info(f"Job enfileirado: pedido={pedido_id} impressora={impressora} reimpressao={reimpressao}")
-                return True
-            except sqlite3.IntegrityError:
-                logger.info(f"Job duplicado ignorado: pedido={pedido_id} impressora={impressora}")
-                return False
-
-    def get_next(self) -> Optional[dict]:
-        """Retorna o próximo job pendente (FIFO)."""
-        with self._lock:
-            row = self._conn.execute(
-                "SELECT * FROM print_jobs WHERE status = 'pendente' AND tentativas < ? ORDER BY id LIMIT 1",
-                (MAX_RETRIES,)
-            ).fetchone()
-            if row:
-                return dict(row)
+                if cur.rowcount:
+                    enfileiradas.append(impressora)
+                    logger.info(f"Job enfileirado: pedido={pedido_id} impressora={impressora} reimpressao={reimpressao}")
+                else:
+                    logger.info(f"Job duplicado ignorado: pedido={pedido_id} impressora={impressora}")
+            self._conn.commit()
+            if enfileiradas:
+                self._novo_job.notify_all()
+        return enfileiradas
+
+    def _assumir(self, impressora: str) -> Optional[dict]:
+        """
+        Próximo job pendente da impressora (FIFO) fora do backoff, já marcado
+        como 'imprimindo'. Exige o lock.
+        """
+        row = self._conn.execute(
+            "SELECT * FROM print_jobs WHERE impressora = ? AND status = 'pendente' AND tentativas < ? "
+            "AND proximo_tentativa <= ? ORDER BY id LIMIT 1",
+            (impressora, MAX_RETRIES, time.time())
+        ).fetchone()
+        if not row:
             return None
+        self._conn.execute(
+            "UPDATE print_jobs SET status = 'imprimindo', tentativas = tentativas + 1 WHERE id = ?",
+            (row["id"],)
+        )
+        job = dict(row)
+        job["status"] = "imprimindo"
+        job["tentativas"] += 1
+        return job
 
-    def mark_printing(self, job_id: int):
-        """Marca job como em impressão."""
-        with self._lock:
-            self._conn.execute(
-                "UPDATE print_jobs SET status = 'imprimindo', tentativas = tentativas + 1 WHERE id = ?",
-                (job_id,)
-            )
-            self._conn.commit()
+    def _espera_backoff(self, impressora: str) -> Optional[float]:
+        """Segundos até o próximo job em backoff da impressora ficar livre. Exige o lock."""
+        row = self._conn.execute(
+            "SELECT MIN(proximo_tentativa) AS liberado FROM print_jobs "
+            "WHERE impressora = ? AND status = 'pendente' AND tentativas < ?",
+            (impressora, MAX_RETRIES)
+        ).fetchone()
+        if row["liberado"] is None:
+            return None
+        return max(0.0, row["liberado"] - time.time())
+
+    def aguardar_proximo(self, impressora: str, timeout: float = 30.0) -> Optional[dict]:
+        """
+        Assume o próximo job da impressora, dormindo até um enqueue acordar,
+        um job sair do backoff ou o timeout (retornando None).
+        """
+        limite = time.monotonic() + timeout
+        with self._novo_job:
+            while True:
+                job = self._assumir(impressora)
+                if job:
+                    self._conn.commit()
+                    return job
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    return None
+                backoff = self._espera_backoff(impressora)
+                if backoff is not None and backoff < restante:
+                    self._novo_job.wait(backoff)
+                elif not self._novo_job.wait(restante):
+                    return None
 
-    def mark_done(self, job_id: int, pedido_id: int, impressora: str):
-        """Marca job como concluído e registra no histórico."""
+    def concluir(self, job: dict, proximo: bool = True) -> Optional[dict]:
+        """
+        Marca job como concluído e registra no histórico. Com proximo=True
+        assume na mesma transação o próximo job da impressora e o retorna.
+        """
+        seguinte = None
         with self._lock:
-            self._conn.execute("DELETE FROM print_jobs WHERE id = ?", (job_id,))
+            self._conn.execute("DELETE FROM print_jobs WHERE id = ?", (job["id"],))
             self._conn.execute(
                 "INSERT INTO print_history (pedido_id, impressora, impresso_em) VALUES (?, ?, ?)",
-                (pedido_id, impressora, time.time())
+                (job["pedido_id"], job["impressora"], time.time())
             )
+            if proximo:
+                seguinte = self._assumir(job["impressora"])
             self._conn.commit()
-        logger.info(f"Job concluído: pedido={pedido_id} impressora={impressora}")
+        logger.info(f"Job concluído: pedido={job['pedido_id']} impressora={job['impressora']}")
+        return seguinte
 
     def mark_failed(self, job_id: int):
-        """Marca job como falhado (volta para pendente para retry)."""
+        """Marca job como falhado (volta para pendente com backoff para retry)."""
         with self._lock:
             row = self._conn.execute("SELECT tentativas FROM print_jobs WHERE id = ?", (job_id,)).fetchone()
             if row and row["tentativas"] >= MAX_RETRIES:
                 self._conn.execute("UPDATE print_jobs SET status = 'falhou' WHERE id = ?", (job_id,))
                 logger.error(f"Job {job_id} falhou após {MAX_RETRIES} tentativas")
-            else:
-                self._conn.execute("UPDATE print_jobs SET status = 'pendente' WHERE id = ?", (job_id,))
+            elif row:
+                espera = RETRY_BACKOFF_SECONDS * 2 ** max(0, row["tentativas"] - 1)
+                self._conn.execute(
+                    "UPDATE print_jobs SET status = 'pendente', proximo_tentativa = ? WHERE id = ?",
+                    (time.time() + espera, job_id)
+                )
+                logger.warning(f"Job {job_id} falhou (tentativa {row['tentativas']}) — nova tentativa em {espera}s")
             self._conn.commit()
 
+    def impressoras_pendentes(self) -> List[str]:
+        """Impressoras com jobs pendentes (para subir os consumidores no início)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT impressora FROM print_jobs WHERE status = 'pendente' AND tentativas < ?",
+                (MAX_RETRIES,)
+            ).fetchall()
+            return [r["impressora"] for r in rows]
+
+    def acordar_todos(self):
+        """Acorda consumidores em espera (usado no encerramento)."""
+        with self._novo_job:
+            self._novo_job.notify_all()
+
     def get_failed_jobs(self) -> List[dict]:
         """Retorna jobs que falharam definitivamente."""
         with self._lock:
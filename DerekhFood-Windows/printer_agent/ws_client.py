@@ -100,8 +100,14 @@ class WebSocketClient:
             except Exception as e:
                 logger.warning(f"Erro ao enviar status: {e}")
 
-    async def enviar_ack(self, pedido_id: int, success: bool, error: Optional[str] = None):
-        """Envia confirmação de impressão."""
+    async def enviar_ack(
+        self,
+        pedido_id: int,
+        success: bool,
+        error: Optional[str] = None,
+        metricas: Optional[dict] = None,
+    ):
+        """Envia confirmação de impressão (com latência enqueue → papel, se houver)."""
         if self._ws:
             try:
                 msg = {
@@ -113,6 +119,8 @@ class WebSocketClient:
                 }
                 if error:
                     msg["dados"]["error"] = error
+                if metricas:
+                    msg["dados"].update(metricas)
                 await self._ws.send(json.dumps(msg))
             except Exception as e:
                 logger.warning(f"Erro ao enviar ACK: {e}")
@@ -67,6 +67,8 @@ def cmd_server(args):
         output_dir=args.output,
         codepage=args.codepage,
         quiet=args.quiet,
+        workers=args.workers,
+        idle_gap=args.idle,
     )
     server.start()
 
@@ -293,6 +295,9 @@ Exemplos:
     p_server.add_argument("--output", default="output", help="Diretorio output (default: output)")
     p_server.add_argument("--codepage", default="CP860", help="Codepage (default: CP860)")
     p_server.add_argument("--quiet", action="store_true", help="Nao exibir recibos no console")
+    p_server.add_argument("--workers", type=int, default=4, help="Threads de decodificacao/gravacao (default: 4)")
+    p_server.add_argument("--idle", type=float, default=1.0,
+                          help="Segundos ociosos que encerram um job sem corte (default: 1.0)")
 
     # ── simulate ─────────────────────────────────────────────────────
     p_sim = subparsers.add_parser("simulate", help="Envia recibos pelo spooler")
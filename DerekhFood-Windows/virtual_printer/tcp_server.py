@@ -1,16 +1,26 @@
 """
 Servidor TCP porta 9100 — simula o "hardware" da impressora térmica virtual.
 
-Protocolo RAW (JetDirect): cada conexão TCP = 1 job de impressão.
-O cliente (spooler Windows) conecta, envia todos os bytes, e desconecta.
-O servidor decodifica ESC/POS e exibe no console + salva arquivos.
+Protocolo RAW (JetDirect): o cliente (spooler Windows) conecta, envia os bytes
+do job e desconecta. O servidor decodifica ESC/POS e exibe no console + salva
+arquivos.
+
+Servidor asyncio (sem thread por conexão) para aguentar centenas de jobs
+simultâneos como sink de teste de carga:
+- Fim do job: EOF, comando de corte (GS V / ESC i / ESC m) seguido de uma
+  pausa curta, ou ociosidade sem corte. Uma conexão aberta pode mandar vários
+  jobs em sequência
+- Decodificação e escrita dos arquivos num pool limitado de threads, fora do
+  event loop; jobs aguardando o pool são limitados (backpressure na leitura)
 """
 
-import os
-import socket
+import asyncio
+import re
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Optional
 
 from virtual_printer.escpos_decoder import ESCPOSDecoder
 
@@ -28,6 +38,13 @@ BOX_SEP_LINE = "─"
 
 RECEIPT_WIDTH = 48  # Colunas padrão impressora 80mm
 
+# GS V m (m = 0/1/48/49) | GS V m n (m = 65/66) | ESC i | ESC m
+CUT_PATTERN = re.compile(rb"\x1dV(?:[\x00\x01\x30\x31]|[\x41\x42].)|\x1b[im]", re.DOTALL)
+
+CUT_GRACE_SECONDS = 0.15   # espera por bytes finais (feed, init) após o corte
+IDLE_GAP_SECONDS = 1.0     # job sem corte termina após essa ociosidade
+READ_CHUNK = 65536
+
 
 class TCPPrinterServer:
     """Servidor TCP que simula uma impressora térmica na porta 9100."""
@@ -39,95 +56,138 @@ class TCPPrinterServer:
         output_dir: str = "output",
         codepage: str = "CP860",
         quiet: bool = False,
+        workers: int = 4,
+        max_conexoes: int = 1024,
+        idle_gap: float = IDLE_GAP_SECONDS,
     ):
         self.host = host
         self.port = port
         self.output_dir = Path(output_dir)
         self.codepage = codepage
         self.quiet = quiet
+        self.workers = max(1, workers)
+        self.max_conexoes = max_conexoes
+        self.idle_gap = idle_gap
         self.decoder = ESCPOSDecoder(codepage=codepage)
         self._job_counter = 0
+        self._bytes_total = 0
         self._running = False
-        self._server_socket: socket.socket | None = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stop_event: Optional[asyncio.Event] = None
+        self._pool: Optional[ThreadPoolExecutor] = None
         self._lock = threading.Lock()
 
     def start(self):
         """Inicia o servidor TCP (bloqueante)."""
-        self.output_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            print("\n  Servidor encerrado pelo usuario.")
 
-        self._server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self._server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self._server_socket.settimeout(1.0)
-        self._server_socket.bind((self.host, self.port))
-        self._server_socket.listen(5)
+    async def serve(self):
+        """Executa o servidor até stop()."""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self._loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+        self._conexoes = asyncio.Semaphore(self.max_conexoes)
+        # Jobs decodificados/gravados em paralelo + os que podem esperar o pool
+        self._jobs_em_voo = asyncio.Semaphore(self.workers * 4)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="vprinter")
+
+        server = await asyncio.start_server(
+            self._handle_connection, self.host, self.port,
+            reuse_address=True, backlog=self.max_conexoes,
+        )
         self._running = True
 
         print(f"\n{'=' * 60}")
         print(f"  IMPRESSORA TERMICA VIRTUAL — TCP Server")
         print(f"  Escutando em {self.host}:{self.port}")
         print(f"  Output: {self.output_dir.resolve()}")
-        print(f"  Codepage: {self.codepage}")
+        print(f"  Codepage: {self.codepage} | Workers: {self.workers}")
         print(f"{'=' * 60}")
         print(f"  Aguardando jobs de impressao... (Ctrl+C para parar)\n")
 
         try:
-            while self._running:
-                try:
-                    conn, addr = self._server_socket.accept()
-                    thread = threading.Thread(
-                        target=self._handle_connection,
-                        args=(conn, addr),
-                        daemon=True,
-                    )
-                    thread.start()
-                except socket.timeout:
-                    continue
-        except KeyboardInterrupt:
-            print("\n  Servidor encerrado pelo usuario.")
+            async with server:
+                await self._stop_event.wait()
         finally:
-            self.stop()
+            self._running = False
+            server.close()
+            await server.wait_closed()
+            # Jobs já recebidos terminam de gravar antes de sair
+            await asyncio.to_thread(self._pool.shutdown, True)
+            print(f"  {self._job_counter} job(s) recebidos, {self._bytes_total} bytes.")
 
     def stop(self):
-        """Para o servidor."""
+        """Para o servidor (seguro de chamar de outra thread)."""
         self._running = False
-        if self._server_socket:
+        if self._loop and self._stop_event and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._stop_event.set)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Processa uma conexão (1 ou mais jobs de impressão)."""
+        addr = writer.get_extra_info("peername") or ("?", 0)
+        async with self._conexoes:
             try:
-                self._server_socket.close()
-            except OSError:
+                while True:
+                    raw_bytes = await self._ler_job(reader)
+                    if raw_bytes is None:
+                        break
+                    await self._enfileirar_job(raw_bytes, addr)
+            except (ConnectionResetError, BrokenPipeError):
                 pass
-            self._server_socket = None
-
-    def _handle_connection(self, conn: socket.socket, addr: tuple):
-        """Processa uma conexão (1 job de impressão)."""
-        chunks = []
-        conn.settimeout(5.0)
-
-        try:
-            while True:
+            finally:
+                writer.close()
                 try:
-                    data = conn.recv(65536)
-                    if not data:
-                        break
-                    chunks.append(data)
-                except socket.timeout:
-                    break
-        except ConnectionResetError:
-            pass
-        finally:
-            conn.close()
-
-        if not chunks:
-            return
-
-        raw_bytes = b"".join(chunks)
-
+                    await writer.wait_closed()
+                except (ConnectionResetError, BrokenPipeError):
+                    pass
+
+    async def _ler_job(self, reader: asyncio.StreamReader) -> Optional[bytes]:
+        """
+        Lê um job até EOF, corte + pausa curta ou ociosidade.
+        Retorna None quando a conexão terminou sem bytes novos.
+        """
+        chunks = []
+        cortado = False
+        while True:
+            espera = CUT_GRACE_SECONDS if cortado else self.idle_gap
+            try:
+                data = await asyncio.wait_for(reader.read(READ_CHUNK), timeout=espera if chunks else None)
+            except asyncio.TimeoutError:
+                break
+            if not data:
+                if not chunks:
+                    return None
+                break
+            chunks.append(data)
+            # Corte no trecho recém-chegado (com folga para comando partido entre leituras)
+            cauda = (chunks[-2][-3:] if len(chunks) > 1 else b"") + data
+            cortado = CUT_PATTERN.search(cauda) is not None or (cortado and len(data) < 16)
+        return b"".join(chunks)
+
+    async def _enfileirar_job(self, raw_bytes: bytes, addr: tuple):
+        """Numera o job e entrega ao pool (espera vaga: backpressure na conexão)."""
+        await self._jobs_em_voo.acquire()
         with self._lock:
             self._job_counter += 1
+            self._bytes_total += len(raw_bytes)
             job_num = self._job_counter
+        future = self._loop.run_in_executor(self._pool, self._processar_job, job_num, raw_bytes, addr)
+        future.add_done_callback(lambda f: self._job_concluido(f))
+
+    def _job_concluido(self, future):
+        self._jobs_em_voo.release()
+        if future.cancelled():
+            return
+        erro = future.exception()
+        if erro:
+            print(f"  [ERRO] Falha ao processar job: {erro}")
 
-        # Decodificar
-        text_only = self.decoder.decode_text_only(raw_bytes)
-        annotated = self.decoder.decode_annotated(raw_bytes)
+    def _processar_job(self, job_num: int, raw_bytes: bytes, addr: tuple):
+        """Decodifica, salva e exibe um job (roda no pool)."""
+        text_only, annotated = self.decoder.decode(raw_bytes)
 
         # Salvar arquivos
         bin_path = self.output_dir / f"job_{job_num:04d}.bin"
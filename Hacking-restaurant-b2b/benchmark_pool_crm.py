@@ -0,0 +1,157 @@
+"""
+benchmark_pool_crm.py — Custo de conexão no render do dashboard do CRM.
+
+Compara as 10 funções de query do dashboard em três modos:
+  1. conexao_por_chamada  — psycopg2.connect novo por função (comportamento antigo)
+  2. pool                 — get_conn() do pool (uma conexão reusada por função)
+  3. pool_lote            — conexao_compartilhada(): uma conexão para o render todo
+
+Uso (Postgres local, banco descartável):
+    createdb crm_bench
+    DATABASE_URL=postgresql://localhost/crm_bench python benchmark_pool_crm.py --seed 5000
+    DATABASE_URL=postgresql://localhost/crm_bench python benchmark_pool_crm.py --renders 200
+
+--seed N aplica o schema.sql e insere N leads sintéticos (só se a tabela estiver vazia).
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import psycopg2
+from psycopg2.extras import RealDictCursor, execute_values
+
+from crm import database as db
+
+CIDADES = [("SAO PAULO", "SP"), ("CAMPINAS", "SP"), ("RIO DE JANEIRO", "RJ"),
+           ("BELO HORIZONTE", "MG"), ("CURITIBA", "PR"), ("SALVADOR", "BA")]
+SEGMENTOS = ["pizzaria", "hamburgueria", "restaurante", "lanchonete", "acai"]
+PIPELINE = ["novo", "contactado", "respondeu", "demo_agendada", "cliente", "perdido"]
+
+
+def _aplicar_schema():
+    try:
+        db.init_schema()
+    except psycopg2.errors.FeatureNotSupported:
+        # Postgres mínimo sem contrib: gen_random_uuid() é nativo desde o PG 13
+        caminho = os.path.join(os.path.dirname(db.__file__), "schema.sql")
+        with open(caminho) as f:
+            sql = "\n".join(l for l in f if not l.startswith("CREATE EXTENSION"))
+        with db.get_conn() as conn:
+            conn.cursor().execute(sql)
+            conn.commit()
+
+
+def seed(n: int):
+    _aplicar_schema()
+    with db.get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT COUNT(*) AS c FROM leads")
+        if cur.fetchone()["c"]:
+            print("[seed] leads já populado — mantendo")
+            return
+        linhas = []
+        for i in range(n):
+            cidade, uf = random.choice(CIDADES)
+            linhas.append((
+                f"{i:014d}", f"Restaurante Bench {i}", cidade, uf,
+                random.choice(SEGMENTOS), random.choice(PIPELINE), random.randint(0, 100),
+                random.choice([0, 1]), random.choice([0, 1]), random.choice([0, 1]),
+            ))
+        execute_values(cur, """
+            INSERT INTO leads (cnpj, razao_social, cidade, uf, segmento, status_pipeline,
+                               lead_score, tem_ifood, tem_rappi, tem_99food)
+            VALUES %s
+        """, linhas, page_size=1000)
+        conn.commit()
+    print(f"[seed] {n} leads inseridos")
+
+
+def render_dashboard():
+    db.kpis_dashboard()
+    db.funil_pipeline()
+    db.distribuicao_segmento()
+    db.top_cidades(10)
+    db.followups_hoje()
+    db.leads_quentes_sem_contato()
+    db.stats_delivery()
+    db.stats_delivery_por_cidade(50)
+    db.cidades_escaneadas_ifood()
+    db.top_categorias_ifood(10)
+
+
+@contextmanager
+def _conexao_por_chamada():
+    """Replica o get_conn antigo: connect + close por função."""
+    @contextmanager
+    def get_conn_antigo():
+        conn = psycopg2.connect(db.DATABASE_URL, cursor_factory=RealDictCursor)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    original = db.get_conn
+    db.get_conn = get_conn_antigo
+    try:
+        yield
+    finally:
+        db.get_conn = original
+
+
+def medir(nome: str, renders: int, lote: bool = False) -> dict:
+    tempos = []
+    for _ in range(renders):
+        inicio = time.perf_counter()
+        if lote:
+            with db.conexao_compartilhada():
+                render_dashboard()
+        else:
+            render_dashboard()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    tempos.sort()
+    return {
+        "modo": nome,
+        "p50_ms": round(statistics.median(tempos), 2),
+        "p95_ms": round(tempos[int(len(tempos) * 0.95) - 1], 2),
+        "media_ms": round(statistics.mean(tempos), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do pool de conexões do CRM")
+    parser.add_argument("--renders", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0, help="Aplica schema e insere N leads")
+    args = parser.parse_args()
+
+    if not db.DATABASE_URL:
+        print("Defina DATABASE_URL (Postgres local descartável)")
+        sys.exit(1)
+
+    db.init_pool(min_conn=1)
+    if args.seed:
+        seed(args.seed)
+
+    resultados = []
+    with _conexao_por_chamada():
+        resultados.append(medir("conexao_por_chamada", args.renders))
+    resultados.append(medir("pool", args.renders))
+    resultados.append(medir("pool_lote", args.renders, lote=True))
+
+    base = resultados[0]["p50_ms"]
+    print(f"\n{'modo':<22}{'p50':>10}{'p95':>10}{'média':>10}{'ganho p50':>12}")
+    print("-" * 64)
+    for r in resultados:
+        ganho = f"{base / r['p50_ms']:.1f}x" if r["p50_ms"] else "-"
+        print(f"{r['modo']:<22}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['media_ms']:>10.2f}{ganho:>12}")
+    print(f"\nPool: {db._get_pool().tamanho()} | stats: {db._get_pool().stats}")
+    db.close_pool()
+
+
+if __name__ == "__main__":
+    main()
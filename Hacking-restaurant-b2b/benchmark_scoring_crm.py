@@ -0,0 +1,103 @@
+"""
+benchmark_scoring_crm.py — Rescore completo e score decay do CRM.
+
+Compara a implementação antiga (LIMIT/OFFSET + executemany; decay com duas
+idas ao banco por lead) com a atual (keyset + temp table + UPDATE ... FROM;
+decay num único statement).
+
+Uso (Postgres local, banco descartável — reaproveita o seed do benchmark do pool):
+    DATABASE_URL=postgresql://localhost/crm_bench python benchmark_pool_crm.py --seed 50000 --renders 1
+    DATABASE_URL=postgresql://localhost/crm_bench python benchmark_scoring_crm.py --batch 5000
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from crm import database as db
+from crm import scoring
+
+
+def rescore_antigo(batch_size: int) -> int:
+    """Réplica do calcular_scores_todos anterior (OFFSET + executemany)."""
+    n = 0
+    with db.get_conn() as conn:
+        cur = conn.cursor()
+        offset = 0
+        while True:
+            cur.execute(f"SELECT {scoring._COLUNAS_SCORE} FROM leads ORDER BY id LIMIT %s OFFSET %s",
+                        (batch_size, offset))
+            rows = cur.fetchall()
+            if not rows:
+                break
+            updates = []
+            for lead in rows:
+                score = scoring.calcular_score(lead)
+                segmento = scoring.determinar_segmento(lead, score)
+                updates.append((score, segmento, scoring.calcular_tier(score), lead["id"]))
+            cur.executemany("UPDATE leads SET lead_score = %s, segmento = %s, tier = %s WHERE id = %s",
+                            updates)
+            conn.commit()
+            n += len(updates)
+            offset += batch_size
+    return n
+
+
+def decay_antigo() -> int:
+    """Réplica do aplicar_decaimento_scores anterior (2 chamadas por lead)."""
+    n = 0
+    for lead in db.leads_sem_interacao_recente(dias=7):
+        score = lead["lead_score"] or 0
+        novo = max(10, score - max(1, int(score * 0.05)))
+        db.atualizar_score_lead(lead["id"], novo, scoring.calcular_tier(novo))
+        db.registrar_evento_lead(lead["id"], "score_decay", novo - score, score, novo)
+        n += 1
+    return n
+
+
+def _limpar_decay():
+    with db.get_conn() as conn:
+        conn.cursor().execute("DELETE FROM lead_eventos WHERE evento = 'score_decay'")
+        conn.commit()
+
+
+def _medir(nome, fn):
+    inicio = time.perf_counter()
+    resultado = fn()
+    ms = (time.perf_counter() - inicio) * 1000
+    print(f"{nome:<24}{ms:>12.0f} ms   {resultado}")
+    return ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do rescore/decay do CRM")
+    parser.add_argument("--batch", type=int, default=5000)
+    args = parser.parse_args()
+
+    if not db.DATABASE_URL:
+        print("Defina DATABASE_URL (Postgres local descartável)")
+        sys.exit(1)
+
+    db.init_pool(min_conn=1)
+    with db.get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT COUNT(*) AS c FROM leads")
+        print(f"leads: {cur.fetchone()['c']}\n")
+
+    antigo = _medir("rescore_antigo", lambda: rescore_antigo(args.batch))
+    novo = _medir("rescore_keyset", lambda: scoring.calcular_scores_todos(args.batch)["atualizados"])
+    print(f"{'ganho rescore':<24}{antigo / novo:>11.1f}x\n")
+
+    _limpar_decay()
+    antigo = _medir("decay_antigo", decay_antigo)
+    _limpar_decay()
+    novo = _medir("decay_set_based", lambda: scoring.aplicar_decaimento_scores()["processados"])
+    print(f"{'ganho decay':<24}{antigo / novo:>11.1f}x")
+    _limpar_decay()
+    db.close_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -14,16 +14,16 @@ import secrets
 from starlette.middleware.base import BaseHTTPMiddleware
 
 from fastapi import FastAPI, Request, Form, Query, BackgroundTasks
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, PlainTextResponse, Response
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
 from crm.database import (
-    init_pool, close_pool, init_schema, criar_lead_quiz,
+    PoolEsgotado, init_pool, close_pool, init_schema, criar_lead_quiz, conexao_compartilhada,
     kpis_dashboard, funil_pipeline, distribuicao_segmento,
     top_cidades, followups_hoje, leads_quentes_sem_contato,
     stats_delivery, stats_delivery_por_cidade, cidades_escaneadas_ifood, top_categorias_ifood,
-    buscar_leads, listar_ufs_disponiveis, listar_cidades_disponiveis,
+    buscar_leads, buscar_leads_keyset, listar_ufs_disponiveis, listar_cidades_disponiveis,
     obter_lead, obter_interacoes_lead, obter_socios_lead,
     atualizar_status_pipeline, agendar_followup,
     registrar_interacao, atualizar_notas,
@@ -159,6 +159,14 @@ app.add_middleware(
 )
 app.add_middleware(AuthMiddleware)
 
+
+@app.exception_handler(PoolEsgotado)
+async def pool_esgotado_handler(request: Request, exc: PoolEsgotado):
+    """Pool cheio: 503 imediato em vez de segurar o event loop esperando conexão."""
+    print(f"[POOL] {exc} — {request.method} {request.url.path}")
+    return JSONResponse({"erro": "Banco ocupado, tente novamente"}, status_code=503,
+                        headers={"Retry-After": "2"})
+
 CRM_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # Static files
@@ -453,18 +461,20 @@ async def logout(request: Request):
 
 @app.get("/", response_class=HTMLResponse)
 async def dashboard(request: Request):
-    kpis = kpis_dashboard()
-    funil = funil_pipeline()
-    segmentos = distribuicao_segmento()
-    cidades = top_cidades(10)
-    followups = followups_hoje()
-    quentes = leads_quentes_sem_contato()
-
-    # Delivery stats
-    delivery = stats_delivery()
-    delivery_cidades = stats_delivery_por_cidade(50)
-    cidades_ifood = cidades_escaneadas_ifood()
-    ifood_categorias = top_categorias_ifood(10)
+    # Uma conexão para as 10 queries do dashboard
+    with conexao_compartilhada():
+        kpis = kpis_dashboard()
+        funil = funil_pipeline()
+        segmentos = distribuicao_segmento()
+        cidades = top_cidades(10)
+        followups = followups_hoje()
+        quentes = leads_quentes_sem_contato()
+
+        # Delivery stats
+        delivery = stats_delivery()
+        delivery_cidades = stats_delivery_por_cidade(50)
+        cidades_ifood = cidades_escaneadas_ifood()
+        ifood_categorias = top_categorias_ifood(10)
 
     return templates.TemplateResponse("dashboard.html", {
         "request": request,
@@ -513,6 +523,7 @@ async def busca(
     status_pipeline: str = "", score_min: str = "", score_max: str = "",
     tem_ifood: str = "", tem_rappi: str = "", tem_99food: str = "",
     eh_rede: str = "", q: str = "", pagina: int = 1,
+    apos: str = "", contar: int = 0,
 ):
     filtros = {}
     for key, val in [("uf", uf), ("cidade", cidade), ("segmento", segmento),
@@ -524,7 +535,14 @@ async def busca(
             filtros[key] = val
 
     por_pagina = 50
-    leads, total = buscar_leads(filtros, pagina, por_pagina)
+    proximo, total_exato = None, True
+    if apos or pagina <= 1:
+        # Navegação sequencial: keyset (sem OFFSET); total estimado se grande
+        resultado = buscar_leads_keyset(filtros, apos or None, por_pagina, bool(contar))
+        leads, total = resultado["leads"], resultado["total"]
+        proximo, total_exato = resultado["proximo"], resultado["total_exato"]
+    else:
+        leads, total = buscar_leads(filtros, pagina, por_pagina)
     total_paginas = math.ceil(total / por_pagina) if total > 0 else 1
     ufs = listar_ufs_disponiveis()
     cidades_list = listar_cidades_disponiveis(uf if uf else None)
@@ -536,6 +554,8 @@ async def busca(
         "pagina": pagina,
         "total_paginas": total_paginas,
         "por_pagina": por_pagina,
+        "proximo": proximo,
+        "total_exato": total_exato,
         "filtros": filtros,
         "ufs": ufs,
         "cidades": cidades_list,
@@ -554,6 +574,23 @@ async def api_cidades(uf: str = ""):
     return listar_cidades_disponiveis(uf)
 
 
+@app.get("/api/leads/exportar.csv")
+async def api_exportar_leads_csv(
+    uf: str = "", cidade: str = "", segmento: str = "", status_pipeline: str = "",
+):
+    """Exporta leads filtrados em CSV (streaming — cursor server-side)."""
+    from crm.database import gerar_csv_leads
+
+    filtros = {k: v for k, v in [("uf", uf), ("cidade", cidade), ("segmento", segmento),
+                                 ("status_pipeline", status_pipeline)] if v}
+    nome = "_".join(filtros.values()).lower().replace(" ", "-") or "todos"
+    return StreamingResponse(
+        gerar_csv_leads(filtros),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="leads_{nome}.csv"'},
+    )
+
+
 # ============================================================
 # FICHA DO LEAD
 # ============================================================
@@ -562,17 +599,18 @@ async def api_cidades(uf: str = ""):
 async def ficha_lead(request: Request, lead_id: int, tab: str = "dados"):
     from crm.scoring import avaliar_qualidade_dados
 
-    lead = obter_lead(lead_id)
-    if not lead:
-        return HTMLResponse("<h1>Lead não encontrado</h1>", status_code=404)
+    with conexao_compartilhada():
+        lead = obter_lead(lead_id)
+        if not lead:
+            return HTMLResponse("<h1>Lead não encontrado</h1>", status_code=404)
 
-    interacoes = obter_interacoes_lead(lead_id)
-    socios = obter_socios_lead(lead_id)
+        interacoes = obter_interacoes_lead(lead_id)
+        socios = obter_socios_lead(lead_id)
 
-    # Qualidade de dados para tab Ações
-    cidade = lead.get("cidade") or ""
-    uf = lead.get("uf") or ""
-    delivery_ok = cidade_tem_delivery_verificado(cidade, uf) if cidade and uf else False
+        # Qualidade de dados para tab Ações
+        cidade = lead.get("cidade") or ""
+        uf = lead.get("uf") or ""
+        delivery_ok = cidade_tem_delivery_verificado(cidade, uf) if cidade and uf else False
     qualidade = avaliar_qualidade_dados(lead, delivery_ok)
 
     # Template recomendado baseado na qualidade
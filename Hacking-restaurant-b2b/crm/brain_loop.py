@@ -32,7 +32,6 @@ if not log.handlers:
 MAX_VALIDACOES_CICLO = 50
 MAX_OUTREACH_CICLO = 20
 MAX_REENGAJAMENTO_CICLO = 10
-DELAY_ENTRE_WA_VERIFICACOES = 1.0  # segundos entre verificações WA
 DELAY_ENTRE_OUTREACH = 2.0  # segundos entre ações de outreach
 SCORE_HANDOFF_IMEDIATO = 80
 SCORE_HANDOFF_QUENTE = 50
@@ -228,9 +227,10 @@ def _etapa_evolution_health_check() -> dict:
 
 async def _etapa_validar_contatos(limite: int) -> dict:
     """Valida WA + email de leads sem contato_validado_at.
-    Usa versão async da verificação WA."""
+    Pipeline em lote: verificação WA concorrente sob o rate limit do
+    contact_validator (token bucket), cache por número e gravação única."""
     from crm.database import leads_pendentes_validacao
-    from crm.contact_validator import validar_contatos_lead_async
+    from crm.contact_validator import validar_leads_async
 
     result = {"validados": 0, "wa_encontrados": 0, "erros": 0}
 
@@ -240,23 +240,18 @@ async def _etapa_validar_contatos(limite: int) -> dict:
 
     log.info(f"Validando {len(leads)} leads pendentes...")
 
-    for lead in leads:
-        try:
-            validacao = await validar_contatos_lead_async(lead["id"])
-            if validacao.get("erro"):
-                result["erros"] += 1
-                continue
-
-            result["validados"] += 1
-            if validacao.get("wa_existe"):
-                result["wa_encontrados"] += 1
-
-            # Delay entre verificações WA
-            await asyncio.sleep(DELAY_ENTRE_WA_VERIFICACOES)
+    try:
+        validacoes = await validar_leads_async([lead["id"] for lead in leads])
+    except Exception as e:
+        log.warning(f"Erro validando lote de {len(leads)} leads: {e}")
+        result["erros"] = len(leads)
+        return result
 
-        except Exception as e:
-            log.warning(f"Erro validando lead {lead['id']}: {e}")
-            result["erros"] += 1
+    result["erros"] = len(leads) - len(validacoes)
+    for validacao in validacoes:
+        result["validados"] += 1
+        if validacao.get("wa_existe"):
+            result["wa_encontrados"] += 1
 
     log.info(f"Validação: {result['validados']} validados, {result['wa_encontrados']} com WA")
     return result
@@ -3,14 +3,18 @@ contact_validator.py - Validação e classificação de canais de contato
 Detecta emails de contador, verifica WhatsApp via Evolution API,
 classifica canal primário/secundário.
 """
+import asyncio
 import logging
 import os
 import re
+import threading
+import time
 from datetime import datetime, timezone
 
 import httpx
 
 from crm.database import get_conn, obter_configuracao
+from crm.rate_limit import BucketTokens
 
 log = logging.getLogger("contact_validator")
 log.setLevel(logging.INFO)
@@ -130,43 +134,167 @@ def verificar_evolution_health() -> dict:
     return result
 
 
-async def _verificar_whatsapp(telefone: str) -> bool:
-    """Verifica se número tem WhatsApp via Evolution API.
+# Limites do endpoint whatsappNumbers (Evolution / Baileys): requisições por
+# segundo por instância, números por requisição e requisições em voo.
+WA_CHECK_RATE = float(os.getenv("WA_CHECK_RATE", "1.0"))
+WA_CHECK_BURST = int(os.getenv("WA_CHECK_BURST", "3"))
+WA_CHECK_LOTE = int(os.getenv("WA_CHECK_LOTE", "25"))
+WA_CHECK_CONCORRENCIA = int(os.getenv("WA_CHECK_CONCORRENCIA", "4"))
+WA_CACHE_TTL_SECONDS = int(os.getenv("WA_CACHE_TTL_SECONDS", "86400"))
+
+
+class CacheWhatsApp:
+    """Resultado da verificação WA por número normalizado.
+
+    O mesmo dono aparece em vários CNPJs com o mesmo celular — o cache evita
+    gastar a cota do endpoint com números já consultados. Só guarda
+    True/False; None (falha de API) é sempre re-verificado."""
+
+    def __init__(self, ttl_seconds: int = WA_CACHE_TTL_SECONDS, max_numeros: int = 200_000):
+        self.ttl = ttl_seconds
+        self.max_numeros = max_numeros
+        self._numeros = {}
+        self._lock = threading.Lock()
+
+    def get(self, numero: str):
+        """Retorna (encontrado, existe)."""
+        item = self._numeros.get(numero)
+        if item is None:
+            return False, None
+        existe, expira = item
+        if time.monotonic() >= expira:
+            with self._lock:
+                self._numeros.pop(numero, None)
+            return False, None
+        return True, existe
+
+    def set(self, numero: str, existe: bool):
+        if existe is None:
+            return
+        with self._lock:
+            if len(self._numeros) >= self.max_numeros:
+                self._numeros.pop(next(iter(self._numeros)), None)
+            self._numeros[numero] = (existe, time.monotonic() + self.ttl)
+
+    def limpar(self):
+        with self._lock:
+            self._numeros.clear()
+
+
+wa_rate_limiter = BucketTokens(WA_CHECK_RATE, WA_CHECK_BURST)
+wa_cache = CacheWhatsApp()
+
+
+def _extrair_resultados(data) -> list:
+    """Normaliza a resposta do whatsappNumbers (lista ou {result|data: [...]})."""
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict):
+        results = data.get("result", data.get("data", []))
+        if isinstance(results, list):
+            return results
+    return []
+
+
+async def _verificar_whatsapp_lote(numeros: list, client: httpx.AsyncClient = None) -> dict:
+    """Verifica vários números (já normalizados) numa requisição só.
     Tenta derekh-reserva-1 primeiro, fallback para derekh-reserva-3.
 
-    Returns True/False, ou None se não conseguiu verificar.
+    Returns {numero: True/False/None} — None se não conseguiu verificar.
     """
-    numero = _limpar_telefone(telefone)
-    if not numero:
-        return None
+    resultado = {n: None for n in numeros}
+    if not numeros:
+        return resultado
 
     url_base = EVOLUTION_URL.rstrip("/")
+    proprio = client is None
+    if proprio:
+        client = httpx.AsyncClient(timeout=15)
 
-    for instance in EVOLUTION_INSTANCES:
-        url = f"{url_base}/chat/whatsappNumbers/{instance}"
-        try:
-            async with httpx.AsyncClient(timeout=15) as client:
+    try:
+        for instance in EVOLUTION_INSTANCES:
+            url = f"{url_base}/chat/whatsappNumbers/{instance}"
+            try:
+                await wa_rate_limiter.adquirir()
                 response = await client.post(
                     url,
-                    json={"numbers": [numero]},
+                    json={"numbers": list(numeros)},
                     headers={"apikey": EVOLUTION_KEY},
                 )
                 if response.status_code == 200:
-                    data = response.json()
-                    if isinstance(data, list) and data:
-                        return data[0].get("exists", False)
-                    elif isinstance(data, dict):
-                        results = data.get("result", data.get("data", []))
-                        if isinstance(results, list) and results:
-                            return results[0].get("exists", False)
+                    itens = _extrair_resultados(response.json())
+                    if itens:
+                        for i, item in enumerate(itens):
+                            numero = re.sub(r"\D", "", str(item.get("number") or ""))
+                            if numero not in resultado and len(itens) == len(numeros):
+                                numero = numeros[i]  # resposta sem "number": mesma ordem do pedido
+                            if numero in resultado:
+                                resultado[numero] = bool(item.get("exists", False))
+                        return resultado
                 # Se status != 200, tentar próxima instância
                 log.warning(f"Evolution {instance} status {response.status_code} — tentando próxima")
-        except Exception as e:
-            log.warning(f"Evolution {instance} falhou para {numero}: {e} — tentando próxima")
-            continue
+            except Exception as e:
+                log.warning(f"Evolution {instance} falhou para {len(numeros)} números: {e} — tentando próxima")
+                continue
+    finally:
+        if proprio:
+            await client.aclose()
+
+    log.error(f"Todas as instâncias Evolution falharam para {len(numeros)} números")
+    return resultado
+
+
+async def _verificar_whatsapp(telefone: str) -> bool:
+    """Verifica se número tem WhatsApp via Evolution API (com cache).
+
+    Returns True/False, ou None se não conseguiu verificar.
+    """
+    numero = _limpar_telefone(telefone)
+    if not numero:
+        return None
+
+    encontrado, existe = wa_cache.get(numero)
+    if encontrado:
+        return existe
+
+    existe = (await _verificar_whatsapp_lote([numero]))[numero]
+    wa_cache.set(numero, existe)
+    return existe
+
+
+async def verificar_whatsapp_numeros(numeros: list) -> dict:
+    """Verifica um conjunto de números normalizados respeitando o rate limit.
 
-    log.error(f"Todas as instâncias Evolution falharam para {numero}")
-    return None
+    Deduplica, atende do cache o que já foi visto e divide o resto em lotes
+    de WA_CHECK_LOTE, com até WA_CHECK_CONCORRENCIA requisições em voo — a
+    vazão fica limitada só pelo token bucket, não pela latência serial.
+    Returns {numero: True/False/None}."""
+    resultado = {}
+    pendentes = []
+    for numero in dict.fromkeys(n for n in numeros if n):
+        encontrado, existe = wa_cache.get(numero)
+        if encontrado:
+            resultado[numero] = existe
+        else:
+            pendentes.append(numero)
+
+    if not pendentes:
+        return resultado
+
+    lotes = [pendentes[i:i + WA_CHECK_LOTE] for i in range(0, len(pendentes), WA_CHECK_LOTE)]
+    semaforo = asyncio.Semaphore(WA_CHECK_CONCORRENCIA)
+
+    async with httpx.AsyncClient(timeout=15) as client:
+        async def _rodar(lote):
+            async with semaforo:
+                return await _verificar_whatsapp_lote(lote, client)
+
+        for parcial in await asyncio.gather(*(_rodar(l) for l in lotes)):
+            for numero, existe in parcial.items():
+                wa_cache.set(numero, existe)
+                resultado[numero] = existe
+
+    return resultado
 
 
 # ============================================================
@@ -212,6 +340,57 @@ def _classificar_canais(lead: dict, wa_existe: bool = None) -> tuple:
 # VALIDAÇÃO COMPLETA DE UM LEAD
 # ============================================================
 
+def _telefone_lead(lead: dict) -> str:
+    return lead.get("telefone1") or lead.get("telefone_proprietario") or ""
+
+
+def _montar_validacao(lead: dict, wa_existe) -> dict:
+    """Classifica email e canais de um lead dado o resultado da verificação WA."""
+    email = lead.get("email") or ""
+    email_tipo = _detectar_email_contador(email) if email else None
+
+    lead["email_tipo_calc"] = email_tipo
+    canal_primario, canal_secundario = _classificar_canais(lead, wa_existe)
+
+    return {
+        "lead_id": lead["id"],
+        "email_tipo": email_tipo,
+        "wa_verificado": wa_existe is not None,
+        "wa_existe": wa_existe,
+        "canal_primario": canal_primario,
+        "canal_secundario": canal_secundario,
+    }
+
+
+def _salvar_validacoes(validacoes: list):
+    """Grava as validações num único UPDATE ... FROM (VALUES ...)."""
+    if not validacoes:
+        return
+    from psycopg2.extras import execute_values
+
+    with get_conn() as conn:
+        cur = conn.cursor()
+        execute_values(cur, """
+            UPDATE leads l SET
+                email_tipo = v.email_tipo,
+                email_validado = TRUE,
+                wa_verificado = v.wa_verificado,
+                wa_existe = v.wa_existe,
+                canal_primario = v.canal_primario,
+                canal_secundario = v.canal_secundario,
+                contato_validado_at = NOW()
+            FROM (VALUES %s) AS v (id, email_tipo, wa_verificado, wa_existe,
+                                   canal_primario, canal_secundario)
+            WHERE l.id = v.id
+        """, [
+            (v["lead_id"], v["email_tipo"], v["wa_verificado"], v["wa_existe"],
+             v["canal_primario"], v["canal_secundario"])
+            for v in validacoes
+        ], template="(%s::int, %s::text, %s::boolean, %s::boolean, %s::text, %s::text)",
+            page_size=1000)
+        conn.commit()
+
+
 def validar_contatos_lead(lead_id: int) -> dict:
     """Valida e classifica todos os canais de contato de um lead.
 
@@ -224,16 +403,10 @@ def validar_contatos_lead(lead_id: int) -> dict:
     if not lead:
         return {"erro": "Lead não encontrado"}
 
-    # Classificar email
-    email = lead.get("email") or ""
-    email_tipo = _detectar_email_contador(email) if email else None
-
     # Verificar WhatsApp (síncrono wrapper)
-    tel = lead.get("telefone1") or lead.get("telefone_proprietario") or ""
     wa_existe = None
-    if _limpar_telefone(tel):
+    if _limpar_telefone(_telefone_lead(lead)):
         try:
-            import asyncio
             try:
                 asyncio.get_running_loop()
                 # Dentro de loop async (uvicorn) — NÃO bloquear
@@ -241,45 +414,13 @@ def validar_contatos_lead(lead_id: int) -> dict:
                 wa_existe = None
             except RuntimeError:
                 # Fora de loop async — pode usar asyncio.run
-                wa_existe = asyncio.run(_verificar_whatsapp(tel))
+                wa_existe = asyncio.run(_verificar_whatsapp(_telefone_lead(lead)))
         except Exception:
             wa_existe = None
 
-    # Classificar canais
-    lead["email_tipo_calc"] = email_tipo
-    canal_primario, canal_secundario = _classificar_canais(lead, wa_existe)
-
-    # Salvar no banco
-    with get_conn() as conn:
-        cur = conn.cursor()
-        cur.execute("""
-            UPDATE leads SET
-                email_tipo = %s,
-                email_validado = TRUE,
-                wa_verificado = %s,
-                wa_existe = %s,
-                canal_primario = %s,
-                canal_secundario = %s,
-                contato_validado_at = NOW()
-            WHERE id = %s
-        """, (
-            email_tipo,
-            wa_existe is not None,
-            wa_existe,
-            canal_primario,
-            canal_secundario,
-            lead_id,
-        ))
-        conn.commit()
-
-    return {
-        "lead_id": lead_id,
-        "email_tipo": email_tipo,
-        "wa_verificado": wa_existe is not None,
-        "wa_existe": wa_existe,
-        "canal_primario": canal_primario,
-        "canal_secundario": canal_secundario,
-    }
+    validacao = _montar_validacao(lead, wa_existe)
+    _salvar_validacoes([validacao])
+    return validacao
 
 
 # ============================================================
@@ -294,61 +435,45 @@ async def verificar_whatsapp_async(telefone: str):
 async def validar_contatos_lead_async(lead_id: int) -> dict:
     """Versão async de validar_contatos_lead() — funciona dentro do uvicorn.
     Usa await direto em vez de asyncio.run()."""
-    from crm.database import obter_lead
-
-    lead = obter_lead(lead_id)
-    if not lead:
-        return {"erro": "Lead não encontrado"}
-
-    # Classificar email
-    email = lead.get("email") or ""
-    email_tipo = _detectar_email_contador(email) if email else None
+    resultados = await validar_leads_async([lead_id])
+    return resultados[0] if resultados else {"erro": "Lead não encontrado"}
 
-    # Verificar WhatsApp (async direto)
-    tel = lead.get("telefone1") or lead.get("telefone_proprietario") or ""
-    wa_existe = None
-    if _limpar_telefone(tel):
-        try:
-            wa_existe = await _verificar_whatsapp(tel)
-        except Exception as e:
-            log.warning(f"Erro WA async para lead {lead_id}: {e}")
-            wa_existe = None
 
-    # Classificar canais
-    lead["email_tipo_calc"] = email_tipo
-    canal_primario, canal_secundario = _classificar_canais(lead, wa_existe)
-
-    # Salvar no banco
+def _carregar_leads(lead_ids: list) -> list:
+    """Campos usados na classificação, para vários leads numa query."""
     with get_conn() as conn:
         cur = conn.cursor()
         cur.execute("""
-            UPDATE leads SET
-                email_tipo = %s,
-                email_validado = TRUE,
-                wa_verificado = %s,
-                wa_existe = %s,
-                canal_primario = %s,
-                canal_secundario = %s,
-                contato_validado_at = NOW()
-            WHERE id = %s
-        """, (
-            email_tipo,
-            wa_existe is not None,
-            wa_existe,
-            canal_primario,
-            canal_secundario,
-            lead_id,
-        ))
-        conn.commit()
+            SELECT id, email, telefone1, telefone_proprietario, email_invalido
+            FROM leads
+            WHERE id = ANY(%s)
+        """, (list(lead_ids),))
+        por_id = {r["id"]: dict(r) for r in cur.fetchall()}
+    return [por_id[i] for i in lead_ids if i in por_id]
 
-    return {
-        "lead_id": lead_id,
-        "email_tipo": email_tipo,
-        "wa_verificado": wa_existe is not None,
-        "wa_existe": wa_existe,
-        "canal_primario": canal_primario,
-        "canal_secundario": canal_secundario,
-    }
+
+async def validar_leads_async(lead_ids: list) -> list:
+    """Pipeline de validação em lote.
+
+    1 query para carregar os leads, verificação WA deduplicada/cacheada em
+    lotes concorrentes sob o rate limit, 1 UPDATE para gravar tudo.
+    Returns lista de validações (mesmo formato de validar_contatos_lead),
+    na ordem de lead_ids; ids inexistentes são omitidos."""
+    if not lead_ids:
+        return []
+
+    leads = await asyncio.to_thread(_carregar_leads, lead_ids)
+    numeros = {lead["id"]: _limpar_telefone(_telefone_lead(lead)) for lead in leads}
+
+    try:
+        wa = await verificar_whatsapp_numeros(list(numeros.values()))
+    except Exception as e:
+        log.warning(f"Erro WA em lote ({len(leads)} leads): {e}")
+        wa = {}
+
+    validacoes = [_montar_validacao(lead, wa.get(numeros[lead["id"]])) for lead in leads]
+    await asyncio.to_thread(_salvar_validacoes, validacoes)
+    return validacoes
 
 
 # ============================================================
@@ -384,41 +509,43 @@ def validar_lote(cidade: str = None, uf: str = None, limite: int = 500) -> dict:
         where_clause = " AND ".join(where)
 
         cur.execute(f"""
-            SELECT id, email, telefone1, telefone_proprietario, email_invalido
+            SELECT id
             FROM leads
             WHERE {where_clause}
             ORDER BY lead_score DESC
             LIMIT %s
         """, params)
-        leads = cur.fetchall()
-
-    stats["total"] = len(leads)
-    log.info(f"Validando {len(leads)} leads {f'de {cidade}/{uf}' if cidade else ''}...")
-
-    for lead in leads:
-        try:
-            result = validar_contatos_lead(lead["id"])
-            stats["validados"] += 1
-
-            et = result.get("email_tipo")
-            if et == "proprietario":
-                stats["email_proprietario"] += 1
-            elif et == "contador":
-                stats["email_contador"] += 1
-            elif et == "generico":
-                stats["email_generico"] += 1
-
-            wa = result.get("wa_existe")
-            if wa is True:
-                stats["wa_existe"] += 1
-            elif wa is False:
-                stats["wa_nao_existe"] += 1
-            else:
-                stats["wa_nao_verificado"] += 1
-
-        except Exception as e:
-            stats["erros"] += 1
-            log.warning(f"Erro validando lead {lead['id']}: {e}")
+        lead_ids = [r["id"] for r in cur.fetchall()]
+
+    stats["total"] = len(lead_ids)
+    log.info(f"Validando {len(lead_ids)} leads {f'de {cidade}/{uf}' if cidade else ''}...")
+
+    try:
+        validacoes = asyncio.run(validar_leads_async(lead_ids))
+    except Exception as e:
+        stats["erros"] = len(lead_ids)
+        log.warning(f"Erro validando lote: {e}")
+        return stats
+
+    stats["erros"] = len(lead_ids) - len(validacoes)
+    for result in validacoes:
+        stats["validados"] += 1
+
+        et = result.get("email_tipo")
+        if et == "proprietario":
+            stats["email_proprietario"] += 1
+        elif et == "contador":
+            stats["email_contador"] += 1
+        elif et == "generico":
+            stats["email_generico"] += 1
+
+        wa = result.get("wa_existe")
+        if wa is True:
+            stats["wa_existe"] += 1
+        elif wa is False:
+            stats["wa_nao_existe"] += 1
+        else:
+            stats["wa_nao_verificado"] += 1
 
     log.info(f"Validação concluída: {stats}")
     return stats
@@ -2,10 +2,14 @@
 database.py - Conexão PostgreSQL + queries do CRM Derekh
 Usa pool de conexões psycopg2. DATABASE_URL via env var.
 """
+import asyncio
 import json
 import os
 import re
+import time
 import logging
+import threading
+from contextvars import ContextVar
 from datetime import date, datetime
 from typing import Optional
 from contextlib import contextmanager
@@ -14,29 +18,263 @@ log = logging.getLogger("database")
 
 import psycopg2
 from psycopg2.extras import RealDictCursor
-from psycopg2 import pool
+from psycopg2 import extensions
 
 DATABASE_URL = os.environ.get("DATABASE_URL", "")
 
+# Pool — o Fly.io (flycast) derruba conexões ociosas, por isso:
+#   keepalives TCP, reciclagem por ociosidade e validação (SELECT 1) no checkout
+POOL_MAX_CONN = int(os.environ.get("CRM_POOL_MAX_CONN", "10"))
+POOL_MAX_IDLE_SECONDS = int(os.environ.get("CRM_POOL_MAX_IDLE_SECONDS", "240"))
+POOL_MAX_LIFETIME_SECONDS = int(os.environ.get("CRM_POOL_MAX_LIFETIME_SECONDS", "1800"))
+POOL_VALIDAR_APOS_SECONDS = int(os.environ.get("CRM_POOL_VALIDAR_APOS_SECONDS", "10"))
+POOL_CHECKOUT_TIMEOUT_SECONDS = int(os.environ.get("CRM_POOL_CHECKOUT_TIMEOUT_SECONDS", "30"))
+# Checkout na thread do event loop (handler async chamando o banco direto):
+# esperar ali congela todas as requests, então falha rápido (→ 503)
+POOL_CHECKOUT_TIMEOUT_LOOP_SECONDS = float(os.environ.get("CRM_POOL_CHECKOUT_TIMEOUT_LOOP_SECONDS", "0"))
+
+KEEPALIVE_KWARGS = {
+    "keepalives": 1,
+    "keepalives_idle": 30,
+    "keepalives_interval": 10,
+    "keepalives_count": 3,
+    "connect_timeout": 10,
+}
+
+# Erros que indicam conexão morta — descartar em vez de devolver ao pool
+_ERROS_CONEXAO = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+
+class PoolEsgotado(Exception):
+    """Nenhuma conexão livre dentro do timeout de checkout."""
+
+
+def _no_event_loop() -> bool:
+    """True se a thread atual está rodando um event loop asyncio."""
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
 
-def init_pool(min_conn: int = 1, max_conn: int = 5):
-    """Compatibilidade — no-op. Conexões são criadas por request."""
-    pass
+class PoolConexoes:
+    """
+    Pool thread-safe de conexões psycopg2 com checagem de vida.
+
+    - Ociosa há mais de max_idle ou viva há mais de max_lifetime → fechada.
+    - Ociosa há mais de validar_apos → SELECT 1 antes de entregar.
+    - Devolvida com transação aberta → rollback (mesma semântica do
+      close() da conexão-por-request: o que não foi commitado é descartado).
+    - Pool cheio: espera até checkout_timeout numa thread comum; na thread do
+      event loop espera no máximo checkout_timeout_loop (padrão 0: falha já).
+    """
+
+    def __init__(self, conectar, min_conn: int = 1, max_conn: int = POOL_MAX_CONN,
+                 max_idle_seconds: int = POOL_MAX_IDLE_SECONDS,
+                 max_lifetime_seconds: int = POOL_MAX_LIFETIME_SECONDS,
+                 validar_apos_seconds: int = POOL_VALIDAR_APOS_SECONDS,
+                 checkout_timeout_seconds: int = POOL_CHECKOUT_TIMEOUT_SECONDS,
+                 checkout_timeout_loop_seconds: float = POOL_CHECKOUT_TIMEOUT_LOOP_SECONDS):
+        self._conectar = conectar
+        self.min_conn = min_conn
+        self.max_conn = max_conn
+        self.max_idle_seconds = max_idle_seconds
+        self.max_lifetime_seconds = max_lifetime_seconds
+        self.validar_apos_seconds = validar_apos_seconds
+        self.checkout_timeout_seconds = checkout_timeout_seconds
+        self.checkout_timeout_loop_seconds = checkout_timeout_loop_seconds
+        self._cond = threading.Condition()
+        self._livres = []    # [(conn, ultimo_uso, criada_em)] — LIFO: a mais quente sai primeiro
+        self._criada_em = {}  # id(conn) → timestamp
+        self._total = 0
+        self._fechado = False
+        self.stats = {"criadas": 0, "reusadas": 0, "descartadas": 0, "validacoes_falhas": 0}
+
+    def _nova(self):
+        conn = self._conectar()
+        self._criada_em[id(conn)] = time.monotonic()
+        self.stats["criadas"] += 1
+        return conn
+
+    def _fechar(self, conn):
+        self._criada_em.pop(id(conn), None)
+        self.stats["descartadas"] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _valida(self, conn) -> bool:
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.fetchall()
+            conn.rollback()
+            return True
+        except Exception:
+            self.stats["validacoes_falhas"] += 1
+            return False
+
+    def getconn(self):
+        timeout = self.checkout_timeout_seconds
+        if _no_event_loop():
+            timeout = min(timeout, self.checkout_timeout_loop_seconds)
+        prazo = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if self._fechado:
+                    raise PoolEsgotado("Pool fechado")
+                while self._livres:
+                    conn, ultimo_uso, criada_em = self._livres.pop()
+                    agora = time.monotonic()
+                    if (conn.closed or agora - ultimo_uso > self.max_idle_seconds
+                            or agora - criada_em > self.max_lifetime_seconds):
+                        self._total -= 1
+                        self._fechar(conn)
+                        continue
+                    if agora - ultimo_uso > self.validar_apos_seconds and not self._valida(conn):
+                        self._total -= 1
+                        self._fechar(conn)
+                        continue
+                    self.stats["reusadas"] += 1
+                    return conn
+                if self._total < self.max_conn:
+                    self._total += 1
+                    break
+                restante = prazo - time.monotonic()
+                if restante <= 0:
+                    raise PoolEsgotado(f"Pool CRM esgotado ({self.max_conn} conexões em uso)")
+                self._cond.wait(restante)
+
+        # Conecta fora do lock (handshake TCP+auth é o custo que o pool evita)
+        try:
+            return self._nova()
+        except Exception:
+            with self._cond:
+                self._total -= 1
+                self._cond.notify()
+            raise
+
+    def putconn(self, conn, descartar: bool = False):
+        if not descartar and not conn.closed:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                descartar = True
+        with self._cond:
+            if descartar or conn.closed or self._fechado:
+                self._total -= 1
+                self._fechar(conn)
+            else:
+                self._livres.append((conn, time.monotonic(), self._criada_em.get(id(conn), 0.0)))
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            self._fechado = True
+            for conn, _, _ in self._livres:
+                self._total -= 1
+                self._fechar(conn)
+            self._livres = []
+            self._cond.notify_all()
+
+    def tamanho(self) -> dict:
+        with self._cond:
+            return {"total": self._total, "livres": len(self._livres), "max": self.max_conn}
+
+
+_pool: Optional[PoolConexoes] = None
+_pool_lock = threading.Lock()
+
+# Conexão do lote corrente (conexao_compartilhada) — get_conn reusa
+_conn_lote: ContextVar = ContextVar("crm_conn_lote", default=None)
+
+
+def _conectar():
+    return psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor, **KEEPALIVE_KWARGS)
+
+
+def init_pool(min_conn: int = 1, max_conn: int = POOL_MAX_CONN):
+    """Cria o pool (idempotente) e aquece min_conn conexões."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            return
+        _pool = PoolConexoes(_conectar, min_conn=min_conn, max_conn=max_conn)
+    try:
+        aquecidas = [_pool.getconn() for _ in range(min_conn)]
+        for conn in aquecidas:
+            _pool.putconn(conn)
+    except Exception as e:
+        log.warning(f"[CRM] Pool sem aquecimento: {e}")
 
 
 def close_pool():
-    """Compatibilidade — no-op."""
-    pass
+    """Fecha todas as conexões ociosas do pool."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+
+def _get_pool() -> PoolConexoes:
+    if _pool is None:
+        init_pool(min_conn=0)
+    return _pool
 
 
 @contextmanager
 def get_conn():
-    """Cria conexão nova por request (Fly.io flycast mata idle connections)."""
-    conn = psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
+    """
+    Conexão do pool (ou a do lote corrente, ver conexao_compartilhada).
+    Conexão com erro de rede é descartada; transação não commitada sofre rollback.
+    """
+    conn = _conn_lote.get()
+    if conn is not None:
+        try:
+            yield conn
+        except Exception:
+            # Transação abortada não pode envenenar as próximas queries do lote
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            raise
+        return
+
+    pool = _get_pool()
+    conn = pool.getconn()
+    descartar = False
     try:
         yield conn
+    except _ERROS_CONEXAO:
+        descartar = True
+        raise
     finally:
-        conn.close()
+        pool.putconn(conn, descartar=descartar or conn.closed != 0)
+
+
+@contextmanager
+def conexao_compartilhada():
+    """
+    Várias funções de query numa única conexão (ex: render do dashboard).
+
+        with conexao_compartilhada():
+            kpis = kpis_dashboard()
+            funil = funil_pipeline()
+    """
+    if _conn_lote.get() is not None:
+        yield _conn_lote.get()
+        return
+    with get_conn() as conn:
+        token = _conn_lote.set(conn)
+        try:
+            yield conn
+        finally:
+            _conn_lote.reset(token)
 
 
 def init_schema():
@@ -262,142 +500,279 @@ def cidades_escaneadas_ifood() -> list:
 # FUNÇÕES BUSCA
 # ============================================================
 
-def buscar_leads(filtros: dict, pagina: int = 1, por_pagina: int = 50) -> tuple:
-    """Busca leads com filtros e paginação server-side.
-    Retorna (lista_leads, total_count)."""
+# Busca: expressão indexada (idx_leads_busca_fts / idx_leads_busca_trgm) e
+# ordem da paginação keyset (idx_leads_busca_ordem) — manter iguais ao schema.sql
+_BUSCA_EXPR = "(crm_normalizar(l.razao_social) || ' ' || crm_normalizar(l.nome_fantasia))"
+_BUSCA_ORDEM = "-coalesce(l.lead_score, 0), coalesce(l.razao_social, ''), l.id"
+_BUSCA_COLUNAS = """
+    l.id, l.cnpj, l.razao_social, l.nome_fantasia,
+    l.cidade, l.uf, l.lead_score, l.segmento,
+    l.status_pipeline, l.telefone1, l.email,
+    l.tem_ifood, l.tem_rappi, l.tem_99food,
+    l.capital_social, l.data_abertura,
+    l.rating, l.website, l.data_ultimo_contato,
+    l.ifood_rating, l.ifood_reviews, l.ifood_preco,
+    l.ifood_categorias, l.ifood_tempo_entrega, l.ifood_aberto
+"""
+# Até este tamanho (estimado pelo planner) o total é contado de verdade
+BUSCA_CONTAGEM_EXATA_ATE = int(os.environ.get("CRM_BUSCA_CONTAGEM_EXATA_ATE", "5000"))
+
+_busca_trgm: Optional[bool] = None
+
+
+def normalizar_busca(texto: str) -> str:
+    """Minúsculas sem acento — mesmo resultado do crm_normalizar() do schema."""
+    import unicodedata
+    decomposto = unicodedata.normalize("NFKD", texto or "")
+    return "".join(c for c in decomposto if not unicodedata.combining(c)).lower()
+
+
+def _tem_trgm(cur) -> bool:
+    """pg_trgm instalado? (verificado uma vez por processo)."""
+    global _busca_trgm
+    if _busca_trgm is None:
+        cur.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        _busca_trgm = cur.fetchone() is not None
+    return _busca_trgm
+
+
+def _where_busca(cur, filtros: dict) -> tuple:
+    """Monta (where_clause, params) dos filtros da tela de busca."""
+    where = ["1=1"]
+    params = []
+
+    if filtros.get("uf"):
+        params.append(filtros["uf"].upper())
+        where.append(f"l.uf = %s")
+
+    if filtros.get("cidade"):
+        params.append(filtros["cidade"].upper())
+        where.append(f"l.cidade = %s")
+
+    if filtros.get("segmento"):
+        params.append(filtros["segmento"])
+        where.append(f"l.segmento = %s")
+
+    if filtros.get("status_pipeline"):
+        params.append(filtros["status_pipeline"])
+        where.append(f"l.status_pipeline = %s")
+
+    if filtros.get("score_min"):
+        params.append(int(filtros["score_min"]))
+        where.append(f"l.lead_score >= %s")
+
+    if filtros.get("score_max"):
+        params.append(int(filtros["score_max"]))
+        where.append(f"l.lead_score <= %s")
+
+    if filtros.get("tem_ifood") == "sim":
+        where.append("l.tem_ifood = 1")
+    elif filtros.get("tem_ifood") == "nao":
+        where.append("(l.tem_ifood = 0 OR l.tem_ifood IS NULL)")
+
+    if filtros.get("tem_rappi") == "sim":
+        where.append("l.tem_rappi = 1")
+    elif filtros.get("tem_rappi") == "nao":
+        where.append("(l.tem_rappi = 0 OR l.tem_rappi IS NULL)")
+
+    if filtros.get("tem_99food") == "sim":
+        where.append("l.tem_99food = 1")
+    elif filtros.get("tem_99food") == "nao":
+        where.append("(l.tem_99food = 0 OR l.tem_99food IS NULL)")
+
+    if filtros.get("eh_rede") == "sim":
+        where.append("l.multi_restaurante = 1")
+
+    # Filtros iFood enriquecidos
+    if filtros.get("ifood_rating_min"):
+        params.append(float(filtros["ifood_rating_min"]))
+        where.append("l.ifood_rating >= %s")
+
+    if filtros.get("ifood_preco"):
+        precos = filtros["ifood_preco"] if isinstance(filtros["ifood_preco"], list) else [filtros["ifood_preco"]]
+        placeholders = ", ".join(["%s"] * len(precos))
+        params.extend(precos)
+        where.append(f"l.ifood_preco IN ({placeholders})")
+
+    if filtros.get("ifood_categorias"):
+        params.append(f"%{filtros['ifood_categorias']}%")
+        where.append("l.ifood_categorias ILIKE %s")
+
+    if filtros.get("ifood_aberto") == "sim":
+        where.append("l.ifood_aberto = 1 AND l.tem_ifood = 1")
+    elif filtros.get("ifood_aberto") == "fechado":
+        where.append("l.ifood_aberto = 0 AND l.tem_ifood = 1")
+
+    q = (filtros.get("q") or "").strip()
+    if q:
+        trgm = _tem_trgm(cur)
+        digitos = re.sub(r"\D", "", q)
+        if len(digitos) >= 3 and re.fullmatch(r"[\d./\-\s]+", q):
+            # CNPJ: substring com trigram, senão prefixo (text_pattern_ops)
+            params.append(f"%{digitos}%" if trgm else f"{digitos}%")
+            where.append("l.cnpj LIKE %s")
+        elif trgm:
+            params.append(f"%{normalizar_busca(q)}%")
+            where.append(f"{_BUSCA_EXPR} LIKE %s")
+        else:
+            termos = re.findall(r"\w+", normalizar_busca(q))
+            if termos:
+                params.append(" & ".join(f"{t}:*" for t in termos))
+                where.append(f"to_tsvector('simple', {_BUSCA_EXPR}) @@ to_tsquery('simple', %s)")
+
+    return " AND ".join(where), params
+
+
+def _contar_busca(cur, where_clause: str, params: list, exata: bool) -> tuple:
+    """(total, exato). Conjuntos grandes usam a estimativa do planner —
+    COUNT(*) em 500k linhas a cada tecla é o que deixava a busca lenta."""
+    if not exata:
+        cur.execute(f"EXPLAIN (FORMAT JSON) SELECT 1 FROM leads l WHERE {where_clause}", params)
+        plano = cur.fetchone()["QUERY PLAN"]
+        if isinstance(plano, str):
+            plano = json.loads(plano)
+        estimado = int(plano[0]["Plan"]["Plan Rows"])
+        if estimado > BUSCA_CONTAGEM_EXATA_ATE:
+            return estimado, False
+
+    cur.execute(f"SELECT COUNT(*) as c FROM leads l WHERE {where_clause}", params)
+    return cur.fetchone()["c"], True
+
+
+def _cursor_busca(lead: dict) -> str:
+    import base64
+    chave = [lead.get("lead_score") or 0, lead.get("razao_social") or "", lead["id"]]
+    return base64.urlsafe_b64encode(json.dumps(chave).encode()).decode().rstrip("=")
+
+
+def _ler_cursor_busca(token: str) -> Optional[list]:
+    import base64
+    try:
+        score, razao, lead_id = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        return [-int(score), str(razao), int(lead_id)]
+    except Exception:
+        return None
+
+
+def buscar_leads_keyset(filtros: dict, apos: str = None, por_pagina: int = 50,
+                        contagem_exata: bool = False) -> dict:
+    """Busca leads com paginação keyset sobre (lead_score DESC, razao_social, id).
+
+    apos: cursor opaco devolvido em "proximo" da página anterior.
+    Retorna {"leads", "total", "total_exato", "proximo"}; total é estimado
+    para conjuntos grandes, a menos que contagem_exata=True."""
     with get_conn() as conn:
         cur = conn.cursor()
-        where = ["1=1"]
-        params = []
+        where_clause, params = _where_busca(cur, filtros)
+        total, exato = _contar_busca(cur, where_clause, params, contagem_exata)
 
-        if filtros.get("uf"):
-            params.append(filtros["uf"].upper())
-            where.append(f"l.uf = %s")
-
-        if filtros.get("cidade"):
-            params.append(filtros["cidade"].upper())
-            where.append(f"l.cidade = %s")
-
-        if filtros.get("segmento"):
-            params.append(filtros["segmento"])
-            where.append(f"l.segmento = %s")
-
-        if filtros.get("status_pipeline"):
-            params.append(filtros["status_pipeline"])
-            where.append(f"l.status_pipeline = %s")
-
-        if filtros.get("score_min"):
-            params.append(int(filtros["score_min"]))
-            where.append(f"l.lead_score >= %s")
-
-        if filtros.get("score_max"):
-            params.append(int(filtros["score_max"]))
-            where.append(f"l.lead_score <= %s")
-
-        if filtros.get("tem_ifood") == "sim":
-            where.append("l.tem_ifood = 1")
-        elif filtros.get("tem_ifood") == "nao":
-            where.append("(l.tem_ifood = 0 OR l.tem_ifood IS NULL)")
-
-        if filtros.get("tem_rappi") == "sim":
-            where.append("l.tem_rappi = 1")
-        elif filtros.get("tem_rappi") == "nao":
-            where.append("(l.tem_rappi = 0 OR l.tem_rappi IS NULL)")
-
-        if filtros.get("tem_99food") == "sim":
-            where.append("l.tem_99food = 1")
-        elif filtros.get("tem_99food") == "nao":
-            where.append("(l.tem_99food = 0 OR l.tem_99food IS NULL)")
-
-        if filtros.get("eh_rede") == "sim":
-            where.append("l.multi_restaurante = 1")
-
-        # Filtros iFood enriquecidos
-        if filtros.get("ifood_rating_min"):
-            params.append(float(filtros["ifood_rating_min"]))
-            where.append("l.ifood_rating >= %s")
-
-        if filtros.get("ifood_preco"):
-            precos = filtros["ifood_preco"] if isinstance(filtros["ifood_preco"], list) else [filtros["ifood_preco"]]
-            placeholders = ", ".join(["%s"] * len(precos))
-            params.extend(precos)
-            where.append(f"l.ifood_preco IN ({placeholders})")
-
-        if filtros.get("ifood_categorias"):
-            params.append(f"%{filtros['ifood_categorias']}%")
-            where.append("l.ifood_categorias ILIKE %s")
-
-        if filtros.get("ifood_aberto") == "sim":
-            where.append("l.ifood_aberto = 1 AND l.tem_ifood = 1")
-        elif filtros.get("ifood_aberto") == "fechado":
-            where.append("l.ifood_aberto = 0 AND l.tem_ifood = 1")
-
-        if filtros.get("q"):
-            termo = f"%{filtros['q']}%"
-            params.extend([termo, termo, termo])
-            where.append("(l.razao_social ILIKE %s OR l.nome_fantasia ILIKE %s OR l.cnpj LIKE %s)")
+        chave = _ler_cursor_busca(apos) if apos else None
+        if chave:
+            where_clause += f" AND ({_BUSCA_ORDEM}) > (%s, %s, %s)"
+            params = params + chave
 
-        where_clause = " AND ".join(where)
+        cur.execute(f"""
+            SELECT {_BUSCA_COLUNAS}
+            FROM leads l
+            WHERE {where_clause}
+            ORDER BY {_BUSCA_ORDEM}
+            LIMIT %s
+        """, params + [por_pagina + 1])
+        leads = [dict(r) for r in cur.fetchall()]
 
-        # Count total
-        cur.execute(f"SELECT COUNT(*) as c FROM leads l WHERE {where_clause}", params)
-        total = cur.fetchone()["c"]
+    proximo = None
+    if len(leads) > por_pagina:
+        leads = leads[:por_pagina]
+        proximo = _cursor_busca(leads[-1])
+    return {"leads": leads, "total": total, "total_exato": exato, "proximo": proximo}
+
+
+def buscar_leads(filtros: dict, pagina: int = 1, por_pagina: int = 50) -> tuple:
+    """Busca leads com filtros e paginação server-side.
+    Retorna (lista_leads, total_count).
+    Compatibilidade com links por número de página — navegação sequencial
+    deve usar buscar_leads_keyset (sem OFFSET)."""
+    if pagina <= 1:
+        r = buscar_leads_keyset(filtros, por_pagina=por_pagina)
+        return r["leads"], r["total"]
+
+    with get_conn() as conn:
+        cur = conn.cursor()
+        where_clause, params = _where_busca(cur, filtros)
+        total, _ = _contar_busca(cur, where_clause, params, False)
 
-        # Busca com paginação
         offset = (pagina - 1) * por_pagina
-        params.extend([por_pagina, offset])
         cur.execute(f"""
-            SELECT l.id, l.cnpj, l.razao_social, l.nome_fantasia,
-                   l.cidade, l.uf, l.lead_score, l.segmento,
-                   l.status_pipeline, l.telefone1, l.email,
-                   l.tem_ifood, l.tem_rappi, l.tem_99food,
-                   l.capital_social, l.data_abertura,
-                   l.rating, l.website, l.data_ultimo_contato,
-                   l.ifood_rating, l.ifood_reviews, l.ifood_preco,
-                   l.ifood_categorias, l.ifood_tempo_entrega, l.ifood_aberto
+            SELECT {_BUSCA_COLUNAS}
             FROM leads l
             WHERE {where_clause}
-            ORDER BY l.lead_score DESC, l.razao_social ASC
+            ORDER BY {_BUSCA_ORDEM}
             LIMIT %s OFFSET %s
-        """, params)
+        """, params + [por_pagina, offset])
 
         return [dict(r) for r in cur.fetchall()], total
 
 
-def listar_ufs_disponiveis() -> list:
-    """UFs distintas presentes no banco."""
-    with get_conn() as conn:
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT DISTINCT uf FROM leads
-            WHERE uf IS NOT NULL AND uf != ''
-            ORDER BY uf
-        """)
-        return [r["uf"] for r in cur.fetchall()]
+# Facetas da busca (UFs/cidades) mudam só com importação de leads
+FACETAS_TTL_SECONDS = int(os.environ.get("CRM_FACETAS_TTL_SECONDS", "600"))
+_facetas_cache: dict = {}
+_facetas_lock = threading.Lock()
 
 
-def listar_cidades_disponiveis(uf: str = None) -> list:
-    """Cidades disponíveis, opcionalmente filtradas por UF."""
-    with get_conn() as conn:
-        cur = conn.cursor()
-        if uf:
-            cur.execute("""
-                SELECT cidade, uf, COUNT(*) as total
-                FROM leads
-                WHERE uf = %s AND cidade IS NOT NULL AND cidade != ''
-                GROUP BY cidade, uf
-                ORDER BY total DESC
-            """, (uf.upper(),))
-        else:
+def _faceta(chave: tuple, carregar):
+    item = _facetas_cache.get(chave)
+    if item and time.monotonic() - item[1] < FACETAS_TTL_SECONDS:
+        return item[0]
+    valor = carregar()
+    with _facetas_lock:
+        _facetas_cache[chave] = (valor, time.monotonic())
+    return valor
+
+
+def invalidar_facetas():
+    """Descarta o cache de UFs/cidades (chamar após importar leads)."""
+    with _facetas_lock:
+        _facetas_cache.clear()
+
+
+def listar_ufs_disponiveis() -> list:
+    """UFs distintas presentes no banco (cache FACETAS_TTL_SECONDS)."""
+    def carregar():
+        with get_conn() as conn:
+            cur = conn.cursor()
             cur.execute("""
-                SELECT cidade, uf, COUNT(*) as total
-                FROM leads
-                WHERE cidade IS NOT NULL AND cidade != ''
-                GROUP BY cidade, uf
-                ORDER BY total DESC
-                LIMIT 100
+                SELECT DISTINCT uf FROM leads
+                WHERE uf IS NOT NULL AND uf != ''
+                ORDER BY uf
             """)
-        return [dict(r) for r in cur.fetchall()]
+            return [r["uf"] for r in cur.fetchall()]
+    return list(_faceta(("ufs",), carregar))
+
+
+def listar_cidades_disponiveis(uf: str = None) -> list:
+    """Cidades disponíveis, opcionalmente filtradas por UF (cache FACETAS_TTL_SECONDS)."""
+    def carregar():
+        with get_conn() as conn:
+            cur = conn.cursor()
+            if uf:
+                cur.execute("""
+                    SELECT cidade, uf, COUNT(*) as total
+                    FROM leads
+                    WHERE uf = %s AND cidade IS NOT NULL AND cidade != ''
+                    GROUP BY cidade, uf
+                    ORDER BY total DESC
+                """, (uf.upper(),))
+            else:
+                cur.execute("""
+                    SELECT cidade, uf, COUNT(*) as total
+                    FROM leads
+                    WHERE cidade IS NOT NULL AND cidade != ''
+                    GROUP BY cidade, uf
+                    ORDER BY total DESC
+                    LIMIT 100
+                """)
+            return [dict(r) for r in cur.fetchall()]
+    return [dict(c) for c in _faceta(("cidades", (uf or "").upper()), carregar)]
 
 
 # ============================================================
@@ -528,33 +903,79 @@ def contagem_pipeline() -> dict:
 # EXPORT
 # ============================================================
 
+# Colunas da exportação CSV (ordem do arquivo)
+COLUNAS_EXPORT = [
+    "id", "cnpj", "razao_social", "nome_fantasia", "cidade", "uf", "bairro",
+    "telefone1", "telefone_proprietario", "email", "segmento", "tier",
+    "lead_score", "status_pipeline", "tem_ifood", "tem_rappi", "tem_99food",
+]
+
+
+def iterar_leads_para_export(filtros: dict, colunas: list = None,
+                             tamanho_lote: int = 2000):
+    """Gera leads para exportação/campanha sem materializar o resultado.
+
+    Cursor nomeado (server-side): o Postgres entrega tamanho_lote linhas por
+    round-trip e a memória fica constante em 500k leads. A conexão fica
+    presa ao gerador até ele terminar (ou ser fechado)."""
+    where = ["1=1"]
+    params = []
+
+    if filtros.get("uf"):
+        params.append(filtros["uf"].upper())
+        where.append("uf = %s")
+    if filtros.get("cidade"):
+        params.append(filtros["cidade"].upper())
+        where.append("cidade = %s")
+    if filtros.get("segmento"):
+        params.append(filtros["segmento"])
+        where.append("segmento = %s")
+    if filtros.get("status_pipeline"):
+        params.append(filtros["status_pipeline"])
+        where.append("status_pipeline = %s")
+
+    where_clause = " AND ".join(where)
+    select = ", ".join(colunas) if colunas else "*"
+
+    with get_conn() as conn:
+        cur = conn.cursor(name=f"export_leads_{id(conn)}_{time.monotonic_ns()}")
+        cur.itersize = tamanho_lote
+        try:
+            cur.execute(f"""
+                SELECT {select} FROM leads
+                WHERE {where_clause}
+                ORDER BY lead_score DESC
+            """, params)
+            for r in cur:
+                yield dict(r)
+        finally:
+            cur.close()
+
+
 def buscar_leads_para_export(filtros: dict) -> list:
     """Busca leads para exportação (sem paginação)."""
-    with get_conn() as conn:
-        cur = conn.cursor()
-        where = ["1=1"]
-        params = []
+    return list(iterar_leads_para_export(filtros))
 
-        if filtros.get("uf"):
-            params.append(filtros["uf"].upper())
-            where.append("uf = %s")
-        if filtros.get("cidade"):
-            params.append(filtros["cidade"].upper())
-            where.append("cidade = %s")
-        if filtros.get("segmento"):
-            params.append(filtros["segmento"])
-            where.append("segmento = %s")
-        if filtros.get("status_pipeline"):
-            params.append(filtros["status_pipeline"])
-            where.append("status_pipeline = %s")
 
-        where_clause = " AND ".join(where)
-        cur.execute(f"""
-            SELECT * FROM leads
-            WHERE {where_clause}
-            ORDER BY lead_score DESC
-        """, params)
-        return [dict(r) for r in cur.fetchall()]
+def gerar_csv_leads(filtros: dict, colunas: list = None, linhas_por_bloco: int = 500):
+    """CSV da exportação escrito incrementalmente (blocos de texto).
+    Para StreamingResponse — nunca monta o arquivo inteiro em memória."""
+    import csv
+    import io
+
+    colunas = colunas or COLUNAS_EXPORT
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(colunas)
+
+    for i, lead in enumerate(iterar_leads_para_export(filtros, colunas), 1):
+        writer.writerow(["" if lead[c] is None else lead[c] for c in colunas])
+        if i % linhas_por_bloco == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+
+    yield buf.getvalue()
 
 
 # ============================================================
@@ -898,6 +1319,46 @@ def criar_email_enviado(lead_id: int, template_id: int, assunto: str,
         return new_id
 
 
+def registrar_emails_enviados_lote(envios: list, campanha_id: int = None):
+    """Grava um lote de envios de campanha numa transação: emails_enviados,
+    interacoes e data_ultimo_contato via execute_values + contador da campanha.
+
+    envios: dicts com lead_id, template_id, assunto, tracking_id, pixel_url,
+    resend_message_id."""
+    if not envios:
+        return
+    from psycopg2.extras import execute_values
+
+    with get_conn() as conn:
+        cur = conn.cursor()
+        execute_values(cur, """
+            INSERT INTO emails_enviados
+                (lead_id, template_id, assunto, tracking_id, pixel_url,
+                 resend_message_id, campanha_id, horario_enviado)
+            VALUES %s
+        """, [
+            (e["lead_id"], e["template_id"], e["assunto"], e["tracking_id"],
+             e["pixel_url"], e["resend_message_id"], campanha_id)
+            for e in envios
+        ], template="(%s, %s, %s, %s, %s, %s, %s, NOW())", page_size=500)
+        execute_values(cur, """
+            INSERT INTO interacoes (lead_id, tipo, canal, conteudo, resultado, email_message_id)
+            VALUES %s
+        """, [
+            (e["lead_id"], "email", "email", f"Assunto: {e['assunto']}", "enviado",
+             e["resend_message_id"])
+            for e in envios
+        ], page_size=500)
+        cur.execute("""
+            UPDATE leads SET data_ultimo_contato = NOW() WHERE id = ANY(%s)
+        """, ([e["lead_id"] for e in envios],))
+        if campanha_id:
+            cur.execute("""
+                UPDATE campanhas_email SET total_enviados = total_enviados + %s WHERE id = %s
+            """, (len(envios), campanha_id))
+        conn.commit()
+
+
 def marcar_email_aberto(tracking_id: str) -> bool:
     """Marca email como aberto. Incrementa contador. Retorna True se encontrado."""
     with get_conn() as conn:
@@ -3328,6 +3789,8 @@ def upsert_leads_batch(leads_data: list, source: str = "sync_api") -> dict:
 
         conn.commit()
 
+    if stats["inseridos"]:
+        invalidar_facetas()
     return stats
 
 
@@ -5,9 +5,9 @@ Tracking: pixel de abertura + link tracking + unsubscribe
 """
 import os
 import json
-import time
 import re
 import uuid
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from typing import Optional
 
 import resend
@@ -15,13 +15,14 @@ import resend
 from crm.database import (
     obter_lead, obter_email_template, registrar_interacao,
     atualizar_campanha_contadores, atualizar_status_campanha,
-    buscar_leads_para_export, marcar_email_invalido,
+    iterar_leads_para_export, marcar_email_invalido,
     buscar_interacao_por_email_id,
     obter_configuracao, cidade_tem_delivery_verificado,
     criar_email_enviado, marcar_email_aberto, marcar_email_clique,
     marcar_email_bounce, buscar_email_por_resend_id,
-    emails_enviados_hoje, opt_out_lead,
+    emails_enviados_hoje, opt_out_lead, registrar_emails_enviados_lote,
 )
+from crm.rate_limit import BucketTokens
 from crm.scoring import personalizar_abordagem
 from crm.competitor_service import dados_mercado_cidade, concorrentes_bairro
 
@@ -31,6 +32,10 @@ FROM_EMAIL = os.environ.get("FROM_EMAIL", "contato@derekhfood.com.br")
 FROM_NAME = os.environ.get("FROM_NAME", "Ana | Derekh Food")
 BASE_URL = os.environ.get("CRM_BASE_URL", "http://localhost:8000")
 
+# Campanha: envios simultâneos (render + Resend) e tamanho do lote de tracking
+CAMPANHA_CONCORRENCIA = int(os.environ.get("CAMPANHA_CONCORRENCIA", "4"))
+CAMPANHA_LOTE_GRAVACAO = int(os.environ.get("CAMPANHA_LOTE_GRAVACAO", "200"))
+
 
 def _html_para_texto(html: str) -> str:
     """Converte HTML para plain text para multipart email (melhora deliverability)."""
@@ -55,9 +60,13 @@ def _html_para_texto(html: str) -> str:
 # VARIÁVEIS DE TEMPLATE
 # ============================================================
 
-def _extrair_variaveis(lead: dict) -> dict:
+def _extrair_variaveis(lead: dict, cache: dict = None) -> dict:
     """Extrai variáveis disponíveis para substituição em templates.
-    Inclui dados de mercado e concorrentes para personalização."""
+    Inclui dados de mercado e concorrentes para personalização.
+    cache (opcional): memoiza configuração e dados por cidade durante uma
+    campanha — milhares de leads da mesma cidade não repetem as queries."""
+    if cache is None:
+        cache = {}
     personalizacao = personalizar_abordagem(lead)
 
     cidade = lead.get("cidade") or ""
@@ -65,7 +74,9 @@ def _extrair_variaveis(lead: dict) -> dict:
     bairro = lead.get("bairro") or ""
 
     # Buscar nome_usuario das configurações
-    nome_usuario = obter_configuracao("nome_usuario") or "Equipe Derekh"
+    if "nome_usuario" not in cache:
+        cache["nome_usuario"] = obter_configuracao("nome_usuario") or "Equipe Derekh"
+    nome_usuario = cache["nome_usuario"]
 
     vars = {
         "nome_dono": personalizacao["nome_dono"] or "prezado(a)",
@@ -86,9 +97,12 @@ def _extrair_variaveis(lead: dict) -> dict:
     if cidade and uf:
         try:
             # Verificar se delivery foi verificado antes de mostrar concorrentes
-            delivery_verificado = cidade_tem_delivery_verificado(cidade, uf)
+            chave = ("cidade", cidade, uf)
+            if chave not in cache:
+                cache[chave] = (cidade_tem_delivery_verificado(cidade, uf),
+                                dados_mercado_cidade(cidade, uf))
+            delivery_verificado, mercado = cache[chave]
 
-            mercado = dados_mercado_cidade(cidade, uf)
             vars["total_restaurantes_cidade"] = str(mercado.get("total_restaurantes", 0))
             vars["total_com_delivery_cidade"] = str(mercado.get("com_algum_delivery", 0))
             vars["total_sem_delivery_cidade"] = str(mercado.get("sem_delivery", 0))
@@ -180,7 +194,7 @@ WHATSAPP_INBOUND = "351961330536"  # Ana — ÚNICO número ativo
 LANDING_URL_DEFAULT = "https://derekhfood.com.br"
 
 
-def _envolver_email_branded(corpo_html: str, tracking_id: str) -> str:
+def _envolver_email_branded(corpo_html: str, tracking_id: str, landing: str = None) -> str:
     """Envolve QUALQUER corpo de email no template branded Derekh Food.
     Header verde + corpo + link site + botão WA + unsub + pixel tracking."""
     import urllib.parse
@@ -191,7 +205,7 @@ def _envolver_email_branded(corpo_html: str, tracking_id: str) -> str:
 
     pixel = gerar_pixel_url(tracking_id)
     unsub = gerar_link_unsub(tracking_id)
-    landing = obter_configuracao("outreach_landing_url") or LANDING_URL_DEFAULT
+    landing = landing or obter_configuracao("outreach_landing_url") or LANDING_URL_DEFAULT
     link_site = gerar_link_rastreado(landing, tracking_id, "site")
     wa_text = "Olá! Gostaria de saber mais sobre a Derekh Food"
     wa_link = f"https://wa.me/{WHATSAPP_INBOUND}?text={urllib.parse.quote(wa_text)}"
@@ -236,7 +250,7 @@ def _envolver_email_branded(corpo_html: str, tracking_id: str) -> str:
 
 def _injetar_tracking(corpo_html: str, tracking_id: str, landing_url: str = None) -> str:
     """Envolve email no template branded Derekh Food com tracking completo."""
-    return _envolver_email_branded(corpo_html, tracking_id)
+    return _envolver_email_branded(corpo_html, tracking_id, landing_url)
 
 
 # ============================================================
@@ -396,40 +410,117 @@ def enviar_email_personalizado(lead_id: int, assunto: str, corpo: str,
         return {"erro": str(e)}
 
 
-def enviar_campanha(campanha_id: int, filtros: dict, template_id: int,
-                    throttle_por_segundo: int = 10) -> dict:
-    """Envia campanha para todos os leads que passam nos filtros.
-    Throttle de N emails/segundo."""
-    leads = buscar_leads_para_export(filtros)
-    atualizar_status_campanha(campanha_id, "enviando")
+def _preparar_envio_campanha(lead: dict, template: dict, landing_url: str,
+                             cache: dict) -> dict:
+    """Renderiza o email de campanha de um lead (sem I/O de envio)."""
+    tracking_id = gerar_tracking_id()
+    variaveis = _extrair_variaveis(lead, cache)
+    assunto = _substituir_variaveis(template["assunto"], variaveis)
+    corpo = _injetar_tracking(_substituir_variaveis(template["corpo_html"], variaveis),
+                              tracking_id, landing_url)
+    return {
+        "lead_id": lead["id"],
+        "email": lead["email"],
+        "template_id": template["id"],
+        "assunto": assunto,
+        "corpo": corpo,
+        "tracking_id": tracking_id,
+        "pixel_url": gerar_pixel_url(tracking_id),
+    }
 
-    stats = {"enviados": 0, "erros": 0, "sem_email": 0}
-    batch_start = time.time()
-    batch_count = 0
 
-    for lead in leads:
-        if not lead.get("email") or lead.get("email_invalido"):
-            stats["sem_email"] += 1
-            continue
+def _enviar_campanha_um(lead: dict, template: dict, landing_url: str, cache: dict,
+                        limitador: BucketTokens) -> dict:
+    """Worker da campanha: renderiza, espera o token do throttle e envia."""
+    try:
+        envio = _preparar_envio_campanha(lead, template, landing_url, cache)
+        unsub_url = gerar_link_unsub(envio["tracking_id"])
+        limitador.esperar()
+        resultado = resend.Emails.send({
+            "from": f"{FROM_NAME} <{FROM_EMAIL}>",
+            "to": [envio["email"]],
+            "subject": envio["assunto"],
+            "html": envio["corpo"],
+            "text": _html_para_texto(envio["corpo"]),
+            "headers": {
+                "List-Unsubscribe": f"<{unsub_url}>",
+                "List-Unsubscribe-Post": "List-Unsubscribe=One-Click",
+                "X-Entity-Ref-ID": envio["tracking_id"],
+            },
+        })
+    except Exception as e:
+        return {"erro": str(e), "lead_id": lead.get("id")}
 
-        resultado = enviar_email(lead["id"], template_id, campanha_id)
+    envio["resend_message_id"] = resultado.get("id", "")
+    del envio["corpo"]  # não segura o HTML no buffer de gravação
+    return envio
 
-        if resultado.get("sucesso"):
-            stats["enviados"] += 1
-        else:
-            stats["erros"] += 1
 
-        batch_count += 1
+def enviar_campanha(campanha_id: int, filtros: dict, template_id: int,
+                    throttle_por_segundo: int = 10) -> dict:
+    """Envia campanha para todos os leads que passam nos filtros.
+    Throttle de N emails/segundo.
+
+    Leads vêm em streaming (cursor server-side); render + chamada Resend
+    rodam em CAMPANHA_CONCORRENCIA threads sob o mesmo throttle, com no
+    máximo 2x isso em voo; o tracking é gravado em lotes. Memória constante
+    mesmo em campanhas de 500k leads."""
+    template = obter_email_template(template_id)
+    if not template:
+        return {"erro": "Template não encontrado"}
 
-        # Throttling
-        if batch_count >= throttle_por_segundo:
-            elapsed = time.time() - batch_start
-            if elapsed < 1.0:
-                time.sleep(1.0 - elapsed)
-            batch_start = time.time()
-            batch_count = 0
+    atualizar_status_campanha(campanha_id, "enviando")
 
-    atualizar_status_campanha(campanha_id, "concluida")
+    stats = {"enviados": 0, "erros": 0, "sem_email": 0}
+    limitador = BucketTokens(throttle_por_segundo, throttle_por_segundo)
+    landing_url = obter_configuracao("outreach_landing_url") or LANDING_URL_DEFAULT
+    cache = {}
+    buffer = []
+    em_voo = set()
+
+    def _coletar(futuros):
+        for fut in futuros:
+            try:
+                envio = fut.result()
+            except Exception as e:
+                envio = {"erro": str(e)}
+            if envio.get("erro"):
+                stats["erros"] += 1
+                continue
+            stats["enviados"] += 1
+            buffer.append(envio)
+        if len(buffer) >= CAMPANHA_LOTE_GRAVACAO:
+            registrar_emails_enviados_lote(buffer, campanha_id)
+            buffer.clear()
+
+    # Em erro no meio (banco, SMTP, leads), o que já saiu é registrado e a
+    # campanha fica "pausada" — sem isso um retry reenviaria os emails do buffer
+    concluida = False
+    try:
+        with ThreadPoolExecutor(max_workers=CAMPANHA_CONCORRENCIA,
+                                thread_name_prefix="campanha") as executor:
+            try:
+                for lead in iterar_leads_para_export(filtros):
+                    if not lead.get("email") or not lead["email"].strip() or lead.get("email_invalido"):
+                        stats["sem_email"] += 1
+                        continue
+                    if lead.get("opt_out_email"):
+                        stats["erros"] += 1  # mesma contagem de quando enviar_email recusava
+                        continue
+
+                    em_voo.add(executor.submit(_enviar_campanha_um, lead, template,
+                                               landing_url, cache, limitador))
+                    if len(em_voo) >= CAMPANHA_CONCORRENCIA * 2:
+                        prontos, em_voo = wait(em_voo, return_when=FIRST_COMPLETED)
+                        _coletar(prontos)
+            finally:
+                _coletar(em_voo)
+        concluida = True
+    finally:
+        try:
+            registrar_emails_enviados_lote(buffer, campanha_id)
+        finally:
+            atualizar_status_campanha(campanha_id, "concluida" if concluida else "pausada")
     return stats
 
 
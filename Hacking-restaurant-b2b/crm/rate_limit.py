@@ -0,0 +1,44 @@
+"""
+rate_limit.py - Token bucket compartilhado por threads e event loops.
+Usado para respeitar limites de APIs externas (Evolution whatsappNumbers, Resend).
+"""
+import asyncio
+import threading
+import time
+
+
+class BucketTokens:
+    """Token bucket thread-safe e independente de event loop.
+
+    Cada reserva consome o próximo slot (o saldo pode ficar negativo) e o
+    chamador dorme só o necessário — chamadas concorrentes saem espaçadas em
+    1/taxa sem fila explícita."""
+
+    def __init__(self, taxa: float, capacidade: int):
+        self.taxa = max(taxa, 0.01)
+        self.capacidade = max(capacidade, 1)
+        self._tokens = float(self.capacidade)
+        self._atualizado = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reservar(self) -> float:
+        """Consome um token e retorna quantos segundos esperar por ele."""
+        with self._lock:
+            agora = time.monotonic()
+            self._tokens = min(self.capacidade,
+                               self._tokens + (agora - self._atualizado) * self.taxa)
+            self._atualizado = agora
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.taxa
+
+    def esperar(self):
+        """Versão bloqueante (threads)."""
+        espera = self.reservar()
+        if espera > 0:
+            time.sleep(espera)
+
+    async def adquirir(self):
+        """Versão async."""
+        espera = self.reservar()
+        if espera > 0:
+            await asyncio.sleep(espera)
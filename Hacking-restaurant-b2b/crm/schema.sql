@@ -762,3 +762,35 @@ CREATE TABLE IF NOT EXISTS email_outreach_fila (
 CREATE INDEX IF NOT EXISTS idx_email_fila_status ON email_outreach_fila(status, created_at DESC)
     WHERE status = 'pendente';
 CREATE INDEX IF NOT EXISTS idx_email_fila_lead ON email_outreach_fila(lead_id);
+
+-- ============================================================
+-- BUSCA DE LEADS — texto sem acento + ordem para paginação keyset
+-- crm_normalizar() é IMMUTABLE (translate, sem depender de unaccent)
+-- para poder ser usada em índice de expressão.
+-- ============================================================
+CREATE OR REPLACE FUNCTION crm_normalizar(texto TEXT) RETURNS TEXT AS $$
+    SELECT lower(translate(coalesce(texto, ''),
+        'ÁÀÂÃÄÉÈÊËÍÌÎÏÓÒÔÕÖÚÙÛÜÇÑáàâãäéèêëíìîïóòôõöúùûüçñ',
+        'aaaaaeeeeiiiiooooouuuucnaaaaaeeeeiiiiooooouuuucn'))
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+CREATE INDEX IF NOT EXISTS idx_leads_busca_fts ON leads
+    USING gin (to_tsvector('simple', crm_normalizar(razao_social) || ' ' || crm_normalizar(nome_fantasia)));
+CREATE INDEX IF NOT EXISTS idx_leads_busca_ordem ON leads
+    ((-coalesce(lead_score, 0)), (coalesce(razao_social, '')), id);
+CREATE INDEX IF NOT EXISTS idx_leads_cnpj_prefixo ON leads (cnpj text_pattern_ops);
+
+-- Trigram (substring "%termo%" indexado) — só se o contrib estiver disponível
+DO $$ BEGIN
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+EXCEPTION WHEN OTHERS THEN
+    RAISE NOTICE 'pg_trgm indisponível — busca de leads usa o índice tsvector';
+END $$;
+
+DO $$ BEGIN
+    IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN
+        CREATE INDEX IF NOT EXISTS idx_leads_busca_trgm ON leads
+            USING gin ((crm_normalizar(razao_social) || ' ' || crm_normalizar(nome_fantasia)) gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS idx_leads_cnpj_trgm ON leads USING gin (cnpj gin_trgm_ops);
+    END IF;
+END $$;
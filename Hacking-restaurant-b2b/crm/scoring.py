@@ -336,53 +336,85 @@ def _formatar_nome(nome: str) -> str:
 # CÁLCULO EM BATCH
 # ============================================================
 
+# Colunas lidas por calcular_score/determinar_segmento
+_COLUNAS_SCORE = """
+    id, tem_ifood, tem_rappi, tem_99food,
+    rating, total_reviews, capital_social, porte,
+    data_abertura, email, telefone1,
+    status_pipeline, email_invalido,
+    multi_restaurante, socios_json, mei,
+    nome_fantasia, razao_social, email_tipo,
+    ifood_rating, ifood_reviews, ifood_preco,
+    ifood_categorias
+"""
+
+
 def calcular_scores_todos(batch_size: int = 5000) -> dict:
     """Calcula e atualiza lead_score + segmento + tier para todos os leads.
-    Processa em batches para não sobrecarregar memória.
-    Retorna estatísticas."""
-    stats = {"total": 0, "atualizados": 0, "por_segmento": {}}
+
+    Paginação keyset (id > último) em vez de OFFSET — cada página custa o
+    mesmo no lead 10 mil e no lead 5 milhões. Por página: score calculado em
+    memória, resultados carregados com execute_values numa tabela temporária
+    e aplicados com um único UPDATE ... FROM, só nas linhas que mudaram
+    (não dispara o trigger de updated_at à toa). Retorna estatísticas."""
+    from psycopg2.extras import execute_values
+
+    stats = {"total": 0, "atualizados": 0, "alterados": 0, "por_segmento": {}}
 
     with get_conn() as conn:
         cur = conn.cursor()
         cur.execute("SELECT COUNT(*) as total FROM leads")
         stats["total"] = cur.fetchone()["total"]
 
-        offset = 0
+        cur.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS _rescore_leads (
+                id INTEGER PRIMARY KEY,
+                lead_score INTEGER,
+                segmento TEXT,
+                tier TEXT
+            ) ON COMMIT DELETE ROWS
+        """)
+
+        ultimo_id = 0
         while True:
-            cur.execute("""
-                SELECT id, tem_ifood, tem_rappi, tem_99food,
-                       rating, total_reviews, capital_social, porte,
-                       data_abertura, email, telefone1,
-                       status_pipeline, email_invalido,
-                       multi_restaurante, socios_json, mei,
-                       nome_fantasia, razao_social, email_tipo,
-                       ifood_rating, ifood_reviews, ifood_preco,
-                       ifood_categorias
+            cur.execute(f"""
+                SELECT {_COLUNAS_SCORE}
                 FROM leads
+                WHERE id > %s
                 ORDER BY id
-                LIMIT %s OFFSET %s
-            """, (batch_size, offset))
+                LIMIT %s
+            """, (ultimo_id, batch_size))
 
             rows = cur.fetchall()
             if not rows:
                 break
 
-            updates = []
+            valores = []
             for lead in rows:
                 score = calcular_score(lead)
                 segmento = determinar_segmento(lead, score)
-                tier = calcular_tier(score)
-                updates.append((score, segmento, tier, lead["id"]))
+                valores.append((lead["id"], score, segmento, calcular_tier(score)))
                 stats["por_segmento"][segmento] = stats["por_segmento"].get(segmento, 0) + 1
 
-            cur.executemany("""
-                UPDATE leads SET lead_score = %s, segmento = %s, tier = %s WHERE id = %s
-            """, updates)
-            conn.commit()
-
-            stats["atualizados"] += len(updates)
-            offset += batch_size
-
+            execute_values(cur, """
+                INSERT INTO _rescore_leads (id, lead_score, segmento, tier) VALUES %s
+            """, valores, page_size=len(valores))
+            cur.execute("""
+                UPDATE leads l
+                SET lead_score = r.lead_score, segmento = r.segmento, tier = r.tier
+                FROM _rescore_leads r
+                WHERE l.id = r.id
+                  AND (l.lead_score IS DISTINCT FROM r.lead_score
+                       OR l.segmento IS DISTINCT FROM r.segmento
+                       OR l.tier IS DISTINCT FROM r.tier)
+            """)
+            stats["alterados"] += cur.rowcount
+            conn.commit()  # ON COMMIT DELETE ROWS limpa a temp para a próxima página
+
+            stats["atualizados"] += len(valores)
+            ultimo_id = rows[-1]["id"]
+
+    log.info(f"Rescore: {stats['atualizados']} leads, {stats['alterados']} alterados")
     return stats
 
 
@@ -390,17 +422,7 @@ def calcular_score_lead(lead_id: int) -> dict:
     """Calcula e atualiza score, segmento e tier de um lead específico."""
     with get_conn() as conn:
         cur = conn.cursor()
-        cur.execute("""
-            SELECT id, tem_ifood, tem_rappi, tem_99food,
-                   rating, total_reviews, capital_social, porte,
-                   data_abertura, email, telefone1,
-                   status_pipeline, email_invalido,
-                   multi_restaurante, socios_json, mei,
-                   nome_fantasia, razao_social, email_tipo,
-                   ifood_rating, ifood_reviews, ifood_preco,
-                   ifood_categorias
-            FROM leads WHERE id = %s
-        """, (lead_id,))
+        cur.execute(f"SELECT {_COLUNAS_SCORE} FROM leads WHERE id = %s", (lead_id,))
         lead = cur.fetchone()
         if not lead:
             return {"erro": "Lead não encontrado"}
@@ -458,37 +480,59 @@ def atualizar_score_evento(lead_id: int, evento: str, valor: int = 0) -> dict:
 # P4: SCORE DECAY (DECAIMENTO TEMPORAL)
 # ============================================================
 
-def aplicar_decaimento_scores() -> dict:
+def _sql_tier(coluna: str) -> str:
+    """CASE SQL equivalente a calcular_tier()."""
+    return (f"CASE WHEN {coluna} >= {int(TIERS['hot'])} THEN 'hot' "
+            f"WHEN {coluna} >= {int(TIERS['warm'])} THEN 'warm' "
+            f"WHEN {coluna} >= {int(TIERS['cool'])} THEN 'cool' ELSE 'cold' END")
+
+
+def aplicar_decaimento_scores(dias: int = 7) -> dict:
     """Aplica decaimento de 5% por semana para leads sem interação recente.
     Rodar diariamente (brain_loop chama 1x/dia).
-    Mínimo: 10 (nunca zera). Retorna stats."""
-    from crm.database import leads_sem_interacao_recente, atualizar_score_lead, registrar_evento_lead
+    Mínimo: 10 (nunca zera). Retorna stats.
 
+    Um único statement: o UPDATE decai os elegíveis (mesmo critério de
+    leads_sem_interacao_recente) e o INSERT do evento score_decay sai do
+    RETURNING — uma ida ao banco para a base inteira."""
     stats = {"processados": 0, "decaidos": 0}
 
-    leads = leads_sem_interacao_recente(dias=7)
-    if not leads:
-        return stats
-
-    for lead in leads:
-        lead_id = lead["id"]
-        score_atual = lead["lead_score"] or 0
-
-        if score_atual <= 10:
-            continue  # Já no mínimo
-
-        # Decaimento de 5%
-        decaimento = max(1, int(score_atual * 0.05))
-        novo_score = max(10, score_atual - decaimento)
-        novo_tier = calcular_tier(novo_score)
-
-        atualizar_score_lead(lead_id, novo_score, novo_tier)
-        registrar_evento_lead(lead_id, "score_decay", -decaimento, score_atual, novo_score)
-
-        stats["processados"] += 1
-        if novo_score < score_atual:
-            stats["decaidos"] += 1
+    # int(score * 0.05) == score / 20 em inteiros (score > 10 → decaimento >= 1)
+    novo_score = "GREATEST(10, l.lead_score - GREATEST(1, l.lead_score / 20))"
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute(f"""
+            WITH decaidos AS (
+                UPDATE leads l
+                SET lead_score = {novo_score},
+                    tier = {_sql_tier(novo_score)}
+                FROM leads antes
+                WHERE antes.id = l.id
+                  AND l.lead_score > 10
+                  AND l.status_pipeline NOT IN ('cliente', 'perdido', 'lead_falso')
+                  AND (l.data_ultimo_contato IS NULL
+                       OR l.data_ultimo_contato < NOW() - make_interval(days => %s))
+                  AND NOT EXISTS (
+                      SELECT 1 FROM lead_eventos le
+                      WHERE le.lead_id = l.id AND le.created_at >= NOW() - make_interval(days => %s)
+                  )
+                RETURNING l.id, antes.lead_score AS score_antes, l.lead_score AS score_depois
+            ),
+            eventos AS (
+                INSERT INTO lead_eventos (lead_id, evento, valor, score_antes, score_depois)
+                SELECT id, 'score_decay', score_depois - score_antes, score_antes, score_depois
+                FROM decaidos
+                RETURNING 1
+            )
+            SELECT COUNT(*) AS processados,
+                   COUNT(*) FILTER (WHERE score_depois < score_antes) AS decaidos
+            FROM decaidos
+        """, (dias, dias))
+        row = cur.fetchone()
+        conn.commit()
 
+    stats["processados"] = row["processados"]
+    stats["decaidos"] = row["decaidos"]
     if stats["decaidos"] > 0:
         log.info(f"Score decay: {stats['decaidos']}/{stats['processados']} leads decaíram")
 
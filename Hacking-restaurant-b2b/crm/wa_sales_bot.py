@@ -25,6 +25,8 @@ import logging
 import tempfile
 import base64
 import random
+import subprocess
+import threading
 import time as _time
 from typing import Optional
 
@@ -899,14 +901,39 @@ def _calcular_delay_audio(duracao_seg: int) -> float:
     return max(5.0, min(delay, 120.0))
 
 
+# --- ffmpeg com concorrência limitada ---
+# Cada conversão/análise é um fork de ffmpeg; numa rajada de áudios isso
+# abria dezenas de processos na máquina Fly. Slots limitam os simultâneos.
+FFMPEG_MAX_PROCESSOS = int(os.environ.get("FFMPEG_MAX_PROCESSOS", "2"))
+FFMPEG_ESPERA_MAX = float(os.environ.get("FFMPEG_ESPERA_MAX", "20"))
+_ffmpeg_slots = threading.BoundedSemaphore(FFMPEG_MAX_PROCESSOS)
+ffmpeg_stats = {"execucoes": 0, "recusados": 0, "espera_ms_max": 0.0, "execucao_ms_total": 0.0}
+
+
+def _rodar_ffmpeg(args: list, timeout: float, **kwargs) -> subprocess.CompletedProcess:
+    """subprocess.run com no máximo FFMPEG_MAX_PROCESSOS ffmpeg vivos.
+    Sem slot em FFMPEG_ESPERA_MAX segundos → TimeoutExpired (backpressure)."""
+    enfileirado = _time.monotonic()
+    if not _ffmpeg_slots.acquire(timeout=FFMPEG_ESPERA_MAX):
+        ffmpeg_stats["recusados"] += 1
+        raise subprocess.TimeoutExpired(args, FFMPEG_ESPERA_MAX)
+    inicio = _time.monotonic()
+    try:
+        return subprocess.run(args, capture_output=True, timeout=timeout, **kwargs)
+    finally:
+        _ffmpeg_slots.release()
+        ffmpeg_stats["execucoes"] += 1
+        ffmpeg_stats["espera_ms_max"] = max(ffmpeg_stats["espera_ms_max"], (inicio - enfileirado) * 1000)
+        ffmpeg_stats["execucao_ms_total"] += (_time.monotonic() - inicio) * 1000
+
+
 def _mp3_to_ogg_opus(mp3_bytes: bytes) -> bytes | None:
     """Converte MP3 → OGG/Opus via ffmpeg (necessário para PTT no Meta Cloud API)."""
-    import subprocess
     try:
-        proc = subprocess.run(
+        proc = _rodar_ffmpeg(
             ["ffmpeg", "-i", "pipe:0", "-c:a", "libopus", "-b:a", "64k",
              "-f", "ogg", "pipe:1", "-loglevel", "error"],
-            input=mp3_bytes, capture_output=True, timeout=15,
+            timeout=15, input=mp3_bytes,
         )
         if proc.returncode != 0:
             log.error(f"ffmpeg OGG/Opus falhou: {proc.stderr.decode()[:200]}")
@@ -1194,9 +1221,7 @@ def _analisar_audio_ffmpeg(audio_bytes: bytes) -> dict:
     - Taxa de fala estimada (palavras/seg baseado em duração)
 
     Retorna dict com métricas + veredicto {"aprovado": bool, "problemas": [...]}
-    Leve: ~50ms no servidor, sem rede, sem API externa."""
-    import subprocess
-
+    Leve: um ffmpeg (~50ms) no servidor, sem rede, sem API externa."""
     tmp_path = None
     resultado = {
         "aprovado": True,
@@ -1215,38 +1240,36 @@ def _analisar_audio_ffmpeg(audio_bytes: bytes) -> dict:
         tmp.close()
         tmp_path = tmp.name
 
-        # 1. ffprobe — duração
-        probe = subprocess.run(
-            ["ffprobe", "-v", "quiet", "-show_entries", "format=duration",
-             "-of", "csv=p=0", tmp_path],
-            capture_output=True, text=True, timeout=10
+        # Um único ffmpeg (antes: ffprobe + 2 ffmpeg): duração do cabeçalho,
+        # volumedetect (passa o áudio adiante) e silencedetect em cadeia
+        # — pausas naturais com threshold -30dB, min 0.3s
+        proc = _rodar_ffmpeg(
+            ["ffmpeg", "-hide_banner", "-nostats", "-i", tmp_path, "-af",
+             "volumedetect,silencedetect=noise=-30dB:d=0.3", "-f", "null", "-"],
+            timeout=10, text=True,
         )
-        duracao = float(probe.stdout.strip()) if probe.stdout.strip() else 0
+        saida = proc.stderr
+
+        # 1. Duração
+        dur_match = re.search(r'Duration:\s*(\d+):(\d+):([\d.]+)', saida)
+        duracao = 0.0
+        if dur_match:
+            h, m, seg = dur_match.groups()
+            duracao = int(h) * 3600 + int(m) * 60 + float(seg)
         resultado["duracao_s"] = round(duracao, 2)
 
         # 2. volumedetect — volume máximo e médio
-        vol = subprocess.run(
-            ["ffmpeg", "-i", tmp_path, "-af", "volumedetect", "-f", "null", "-"],
-            capture_output=True, text=True, timeout=10
-        )
-        vol_output = vol.stderr
-        max_vol_match = re.search(r'max_volume:\s*([-\d.]+)\s*dB', vol_output)
-        mean_vol_match = re.search(r'mean_volume:\s*([-\d.]+)\s*dB', vol_output)
+        max_vol_match = re.search(r'max_volume:\s*([-\d.]+)\s*dB', saida)
+        mean_vol_match = re.search(r'mean_volume:\s*([-\d.]+)\s*dB', saida)
         if max_vol_match:
             resultado["volume_max_db"] = float(max_vol_match.group(1))
         if mean_vol_match:
             resultado["volume_mean_db"] = float(mean_vol_match.group(1))
 
-        # 3. silencedetect — pausas naturais (threshold -30dB, min 0.3s)
-        sil = subprocess.run(
-            ["ffmpeg", "-i", tmp_path, "-af",
-             "silencedetect=noise=-30dB:d=0.3", "-f", "null", "-"],
-            capture_output=True, text=True, timeout=10
-        )
-        sil_output = sil.stderr
+        # 3. silencedetect — pausas naturais
         silencios = re.findall(
             r'silence_end:\s*([\d.]+)\s*\|\s*silence_duration:\s*([\d.]+)',
-            sil_output
+            saida
         )
         resultado["silencios"] = len(silencios)
         silencio_total = sum(float(d) for _, d in silencios)
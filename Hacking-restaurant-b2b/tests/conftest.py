@@ -0,0 +1,103 @@
+"""
+conftest.py — Conexão psycopg2 falsa compartilhada pelos testes do CRM.
+
+FakeConn/FakeCursor registram os statements (SQL normalizado + params) e
+devolvem o que o `responder` do teste mandar; a fixture `usar_conn` troca o
+get_conn de um módulo do CRM para entregar a conexão falsa. Não precisa de
+Postgres.
+"""
+import os
+import sys
+from contextlib import ExitStack, contextmanager
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+import psycopg2
+from psycopg2 import extensions
+
+
+class FakeCursor:
+    def __init__(self, conn, name=None):
+        self.conn = conn
+        self.name = name
+        self.itersize = None
+        self.rowcount = 0
+        self.fechado = False
+        self._resultado = []
+
+    def execute(self, sql, params=None):
+        if self.conn.morta:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        sql = " ".join(sql.split())
+        self.conn.statements.append((sql, params))
+        self.conn.em_transacao = True
+        if self.conn.responder:
+            self._resultado = self.conn.responder(self, sql, params) or []
+
+    def fetchone(self):
+        return self._resultado[0] if self._resultado else None
+
+    def fetchall(self):
+        return self._resultado
+
+    def __iter__(self):
+        return iter(self.conn.linhas)
+
+    def close(self):
+        self.fechado = True
+
+
+class FakeConn:
+    """
+    responder(cursor, sql, params) → linhas do execute (pode ajustar
+    cursor.rowcount). `linhas` alimenta a iteração de cursores nomeados.
+    """
+
+    def __init__(self, responder=None, linhas=()):
+        self.responder = responder
+        self.linhas = list(linhas)
+        self.statements = []
+        self.cursores = []
+        self.commits = 0
+        self.rollbacks = 0
+        self.closed = 0
+        self.morta = False
+        self.em_transacao = False
+
+    def cursor(self, name=None):
+        cur = FakeCursor(self, name)
+        self.cursores.append(cur)
+        return cur
+
+    def commit(self):
+        self.commits += 1
+        self.em_transacao = False
+
+    def rollback(self):
+        if self.morta:
+            raise psycopg2.InterfaceError("connection already closed")
+        self.rollbacks += 1
+        self.em_transacao = False
+
+    def get_transaction_status(self):
+        if self.em_transacao:
+            return extensions.TRANSACTION_STATUS_INTRANS
+        return extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def usar_conn():
+    """usar_conn(modulo, conn): o get_conn do módulo passa a entregar `conn`."""
+    with ExitStack() as pilha:
+        def aplicar(modulo, conn):
+            @contextmanager
+            def get_conn():
+                yield conn
+            pilha.enter_context(patch.object(modulo, "get_conn", get_conn))
+            return conn
+        yield aplicar
@@ -0,0 +1,123 @@
+"""
+test_busca_leads_crm.py — Busca de leads (crm/database.py).
+
+Usa conexão falsa: valida a escolha do predicado de texto (trigram, tsvector
+ou CNPJ), a paginação keyset por cursor opaco, a contagem estimada x exata e
+o cache das facetas. A normalização Python é conferida contra o translate do
+schema.sql. Não precisa de Postgres.
+
+Rodar:
+  python -m pytest tests/test_busca_leads_crm.py -v
+"""
+import os
+import re
+import sys
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+
+from crm import database as db
+from conftest import FakeConn
+
+
+def _responder(cur, sql, params):
+    conn = cur.conn
+    if "pg_extension" in sql:
+        return [{"?column?": 1}] if conn.trgm else []
+    if sql.startswith("EXPLAIN"):
+        return [{"QUERY PLAN": [{"Plan": {"Plan Rows": conn.estimado}}]}]
+    if "COUNT(*)" in sql:
+        return [{"c": len(conn.leads)}]
+    if "DISTINCT uf" in sql:
+        return [{"uf": "SP"}]
+    return conn.leads[:params[-1]]
+
+
+@pytest.fixture
+def conn(usar_conn):
+    c = usar_conn(db, FakeConn(_responder))
+    c.leads = [{"id": i, "lead_score": 90 - i, "razao_social": f"R {i}"} for i in range(1, 6)]
+    c.trgm, c.estimado = False, 10
+    with patch.object(db, "_busca_trgm", None):
+        yield c
+
+
+def _select(conn):
+    return [(s, p) for s, p in conn.statements if s.startswith("SELECT l.id")][-1]
+
+
+class TestPredicadoDeTexto:
+    def test_sem_trgm_usa_tsvector_prefixo(self, conn):
+        db.buscar_leads_keyset({"q": "São João"})
+        sql, params = _select(conn)
+        assert "to_tsquery('simple', %s)" in sql
+        assert "sao:* & joao:*" in params
+
+    def test_com_trgm_usa_substring_normalizada(self, conn):
+        conn.trgm = True
+        db.buscar_leads_keyset({"q": "Açaí"})
+        sql, params = _select(conn)
+        assert f"{db._BUSCA_EXPR} LIKE %s" in sql
+        assert "%acai%" in params
+
+    def test_cnpj(self, conn):
+        db.buscar_leads_keyset({"q": "12.345.678"})
+        sql, params = _select(conn)
+        assert "l.cnpj LIKE %s" in sql
+        assert "12345678%" in params
+
+    def test_normalizacao_igual_ao_schema(self):
+        schema = open(os.path.join(os.path.dirname(db.__file__), "schema.sql")).read()
+        de, para = re.search(r"translate\(coalesce\(texto, ''\),\s*'([^']+)',\s*'([^']+)'", schema).groups()
+        assert len(de) == len(para)
+        for a, b in zip(de, para):
+            assert db.normalizar_busca(a) == b
+
+
+class TestKeyset:
+    def test_cursor_e_proxima_pagina(self, conn):
+        r = db.buscar_leads_keyset({"uf": "sp"}, por_pagina=2)
+        assert [l["id"] for l in r["leads"]] == [1, 2]
+        assert r["proximo"]
+
+        db.buscar_leads_keyset({"uf": "sp"}, apos=r["proximo"], por_pagina=2)
+        sql, params = _select(conn)
+        assert f"({db._BUSCA_ORDEM}) > (%s, %s, %s)" in sql
+        assert "OFFSET" not in sql
+        assert params == ["SP", -88, "R 2", 2, 3]
+
+    def test_ultima_pagina_sem_cursor(self, conn):
+        assert db.buscar_leads_keyset({}, por_pagina=10)["proximo"] is None
+
+    def test_cursor_invalido_volta_ao_inicio(self, conn):
+        r = db.buscar_leads_keyset({}, apos="lixo", por_pagina=2)
+        assert [l["id"] for l in r["leads"]] == [1, 2]
+
+
+class TestContagem:
+    def test_pequeno_conta_exato(self, conn):
+        r = db.buscar_leads_keyset({})
+        assert (r["total"], r["total_exato"]) == (5, True)
+
+    def test_grande_estimado_e_exato_sob_demanda(self, conn):
+        conn.estimado = 1_000_000
+        r = db.buscar_leads_keyset({})
+        assert (r["total"], r["total_exato"]) == (1_000_000, False)
+        assert not any("COUNT(*)" in s for s, _ in conn.statements)
+
+        r = db.buscar_leads_keyset({}, contagem_exata=True)
+        assert (r["total"], r["total_exato"]) == (5, True)
+
+
+class TestFacetas:
+    def test_cache_e_invalidacao(self, conn):
+        db.invalidar_facetas()
+        assert db.listar_ufs_disponiveis() == ["SP"]
+        db.listar_ufs_disponiveis()
+        assert sum("DISTINCT uf" in s for s, _ in conn.statements) == 1
+        db.invalidar_facetas()
+        db.listar_ufs_disponiveis()
+        assert sum("DISTINCT uf" in s for s, _ in conn.statements) == 2
+        db.invalidar_facetas()
@@ -0,0 +1,137 @@
+"""
+test_contact_validator_crm.py — Pipeline de validação de contatos (crm/contact_validator.py).
+
+Valida o token bucket, o cache por número normalizado, o parse da resposta
+em lote do whatsappNumbers (com failover) e que o pipeline faz uma carga,
+requisições em lote deduplicadas e uma gravação. Não precisa de Postgres
+nem da Evolution (httpx.MockTransport).
+
+Rodar:
+  python -m pytest tests/test_contact_validator_crm.py -v
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import httpx
+import pytest
+
+from crm import contact_validator as cv
+
+
+@pytest.fixture(autouse=True)
+def isolado():
+    """Rate limit folgado e cache limpo a cada teste."""
+    with patch.object(cv, "wa_rate_limiter", cv.BucketTokens(taxa=1000, capacidade=1000)):
+        cv.wa_cache.limpar()
+        yield
+        cv.wa_cache.limpar()
+
+
+def _evolution(respostas, chamadas):
+    """MockTransport: respostas[instancia](numeros) -> (status, corpo)."""
+    def handler(request):
+        instancia = request.url.path.rsplit("/", 1)[-1]
+        numeros = json.loads(request.content)["numbers"]
+        chamadas.append((instancia, numeros))
+        status, corpo = respostas[instancia](numeros)
+        return httpx.Response(status, json=corpo)
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+class TestBucketTokens:
+    def test_rajada_e_depois_espaca(self):
+        bucket = cv.BucketTokens(taxa=10, capacidade=2)
+        esperas = [bucket.reservar() for _ in range(4)]
+        assert esperas[:2] == [0.0, 0.0]
+        assert esperas[2] == pytest.approx(0.1, abs=0.01)
+        assert esperas[3] == pytest.approx(0.2, abs=0.01)
+
+    def test_repoe_com_o_tempo(self):
+        bucket = cv.BucketTokens(taxa=10, capacidade=1)
+        bucket.reservar()
+        agora = time.monotonic()
+        with patch("crm.rate_limit.time.monotonic", return_value=agora + 1):
+            assert bucket.reservar() == 0.0
+
+
+class TestCacheWhatsApp:
+    def test_ttl_e_nao_guarda_falha(self):
+        cache = cv.CacheWhatsApp(ttl_seconds=60)
+        cache.set("5511999990000", True)
+        cache.set("5511888880000", None)
+        assert cache.get("5511999990000") == (True, True)
+        assert cache.get("5511888880000") == (False, None)
+        agora = time.monotonic()
+        with patch("crm.contact_validator.time.monotonic", return_value=agora + 61):
+            assert cache.get("5511999990000") == (False, None)
+
+
+class TestVerificacaoEmLote:
+    def test_mapeia_por_numero_com_failover(self):
+        chamadas = []
+        client = _evolution({
+            "derekh-reserva-1": lambda ns: (500, {"erro": "desconectada"}),
+            "derekh-reserva-3": lambda ns: (200, [
+                {"number": n, "exists": n.endswith("1")} for n in reversed(ns)
+            ]),
+        }, chamadas)
+        numeros = ["5511900000001", "5511900000002"]
+        resultado = asyncio.run(cv._verificar_whatsapp_lote(numeros, client))
+        assert resultado == {"5511900000001": True, "5511900000002": False}
+        assert [c[0] for c in chamadas] == ["derekh-reserva-1", "derekh-reserva-3"]
+
+    def test_todas_falham_retorna_none(self):
+        client = _evolution({i: (lambda ns: (503, {})) for i in cv.EVOLUTION_INSTANCES}, [])
+        resultado = asyncio.run(cv._verificar_whatsapp_lote(["5511900000001"], client))
+        assert resultado == {"5511900000001": None}
+
+    def test_dedup_cache_e_lotes(self):
+        lotes = []
+
+        async def fake_lote(numeros, client=None):
+            lotes.append(list(numeros))
+            return {n: True for n in numeros}
+
+        cv.wa_cache.set("5511900000000", False)
+        numeros = [f"55119000000{i:02d}" for i in range(7)] * 2 + [""]
+        with patch.object(cv, "_verificar_whatsapp_lote", fake_lote), \
+             patch.object(cv, "WA_CHECK_LOTE", 3):
+            resultado = asyncio.run(cv.verificar_whatsapp_numeros(numeros))
+
+        assert resultado["5511900000000"] is False  # veio do cache
+        assert sorted(len(l) for l in lotes) == [3, 3]  # 6 únicos fora do cache
+        assert cv.wa_cache.get("5511900000006") == (True, True)
+
+
+class TestPipeline:
+    def test_uma_carga_uma_gravacao(self):
+        leads = [
+            {"id": 1, "email": "dono@pizzaria.com.br", "telefone1": "(11) 90000-0001",
+             "telefone_proprietario": None, "email_invalido": False},
+            {"id": 2, "email": "", "telefone1": "11 90000-0001",  # mesmo dono, outro CNPJ
+             "telefone_proprietario": None, "email_invalido": False},
+            {"id": 3, "email": "contato@gmail.com", "telefone1": None,
+             "telefone_proprietario": None, "email_invalido": False},
+        ]
+        gravados, lotes = [], []
+
+        async def fake_lote(numeros, client=None):
+            lotes.append(list(numeros))
+            return {n: True for n in numeros}
+
+        with patch.object(cv, "_carregar_leads", return_value=leads) as carregar, \
+             patch.object(cv, "_salvar_validacoes", side_effect=gravados.append), \
+             patch.object(cv, "_verificar_whatsapp_lote", fake_lote):
+            validacoes = asyncio.run(cv.validar_leads_async([1, 2, 3, 99]))
+
+        carregar.assert_called_once()
+        assert lotes == [["5511900000001"]]
+        assert len(gravados) == 1 and gravados[0] is validacoes
+        assert [v["canal_primario"] for v in validacoes] == ["whatsapp", "whatsapp", "email"]
+        assert validacoes[2]["wa_verificado"] is False
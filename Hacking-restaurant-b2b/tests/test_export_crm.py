@@ -0,0 +1,109 @@
+"""
+test_export_crm.py — Exportação em streaming e gravação em lote de envios (crm/database.py).
+
+Usa conexão falsa: valida que a exportação usa cursor nomeado (server-side)
+e escreve o CSV em blocos, e que um lote de envios de campanha vira poucas
+queries numa transação. Não precisa de Postgres.
+
+Rodar:
+  python -m pytest tests/test_export_crm.py -v
+"""
+import os
+import sys
+import csv
+import io
+from unittest.mock import patch
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from crm import database as db
+from conftest import FakeConn
+
+
+def _lead(i, **kw):
+    lead = {c: None for c in db.COLUNAS_EXPORT}
+    lead.update(id=i, razao_social=f"Restaurante {i}", uf="SP", lead_score=i, **kw)
+    return lead
+
+
+class TestExportacao:
+    def test_cursor_nomeado_e_filtros(self, usar_conn):
+        conn = usar_conn(db, FakeConn(linhas=[_lead(1), _lead(2)]))
+        leads = list(db.iterar_leads_para_export({"uf": "sp", "cidade": "campinas"}, tamanho_lote=500))
+        assert [l["id"] for l in leads] == [1, 2]
+        cur = conn.cursores[0]
+        assert cur.name and cur.itersize == 500 and cur.fechado
+        sql, params = conn.statements[0]
+        assert "uf = %s AND cidade = %s" in sql
+        assert params == ["SP", "CAMPINAS"]
+
+    def test_csv_em_blocos(self, usar_conn):
+        conn = usar_conn(db, FakeConn(linhas=[_lead(i, cidade="SÃO PAULO, SP") for i in range(1, 8)]))
+        blocos = list(db.gerar_csv_leads({}, linhas_por_bloco=3))
+
+        assert len(blocos) == 3  # 3 + 3 + (1 restante)
+        linhas = list(csv.reader(io.StringIO("".join(blocos))))
+        assert linhas[0] == db.COLUNAS_EXPORT
+        assert len(linhas) == 8
+        assert linhas[1][db.COLUNAS_EXPORT.index("cidade")] == "SÃO PAULO, SP"
+        assert linhas[1][db.COLUNAS_EXPORT.index("email")] == ""
+        assert "SELECT id, cnpj" in conn.statements[0][0]
+
+    def test_buscar_leads_para_export_compativel(self, usar_conn):
+        conn = usar_conn(db, FakeConn(linhas=[_lead(1)]))
+        assert db.buscar_leads_para_export({})[0]["id"] == 1
+
+
+class TestEnviosEmLote:
+    def test_uma_transacao(self, usar_conn):
+        conn = usar_conn(db, FakeConn())
+        chamadas = []
+        envios = [{"lead_id": i, "template_id": 3, "assunto": "Oi", "tracking_id": f"t{i}",
+                   "pixel_url": "p", "resend_message_id": f"m{i}"} for i in range(250)]
+        with patch("psycopg2.extras.execute_values",
+                   side_effect=lambda cur, sql, linhas, **kw: chamadas.append(linhas)):
+            db.registrar_emails_enviados_lote(envios, campanha_id=9)
+
+        assert [len(c) for c in chamadas] == [250, 250]
+        assert chamadas[0][0][-1] == 9
+        sqls = [s for s, _ in conn.statements]
+        assert any("id = ANY" in s for s in sqls)
+        assert conn.statements[-1][1] == (250, 9)
+        assert conn.commits == 1
+
+    def test_lote_vazio_nao_abre_conexao(self):
+        with patch.object(db, "get_conn", side_effect=AssertionError):
+            db.registrar_emails_enviados_lote([])
+
+
+class TestCampanhaComFalha:
+    def test_envios_registrados_e_status_final_mesmo_com_erro(self):
+        es = pytest.importorskip("crm.email_service")
+
+        def leads():
+            for i in range(3):
+                yield _lead(i, email=f"l{i}@x.com")
+            raise RuntimeError("conexão caiu")
+
+        registrados, status = [], []
+        with patch.object(es, "obter_email_template", return_value={"id": 3}), \
+                patch.object(es, "obter_configuracao", return_value=None), \
+                patch.object(es, "iterar_leads_para_export", side_effect=lambda f: leads()), \
+                patch.object(es, "_enviar_campanha_um",
+                             side_effect=lambda lead, *a: {"lead_id": lead["id"]}), \
+                patch.object(es, "registrar_emails_enviados_lote",
+                             side_effect=lambda envios, cid: registrados.extend(envios)), \
+                patch.object(es, "atualizar_status_campanha",
+                             side_effect=lambda cid, st: status.append(st)):
+            try:
+                es.enviar_campanha(9, {}, 3)
+            except RuntimeError:
+                pass
+            else:
+                raise AssertionError("erro do meio da campanha deveria propagar")
+
+        assert sorted(e["lead_id"] for e in registrados) == [0, 1, 2]
+        assert status == ["enviando", "pausada"]
+
@@ -0,0 +1,100 @@
+"""
+test_ffmpeg_crm.py — ffmpeg com concorrência limitada no bot de vendas (crm/wa_sales_bot.py).
+
+Valida o limite de processos simultâneos, a recusa quando não há slot e a
+análise acústica (Camada 1) feita com um único ffmpeg. Não precisa de ffmpeg
+instalado: subprocess.run é substituído.
+
+Rodar:
+  python -m pytest tests/test_ffmpeg_crm.py -v
+"""
+import os
+import sys
+import time
+import threading
+import subprocess
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+
+from crm import wa_sales_bot as bot
+
+STDERR_ANALISE = """Input #0, mp3, from '/tmp/x.mp3':
+  Duration: 00:00:14.52, start: 0.025057, bitrate: 128 kb/s
+[silencedetect @ 0x1] silence_start: 3.1
+[silencedetect @ 0x1] silence_end: 3.6 | silence_duration: 0.5
+[silencedetect @ 0x1] silence_start: 9.0
+[silencedetect @ 0x1] silence_end: 9.4 | silence_duration: 0.4
+[Parsed_volumedetect_0 @ 0x2] mean_volume: -18.3 dB
+[Parsed_volumedetect_0 @ 0x2] max_volume: -0.5 dB
+"""
+
+
+def _resultado(args, stdout=b"", stderr=""):
+    return subprocess.CompletedProcess(args, 0, stdout=stdout, stderr=stderr)
+
+
+class TestRodarFfmpeg:
+    def test_limita_simultaneos(self):
+        ativos, pico = [0], [0]
+        lock = threading.Lock()
+
+        def fake_run(args, **kw):
+            with lock:
+                ativos[0] += 1
+                pico[0] = max(pico[0], ativos[0])
+            time.sleep(0.05)
+            with lock:
+                ativos[0] -= 1
+            return _resultado(args, stdout=b"OggS")
+
+        slots = threading.BoundedSemaphore(2)
+        with patch.object(bot, "_ffmpeg_slots", slots), \
+             patch("crm.wa_sales_bot.subprocess.run", fake_run):
+            threads = [threading.Thread(target=bot._mp3_to_ogg_opus, args=(b"mp3",)) for _ in range(6)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        assert pico[0] == 2
+
+    def test_sem_slot_recusa(self):
+        slots = threading.BoundedSemaphore(1)
+        slots.acquire()
+        with patch.object(bot, "_ffmpeg_slots", slots), \
+             patch.object(bot, "FFMPEG_ESPERA_MAX", 0.01), \
+             patch("crm.wa_sales_bot.subprocess.run") as run:
+            with pytest.raises(subprocess.TimeoutExpired):
+                bot._rodar_ffmpeg(["ffmpeg"], timeout=1)
+            # Conversão trata a recusa como falha (None), sem derrubar o bot
+            assert bot._mp3_to_ogg_opus(b"mp3") is None
+        run.assert_not_called()
+        slots.release()
+
+
+class TestAnaliseAudio:
+    def test_um_processo_para_duracao_volume_e_silencio(self):
+        chamadas = []
+
+        def fake_run(args, **kw):
+            chamadas.append(args)
+            return _resultado(args, stderr=STDERR_ANALISE)
+
+        with patch("crm.wa_sales_bot.subprocess.run", fake_run):
+            r = bot._analisar_audio_ffmpeg(b"ID3" + b"\x00" * 100)
+
+        assert len(chamadas) == 1
+        assert "volumedetect,silencedetect=noise=-30dB:d=0.3" in chamadas[0]
+        assert r["duracao_s"] == 14.52
+        assert r["volume_max_db"] == -0.5
+        assert r["volume_mean_db"] == -18.3
+        assert r["silencios"] == 2
+        assert r["silencio_total_s"] == 0.9
+        assert r["aprovado"] is True
+
+    def test_ffmpeg_ausente_aprova(self):
+        with patch("crm.wa_sales_bot.subprocess.run", side_effect=FileNotFoundError("ffmpeg")):
+            r = bot._analisar_audio_ffmpeg(b"ID3")
+        assert r["aprovado"] is True
@@ -0,0 +1,180 @@
+"""
+test_pool_crm.py — Pool de conexões do CRM (crm/database.py).
+
+Usa conexões falsas: valida reuso, reciclagem por ociosidade, validação no
+checkout, descarte de conexão morta, rollback na devolução, o lote
+(conexao_compartilhada) e o checkout sem espera na thread do event loop.
+Não precisa de Postgres.
+
+Rodar:
+  python -m pytest tests/test_pool_crm.py -v
+"""
+import os
+import sys
+import time
+import asyncio
+import threading
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+import psycopg2
+
+from crm import database as db
+from conftest import FakeConn
+
+
+def _pool(**kw):
+    criadas = []
+
+    def conectar():
+        c = FakeConn()
+        criadas.append(c)
+        return c
+
+    kw.setdefault("max_conn", 3)
+    return db.PoolConexoes(conectar, **kw), criadas
+
+
+@pytest.fixture
+def pool_global():
+    """Substitui o pool do módulo por um de conexões falsas."""
+    pool, criadas = _pool()
+    with patch.object(db, "_pool", pool):
+        yield pool, criadas
+
+
+class TestPoolConexoes:
+    def test_reusa_conexao(self):
+        pool, criadas = _pool()
+        for _ in range(5):
+            conn = pool.getconn()
+            pool.putconn(conn)
+        assert len(criadas) == 1
+        assert pool.stats["reusadas"] == 4
+
+    def test_recicla_ociosa(self):
+        pool, criadas = _pool(max_idle_seconds=60)
+        conn = pool.getconn()
+        pool.putconn(conn)
+        agora = time.monotonic()
+        with patch("crm.database.time.monotonic", return_value=agora + 61):
+            nova = pool.getconn()
+        assert nova is not conn
+        assert conn.closed
+        assert len(criadas) == 2
+
+    def test_valida_antes_de_entregar_e_descarta_morta(self):
+        pool, criadas = _pool(validar_apos_seconds=5, max_idle_seconds=300)
+        conn = pool.getconn()
+        pool.putconn(conn)
+        conn.morta = True  # flycast derrubou a conexão ociosa
+        agora = time.monotonic()
+        with patch("crm.database.time.monotonic", return_value=agora + 10):
+            nova = pool.getconn()
+        assert nova is not conn
+        assert pool.stats["validacoes_falhas"] == 1
+
+    def test_rollback_na_devolucao(self):
+        pool, _ = _pool()
+        conn = pool.getconn()
+        conn.cursor().execute("UPDATE leads SET notas = 'x'")
+        pool.putconn(conn)
+        assert conn.rollbacks == 1
+        assert not conn.closed
+
+    def test_limite_e_timeout(self):
+        pool, _ = _pool(max_conn=2, checkout_timeout_seconds=0)
+        a, b = pool.getconn(), pool.getconn()
+        with pytest.raises(db.PoolEsgotado):
+            pool.getconn()
+        pool.putconn(a)
+        assert pool.getconn() is a
+        pool.putconn(b)
+
+    def test_espera_devolucao_de_outra_thread(self):
+        pool, _ = _pool(max_conn=1, checkout_timeout_seconds=5)
+        conn = pool.getconn()
+        threading.Timer(0.05, pool.putconn, args=(conn,)).start()
+        assert pool.getconn() is conn
+
+    def test_no_event_loop_falha_sem_esperar(self):
+        pool, _ = _pool(max_conn=1, checkout_timeout_seconds=5)
+        conn = pool.getconn()
+
+        async def handler_async():
+            inicio = time.monotonic()
+            with pytest.raises(db.PoolEsgotado):
+                pool.getconn()
+            return time.monotonic() - inicio
+
+        assert asyncio.run(handler_async()) < 0.5
+        pool.putconn(conn)
+
+    def test_em_thread_do_loop_espera_devolucao(self):
+        pool, _ = _pool(max_conn=1, checkout_timeout_seconds=5)
+        conn = pool.getconn()
+
+        async def handler_async():
+            threading.Timer(0.05, pool.putconn, args=(conn,)).start()
+            return await asyncio.to_thread(pool.getconn)
+
+        assert asyncio.run(handler_async()) is conn
+
+    def test_falha_ao_conectar_libera_vaga(self):
+        def conectar():
+            raise psycopg2.OperationalError("sem rede")
+        pool = db.PoolConexoes(conectar, max_conn=1, checkout_timeout_seconds=0)
+        for _ in range(3):
+            with pytest.raises(psycopg2.OperationalError):
+                pool.getconn()
+        assert pool.tamanho()["total"] == 0
+
+
+class TestGetConn:
+    def test_erro_de_conexao_descarta(self, pool_global):
+        pool, criadas = pool_global
+        with pytest.raises(psycopg2.OperationalError):
+            with db.get_conn() as conn:
+                conn.morta = True
+                conn.cursor().execute("SELECT 1")
+        assert criadas[0].closed
+        assert pool.tamanho()["total"] == 0
+
+    def test_lote_compartilha_conexao(self, pool_global):
+        pool, criadas = pool_global
+        with db.conexao_compartilhada() as lote:
+            with db.get_conn() as a:
+                a.cursor().execute("SELECT 1")
+            with db.get_conn() as b:
+                b.cursor().execute("SELECT 2")
+            # Aninhado reusa o mesmo lote
+            with db.conexao_compartilhada() as interno:
+                assert interno is lote
+            assert a is b is lote
+            assert pool.tamanho()["livres"] == 0
+        assert len(criadas) == 1
+        assert pool.tamanho()["livres"] == 1
+
+    def test_erro_no_lote_faz_rollback_e_segue(self, pool_global):
+        _, criadas = pool_global
+        with db.conexao_compartilhada():
+            with pytest.raises(ValueError):
+                with db.get_conn() as conn:
+                    conn.cursor().execute("SELECT 1")
+                    raise ValueError("query quebrada")
+            with db.get_conn() as conn:
+                conn.cursor().execute("SELECT 2")
+        assert criadas[0].rollbacks >= 1
+        assert len(criadas) == 1
+
+    def test_lote_isolado_por_thread(self, pool_global):
+        _, criadas = pool_global
+        vistos = []
+        with db.conexao_compartilhada() as lote:
+            t = threading.Thread(target=lambda: vistos.append(db._conn_lote.get()))
+            t.start()
+            t.join()
+        assert vistos == [None]
+        assert lote is criadas[0]
@@ -0,0 +1,79 @@
+"""
+test_scoring_crm.py — Rescore em lote e score decay (crm/scoring.py).
+
+Usa conexão falsa: valida paginação keyset (sem OFFSET), carga via temp
+table + um UPDATE ... FROM por página e decay num único statement. O CASE de
+tier é conferido contra calcular_tier() no sqlite. Não precisa de Postgres.
+
+Rodar:
+  python -m pytest tests/test_scoring_crm.py -v
+"""
+import os
+import sys
+import sqlite3
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from crm import scoring
+from conftest import FakeConn
+
+
+def _responder(leads=()):
+    leads = list(leads)
+
+    def responder(cur, sql, params):
+        if "COUNT(*) as total" in sql:
+            return [{"total": len(leads)}]
+        if sql.startswith("SELECT") and "FROM leads" in sql:
+            ultimo, limite = params
+            return [l for l in leads if l["id"] > ultimo][:limite]
+        if "WITH decaidos" in sql:
+            return [{"processados": 4, "decaidos": 4}]
+        if sql.startswith("UPDATE"):
+            cur.rowcount = 2
+    return responder
+
+
+class TestCalcularScoresTodos:
+    def test_keyset_e_um_update_por_pagina(self, usar_conn):
+        conn = usar_conn(scoring, FakeConn(_responder({"id": i, "status_pipeline": "novo"} for i in (3, 8, 15, 21, 40))))
+        inseridos = []
+        with patch("psycopg2.extras.execute_values",
+                   side_effect=lambda cur, sql, valores, page_size: inseridos.append(valores)):
+            stats = scoring.calcular_scores_todos(batch_size=2)
+
+        assert stats["total"] == 5
+        assert stats["atualizados"] == 5
+        assert stats["alterados"] == 6  # 3 páginas × rowcount falso
+        assert sum(stats["por_segmento"].values()) == 5
+
+        selects = [p for s, p in conn.statements if s.startswith("SELECT id,")]
+        assert selects == [(0, 2), (8, 2), (21, 2), (40, 2)]
+        assert not any("OFFSET" in s for s, _ in conn.statements)
+        updates = [s for s, _ in conn.statements if s.startswith("UPDATE leads")]
+        assert len(updates) == 3
+        assert "FROM _rescore_leads" in updates[0]
+        assert [v[0] for v in inseridos[0]] == [3, 8]
+        assert conn.commits == 3
+
+
+class TestDecaimento:
+    def test_um_statement(self, usar_conn):
+        conn = usar_conn(scoring, FakeConn(_responder()))
+        stats = scoring.aplicar_decaimento_scores()
+        assert stats == {"processados": 4, "decaidos": 4}
+        assert len(conn.statements) == 1
+        sql, params = conn.statements[0]
+        assert "INSERT INTO lead_eventos" in sql
+        assert params == (7, 7)
+
+    def test_formula_igual_a_python(self):
+        db = sqlite3.connect(":memory:")
+        expr = "MAX(10, s - MAX(1, s / 20))"  # sqlite: MAX escalar = GREATEST
+        for s in range(11, 101):
+            esperado = max(10, s - max(1, int(s * 0.05)))
+            novo, tier = db.execute(f"SELECT {expr}, {scoring._sql_tier(expr)} FROM (SELECT ? AS s)",
+                                    (s,)).fetchone()
+            assert novo == esperado
+            assert tier == scoring.calcular_tier(esperado)
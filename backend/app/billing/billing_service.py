@@ -10,6 +10,7 @@ from typing import Optional
 from sqlalchemy.orm import Session
 
 from .. import models
+from ..middleware import invalidar_dominio_tenant
 from .asaas_client import asaas_client
 from ..feature_flags import (
     get_tier, get_features_list_for_plano, get_new_features_for_plano,
@@ -403,6 +404,11 @@ async def suspender_por_inadimplencia(restaurante: models.Restaurante, db: Sessi
         dom.ativo = False
 
     db.commit()
+    invalidar_dominio_tenant(
+        *[d.dominio for d in dominios],
+        restaurante_id=restaurante.id,
+        codigo_acesso=restaurante.codigo_acesso,
+    )
     registrar_audit(db, restaurante.id, "suspended_billing", {
         "dias_vencido": restaurante.dias_vencido,
     }, automatico=True)
@@ -425,6 +431,11 @@ async def reativar_por_pagamento(restaurante: models.Restaurante, db: Session):
         dom.ativo = True
 
     db.commit()
+    invalidar_dominio_tenant(
+        *[d.dominio for d in dominios],
+        restaurante_id=restaurante.id,
+        codigo_acesso=restaurante.codigo_acesso,
+    )
     registrar_audit(db, restaurante.id, "reactivated_payment", automatico=True)
     logger.info(f"Restaurante {restaurante.id} reativado por pagamento")
 
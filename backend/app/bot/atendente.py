@@ -13,12 +13,9 @@ from sqlalchemy.orm import Session
 
 from .. import models
 from ..database import SessionLocal
-from . import evolution_client, groq_stt, xai_tts, xai_llm
+from . import evolution_client, groq_stt, xai_llm
 from . import whatsapp_client as _wa
-try:
-    from . import fish_tts as _fish_tts
-except ImportError:
-    _fish_tts = None
+from . import audio_cache as _audio_cache
 from .context_builder import build_system_prompt, build_restaurant_context, build_client_context, build_conversation_history
 from .function_calls import TOOLS, executar_funcao
 from . import phone_pool as _phone_pool
@@ -134,8 +131,10 @@ def _preparar_texto_para_audio(texto: str) -> str:
     return texto.strip()
 
 
-async def processar_webhook(payload: dict) -> dict:
-    """Processa webhook da Evolution API. Ponto de entrada principal."""
+async def processar_webhook(payload: dict, aguardar: bool = False) -> dict:
+    """Processa webhook da Evolution API. Ponto de entrada principal.
+    aguardar=True (consumidor da webhook_fila): espera o atendimento terminar,
+    para a concorrência da fila valer; senão dispara em background."""
     event = payload.get("event")
 
     # Apenas processar mensagens recebidas
@@ -185,19 +184,27 @@ async def processar_webhook(payload: dict) -> dict:
         else:
             return {"status": "ignored", "reason": "no_text_no_audio"}
 
+    processamento = _processar_mensagem(numero, texto, audio_msg, msg_id, instance)
+    if aguardar:
+        await processamento
+        return {"status": "processed"}
+
     # Processar em background para resposta rápida ao webhook
-    asyncio.create_task(_processar_mensagem(numero, texto, audio_msg, msg_id, instance))
+    asyncio.create_task(processamento)
 
     return {"status": "processing"}
 
 
-async def processar_webhook_meta(payload: dict) -> dict:
+async def processar_webhook_meta(payload: dict, aguardar: bool = False) -> dict:
     """Processa webhook da Meta Cloud API. Ponto de entrada para provider 'meta'.
-    Extrai mensagens do payload Meta e despacha para _processar_mensagem_meta()."""
+    Extrai mensagens do payload Meta e despacha para _processar_mensagem_meta()
+    (aguardar=True: espera todas, como em processar_webhook)."""
     entries = payload.get("entry", [])
     if not entries:
         return {"status": "ignored", "reason": "no_entry"}
 
+    pendentes = []
+
     for entry in entries:
         changes = entry.get("changes", [])
         for change in changes:
@@ -261,11 +268,18 @@ async def processar_webhook_meta(payload: dict) -> dict:
                 if not texto and not audio_meta:
                     continue
 
-                # Processar em background
-                asyncio.create_task(
+                pendentes.append(
                     _processar_mensagem_meta(numero, texto, audio_meta, msg_id, phone_number_id)
                 )
 
+    if aguardar:
+        await asyncio.gather(*pendentes)
+        return {"status": "processed"}
+
+    # Processar em background
+    for processamento in pendentes:
+        asyncio.create_task(processamento)
+
     return {"status": "processing"}
 
 
@@ -559,22 +573,12 @@ async def _processar_mensagem_meta(
             if enviar_audio and bot_config.tts_autonomo:
                 resposta_audio = _preparar_texto_para_audio(resposta_final)
 
-                audio_b64 = None
-                tts_provider = getattr(bot_config, "tts_provider", "") or ""
-                if tts_provider.lower() == "fish" and _fish_tts:
-                    audio_b64 = await _fish_tts.gerar_audio(
-                        resposta_audio,
-                        voz=bot_config.voz_tts or "",
-                        idioma=bot_config.idioma or "pt-BR",
-                    )
-                    if audio_b64:
-                        logger.info("TTS via Fish Audio S2-Pro (Meta)")
-                if not audio_b64:
-                    audio_b64 = await xai_tts.gerar_audio(resposta_audio, bot_config.voz_tts or "ara", bot_config.idioma or "pt-BR")
-                if audio_b64:
+                # TTS com cache por conteúdo (Fish → fallback xAI); OGG/Opus cacheado
+                audio = await _audio_cache.sintetizar(resposta_audio, bot_config)
+                if audio:
                     try:
                         await _wa.enviar_presenca_conversa(numero, bot_config, presenca="recording", delay_ms=3000)
-                        await _wa.enviar_audio_ptt(numero, audio_b64, bot_config)
+                        await _wa.enviar_audio_tts(numero, audio, bot_config)
                     except Exception as audio_err:
                         logger.warning(f"Áudio Meta falhou, enviando texto: {audio_err}")
                         await _wa.enviar_texto(numero, resposta_final, bot_config)
@@ -944,27 +948,16 @@ async def _processar_mensagem(
                 # ÁUDIO: transformar português correto → dicção falada brasileira
                 resposta_audio = _preparar_texto_para_audio(resposta_final)
 
-                # Dual-mode TTS: Fish Audio (se configurado) → fallback xAI Grok
-                audio_b64 = None
-                tts_provider = getattr(bot_config, "tts_provider", "") or ""
-                if tts_provider.lower() == "fish" and _fish_tts:
-                    audio_b64 = await _fish_tts.gerar_audio(
-                        resposta_audio,
-                        voz=bot_config.voz_tts or "",
-                        idioma=bot_config.idioma or "pt-BR",
-                    )
-                    if audio_b64:
-                        logger.info("TTS via Fish Audio S2-Pro")
-                if not audio_b64:
-                    audio_b64 = await xai_tts.gerar_audio(resposta_audio, bot_config.voz_tts or "ara", bot_config.idioma or "pt-BR")
-                if audio_b64:
+                # Dual-mode TTS: Fish Audio (se configurado) → fallback xAI Grok, com cache
+                audio = await _audio_cache.sintetizar(resposta_audio, bot_config)
+                if audio:
                     try:
                         await evolution_client.enviar_presenca_conversa(
                             numero, _send_instance, _send_url, _send_key,
                             presenca="recording", delay_ms=3000,
                         )
                         await evolution_client.enviar_audio_ptt(
-                            numero, audio_b64, _send_instance, _send_url, _send_key,
+                            numero, audio.base64_mp3(), _send_instance, _send_url, _send_key,
                             delay_ms=3000,
                         )
                     except Exception as audio_err:
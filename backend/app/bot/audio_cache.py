@@ -0,0 +1,291 @@
+"""
+Cache de áudio TTS endereçado por conteúdo — Bot WhatsApp.
+
+Chave = sha256(texto normalizado + provider + voz + idioma + emoção). Cada
+entrada guarda o MP3 do TTS e, quando algum envio Meta precisa, a variante
+OGG/Opus já transcodificada — respostas repetidas ("Seu pedido saiu!",
+saudações) saem sem chamada de TTS e sem ffmpeg.
+
+Camadas:
+- Disco local (TTS_CACHE_DIR, fora de backend/static — não é servido
+  publicamente) com despejo LRU por tamanho total (TTS_CACHE_MAX_MB)
+- Storage R2 opcional (TTS_CACHE_R2=1 + STORAGE_BACKEND=r2) compartilhado
+  entre máquinas — best-effort, erro de R2 nunca quebra o envio
+
+Os bytes circulam crus (sem base64); o base64 só é feito para a Evolution.
+Nos caminhos async, leitura e escrita em disco rodam em asyncio.to_thread.
+"""
+import asyncio
+import base64
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Set
+
+logger = logging.getLogger("superfood.bot.audio_cache")
+
+TTS_CACHE_DIR = os.environ.get("TTS_CACHE_DIR", os.path.join(tempfile.gettempdir(), "derekh_tts_cache"))
+TTS_CACHE_MAX_MB = int(os.environ.get("TTS_CACHE_MAX_MB", "256"))
+TTS_CACHE_R2 = os.environ.get("TTS_CACHE_R2", "0") == "1"
+TTS_CACHE_R2_PREFIXO = "tts-cache"
+
+# Muda quando o pipeline de áudio muda (pronúncia, bitrate) — invalida tudo
+_VERSAO_CHAVE = "v1"
+
+_EXTENSOES = {"mp3": ".mp3", "ogg": ".ogg"}
+
+# Uploads R2 em background: o loop só guarda referência fraca das tasks
+_uploads_r2: Set[asyncio.Task] = set()
+
+
+def _upload_r2_concluido(task: asyncio.Task):
+    _uploads_r2.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"Falha ao subir áudio TTS no R2: {task.exception()}")
+
+
+def _normalizar_texto(texto: str) -> str:
+    """NFC + espaços colapsados. Pontuação e caixa ficam (mudam a entonação)."""
+    return " ".join(unicodedata.normalize("NFC", texto or "").split())
+
+
+def chave_audio(texto: str, provider: str, voz: str = "", idioma: str = "pt-BR",
+                emocao: str = "") -> str:
+    """Chave de conteúdo do áudio TTS."""
+    partes = [_VERSAO_CHAVE, provider, voz or "", idioma or "", emocao or "",
+              _normalizar_texto(texto)]
+    return hashlib.sha256("\x1f".join(partes).encode("utf-8")).hexdigest()
+
+
+class AudioTTS:
+    """Áudio sintetizado: MP3 + OGG/Opus (transcodificado sob demanda e cacheado)."""
+
+    def __init__(self, chave: str, mp3: bytes, ogg: Optional[bytes] = None,
+                 cache: Optional["AudioCache"] = None, do_cache: bool = False):
+        self.chave = chave
+        self.mp3 = mp3
+        self._ogg = ogg
+        self._cache = cache
+        self.do_cache = do_cache
+
+    def base64_mp3(self) -> str:
+        """Para a Evolution (JSON exige base64)."""
+        return base64.b64encode(self.mp3).decode("ascii")
+
+    async def ogg_opus(self) -> Optional[bytes]:
+        """OGG/Opus para PTT Meta — do cache ou via ffmpeg (uma vez por chave)."""
+        if self._ogg is None and self._cache is not None:
+            self._ogg = await asyncio.to_thread(self._cache.get, self.chave, "ogg")
+        if self._ogg is None:
+            from .whatsapp_client import _mp3_to_ogg_opus
+            self._ogg = await _mp3_to_ogg_opus(self.mp3)
+            if self._ogg and self._cache is not None:
+                await self._cache.put(self.chave, "ogg", self._ogg)
+        return self._ogg
+
+
+class AudioCache:
+    """Store de áudio em disco com LRU por bytes + R2 opcional."""
+
+    def __init__(self, diretorio: str = TTS_CACHE_DIR, max_bytes: int = TTS_CACHE_MAX_MB * 1024 * 1024,
+                 usar_r2: bool = TTS_CACHE_R2):
+        self.diretorio = Path(diretorio)
+        self.max_bytes = max_bytes
+        self.usar_r2 = usar_r2
+        self._lru: "OrderedDict[str, int]" = OrderedDict()  # arquivo -> bytes
+        self._total = 0
+        self._lock = threading.Lock()
+        self._carregado = False
+        self._em_voo: dict[str, asyncio.Future] = {}
+        self.stats = {"hits": 0, "hits_r2": 0, "misses": 0, "despejados": 0}
+
+    # ---------- disco ----------
+
+    def _carregar_indice(self):
+        """Reconstrói o LRU a partir do disco (ordem por último acesso)."""
+        if self._carregado:
+            return
+        with self._lock:
+            if self._carregado:
+                return
+            self.diretorio.mkdir(parents=True, exist_ok=True)
+            arquivos = []
+            for f in self.diretorio.iterdir():
+                if f.suffix in (".mp3", ".ogg"):
+                    st = f.stat()
+                    arquivos.append((st.st_mtime, f.name, st.st_size))
+            for _, nome, tamanho in sorted(arquivos):
+                self._lru[nome] = tamanho
+                self._total += tamanho
+            self._carregado = True
+
+    def _arquivo(self, chave: str, formato: str) -> Path:
+        return self.diretorio / f"{chave}{_EXTENSOES[formato]}"
+
+    def get(self, chave: str, formato: str = "mp3") -> Optional[bytes]:
+        """Lê do disco e marca como usado recentemente."""
+        self._carregar_indice()
+        caminho = self._arquivo(chave, formato)
+        try:
+            dados = caminho.read_bytes()
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            if caminho.name in self._lru:
+                self._lru.move_to_end(caminho.name)
+        try:
+            os.utime(caminho)  # LRU sobrevive a restart
+        except OSError:
+            pass
+        return dados
+
+    def _gravar_disco(self, chave: str, formato: str, dados: bytes):
+        self._carregar_indice()
+        caminho = self._arquivo(chave, formato)
+        tmp = caminho.with_suffix(caminho.suffix + f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(dados)
+        os.replace(tmp, caminho)  # atômico: leitor nunca vê arquivo parcial
+
+        despejar = []
+        with self._lock:
+            self._total -= self._lru.pop(caminho.name, 0)
+            self._lru[caminho.name] = len(dados)
+            self._total += len(dados)
+            while self._total > self.max_bytes and len(self._lru) > 1:
+                nome, tamanho = self._lru.popitem(last=False)
+                self._total -= tamanho
+                despejar.append(nome)
+        for nome in despejar:
+            try:
+                (self.diretorio / nome).unlink()
+                self.stats["despejados"] += 1
+            except FileNotFoundError:
+                pass
+
+    # ---------- R2 ----------
+
+    def _chave_r2(self, chave: str, formato: str) -> str:
+        return f"{TTS_CACHE_R2_PREFIXO}/{chave}{_EXTENSOES[formato]}"
+
+    async def _get_r2(self, chave: str, formato: str) -> Optional[bytes]:
+        if not self.usar_r2:
+            return None
+        try:
+            from ..storage import get_storage
+            return await asyncio.to_thread(get_storage().download, self._chave_r2(chave, formato))
+        except Exception as e:
+            logger.debug(f"R2 indisponível para cache TTS: {e}")
+            return None
+
+    async def _put_r2(self, chave: str, formato: str, dados: bytes):
+        if not self.usar_r2:
+            return
+        from ..storage import get_storage
+        content_type = "audio/mpeg" if formato == "mp3" else "audio/ogg"
+        await asyncio.to_thread(get_storage().upload, dados, self._chave_r2(chave, formato), content_type)
+
+    # ---------- API ----------
+
+    async def obter(self, chave: str, formato: str = "mp3") -> Optional[bytes]:
+        """Disco → R2 (e reidrata o disco)."""
+        dados = await asyncio.to_thread(self.get, chave, formato)
+        if dados is not None:
+            return dados
+        dados = await self._get_r2(chave, formato)
+        if dados is not None:
+            await asyncio.to_thread(self._gravar_disco, chave, formato, dados)
+            self.stats["hits_r2"] += 1
+        return dados
+
+    async def put(self, chave: str, formato: str, dados: bytes):
+        """Grava no disco e, em background, no R2."""
+        try:
+            await asyncio.to_thread(self._gravar_disco, chave, formato, dados)
+        except OSError as e:
+            logger.warning(f"Falha ao gravar cache TTS em disco: {e}")
+        if self.usar_r2:
+            task = asyncio.create_task(self._put_r2(chave, formato, dados))
+            _uploads_r2.add(task)
+            task.add_done_callback(_upload_r2_concluido)
+
+    async def obter_ou_gerar(self, chave: str, gerar) -> Optional[AudioTTS]:
+        """Retorna o áudio da chave; na falta, chama gerar() (corrotina → bytes MP3).
+
+        Single-flight: N conversas pedindo o mesmo texto ao mesmo tempo
+        disparam uma única chamada de TTS."""
+        mp3 = await self.obter(chave, "mp3")
+        if mp3 is not None:
+            self.stats["hits"] += 1
+            return AudioTTS(chave, mp3, cache=self, do_cache=True)
+
+        pendente = self._em_voo.get(chave)
+        if pendente is not None:
+            mp3 = await asyncio.shield(pendente)
+            return AudioTTS(chave, mp3, cache=self, do_cache=True) if mp3 else None
+
+        futuro = asyncio.get_running_loop().create_future()
+        self._em_voo[chave] = futuro
+        mp3 = None
+        try:
+            self.stats["misses"] += 1
+            mp3 = await gerar()
+            if mp3:
+                await self.put(chave, "mp3", mp3)
+        finally:
+            futuro.set_result(mp3)
+            self._em_voo.pop(chave, None)
+        return AudioTTS(chave, mp3, cache=self) if mp3 else None
+
+    def limpar(self):
+        """Remove todo o cache em disco (não toca no R2)."""
+        self._carregar_indice()
+        with self._lock:
+            nomes = list(self._lru)
+            self._lru.clear()
+            self._total = 0
+        for nome in nomes:
+            try:
+                (self.diretorio / nome).unlink()
+            except FileNotFoundError:
+                pass
+
+
+audio_cache = AudioCache()
+
+
+async def sintetizar(texto: str, bot_config, emocao: str = "") -> Optional[AudioTTS]:
+    """TTS com cache: Fish Audio (se tts_provider='fish') → fallback xAI.
+
+    Retorna AudioTTS (mp3 + ogg_opus() sob demanda) ou None se nenhum TTS respondeu."""
+    from . import xai_tts
+    try:
+        from . import fish_tts
+    except ImportError:
+        fish_tts = None
+
+    idioma = bot_config.idioma or "pt-BR"
+    tts_provider = (getattr(bot_config, "tts_provider", "") or "").lower()
+
+    if tts_provider == "fish" and fish_tts and os.environ.get("FISH_API_KEY"):
+        voz = bot_config.voz_tts or os.environ.get("FISH_VOICE_ID", "")
+        audio = await audio_cache.obter_ou_gerar(
+            chave_audio(texto, "fish", voz, idioma, emocao),
+            lambda: fish_tts.gerar_audio_bytes(texto, voz=voz, idioma=idioma, emocao=emocao),
+        )
+        if audio:
+            logger.info(f"TTS Fish Audio ({'cache' if audio.do_cache else 'gerado'})")
+            return audio
+
+    voz = bot_config.voz_tts or "ara"
+    audio = await audio_cache.obter_ou_gerar(
+        chave_audio(texto, "xai", voz, idioma),
+        lambda: xai_tts.gerar_audio_bytes(texto, voz, idioma),
+    )
+    if audio and audio.do_cache:
+        logger.info("TTS xAI (cache)")
+    return audio
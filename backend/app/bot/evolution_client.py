@@ -8,6 +8,8 @@ import logging
 import os
 from typing import Optional
 
+from ..webhook_fila import registrar_resposta_enviada
+
 logger = logging.getLogger("superfood.bot.evolution")
 
 # Timeout padrão para chamadas Evolution
@@ -80,6 +82,7 @@ async def enviar_texto(
     async with httpx.AsyncClient(timeout=_TIMEOUT + (delay_ms / 1000)) as client:
         resp = await client.post(url, json=payload, headers=headers)
         resp.raise_for_status()
+        registrar_resposta_enviada()
         data = resp.json()
         logger.info(f"Texto enviado para {numero[:8]}*** via {instance}")
         return data
@@ -109,6 +112,7 @@ async def enviar_audio_ptt(
     async with httpx.AsyncClient(timeout=30 + (delay_ms / 1000)) as client:
         resp = await client.post(url, json=payload, headers=headers)
         resp.raise_for_status()
+        registrar_resposta_enviada()
         data = resp.json()
         logger.info(f"Áudio PTT enviado para {numero[:8]}*** via {instance}")
         return data
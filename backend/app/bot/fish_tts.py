@@ -47,9 +47,9 @@ def _preparar_texto_fish(texto: str, emocao: str = "") -> str:
     return texto
 
 
-async def gerar_audio(texto: str, voz: str = "", idioma: str = "pt-BR",
-                      emocao: str = "") -> str | None:
-    """Gera áudio TTS via Fish Audio e retorna base64 MP3.
+async def gerar_audio_bytes(texto: str, voz: str = "", idioma: str = "pt-BR",
+                            emocao: str = "") -> bytes | None:
+    """Gera áudio TTS via Fish Audio e retorna os bytes MP3 (sem base64).
 
     Args:
         texto: Texto para converter em áudio
@@ -58,7 +58,7 @@ async def gerar_audio(texto: str, voz: str = "", idioma: str = "pt-BR",
         emocao: Tag de emoção livre (ex: "amigável", "empolgado")
 
     Returns:
-        Base64 MP3 string ou None em caso de erro/sem API key.
+        Bytes MP3 ou None em caso de erro/sem API key.
     """
     fish_key = os.environ.get("FISH_API_KEY", "")
     if not fish_key:
@@ -93,10 +93,22 @@ async def gerar_audio(texto: str, voz: str = "", idioma: str = "pt-BR",
             )
             resp.raise_for_status()
             audio_bytes = resp.content
-            audio_b64 = base64.b64encode(audio_bytes).decode("utf-8")
             logger.info(f"Fish TTS: {len(texto)} chars → {len(audio_bytes)} bytes")
-            return audio_b64
+            return audio_bytes
 
     except Exception as e:
         logger.error(f"Erro Fish Audio TTS: {e}")
         return None
+
+
+async def gerar_audio(texto: str, voz: str = "", idioma: str = "pt-BR",
+                      emocao: str = "") -> str | None:
+    """Gera áudio TTS via Fish Audio e retorna base64 MP3.
+
+    Returns:
+        Base64 MP3 string ou None em caso de erro/sem API key.
+    """
+    audio_bytes = await gerar_audio_bytes(texto, voz, idioma, emocao)
+    if audio_bytes is None:
+        return None
+    return base64.b64encode(audio_bytes).decode("utf-8")
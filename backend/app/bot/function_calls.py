@@ -6,6 +6,7 @@ Pix Online: quando forma_pagamento='pix' e restaurante tem PixConfig ativo,
 o pedido fica pendente e gera link de pagamento automaticamente.
 """
 import json
+import asyncio
 import random
 import string
 import logging
@@ -16,6 +17,7 @@ from sqlalchemy.orm import Session
 from typing import Optional
 
 from .. import models
+from ..utils.comanda import proxima_comanda as alocar_comanda
 from ..email_service import BASE_URL
 
 logger = logging.getLogger("superfood.bot.functions")
@@ -464,7 +466,7 @@ async def executar_funcao(
         elif nome == "atualizar_endereco_cliente":
             result = _atualizar_endereco_cliente(db, restaurante_id, args)
         elif nome == "validar_endereco":
-            result = _validar_endereco(db, restaurante_id, args, conversa)
+            result = await _validar_endereco(db, restaurante_id, args, conversa)
         elif nome == "confirmar_endereco_validado":
             result = _confirmar_endereco_validado(db, restaurante_id, args, conversa)
         elif nome == "gerar_cobranca_pix":
@@ -762,8 +764,8 @@ async def _criar_pedido(db: Session, restaurante_id: int, bot_config: models.Bot
         models.Cliente.telefone.like(f"%{tel_limpo[-8:]}"),
     ).first()
 
-    # Gerar comanda
-    comanda = f"WA{random.randint(1000, 9999)}"
+    # Gerar comanda (mesma numeração das outras origens; prefixo WA identifica o bot)
+    comanda = f"WA{alocar_comanda(db, restaurante_id)}"
 
     # Calcular taxa de entrega e distância
     taxa_entrega = 0
@@ -2136,9 +2138,9 @@ def _reverse_geocode_country(lat: float, lng: float) -> Optional[str]:
     return None
 
 
-def _validar_endereco(db: Session, restaurante_id: int, args: dict, conversa: Optional[models.BotConversa]) -> str:
-    """Valida endereço via Mapbox geocoding, calcula distância e taxa de entrega."""
-    from utils.mapbox_api import autocomplete_address
+async def _validar_endereco(db: Session, restaurante_id: int, args: dict, conversa: Optional[models.BotConversa]) -> str:
+    """Valida endereço (histórico do restaurante ou Mapbox), calcula distância e taxa de entrega."""
+    from ..enderecos_service import enderecos_service
     from utils.haversine import haversine
 
     endereco_texto = args.get("endereco_texto", "").strip()
@@ -2194,11 +2196,16 @@ def _validar_endereco(db: Session, restaurante_id: int, args: dict, conversa: Op
         if estado and estado.isalpha() and len(estado) <= 4:
             query = f"{query}, {estado}"
 
-    sugestoes_raw = autocomplete_address(query, proximity, country=pais)
+    # Endereço já entregue por este restaurante: sem chamada ao Mapbox
+    sugestoes_raw = await asyncio.to_thread(enderecos_service.buscar_historico, db, restaurante_id, endereco_texto)
+    do_historico = bool(sugestoes_raw)
+
+    if not sugestoes_raw:
+        sugestoes_raw = await enderecos_service.autocompletar(query, proximity, country=pais)
 
     # Fallback: sem cidade (query livre)
     if not sugestoes_raw and query != endereco_texto:
-        sugestoes_raw = autocomplete_address(endereco_texto, proximity, country=pais)
+        sugestoes_raw = await enderecos_service.autocompletar(endereco_texto, proximity, country=pais)
 
     if not sugestoes_raw:
         return json.dumps({
@@ -2273,7 +2280,8 @@ def _validar_endereco(db: Session, restaurante_id: int, args: dict, conversa: Op
     cidade_rest = (restaurante.cidade or "").strip()
     cidade_rest_norm = _normalize_text(cidade_rest) if cidade_rest else ""
     if cidade_rest_norm and dentro:
-        na_cidade = [s for s in dentro if cidade_rest_norm in _normalize_text(s["place_name"])]
+        # Histórico já foi entregue por este restaurante (place_name pode não trazer a cidade)
+        na_cidade = [s for s in dentro if do_historico or cidade_rest_norm in _normalize_text(s["place_name"])]
         if na_cidade:
             dentro = na_cidade  # Priorizar resultados na cidade correta
         elif pais and pais != "BR":
@@ -2290,7 +2298,7 @@ def _validar_endereco(db: Session, restaurante_id: int, args: dict, conversa: Op
     if not dentro and fora:
         # Todos fora da zona — verificar se estão em cidades erradas
         if cidade_rest_norm:
-            na_cidade_fora = [s for s in fora if cidade_rest_norm in _normalize_text(s["place_name"])]
+            na_cidade_fora = [s for s in fora if do_historico or cidade_rest_norm in _normalize_text(s["place_name"])]
             if not na_cidade_fora and pais == "BR":
                 # Nenhum resultado na cidade do restaurante (só bloquear para BR)
                 return json.dumps({
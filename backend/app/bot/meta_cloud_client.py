@@ -15,6 +15,8 @@ from typing import Optional
 
 import httpx
 
+from ..webhook_fila import registrar_resposta_enviada
+
 logger = logging.getLogger("superfood.bot.meta_cloud")
 
 META_API_BASE = "https://graph.facebook.com/v22.0"
@@ -68,6 +70,7 @@ async def enviar_template(
     async with httpx.AsyncClient(timeout=_TIMEOUT) as client:
         resp = await client.post(url, json=payload, headers=headers)
         resp.raise_for_status()
+        registrar_resposta_enviada()
         data = resp.json()
         logger.info(f"Template '{template_name}' enviado para {numero_cliente[:8]}***")
         return data
@@ -98,6 +101,7 @@ async def enviar_texto_livre(
     async with httpx.AsyncClient(timeout=_TIMEOUT) as client:
         resp = await client.post(url, json=payload, headers=headers)
         resp.raise_for_status()
+        registrar_resposta_enviada()
         data = resp.json()
         logger.info(f"Texto livre Meta enviado para {numero_cliente[:8]}***")
         return data
@@ -0,0 +1,203 @@
+"""
+Serviço de transcodificação de áudio — Bot WhatsApp.
+
+MP3 (TTS) → OGG/Opus (PTT Meta) com pool limitado, fila e backpressure.
+Antes, cada conversão fazia fork de um ffmpeg novo sem limite — uma rajada
+de respostas em áudio abria dezenas de processos numa máquina Fly pequena.
+
+- Pool fixo de TRANSCODER_WORKERS threads; cada uma faz uma conversão por vez
+  (no máximo TRANSCODER_WORKERS ffmpeg vivos ao mesmo tempo)
+- Encode in-process via PyAV (`av`) quando instalado — zero fork; qualquer
+  falha cai para o ffmpeg em subprocesso
+- Backpressure: com TRANSCODER_FILA_MAX conversões aguardando, novas são
+  recusadas na hora (TranscoderOcupado) em vez de empilhar memória e latência
+- Métricas: espera na fila e tempo de encode (HistogramaLog), por backend
+"""
+import asyncio
+import io
+import logging
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+try:
+    import av as _av
+except ImportError:
+    _av = None
+
+from ..metrics import HistogramaLog
+
+logger = logging.getLogger("superfood.bot.transcoder")
+
+TRANSCODER_WORKERS = int(os.environ.get("TRANSCODER_WORKERS", "2"))
+TRANSCODER_FILA_MAX = int(os.environ.get("TRANSCODER_FILA_MAX", "32"))
+TRANSCODER_TIMEOUT = float(os.environ.get("TRANSCODER_TIMEOUT", "15"))
+TRANSCODER_INPROCESS = os.environ.get("TRANSCODER_INPROCESS", "1") == "1"
+
+_OPUS_BITRATE = 64000
+_OGG_MIN_BYTES = 100
+
+
+class TranscoderOcupado(Exception):
+    """Fila cheia — chamador decide (texto em vez de áudio, retry)."""
+
+
+def _ffmpeg_mp3_para_ogg(mp3_bytes: bytes, timeout: float) -> Optional[bytes]:
+    """ffmpeg em subprocesso, em memória (stdin/stdout)."""
+    proc = subprocess.run(
+        ["ffmpeg", "-i", "pipe:0",
+         "-c:a", "libopus", "-b:a", f"{_OPUS_BITRATE // 1000}k",
+         "-f", "ogg", "pipe:1",
+         "-loglevel", "error"],
+        input=mp3_bytes, capture_output=True, timeout=timeout,
+    )
+    if proc.returncode != 0:
+        logger.error(f"ffmpeg erro: {proc.stderr.decode(errors='replace')[:200]}")
+        return None
+    return proc.stdout
+
+
+def _pyav_mp3_para_ogg(mp3_bytes: bytes) -> bytes:
+    """Encode in-process com PyAV (libav* linkado, sem fork).
+    O encoder do PyAV reamostra e reempacota no frame_size do Opus."""
+    saida_buf = io.BytesIO()
+    with _av.open(io.BytesIO(mp3_bytes), format="mp3") as entrada, \
+            _av.open(saida_buf, mode="w", format="ogg") as saida:
+        stream = saida.add_stream("libopus", rate=48000)
+        stream.bit_rate = _OPUS_BITRATE
+        for frame in entrada.decode(audio=0):
+            frame.pts = None
+            for pacote in stream.encode(frame):
+                saida.mux(pacote)
+        for pacote in stream.encode(None):
+            saida.mux(pacote)
+    return saida_buf.getvalue()
+
+
+class Transcoder:
+    """Pool limitado de conversões MP3 → OGG/Opus."""
+
+    def __init__(self, workers: int = TRANSCODER_WORKERS, fila_max: int = TRANSCODER_FILA_MAX,
+                 timeout: float = TRANSCODER_TIMEOUT, inprocess: bool = TRANSCODER_INPROCESS):
+        self.workers = max(1, workers)
+        self.fila_max = fila_max
+        self.timeout = timeout
+        self.inprocess = inprocess and _av is not None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pendentes = 0  # na fila + em execução
+        self._espera = HistogramaLog()
+        self._encode = {"pyav": HistogramaLog(), "ffmpeg": HistogramaLog()}
+        self.contadores = {"ok": 0, "falhas": 0, "recusados": 0, "fallback_ffmpeg": 0}
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.workers, thread_name_prefix="transcoder",
+                    )
+        return self._executor
+
+    def _reservar(self):
+        with self._lock:
+            if self._pendentes >= self.workers + self.fila_max:
+                self.contadores["recusados"] += 1
+                raise TranscoderOcupado(f"{self._pendentes} conversões pendentes")
+            self._pendentes += 1
+
+    def _liberar(self):
+        with self._lock:
+            self._pendentes -= 1
+
+    def _submeter(self, mp3_bytes: bytes) -> Future:
+        """Reserva a vaga e enfileira; a vaga volta se o job nunca chegar a rodar."""
+        self._reservar()
+        try:
+            futuro = self._get_executor().submit(self._converter, mp3_bytes, time.perf_counter())
+        except BaseException:
+            self._liberar()
+            raise
+        # Cancelado ainda na fila (timeout do chamador, shutdown): _converter não roda
+        futuro.add_done_callback(lambda f: f.cancelled() and self._liberar())
+        return futuro
+
+    def _converter(self, mp3_bytes: bytes, enfileirado_em: float) -> Optional[bytes]:
+        """Roda na thread do pool."""
+        try:
+            inicio = time.perf_counter()
+            ogg, backend = None, "ffmpeg"
+            if self.inprocess:
+                try:
+                    ogg, backend = _pyav_mp3_para_ogg(mp3_bytes), "pyav"
+                except Exception as e:
+                    logger.warning(f"PyAV falhou ({e}) — usando ffmpeg")
+                    with self._lock:
+                        self.contadores["fallback_ffmpeg"] += 1
+            inicio_encode = inicio if backend == "pyav" else time.perf_counter()
+            if backend == "ffmpeg":
+                ogg = self._ffmpeg(mp3_bytes)
+            fim = time.perf_counter()
+
+            valido = bool(ogg) and len(ogg) >= _OGG_MIN_BYTES
+            with self._lock:
+                self._espera.registrar((inicio - enfileirado_em) * 1000)
+                self._encode[backend].registrar((fim - inicio_encode) * 1000)
+                self.contadores["ok" if valido else "falhas"] += 1
+
+            if not valido:
+                if ogg:
+                    logger.error("Saída OGG/Opus muito pequena — conversão falhou")
+                return None
+            logger.debug(f"MP3→OGG/Opus ({backend}): {len(mp3_bytes)}→{len(ogg)} bytes")
+            return ogg
+        finally:
+            self._liberar()
+
+    def _ffmpeg(self, mp3_bytes: bytes) -> Optional[bytes]:
+        try:
+            return _ffmpeg_mp3_para_ogg(mp3_bytes, self.timeout)
+        except FileNotFoundError:
+            logger.warning("ffmpeg não encontrado — áudio Meta PTT indisponível")
+        except subprocess.TimeoutExpired:
+            logger.error(f"ffmpeg timeout ({self.timeout:.0f}s)")
+        except Exception as e:
+            logger.error(f"Erro conversão MP3→OGG: {e}")
+        return None
+
+    def mp3_para_ogg_opus(self, mp3_bytes: bytes) -> Optional[bytes]:
+        """Versão síncrona (threads). Levanta TranscoderOcupado se a fila estiver cheia."""
+        return self._submeter(mp3_bytes).result(timeout=self.timeout * 2)
+
+    async def mp3_para_ogg_opus_async(self, mp3_bytes: bytes) -> Optional[bytes]:
+        """Versão async — não bloqueia o event loop. Levanta TranscoderOcupado."""
+        futuro = asyncio.wrap_future(self._submeter(mp3_bytes))
+        return await asyncio.wait_for(futuro, timeout=self.timeout * 2)
+
+    def stats(self) -> dict:
+        with self._lock:
+            encode = {
+                nome: {"n": h.n, "p50_ms": h.percentil(50), "p95_ms": h.percentil(95)}
+                for nome, h in self._encode.items() if h.n
+            }
+            return {
+                "workers": self.workers,
+                "fila_max": self.fila_max,
+                "backend": "pyav" if self.inprocess else "ffmpeg",
+                "pendentes": self._pendentes,
+                "espera_p50_ms": self._espera.percentil(50),
+                "espera_p95_ms": self._espera.percentil(95),
+                "encode": encode,
+                **self.contadores,
+            }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+transcoder = Transcoder()
@@ -21,6 +21,7 @@ import httpx
 
 from . import evolution_client
 from .. import models
+from ..webhook_fila import registrar_resposta_enviada
 
 logger = logging.getLogger("superfood.bot.wa_client")
 
@@ -88,6 +89,7 @@ async def _meta_enviar_texto(numero: str, texto: str, bot_config: models.BotConf
     async with httpx.AsyncClient(timeout=_META_TIMEOUT) as client:
         resp = await client.post(url, json=payload, headers=_meta_headers(bot_config))
         resp.raise_for_status()
+        registrar_resposta_enviada()
         data = resp.json()
         logger.info(f"Meta texto enviado para {numero[:8]}***")
         return data
@@ -114,6 +116,27 @@ async def enviar_audio_ptt(
         return await evolution_client.enviar_audio_ptt(numero, audio_b64, inst, url, key, delay_ms=delay_ms)
 
 
+async def enviar_audio_tts(
+    numero: str,
+    audio,
+    bot_config: models.BotConfig,
+    pool_entry: Optional[models.BotPhonePool] = None,
+    delay_ms: int = 3000,
+) -> dict:
+    """Envia áudio PTT de um AudioTTS (audio_cache) sem round-trip de base64.
+    Meta usa o OGG/Opus já transcodificado do cache; Evolution recebe o MP3."""
+    provider = getattr(bot_config, "whatsapp_provider", "") or "evolution"
+
+    if provider == "meta":
+        ogg_bytes = await audio.ogg_opus()
+        if not ogg_bytes:
+            raise RuntimeError("Conversão MP3→OGG/Opus falhou (ffmpeg indisponível?)")
+        return await _meta_enviar_ogg(numero, ogg_bytes, bot_config)
+    else:
+        inst, url, key = _evo_creds(bot_config, pool_entry)
+        return await evolution_client.enviar_audio_ptt(numero, audio.base64_mp3(), inst, url, key, delay_ms=delay_ms)
+
+
 async def _meta_enviar_audio_ptt(numero: str, audio_b64: str, bot_config: models.BotConfig) -> dict:
     """Meta: converte MP3→OGG/Opus, faz upload, envia com voice:true."""
     import base64
@@ -127,6 +150,11 @@ async def _meta_enviar_audio_ptt(numero: str, audio_b64: str, bot_config: models
         logger.warning("Conversão MP3→OGG falhou, áudio Meta ignorado")
         raise RuntimeError("Conversão MP3→OGG/Opus falhou (ffmpeg indisponível?)")
 
+    return await _meta_enviar_ogg(numero, ogg_bytes, bot_config)
+
+
+async def _meta_enviar_ogg(numero: str, ogg_bytes: bytes, bot_config: models.BotConfig) -> dict:
+    """Meta: upload do OGG/Opus e envio com voice:true (bolinha verde)."""
     # 1. Upload media
     upload_url = f"{META_API_BASE}/{bot_config.meta_phone_number_id}/media"
     headers_auth = {"Authorization": f"Bearer {bot_config.meta_access_token}"}
@@ -155,6 +183,7 @@ async def _meta_enviar_audio_ptt(numero: str, audio_b64: str, bot_config: models
     async with httpx.AsyncClient(timeout=_META_TIMEOUT) as client:
         resp = await client.post(msg_url, json=payload, headers=_meta_headers(bot_config))
         resp.raise_for_status()
+        registrar_resposta_enviada()
         data = resp.json()
         logger.info(f"Meta áudio PTT enviado para {numero[:8]}***")
         return data
@@ -341,37 +370,14 @@ async def _meta_baixar_audio(media_id: str, bot_config: models.BotConfig) -> Opt
 # ============================================================
 
 async def _mp3_to_ogg_opus(mp3_bytes: bytes) -> Optional[bytes]:
-    """Converte MP3 → OGG/Opus via ffmpeg em memória (stdin/stdout).
-    Retorna bytes OGG ou None se ffmpeg não disponível."""
+    """Converte MP3 → OGG/Opus no pool do transcoder (PyAV ou ffmpeg limitado).
+    Retorna bytes OGG ou None se a conversão falhar ou a fila estiver cheia."""
+    from .transcoder import transcoder, TranscoderOcupado
     try:
-        proc = await asyncio.create_subprocess_exec(
-            "ffmpeg", "-i", "pipe:0",
-            "-c:a", "libopus", "-b:a", "64k",
-            "-f", "ogg", "pipe:1",
-            "-loglevel", "error",
-            stdin=asyncio.subprocess.PIPE,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-        )
-        stdout, stderr = await asyncio.wait_for(proc.communicate(input=mp3_bytes), timeout=15)
-
-        if proc.returncode != 0:
-            logger.error(f"ffmpeg erro: {stderr.decode()[:200]}")
-            return None
-
-        if len(stdout) < 100:
-            logger.error("ffmpeg output muito pequeno — conversão falhou")
-            return None
-
-        logger.debug(f"MP3→OGG/Opus: {len(mp3_bytes)}→{len(stdout)} bytes")
-        return stdout
-
-    except FileNotFoundError:
-        logger.warning("ffmpeg não encontrado — áudio Meta PTT indisponível")
+        return await transcoder.mp3_para_ogg_opus_async(mp3_bytes)
+    except TranscoderOcupado as e:
+        logger.warning(f"Transcoder sobrecarregado ({e}) — áudio Meta PTT ignorado")
         return None
     except asyncio.TimeoutError:
-        logger.error("ffmpeg timeout (15s)")
-        return None
-    except Exception as e:
-        logger.error(f"Erro conversão MP3→OGG: {e}")
+        logger.error("Transcoder timeout — áudio Meta PTT ignorado")
         return None
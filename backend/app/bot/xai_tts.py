@@ -29,8 +29,8 @@ def _preparar_texto_tts(texto: str) -> str:
     return texto
 
 
-async def gerar_audio(texto: str, voz: str = "ara", idioma: str = "pt-BR") -> str | None:
-    """Gera áudio TTS via xAI e retorna base64 MP3.
+async def gerar_audio_bytes(texto: str, voz: str = "ara", idioma: str = "pt-BR") -> bytes | None:
+    """Gera áudio TTS via xAI e retorna os bytes MP3 (sem base64).
 
     Args:
         texto: Texto para converter em áudio
@@ -38,7 +38,7 @@ async def gerar_audio(texto: str, voz: str = "ara", idioma: str = "pt-BR") -> st
         idioma: Idioma (pt-BR, en-US, etc.)
 
     Returns:
-        Base64 MP3 string ou None em caso de erro
+        Bytes MP3 ou None em caso de erro
     """
     xai_key = os.environ.get("XAI_API_KEY", "")
     if not xai_key:
@@ -68,10 +68,21 @@ async def gerar_audio(texto: str, voz: str = "ara", idioma: str = "pt-BR") -> st
             )
             resp.raise_for_status()
             audio_bytes = resp.content
-            audio_b64 = base64.b64encode(audio_bytes).decode("utf-8")
             logger.info(f"TTS: {len(texto)} chars → {len(audio_bytes)} bytes, voz={voz}")
-            return audio_b64
+            return audio_bytes
 
     except Exception as e:
         logger.error(f"Erro TTS xAI: {e}")
         return None
+
+
+async def gerar_audio(texto: str, voz: str = "ara", idioma: str = "pt-BR") -> str | None:
+    """Gera áudio TTS via xAI e retorna base64 MP3.
+
+    Returns:
+        Base64 MP3 string ou None em caso de erro
+    """
+    audio_bytes = await gerar_audio_bytes(texto, voz, idioma)
+    if audio_bytes is None:
+        return None
+    return base64.b64encode(audio_bytes).decode("utf-8")
@@ -84,6 +84,22 @@ def cache_delete(key: str):
         logger.warning(f"Cache delete erro ({key}): {e}")
 
 
+def cache_lock(key: str, ttl_seconds: int = 60) -> bool:
+    """
+    Lock distribuido best-effort (SET NX EX).
+    Retorna True se adquiriu o lock OU se Redis indisponivel — o chamador
+    deve ter sua propria garantia de idempotencia (ex: chave unica no BD).
+    """
+    r = get_redis()
+    if not r:
+        return True
+    try:
+        return bool(r.set(key, "1", nx=True, ex=ttl_seconds))
+    except Exception as e:
+        logger.warning(f"Cache lock erro ({key}): {e}")
+        return True
+
+
 def cache_delete_pattern(pattern: str):
     """Remove chaves por pattern (ex: 'cardapio:5:*')"""
     r = get_redis()
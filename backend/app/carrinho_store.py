@@ -0,0 +1,310 @@
+# backend/app/carrinho_store.py
+
+"""
+Carrinho Store - Derekh Food API
+Armazenamento plugável do carrinho de compras do site.
+
+O carrinho é efêmero (24h, maioria anônima e abandonada): cada "adicionar"
+reescrevia a linha inteira de `carrinho` no Postgres. Agora:
+
+- Redis (padrão quando disponível): hash `carrinho:{sessao_id}`, um campo por
+  restaurante com o JSON do carrinho; TTL renovado a cada escrita. Nenhuma
+  escrita de carrinho chega ao Postgres — o conteúdo só é persistido no
+  `finalizar`, dentro do Pedido (carrinho_json)
+- Banco (fallback sem Redis ou CARRINHO_STORE=db): tabela `carrinho`, como antes
+
+Preços vêm de um mapa produto → (preço, variações) por restaurante em
+`cardapio:{restaurante_id}:precos`, invalidado junto com o cardápio
+(invalidate_cardapio) — uma leitura Redis em vez de até 1 + 3N queries.
+"""
+
+import os
+import json
+import logging
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List
+
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import flag_modified
+
+from . import models
+from .cache import get_redis
+
+logger = logging.getLogger("superfood.carrinho")
+
+CARRINHO_STORE = os.getenv("CARRINHO_STORE", "auto")  # auto | redis | db
+CARRINHO_TTL_SECONDS = int(os.getenv("CARRINHO_TTL_SECONDS", str(24 * 3600)))
+PRECOS_TTL_SECONDS = int(os.getenv("CARRINHO_PRECOS_TTL_SECONDS", "600"))
+# produto → restaurante nunca muda; só serve para achar o mapa de preços certo
+PRODUTO_REST_TTL_SECONDS = 7 * 86400
+
+
+# ==================== CARRINHO (dict) ====================
+
+def carrinho_vazio(sessao_id: str, restaurante_id: Optional[int]) -> Dict[str, Any]:
+    return {
+        "id": None,
+        "restaurante_id": restaurante_id,
+        "sessao_id": sessao_id,
+        "itens": [],
+        "valor_subtotal": 0.0,
+        "valor_taxa_entrega": 0.0,
+        "valor_desconto": 0.0,
+        "valor_total": 0.0,
+        "cupom_codigo": None,
+    }
+
+
+def recalcular(carrinho: Dict[str, Any]) -> Dict[str, Any]:
+    carrinho["valor_subtotal"] = sum(i["subtotal"] for i in carrinho["itens"])
+    carrinho["valor_total"] = (
+        carrinho["valor_subtotal"]
+        + (carrinho.get("valor_taxa_entrega") or 0.0)
+        - (carrinho.get("valor_desconto") or 0.0)
+    )
+    return carrinho
+
+
+def resposta(carrinho: Dict[str, Any]) -> Dict[str, Any]:
+    """Formato do CarrinhoResponse."""
+    return {
+        "id": carrinho.get("id"),
+        "sessao_id": carrinho["sessao_id"],
+        "itens": carrinho["itens"],
+        "quantidade_itens": len(carrinho["itens"]),
+        "valor_subtotal": carrinho.get("valor_subtotal") or 0.0,
+        "valor_taxa_entrega": carrinho.get("valor_taxa_entrega") or 0.0,
+        "valor_desconto": carrinho.get("valor_desconto") or 0.0,
+        "valor_total": carrinho.get("valor_total") or 0.0,
+    }
+
+
+# ==================== STORES ====================
+
+class CarrinhoStore(ABC):
+    nome = ""
+
+    @abstractmethod
+    def obter(self, db: Session, sessao_id: str, restaurante_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Carrinho ativo da sessão (do restaurante, se informado)."""
+
+    @abstractmethod
+    def salvar(self, db: Session, carrinho: Dict[str, Any]):
+        """Grava o carrinho inteiro e renova a expiração."""
+
+    @abstractmethod
+    def remover(self, db: Session, sessao_id: str, restaurante_id: Optional[int] = None):
+        """Remove o carrinho (de um restaurante ou todos da sessão)."""
+
+
+class CarrinhoStoreRedis(CarrinhoStore):
+    nome = "redis"
+
+    def __init__(self, redis_client):
+        self.r = redis_client
+
+    @staticmethod
+    def _chave(sessao_id: str) -> str:
+        return f"carrinho:{sessao_id}"
+
+    def obter(self, db, sessao_id, restaurante_id=None):
+        chave = self._chave(sessao_id)
+        if restaurante_id is not None:
+            dados = self.r.hget(chave, str(restaurante_id))
+        else:
+            todos = self.r.hgetall(chave)
+            dados = next(iter(todos.values()), None) if todos else None
+        return json.loads(dados) if dados else None
+
+    def salvar(self, db, carrinho):
+        chave = self._chave(carrinho["sessao_id"])
+        pipe = self.r.pipeline()
+        pipe.hset(chave, str(carrinho["restaurante_id"]), json.dumps(carrinho, default=str))
+        pipe.expire(chave, CARRINHO_TTL_SECONDS)
+        pipe.execute()
+
+    def remover(self, db, sessao_id, restaurante_id=None):
+        if restaurante_id is not None:
+            self.r.hdel(self._chave(sessao_id), str(restaurante_id))
+        else:
+            self.r.delete(self._chave(sessao_id))
+
+
+class CarrinhoStoreBanco(CarrinhoStore):
+    nome = "db"
+
+    @staticmethod
+    def _filtros(sessao_id, restaurante_id):
+        filtros = [
+            models.Carrinho.sessao_id == sessao_id,
+            models.Carrinho.data_expiracao > datetime.utcnow(),
+        ]
+        if restaurante_id is not None:
+            filtros.append(models.Carrinho.restaurante_id == restaurante_id)
+        return filtros
+
+    def obter(self, db, sessao_id, restaurante_id=None):
+        row = db.query(models.Carrinho).filter(*self._filtros(sessao_id, restaurante_id)).first()
+        if not row:
+            return None
+        return {
+            "id": row.id,
+            "restaurante_id": row.restaurante_id,
+            "sessao_id": row.sessao_id,
+            "itens": list(row.itens_json or []),
+            "valor_subtotal": row.valor_subtotal or 0.0,
+            "valor_taxa_entrega": row.valor_taxa_entrega or 0.0,
+            "valor_desconto": row.valor_desconto or 0.0,
+            "valor_total": row.valor_total or 0.0,
+            "cupom_codigo": row.cupom_codigo,
+        }
+
+    def salvar(self, db, carrinho):
+        row = db.get(models.Carrinho, carrinho["id"]) if carrinho.get("id") else None
+        if row is None:
+            row = models.Carrinho(
+                restaurante_id=carrinho["restaurante_id"],
+                sessao_id=carrinho["sessao_id"],
+            )
+            db.add(row)
+        row.itens_json = carrinho["itens"]
+        flag_modified(row, "itens_json")
+        row.valor_subtotal = carrinho["valor_subtotal"]
+        row.valor_taxa_entrega = carrinho.get("valor_taxa_entrega") or 0.0
+        row.valor_desconto = carrinho.get("valor_desconto") or 0.0
+        row.valor_total = carrinho["valor_total"]
+        row.data_atualizacao = datetime.utcnow()
+        row.data_expiracao = datetime.utcnow() + timedelta(seconds=CARRINHO_TTL_SECONDS)
+        # flush antes do commit: o id sai do INSERT sem o refresh pós-commit
+        db.flush()
+        carrinho["id"] = row.id
+        db.commit()
+
+    def remover(self, db, sessao_id, restaurante_id=None):
+        filtros = [models.Carrinho.sessao_id == sessao_id]
+        if restaurante_id is not None:
+            filtros.append(models.Carrinho.restaurante_id == restaurante_id)
+        row = db.query(models.Carrinho).filter(*filtros).first()
+        if row:
+            db.delete(row)
+            db.commit()
+
+
+_store_banco = CarrinhoStoreBanco()
+
+
+def get_carrinho_store() -> CarrinhoStore:
+    """Redis se disponível (CARRINHO_STORE=auto|redis), senão banco."""
+    if CARRINHO_STORE != "db":
+        r = get_redis()
+        if r is not None:
+            return CarrinhoStoreRedis(r)
+        if CARRINHO_STORE == "redis":
+            logger.warning("CARRINHO_STORE=redis mas Redis indisponível — usando banco")
+    return _store_banco
+
+
+# ==================== PREÇOS ====================
+
+def _mapa_precos_banco(db: Session, restaurante_id: int) -> Dict[str, str]:
+    """Produtos disponíveis do restaurante + variações, em 2 queries."""
+    produtos = db.query(models.Produto).filter(
+        models.Produto.restaurante_id == restaurante_id,
+        models.Produto.disponivel == True,
+    ).all()
+    variacoes: Dict[int, Dict[str, Any]] = {}
+    if produtos:
+        for v in db.query(models.VariacaoProduto).filter(
+            models.VariacaoProduto.produto_id.in_([p.id for p in produtos])
+        ).all():
+            variacoes.setdefault(v.produto_id, {})[str(v.id)] = {
+                "nome": v.nome, "preco_adicional": v.preco_adicional or 0.0,
+            }
+    return {
+        str(p.id): json.dumps({
+            "restaurante_id": p.restaurante_id,
+            "nome": p.nome,
+            "imagem_url": p.imagem_url,
+            "preco": p.preco_promocional if p.promocao else p.preco,
+            "variacoes": variacoes.get(p.id, {}),
+        })
+        for p in produtos
+    }
+
+
+def _produto_banco(db: Session, produto_id: int, variacoes_ids: List[int]) -> Optional[Dict[str, Any]]:
+    """Produto + só as variações pedidas (sem variações, sem segunda query)."""
+    produto = db.query(models.Produto).filter(
+        models.Produto.id == produto_id,
+        models.Produto.disponivel == True,
+    ).first()
+    if not produto:
+        return None
+    variacoes = db.query(models.VariacaoProduto).filter(
+        models.VariacaoProduto.produto_id == produto_id,
+        models.VariacaoProduto.id.in_(variacoes_ids),
+    ).all() if variacoes_ids else []
+    return {
+        "restaurante_id": produto.restaurante_id,
+        "nome": produto.nome,
+        "imagem_url": produto.imagem_url,
+        "preco": produto.preco_promocional if produto.promocao else produto.preco,
+        "variacoes": {str(v.id): {"nome": v.nome, "preco_adicional": v.preco_adicional or 0.0} for v in variacoes},
+    }
+
+
+def obter_produto_precificado(db: Session, produto_id: int,
+                              variacoes_ids: Optional[List[int]] = None) -> Optional[Dict[str, Any]]:
+    """Produto disponível com preço efetivo e variações, do mapa cacheado.
+    Sem Redis, busca no banco só as `variacoes_ids` pedidas.
+    None se o produto não existe ou está indisponível."""
+    r = get_redis()
+    if r is None:
+        return _produto_banco(db, produto_id, variacoes_ids or [])
+    try:
+        rid = r.get(f"produto:{produto_id}:restaurante")
+        if rid is None:
+            produto = _produto_banco(db, produto_id, variacoes_ids or [])
+            if produto:
+                r.setex(f"produto:{produto_id}:restaurante", PRODUTO_REST_TTL_SECONDS, produto["restaurante_id"])
+            return produto
+
+        chave = f"cardapio:{rid}:precos"
+        dados = r.hget(chave, str(produto_id))
+        if dados is None and not r.exists(chave):
+            mapa = _mapa_precos_banco(db, int(rid))
+            if mapa:
+                pipe = r.pipeline()
+                pipe.hset(chave, mapping=mapa)
+                pipe.expire(chave, PRECOS_TTL_SECONDS)
+                pipe.execute()
+            dados = mapa.get(str(produto_id))
+        return json.loads(dados) if dados else None
+    except Exception as e:
+        logger.warning(f"Mapa de preços indisponível ({produto_id}): {e}")
+        return _produto_banco(db, produto_id, variacoes_ids or [])
+
+
+def montar_item(produto_id: int, produto: Dict[str, Any], variacoes_ids: List[int],
+                quantidade: int, observacoes: Optional[str]) -> Dict[str, Any]:
+    """Item do carrinho com preço unitário = base + adicionais das variações do produto."""
+    variacoes = produto.get("variacoes", {})
+    preco_unitario = produto["preco"] or 0.0
+    for v_id in variacoes_ids:
+        v = variacoes.get(str(v_id))
+        if v:
+            preco_unitario += v["preco_adicional"]
+    return {
+        "produto_id": produto_id,
+        "nome": produto["nome"],
+        "imagem_url": produto["imagem_url"],
+        "variacoes": [
+            {"id": v_id, "nome": variacoes.get(str(v_id), {}).get("nome", "")}
+            for v_id in variacoes_ids
+        ],
+        "observacoes": observacoes,
+        "quantidade": quantidade,
+        "preco_unitario": preco_unitario,
+        "subtotal": preco_unitario * quantidade,
+    }
@@ -10,14 +10,29 @@ Quando um cliente faz pedido em restaurante demo:
 
 A animação de entrega é 100% frontend (DemoMapAnimation.tsx).
 O backend apenas espera 60s e marca como entregue.
+
+Cada transição é um prazo agendado (heap em memória + ZSET `demo:prazos`
+no Redis), armado quando o pedido demo é criado e re-armado a cada
+transição. O loop dorme até o próximo prazo — sem pedido demo ativo não
+há query. Entre workers:
+  - ZREM do membro no ZSET decide quem dispara (prazo de worker morto
+    é assumido pelos outros depois de DEMO_TOLERANCIA_ORFAO)
+  - UPDATE ... WHERE status = <esperado> no banco garante que a transição
+    acontece uma vez só, mesmo sem Redis
+Uma reconciliação a cada DEMO_RECONCILIAR_INTERVAL arma pedidos criados por
+outros caminhos / antes de um restart e limpa pedidos demo antigos.
 """
 
+import os
+import time
+import heapq
 import asyncio
 import logging
 from datetime import datetime, timedelta
 
 from .database import SessionLocal
 from . import models
+from .cache import get_redis
 
 logger = logging.getLogger("superfood.demo")
 
@@ -30,8 +45,14 @@ DEMO_DELAYS = {
     "em_entrega": 60,  # 1 minuto — animação frontend
 }
 
-# Intervalo do loop principal
-LOOP_INTERVAL = 1  # segundo (para capturar transições de 2s)
+DEMO_RECONCILIAR_INTERVAL = int(os.getenv("DEMO_RECONCILIAR_INTERVAL", "300"))
+# Cache dos IDs de restaurantes demo
+DEMO_CACHE_TTL = 600
+# Prazo vencido há mais que isso no Redis = worker que armou não disparou
+DEMO_TOLERANCIA_ORFAO = 5
+DEMO_ORFAOS_INTERVAL = 15
+
+_ZSET_PRAZOS = "demo:prazos"
 
 # Nome do motoboy virtual
 DEMO_MOTOBOY_NOME = "Carlos Demo"
@@ -89,13 +110,6 @@ def _update_status(db, pedido, new_status: str, ws_manager=None):
     logger.debug(f"Demo pedido #{pedido.id} → {new_status}")
 
 
-def _seconds_since(dt: datetime | None) -> float:
-    """Retorna segundos desde dt até agora."""
-    if not dt:
-        return 999999
-    return (datetime.utcnow() - dt).total_seconds()
-
-
 async def _broadcast_demo_update(ws_manager, restaurante_id: int, pedido_id: int, status: str):
     """Envia WebSocket broadcast para o restaurante e cliente."""
     if not ws_manager:
@@ -112,66 +126,6 @@ async def _broadcast_demo_update(ws_manager, restaurante_id: int, pedido_id: int
         pass
 
 
-async def demo_autopilot_loop(ws_manager=None):
-    """Loop principal do demo autopilot. Roda como background task."""
-    logger.info("Demo autopilot iniciado")
-
-    while True:
-        try:
-            await asyncio.sleep(LOOP_INTERVAL)
-            db = SessionLocal()
-            try:
-                demo_ids = _get_demo_restaurant_ids(db)
-                if not demo_ids:
-                    continue
-
-                # Busca pedidos ativos em restaurantes demo
-                pedidos = db.query(models.Pedido).filter(
-                    models.Pedido.restaurante_id.in_(demo_ids),
-                    models.Pedido.status.in_(["pendente", "confirmado", "em_preparo", "pronto", "em_entrega"]),
-                ).all()
-
-                for pedido in pedidos:
-                    status = pedido.status
-                    elapsed = _seconds_since(pedido.atualizado_em)
-                    delay = DEMO_DELAYS.get(status, 999999)
-
-                    if elapsed >= delay:
-                        next_status = _next_status(status)
-                        if next_status:
-                            if next_status == "em_entrega":
-                                await _start_delivery(db, pedido, ws_manager)
-                            elif next_status == "entregue":
-                                await _finish_delivery(db, pedido, ws_manager)
-                            else:
-                                _update_status(db, pedido, next_status)
-                                await _broadcast_demo_update(
-                                    ws_manager, pedido.restaurante_id, pedido.id, next_status
-                                )
-
-                # Limpa pedidos demo antigos (mais de 1 hora)
-                cutoff = datetime.utcnow() - timedelta(hours=1)
-                old_pedidos = db.query(models.Pedido).filter(
-                    models.Pedido.restaurante_id.in_(demo_ids),
-                    models.Pedido.status.in_(["entregue", "finalizado", "cancelado"]),
-                    models.Pedido.data_criacao < cutoff,
-                ).all()
-                for p in old_pedidos:
-                    db.delete(p)
-                if old_pedidos:
-                    db.commit()
-
-            finally:
-                db.close()
-
-        except asyncio.CancelledError:
-            logger.info("Demo autopilot encerrado")
-            break
-        except Exception as e:
-            logger.debug(f"Demo autopilot erro: {e}")
-            await asyncio.sleep(5)
-
-
 def _next_status(current: str) -> str | None:
     """Retorna o próximo status na sequência demo."""
     flow = ["pendente", "confirmado", "em_preparo", "pronto", "em_entrega", "entregue"]
@@ -243,3 +197,235 @@ async def _finish_delivery(db, pedido, ws_manager):
 
     db.commit()
     await _broadcast_demo_update(ws_manager, pedido.restaurante_id, pedido.id, "entregue")
+
+
+class DemoAutopilot:
+    """Agenda e dispara as transições dos pedidos demo por prazo."""
+
+    def __init__(self):
+        self._heap: list[tuple[float, str]] = []
+        self._prazos: dict[str, float] = {}  # membro "pedido_id:status" → vencimento (epoch)
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._acordar: asyncio.Event | None = None
+        self._ws_manager = None
+        self._demo_ids: list[int] = []
+        self._demo_ids_expira = 0.0
+        self._ultima_busca_orfaos = 0.0
+        self.stats = {"agendados": 0, "transicoes": 0, "descartados": 0, "orfaos": 0}
+
+    # ── Agendamento ──
+
+    def agendar(self, pedido_id: int, status: str, atraso: float | None = None):
+        """Arma o prazo da próxima transição de um pedido demo em `status`."""
+        if status not in DEMO_DELAYS:
+            return
+        vence = time.time() + (DEMO_DELAYS[status] if atraso is None else max(atraso, 0))
+        membro = f"{pedido_id}:{status}"
+        r = get_redis()
+        if r:
+            try:
+                r.zadd(_ZSET_PRAZOS, {membro: vence})
+            except Exception as e:
+                logger.warning(f"Demo: Redis indisponível ao agendar #{pedido_id}: {e}")
+
+        loop = self._loop
+        try:
+            mesmo_loop = asyncio.get_running_loop() is loop
+        except RuntimeError:
+            mesmo_loop = False
+        if loop is None or mesmo_loop:
+            self._armar_local(membro, vence)
+        else:
+            try:
+                loop.call_soon_threadsafe(self._armar_local, membro, vence)
+            except RuntimeError:
+                pass  # loop encerrado (shutdown): a reconciliação/Redis cobre
+
+    def agendar_pelo_status(self, pedido):
+        """Arma o prazo a partir de atualizado_em (reconciliação / status mudado por fora)."""
+        if pedido.status not in DEMO_DELAYS:
+            return
+        decorrido = (datetime.utcnow() - pedido.atualizado_em).total_seconds() if pedido.atualizado_em else 0
+        self.agendar(pedido.id, pedido.status, DEMO_DELAYS[pedido.status] - decorrido)
+
+    def _armar_local(self, membro: str, vence: float):
+        if self._prazos.get(membro) == vence:
+            return
+        self._prazos[membro] = vence
+        heapq.heappush(self._heap, (vence, membro))
+        self.stats["agendados"] += 1
+        if self._acordar:
+            self._acordar.set()
+
+    def _proximo_prazo(self) -> float:
+        while self._heap and self._prazos.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)  # entrada substituída por re-agendamento
+        return self._heap[0][0] if self._heap else float("inf")
+
+    def _vencidos(self, agora: float) -> list[str]:
+        membros = []
+        while self._proximo_prazo() <= agora:
+            _, membro = heapq.heappop(self._heap)
+            del self._prazos[membro]
+            membros.append(membro)
+
+        r = get_redis()
+        if r and agora - self._ultima_busca_orfaos >= DEMO_ORFAOS_INTERVAL:
+            self._ultima_busca_orfaos = agora
+            try:
+                orfaos = r.zrangebyscore(_ZSET_PRAZOS, "-inf", agora - DEMO_TOLERANCIA_ORFAO)
+                novos = [m for m in orfaos if m not in membros]
+                self.stats["orfaos"] += len(novos)
+                membros.extend(novos)
+            except Exception as e:
+                logger.warning(f"Demo: erro buscando prazos órfãos: {e}")
+        return membros
+
+    def _assumir(self, membro: str) -> bool:
+        """Só o worker que remove o membro do ZSET dispara (sem Redis: o banco decide)."""
+        r = get_redis()
+        if not r:
+            return True
+        try:
+            return bool(r.zrem(_ZSET_PRAZOS, membro))
+        except Exception as e:
+            logger.warning(f"Demo: Redis indisponível ao assumir {membro}: {e}")
+            return True
+
+    # ── Disparo ──
+
+    async def disparar(self, pedido_id: int, esperado: str) -> bool:
+        """Executa a transição de `esperado` para o próximo status. True se este worker a fez."""
+        proximo = _next_status(esperado)
+        if not proximo:
+            return False
+        db = SessionLocal()
+        try:
+            # Posse no banco: de `esperado` só um UPDATE sai com linha afetada
+            afetados = db.query(models.Pedido).filter(
+                models.Pedido.id == pedido_id,
+                models.Pedido.status == esperado,
+            ).update({"status": proximo}, synchronize_session=False)
+
+            if not afetados:
+                db.rollback()
+                pedido = db.query(models.Pedido).filter(models.Pedido.id == pedido_id).first()
+                self.stats["descartados"] += 1
+                if pedido and pedido.status != proximo:
+                    # Status mudou por fora (painel): segue a partir do status atual
+                    self.agendar_pelo_status(pedido)
+                return False
+
+            pedido = db.query(models.Pedido).filter(models.Pedido.id == pedido_id).first()
+            if proximo == "em_entrega":
+                await _start_delivery(db, pedido, self._ws_manager)
+            elif proximo == "entregue":
+                await _finish_delivery(db, pedido, self._ws_manager)
+            else:
+                _update_status(db, pedido, proximo)
+                await _broadcast_demo_update(self._ws_manager, pedido.restaurante_id, pedido.id, proximo)
+            self.stats["transicoes"] += 1
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        self.agendar(pedido_id, proximo)
+        return True
+
+    # ── Reconciliação ──
+
+    def restaurantes_demo(self, db) -> list[int]:
+        """IDs dos restaurantes demo, com cache de DEMO_CACHE_TTL."""
+        if time.monotonic() >= self._demo_ids_expira:
+            self._demo_ids = _get_demo_restaurant_ids(db)
+            self._demo_ids_expira = time.monotonic() + DEMO_CACHE_TTL
+        return self._demo_ids
+
+    def reconciliar(self):
+        """Arma pedidos demo ativos sem prazo e limpa pedidos demo antigos."""
+        db = SessionLocal()
+        try:
+            demo_ids = self.restaurantes_demo(db)
+            if not demo_ids:
+                return
+
+            pedidos = db.query(models.Pedido).filter(
+                models.Pedido.restaurante_id.in_(demo_ids),
+                models.Pedido.status.in_(list(DEMO_DELAYS)),
+            ).all()
+            for pedido in pedidos:
+                if f"{pedido.id}:{pedido.status}" not in self._prazos:
+                    self.agendar_pelo_status(pedido)
+
+            # Limpa pedidos demo antigos (mais de 1 hora)
+            cutoff = datetime.utcnow() - timedelta(hours=1)
+            old_pedidos = db.query(models.Pedido).filter(
+                models.Pedido.restaurante_id.in_(demo_ids),
+                models.Pedido.status.in_(["entregue", "finalizado", "cancelado"]),
+                models.Pedido.data_criacao < cutoff,
+            ).all()
+            for p in old_pedidos:
+                db.delete(p)
+            if old_pedidos:
+                db.commit()
+        finally:
+            db.close()
+
+    # ── Loop ──
+
+    async def executar(self, ws_manager=None):
+        """Dorme até o próximo prazo (ou reconciliação) e dispara o que venceu."""
+        self._ws_manager = ws_manager
+        self._loop = asyncio.get_running_loop()
+        self._acordar = asyncio.Event()
+        logger.info("Demo autopilot iniciado")
+
+        proxima_reconciliacao = 0.0
+        while True:
+            try:
+                self._acordar.clear()
+                agora = time.time()
+                if agora >= proxima_reconciliacao:
+                    proxima_reconciliacao = agora + DEMO_RECONCILIAR_INTERVAL
+                    self.reconciliar()
+
+                for membro in self._vencidos(time.time()):
+                    if not self._assumir(membro):
+                        continue
+                    pedido_id, status = membro.split(":", 1)
+                    try:
+                        await self.disparar(int(pedido_id), status)
+                    except Exception as e:
+                        logger.debug(f"Demo pedido #{pedido_id}: erro na transição ({e}) — nova tentativa em 5s")
+                        self.agendar(int(pedido_id), status, 5)
+
+                prazo = min(self._proximo_prazo(), proxima_reconciliacao)
+                if get_redis():
+                    prazo = min(prazo, self._ultima_busca_orfaos + DEMO_ORFAOS_INTERVAL)
+                try:
+                    await asyncio.wait_for(self._acordar.wait(), timeout=max(prazo - time.time(), 0))
+                except asyncio.TimeoutError:
+                    pass
+
+            except asyncio.CancelledError:
+                logger.info("Demo autopilot encerrado")
+                break
+            except Exception as e:
+                logger.debug(f"Demo autopilot erro: {e}")
+                await asyncio.sleep(5)
+
+
+# Singleton
+autopilot = DemoAutopilot()
+
+
+def agendar_pedido_demo(pedido_id: int, status: str = "pendente"):
+    """Arma a progressão automática de um pedido recém-criado em restaurante demo."""
+    autopilot.agendar(pedido_id, status)
+
+
+async def demo_autopilot_loop(ws_manager=None):
+    """Loop principal do demo autopilot. Roda como background task."""
+    await autopilot.executar(ws_manager)
@@ -0,0 +1,375 @@
+# backend/app/enderecos_service.py
+
+"""
+Autocomplete de Endereços - Derekh Food API
+Camada entre os autocompletes (site, painel, admin, bot) e o Mapbox.
+
+Antes cada tecla (após o debounce do front) virava um `requests.get` bloqueante
+ao Mapbox, sem cache. Agora, em ordem:
+
+1. Histórico local: endereços já entregues (`pedidos`) e salvos
+   (`enderecos_cliente`) com coordenadas. Painel e bot consultam o histórico
+   do restaurante inteiro; o site público só o do próprio cliente logado
+   (nunca endereços de outros clientes). Quem repete o endereço é atendido
+   sem chamada externa quando o histórico já basta (sugestões suficientes ou
+   busca longa); senão as sugestões do histórico vêm primeiro, completadas
+   pelas do Mapbox
+2. Cache Redis por país + célula de proximidade (lat/lng com 2 casas, ~1km):
+   consulta exata ou, na falta dela, o prefixo mais longo já consultado,
+   filtrado localmente ("rua augu" → "rua augusta 12")
+3. Mapbox via httpx async (cliente keep-alive compartilhado), com consultas
+   idênticas em voo coalescidas numa só chamada
+
+Tudo best-effort: sem Redis cai direto no Mapbox, como antes.
+"""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+import unicodedata
+from concurrent.futures import Future
+from typing import Optional, Tuple, List, Dict, Any
+
+from sqlalchemy.orm import Session
+
+from . import models
+from .cache import get_redis
+
+logger = logging.getLogger("superfood.enderecos")
+
+AUTOCOMPLETE_TTL_SECONDS = int(os.getenv("ENDERECOS_AUTOCOMPLETE_TTL", str(7 * 86400)))
+AUTOCOMPLETE_VAZIO_TTL_SECONDS = int(os.getenv("ENDERECOS_VAZIO_TTL", "600"))
+HISTORICO_TTL_SECONDS = int(os.getenv("ENDERECOS_HISTORICO_TTL", "300"))
+HISTORICO_MAX_PEDIDOS = int(os.getenv("ENDERECOS_HISTORICO_MAX_PEDIDOS", "2000"))
+HISTORICO_CLIENTE_MAX_PEDIDOS = 50
+# Prefixo filtrado só responde se sobrar isso de sugestões (ou se o prefixo
+# já tinha vindo incompleto do Mapbox, i.e. não havia mais o que achar)
+PREFIXO_MIN_SUGESTOES = int(os.getenv("ENDERECOS_PREFIXO_MIN", "2"))
+# Histórico dispensa o Mapbox com tantas sugestões, ou com busca já longa
+# (o cliente está digitando um endereço que já usou)
+HISTORICO_MIN_SUGESTOES = int(os.getenv("ENDERECOS_HISTORICO_MIN", "3"))
+HISTORICO_MIN_CARACTERES = int(os.getenv("ENDERECOS_HISTORICO_MIN_CARACTERES", "15"))
+
+LIMITE_SUGESTOES = 5
+MIN_CARACTERES = 3
+_MAX_PREFIXOS = 20
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas, sem acento e sem pontuação: 'Rua São João, 12' → 'rua sao joao 12'."""
+    nfkd = unicodedata.normalize("NFKD", texto or "")
+    sem_acento = "".join(c for c in nfkd if not unicodedata.combining(c)).lower()
+    return " ".join("".join(c if c.isalnum() else " " for c in sem_acento).split())
+
+
+def _casa(tokens: List[str], texto_norm: str) -> bool:
+    """Todo token da busca é início de alguma palavra do endereço."""
+    palavras = texto_norm.split()
+    return all(any(p.startswith(t) for p in palavras) for t in tokens)
+
+
+def _celula(proximity: Optional[Tuple[float, float]]) -> str:
+    if not proximity or proximity[0] is None or proximity[1] is None:
+        return "x"
+    return f"{proximity[0]:.2f},{proximity[1]:.2f}"
+
+
+def chave_autocomplete(query_norm: str, proximity: Optional[Tuple[float, float]] = None,
+                       country: Optional[str] = None) -> str:
+    h = hashlib.md5(query_norm.encode()).hexdigest()[:16]
+    return f"endereco:ac:{(country or '*').upper()}:{_celula(proximity)}:{h}"
+
+
+def _mesclar(historico: List[Dict], externas: List[Dict], limite: int) -> List[Dict]:
+    """Histórico primeiro; do Mapbox só o que ainda não apareceu."""
+    vistos = {normalizar(s["place_name"]) for s in historico}
+    extras = [s for s in externas if normalizar(s["place_name"]) not in vistos]
+    return (historico + extras)[:limite]
+
+
+def _filtrar(entradas: List[Dict[str, Any]], tokens: List[str], limite: int) -> List[Dict]:
+    return [
+        {"place_name": e["place_name"], "coordinates": e["coordinates"]}
+        for e in entradas if _casa(tokens, e["_norm"])
+    ][:limite]
+
+
+class EnderecoService:
+    """Autocomplete com histórico local, cache por prefixo e coalescência."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._voando: Dict[str, Future] = {}
+        self._historico: Dict[int, Tuple[float, List[Dict[str, Any]]]] = {}
+        self._client = None
+        self._client_loop = None
+        self.stats = {
+            "historico": 0, "historico_mesclado": 0, "cache": 0, "prefixo": 0,
+            "upstream": 0, "coalescidas": 0, "falhas": 0,
+        }
+
+    # ==================== HISTÓRICO LOCAL ====================
+
+    def _carregar_historico(self, db: Session, restaurante_id: int,
+                            cliente_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Endereços com coordenadas já usados no restaurante, mais frequentes primeiro.
+        Com cliente_id, só os pedidos e endereços salvos desse cliente.
+        """
+        entradas: Dict[str, Dict[str, Any]] = {}
+
+        def _adicionar(nome: str, lat: float, lng: float):
+            norm = normalizar(nome)
+            if not norm:
+                return
+            e = entradas.get(norm)
+            if e is None:
+                entradas[norm] = {"place_name": nome.strip(), "coordinates": (lat, lng), "_norm": norm, "_usos": 1}
+            else:
+                e["_usos"] += 1
+
+        pedidos = db.query(
+            models.Pedido.endereco_entrega,
+            models.Pedido.latitude_entrega,
+            models.Pedido.longitude_entrega,
+        ).filter(
+            models.Pedido.restaurante_id == restaurante_id,
+            models.Pedido.endereco_entrega.isnot(None),
+            models.Pedido.latitude_entrega.isnot(None),
+            models.Pedido.longitude_entrega.isnot(None),
+        )
+        if cliente_id is not None:
+            pedidos = pedidos.filter(models.Pedido.cliente_id == cliente_id)
+        pedidos = pedidos.order_by(models.Pedido.id.desc()).limit(
+            HISTORICO_MAX_PEDIDOS if cliente_id is None else HISTORICO_CLIENTE_MAX_PEDIDOS
+        )
+        for endereco, lat, lng in pedidos:
+            _adicionar(endereco, lat, lng)
+
+        salvos = db.query(
+            models.EnderecoCliente.endereco_completo,
+            models.EnderecoCliente.numero,
+            models.EnderecoCliente.bairro,
+            models.EnderecoCliente.latitude,
+            models.EnderecoCliente.longitude,
+        ).join(
+            models.Cliente, models.Cliente.id == models.EnderecoCliente.cliente_id,
+        ).filter(
+            models.Cliente.restaurante_id == restaurante_id,
+            models.EnderecoCliente.ativo == True,
+            models.EnderecoCliente.latitude.isnot(None),
+            models.EnderecoCliente.longitude.isnot(None),
+        )
+        if cliente_id is not None:
+            salvos = salvos.filter(models.EnderecoCliente.cliente_id == cliente_id)
+        for endereco, numero, bairro, lat, lng in salvos:
+            nome = endereco
+            norm = normalizar(endereco)
+            if numero and normalizar(numero) not in norm.split():
+                nome = f"{nome}, {numero}"
+            if bairro and normalizar(bairro) not in norm:
+                nome = f"{nome}, {bairro}"
+            _adicionar(nome, lat, lng)
+
+        return sorted(entradas.values(), key=lambda e: e["_usos"], reverse=True)
+
+    def buscar_historico(self, db: Session, restaurante_id: int, query: str,
+                         limite: int = LIMITE_SUGESTOES) -> List[Dict]:
+        """Sugestões do histórico do restaurante que casam com a busca (sem chamada externa)."""
+        tokens = normalizar(query).split()
+        if not tokens:
+            return []
+        agora = time.monotonic()
+        cache = self._historico.get(restaurante_id)
+        if cache is None or cache[0] < agora:
+            try:
+                entradas = self._carregar_historico(db, restaurante_id)
+            except Exception as e:
+                logger.warning(f"Histórico de endereços indisponível (restaurante {restaurante_id}): {e}")
+                return []
+            self._historico[restaurante_id] = (agora + HISTORICO_TTL_SECONDS, entradas)
+        else:
+            entradas = cache[1]
+
+        return _filtrar(entradas, tokens, limite)
+
+    def buscar_enderecos_cliente(self, db: Session, restaurante_id: int, cliente_id: int, query: str,
+                                 limite: int = LIMITE_SUGESTOES) -> List[Dict]:
+        """Sugestões só com os endereços do próprio cliente (site público). Sem cache em memória."""
+        tokens = normalizar(query).split()
+        if not tokens:
+            return []
+        try:
+            entradas = self._carregar_historico(db, restaurante_id, cliente_id=cliente_id)
+        except Exception as e:
+            logger.warning(f"Endereços do cliente {cliente_id} indisponíveis: {e}")
+            return []
+        return _filtrar(entradas, tokens, limite)
+
+    def invalidar_historico(self, restaurante_id: Optional[int] = None):
+        if restaurante_id is None:
+            self._historico.clear()
+        else:
+            self._historico.pop(restaurante_id, None)
+
+    # ==================== CACHE POR PREFIXO ====================
+
+    def _ler_cache(self, query_norm: str, proximity, country) -> Optional[List[Dict]]:
+        r = get_redis()
+        if r is None:
+            return None
+        # Exata + prefixos (do mais longo ao mínimo) numa única ida ao Redis
+        candidatos = [query_norm] + [
+            query_norm[:n].rstrip()
+            for n in range(len(query_norm) - 1, MIN_CARACTERES - 1, -1)
+        ][:_MAX_PREFIXOS]
+        candidatos = list(dict.fromkeys(c for c in candidatos if len(c) >= MIN_CARACTERES))
+        try:
+            valores = r.mget([chave_autocomplete(c, proximity, country) for c in candidatos])
+        except Exception as e:
+            logger.warning(f"Cache de autocomplete indisponível: {e}")
+            return None
+
+        tokens = query_norm.split()
+        for consulta, valor in zip(candidatos, valores):
+            if not valor:
+                continue
+            dados = json.loads(valor)
+            if consulta == query_norm:
+                self.stats["cache"] += 1
+                return dados["s"]
+            filtradas = [s for s in dados["s"] if _casa(tokens, normalizar(s["place_name"]))]
+            if filtradas and (dados.get("completo") or len(filtradas) >= PREFIXO_MIN_SUGESTOES):
+                self.stats["prefixo"] += 1
+                return filtradas
+            # Prefixo mais longo não serve: os mais curtos servem menos ainda
+            return None
+        return None
+
+    def _gravar_cache(self, query_norm: str, proximity, country, sugestoes: List[Dict]):
+        r = get_redis()
+        if r is None:
+            return
+        ttl = AUTOCOMPLETE_TTL_SECONDS if sugestoes else AUTOCOMPLETE_VAZIO_TTL_SECONDS
+        valor = {"s": sugestoes, "completo": len(sugestoes) < LIMITE_SUGESTOES}
+        try:
+            r.setex(chave_autocomplete(query_norm, proximity, country), ttl, json.dumps(valor))
+        except Exception as e:
+            logger.warning(f"Cache de autocomplete set erro: {e}")
+
+    # ==================== MAPBOX (coalescido) ====================
+
+    def _http(self):
+        """httpx.AsyncClient keep-alive, um por event loop."""
+        import httpx
+
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop or self._client.is_closed:
+            self._client = httpx.AsyncClient(timeout=10.0)
+            self._client_loop = loop
+        return self._client
+
+    async def _upstream(self, query: str, proximity, country) -> Optional[List[Dict]]:
+        from utils import mapbox_api
+
+        self.stats["upstream"] += 1
+        try:
+            return await mapbox_api.autocomplete_address_async(
+                query, proximity, country=country, limite=LIMITE_SUGESTOES, client=self._http(),
+            )
+        except Exception as e:
+            logger.warning(f"Autocomplete Mapbox falhou: {e}")
+            return None
+
+    async def _coalescido(self, chave: str, query: str, proximity, country) -> Optional[List[Dict]]:
+        """Consultas idênticas em voo esperam a mesma chamada ao Mapbox."""
+        with self._lock:
+            voo = self._voando.get(chave)
+            dono = voo is None
+            if dono:
+                voo = Future()
+                self._voando[chave] = voo
+        if not dono:
+            self.stats["coalescidas"] += 1
+            return await asyncio.wrap_future(voo)
+
+        resultado = None
+        try:
+            resultado = await self._upstream(query, proximity, country)
+            return resultado
+        finally:
+            with self._lock:
+                self._voando.pop(chave, None)
+            voo.set_result(resultado)
+
+    # ==================== API ====================
+
+    async def autocompletar(
+        self,
+        query: str,
+        proximity: Optional[Tuple[float, float]] = None,
+        country: Optional[str] = None,
+        db: Optional[Session] = None,
+        restaurante_id: Optional[int] = None,
+        cliente_id: Optional[int] = None,
+    ) -> List[Dict]:
+        """
+        Sugestões de endereço: [{'place_name': str, 'coordinates': (lat, lng)}, ...]
+        Com db + restaurante_id consulta antes o histórico do restaurante inteiro
+        (painel/bot); com cliente_id também, só os endereços desse cliente (site).
+        Poucas sugestões do histórico numa busca curta são completadas pelo Mapbox.
+        A consulta ao banco roda numa thread, fora do event loop.
+        """
+        query_norm = normalizar(query)
+        if len(query_norm) < MIN_CARACTERES:
+            return []
+
+        locais: List[Dict] = []
+        if db is not None and restaurante_id is not None:
+            if cliente_id is not None:
+                locais = await asyncio.to_thread(
+                    self.buscar_enderecos_cliente, db, restaurante_id, cliente_id, query,
+                )
+            else:
+                locais = await asyncio.to_thread(self.buscar_historico, db, restaurante_id, query)
+            if locais and (len(locais) >= min(HISTORICO_MIN_SUGESTOES, LIMITE_SUGESTOES)
+                           or len(query_norm) >= HISTORICO_MIN_CARACTERES):
+                self.stats["historico"] += 1
+                return locais
+
+        sugestoes = await self._sugestoes_mapbox(query, query_norm, proximity, country)
+        if not locais:
+            return sugestoes
+        self.stats["historico_mesclado"] += 1
+        return _mesclar(locais, sugestoes, LIMITE_SUGESTOES)
+
+    async def _sugestoes_mapbox(self, query: str, query_norm: str,
+                                proximity: Optional[Tuple[float, float]],
+                                country: Optional[str]) -> List[Dict]:
+        """Cache (exato ou prefixo) → Mapbox coalescido. Falha vira lista vazia."""
+        cacheadas = self._ler_cache(query_norm, proximity, country)
+        if cacheadas is not None:
+            return cacheadas
+
+        chave = chave_autocomplete(query_norm, proximity, country)
+        sugestoes = await self._coalescido(chave, query, proximity, country)
+        if sugestoes is None:
+            self.stats["falhas"] += 1
+            return []
+        self._gravar_cache(query_norm, proximity, country, sugestoes)
+        return sugestoes
+
+    async def fechar(self):
+        if self._client is not None and not self._client.is_closed:
+            try:
+                await self._client.aclose()
+            except Exception:
+                pass
+        self._client = None
+
+
+enderecos_service = EnderecoService()
@@ -3,13 +3,55 @@
 """
 Logging Configuration - Derekh Food API
 Dev: console colorido | Prod: JSON stdout (Docker coleta)
+
+Pipeline não-bloqueante: os loggers só enfileiram o record (QueueHandler);
+formatação JSON e escrita no stdout acontecem numa thread própria
+(QueueListener). A thread do request paga apenas filtro + enqueue.
+
+- Fila limitada: se o stdout travar, records excedentes são descartados
+  (e contados) em vez de segurar o event loop.
+- Warnings repetidos do mesmo ponto do código são limitados por janela
+  (LOG_WARNINGS_POR_JANELA / LOG_JANELA_WARNINGS_S); erros sempre passam.
+- Logs de sucesso de request são amostrados por rota (AmostragemRotas);
+  erros e requests lentas sempre entram.
+- Custo inline do logging é medido por request (medir_custo_log).
 """
 
 import logging
+import logging.handlers
 import sys
 import os
 import json
-from datetime import datetime
+import time
+import queue
+import atexit
+import random
+import fnmatch
+import threading
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+try:
+    import orjson
+except ImportError:  # fallback para json da stdlib
+    orjson = None
+
+LOG_FILA_MAX = int(os.getenv("LOG_FILA_MAX", "10000"))
+LOG_WARNINGS_POR_JANELA = int(os.getenv("LOG_WARNINGS_POR_JANELA", "5"))
+LOG_JANELA_WARNINGS_S = float(os.getenv("LOG_JANELA_WARNINGS_S", "60"))
+
+# Rotas quentes (polling/ping): no máximo esta fração dos sucessos é logada.
+# Formato "METODO /rota/template=taxa", separado por vírgula; glob permitido.
+AMOSTRAGEM_ROTAS_PADRAO = (
+    "POST /api/gps/*=0.02,"
+    "GET /motoboy/entregas/*=0.05,"
+    "GET /painel/bot/conversas/mudancas=0.05,"
+    "GET /painel/pedidos*=0.1"
+)
+
+_CAMPOS_EXTRA = ('request_id', 'tenant_id', 'method', 'path', 'status_code', 'duration_ms', 'client_ip',
+                 'queries', 'db_ms', 'statements_lentos', 'suprimidos')
 
 
 class ColorFormatter(logging.Formatter):
@@ -31,47 +73,282 @@ class ColorFormatter(logging.Formatter):
 
 
 class JSONFormatter(logging.Formatter):
-    """Formatter JSON para producao (Docker/Cloud)"""
+    """Formatter JSON para producao (Docker/Cloud). Usa orjson quando instalado."""
 
     def format(self, record):
         log_data = {
-            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
             "level": record.levelname,
             "message": record.getMessage(),
             "logger": record.name,
         }
 
-        for field in ('request_id', 'tenant_id', 'method', 'path', 'status_code', 'duration_ms', 'client_ip'):
-            if hasattr(record, field):
-                log_data[field] = getattr(record, field)
+        d = record.__dict__
+        for field in _CAMPOS_EXTRA:
+            if field in d:
+                log_data[field] = d[field]
 
         if record.exc_info and record.exc_info[1]:
             log_data['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            log_data['exception'] = record.exc_text
+
+        if orjson is not None:
+            try:
+                return orjson.dumps(log_data, default=str).decode("utf-8")
+            except TypeError:
+                pass  # ex.: inteiro acima de 64 bits — cai no json da stdlib
+        return json.dumps(log_data, ensure_ascii=False, default=str)
+
+
+# ==================== Custo por request ====================
+
+class CustoLog:
+    """Tempo gasto em logging na thread do request (filtros + enqueue)."""
+
+    __slots__ = ("ms", "records")
+
+    def __init__(self):
+        self.ms = 0.0
+        self.records = 0
+
+
+_custo_atual: ContextVar[Optional[CustoLog]] = ContextVar("custo_log", default=None)
+
+
+def medir_custo_log():
+    """
+    Começa a medir o custo de logging do request corrente.
+    Retorna (custo, token); devolva o token em encerrar_custo_log().
+    Mesmo padrão do query_profiler: o objeto é compartilhado com as
+    threads do threadpool (cópia do contexto), então endpoints síncronos
+    também somam aqui.
+    """
+    custo = CustoLog()
+    return custo, _custo_atual.set(custo)
+
+
+def encerrar_custo_log(token):
+    _custo_atual.reset(token)
+
+
+# ==================== Pipeline em fila ====================
+
+class FilaLogHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler que nunca bloqueia: fila cheia → record descartado e contado.
+    prepare() só resolve a mensagem (args/traceback) — a formatação final
+    fica para o listener.
+    """
+
+    def __init__(self, fila):
+        super().__init__(fila)
+        self.enfileirados = 0
+        self.descartados = 0
+        self.custo_ms = 0.0
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # Traceback vira texto aqui: não segura frames vivos na fila
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.stack_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+            self.enfileirados += 1
+        except queue.Full:
+            self.descartados += 1
+
+    def handle(self, record):
+        inicio = time.perf_counter()
+        try:
+            return super().handle(record)
+        finally:
+            gasto = (time.perf_counter() - inicio) * 1000
+            self.custo_ms += gasto
+            custo = _custo_atual.get()
+            if custo is not None:
+                custo.ms += gasto
+                custo.records += 1
 
-        return json.dumps(log_data, ensure_ascii=False)
+
+class LimiteRepeticaoFilter(logging.Filter):
+    """
+    Limita warnings repetidos do mesmo ponto do código (logger + arquivo +
+    linha) a `maximo` por janela. O primeiro record da janela seguinte
+    carrega quantos foram suprimidos. ERROR/CRITICAL nunca são limitados.
+    Um ponto que loga situações distintas passa extra={"chave_repeticao": ...}
+    (ex.: a rota, na request lenta) para ter um limite por situação.
+    """
+
+    def __init__(self, maximo: int = LOG_WARNINGS_POR_JANELA, janela_s: float = LOG_JANELA_WARNINGS_S):
+        super().__init__()
+        self.maximo = maximo
+        self.janela_s = janela_s
+        self._lock = threading.Lock()
+        self._contagem: Dict[tuple, list] = {}  # chave → [inicio_janela, emitidos, suprimidos]
+        self.suprimidos_total = 0
+
+    def filter(self, record):
+        if record.levelno != logging.WARNING or self.maximo <= 0:
+            return True
+
+        chave = (record.name, record.pathname, record.lineno, getattr(record, "chave_repeticao", None))
+        agora = time.monotonic()
+        with self._lock:
+            estado = self._contagem.get(chave)
+            if estado is None or agora - estado[0] >= self.janela_s:
+                suprimidos = estado[2] if estado else 0
+                self._contagem[chave] = [agora, 1, 0]
+                if len(self._contagem) > 5000:
+                    self._podar(agora)
+            elif estado[1] < self.maximo:
+                estado[1] += 1
+                return True
+            else:
+                estado[2] += 1
+                self.suprimidos_total += 1
+                return False
+
+        if suprimidos:
+            record.suprimidos = suprimidos
+            record.msg = f"{record.getMessage()} (+{suprimidos} repetidos suprimidos)"
+            record.args = None
+        return True
+
+    def _podar(self, agora: float):
+        for chave in [c for c, e in self._contagem.items() if agora - e[0] >= self.janela_s]:
+            del self._contagem[chave]
+
+
+# ==================== Amostragem por rota ====================
+
+class AmostragemRotas:
+    """
+    Decide se o log de SUCESSO de uma rota é registrado.
+    `padrao` é a taxa base; `regras` (glob sobre "METODO /rota/template")
+    só reduzem a taxa das rotas quentes — nunca aumentam.
+    Erros (>= 400) sempre entram; quem chama decide sobre requests lentas.
+    """
+
+    def __init__(self, padrao: float = 1.0, regras: Optional[Dict[str, float]] = None):
+        self.padrao = padrao
+        self.regras = regras or {}
+        self._taxas: Dict[str, float] = {}
+        self.amostrados = 0
+        self.descartados = 0
+
+    @staticmethod
+    def parse_regras(texto: str) -> Dict[str, float]:
+        regras = {}
+        for item in (texto or "").split(","):
+            padrao, sep, taxa = item.strip().rpartition("=")
+            if not sep or not padrao:
+                continue
+            try:
+                regras[padrao.strip()] = max(0.0, min(1.0, float(taxa)))
+            except ValueError:
+                continue
+        return regras
+
+    @classmethod
+    def from_env(cls) -> "AmostragemRotas":
+        producao = os.getenv("ENVIRONMENT", "development") == "production"
+        # Produção: sucessos rápidos não eram logados — mantém 0 por padrão
+        padrao = float(os.getenv("LOG_AMOSTRAGEM_PADRAO", "0" if producao else "1"))
+        return cls(
+            padrao=max(0.0, min(1.0, padrao)),
+            regras=cls.parse_regras(os.getenv("LOG_AMOSTRAGEM_ROTAS", AMOSTRAGEM_ROTAS_PADRAO)),
+        )
+
+    def taxa(self, rota: str) -> float:
+        taxa = self._taxas.get(rota)
+        if taxa is None:
+            taxa = self.padrao
+            for padrao, limite in self.regras.items():
+                if fnmatch.fnmatchcase(rota, padrao):
+                    taxa = min(taxa, limite)
+                    break
+            if len(self._taxas) < 2000:  # rotas são templates, conjunto pequeno
+                self._taxas[rota] = taxa
+        return taxa
+
+    def deve_registrar(self, rota: str, status_code: int) -> bool:
+        if status_code >= 400:
+            return True
+        taxa = self.taxa(rota)
+        if taxa >= 1.0 or (taxa > 0.0 and random.random() < taxa):
+            self.amostrados += 1
+            return True
+        self.descartados += 1
+        return False
+
+
+amostragem = AmostragemRotas.from_env()
+
+_handler: Optional[FilaLogHandler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+_limite: Optional[LimiteRepeticaoFilter] = None
+
+
+def parar_logging():
+    """Esvazia a fila e para a thread de escrita (shutdown / atexit)."""
+    global _listener
+    if _listener is not None:
+        try:
+            _listener.stop()
+        except Exception:
+            pass
+        _listener = None
+
+
+def estatisticas_logging() -> Dict[str, float]:
+    """Contadores do pipeline (para /metrics e diagnóstico)."""
+    enfileirados = _handler.enfileirados if _handler else 0
+    return {
+        "enfileirados": enfileirados,
+        "descartados_fila_cheia": _handler.descartados if _handler else 0,
+        "fila_atual": _handler.queue.qsize() if _handler else 0,
+        "custo_medio_us": round(_handler.custo_ms * 1000 / max(enfileirados, 1), 2) if _handler else 0.0,
+        "warnings_suprimidos": _limite.suprimidos_total if _limite else 0,
+        "requests_amostrados": amostragem.amostrados,
+        "requests_nao_logados": amostragem.descartados,
+    }
 
 
 def setup_logging():
     """Configura logging baseado no ambiente (ENVIRONMENT env var)"""
+    global _handler, _listener, _limite
     environment = os.getenv("ENVIRONMENT", "development")
     log_level = os.getenv("LOG_LEVEL", "INFO").upper()
 
     root_logger = logging.getLogger()
     root_logger.setLevel(getattr(logging, log_level, logging.INFO))
 
+    parar_logging()
     root_logger.handlers.clear()
 
-    handler = logging.StreamHandler(sys.stdout)
+    saida = logging.StreamHandler(sys.stdout)
 
     if environment == "production":
-        handler.setFormatter(JSONFormatter())
+        saida.setFormatter(JSONFormatter())
     else:
-        handler.setFormatter(ColorFormatter(
+        saida.setFormatter(ColorFormatter(
             fmt="%(asctime)s %(levelname)s [%(name)s] %(message)s",
             datefmt="%H:%M:%S"
         ))
 
-    root_logger.addHandler(handler)
+    _limite = LimiteRepeticaoFilter()
+    _handler = FilaLogHandler(queue.Queue(maxsize=LOG_FILA_MAX))
+    _handler.addFilter(_limite)
+    _listener = logging.handlers.QueueListener(_handler.queue, saida, respect_handler_level=True)
+    _listener.start()
+    root_logger.addHandler(_handler)
 
     logging.getLogger("uvicorn.access").setLevel(logging.WARNING)
     logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
@@ -81,3 +358,6 @@ def setup_logging():
     logger.info(f"Logging configurado: env={environment}, level={log_level}")
 
     return logger
+
+
+atexit.register(parar_logging)
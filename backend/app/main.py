@@ -1,7 +1,7 @@
 from fastapi import FastAPI, Query, Request, Depends, HTTPException
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, Response
 from fastapi.websockets import WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
@@ -37,8 +37,12 @@ from .pix.pix_tasks import verificar_pix_periodico
 from .integrations.manager import integration_manager
 from .database import engine, Base, get_db, SessionLocal
 from . import models
-from .logging_config import setup_logging
-from .metrics import metrics
+from .logging_config import (
+    setup_logging, parar_logging, amostragem as amostragem_logs,
+    medir_custo_log, encerrar_custo_log, estatisticas_logging,
+)
+from .metrics import metrics, metrics_export_loop, HistogramaLog
+from . import query_profiler
 from .websocket_manager import create_manager
 from .rate_limit import RateLimitMiddleware
 from .middleware import DomainTenantMiddleware
@@ -49,6 +53,9 @@ from .auth import get_current_admin
 setup_logging()
 logger = logging.getLogger("superfood")
 
+# Queries/tempo de banco por request (ver query_profiler.py)
+query_profiler.instrumentar_engine(engine)
+
 # WebSocket Managers (com suporte Redis Pub/Sub)
 manager = create_manager(channel_prefix="ws:restaurante")
 printer_manager = create_manager(channel_prefix="ws:printer")
@@ -56,6 +63,9 @@ kds_manager = create_manager(channel_prefix="ws:kds")
 garcom_manager = create_manager(channel_prefix="ws:garcom")
 bot_manager = create_manager(channel_prefix="ws:bot")
 
+# Latência enqueue → papel reportada pelos printer agents no print_ack
+impressao_latencia = {"fila": HistogramaLog(), "total": HistogramaLog()}
+
 
 async def verificar_entregas_atrasadas(ws_manager):
     """Task periódica: verifica entregas atrasadas a cada 60s e broadcast alerta"""
@@ -119,13 +129,14 @@ _entrega_task = None
 _billing_task = None
 _pix_task = None
 _demo_task = None
+_metrics_task = None
 _bot_task = None
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Startup/shutdown da aplicacao"""
-    global _entrega_task, _billing_task, _pix_task, _demo_task, _bot_task
+    global _entrega_task, _billing_task, _pix_task, _demo_task, _metrics_task, _bot_task
     # Startup
     environment = os.getenv("ENVIRONMENT", "development")
     if environment == "production":
@@ -167,6 +178,9 @@ async def lifespan(app: FastAPI):
     # Inicia demo autopilot (progride pedidos demo automaticamente)
     _demo_task = asyncio.create_task(demo_autopilot_loop(manager))
 
+    # Publica métricas do worker no Redis (agregação cross-worker em /metrics)
+    _metrics_task = asyncio.create_task(metrics_export_loop())
+
     # Inicia workers do bot WhatsApp
     from .bot.workers import bot_workers_loop
     _bot_task = asyncio.create_task(bot_workers_loop(manager))
@@ -175,6 +189,10 @@ async def lifespan(app: FastAPI):
     integration_manager.set_app(app)
     await integration_manager.start()
 
+    # Consumidores da fila de webhooks (Evolution, Meta, Asaas, Woovi)
+    from .webhook_fila import fila_webhooks
+    await fila_webhooks.start(manager)
+
     yield
 
     # Shutdown
@@ -202,6 +220,12 @@ async def lifespan(app: FastAPI):
             await _demo_task
         except asyncio.CancelledError:
             pass
+    if _metrics_task:
+        _metrics_task.cancel()
+        try:
+            await _metrics_task
+        except asyncio.CancelledError:
+            pass
     if hasattr(manager, 'stop'):
         await manager.stop()
     if hasattr(printer_manager, 'stop'):
@@ -219,7 +243,14 @@ async def lifespan(app: FastAPI):
     if hasattr(bot_manager, 'stop'):
         await bot_manager.stop()
     await integration_manager.stop()
+    from .webhook_fila import fila_webhooks
+    await fila_webhooks.stop()
+    from .bot.transcoder import transcoder
+    transcoder.shutdown()
+    from .enderecos_service import enderecos_service
+    await enderecos_service.fechar()
     logger.info("Derekh Food API encerrada")
+    parar_logging()
 
 
 app = FastAPI(
@@ -293,31 +324,64 @@ async def request_logging_middleware(request: Request, call_next):
     request_id = str(uuid.uuid4())[:8]
     start_time = time.time()
 
-    response = await call_next(request)
-
-    duration_ms = round((time.time() - start_time) * 1000, 2)
-
-    # Registra metricas
-    metrics.record_request(response.status_code, duration_ms)
-
-    # Log (apenas requests lentos ou erros em producao)
-    environment = os.getenv("ENVIRONMENT", "development")
-    if environment == "production" and response.status_code < 400 and duration_ms < 500:
-        pass  # Ignora requests normais em producao
-    else:
-        logger.info(
-            f"{request.method} {path} {response.status_code} {duration_ms}ms",
-            extra={
-                "request_id": request_id,
-                "method": request.method,
-                "path": path,
-                "status_code": response.status_code,
-                "duration_ms": duration_ms,
-                "client_ip": request.client.host if request.client else "unknown",
-            },
-        )
+    perfil, token = query_profiler.iniciar_perfil(path)
+    custo_log, token_log = medir_custo_log()
+    try:
+        response = await call_next(request)
+
+        duration_ms = round((time.time() - start_time) * 1000, 2)
+        perfil.rota = query_profiler.rota_da_request(request)
+        rota = f"{request.method} {perfil.rota}"
+
+        if duration_ms >= query_profiler.SLOW_REQUEST_MS:
+            logger.warning(
+                f"Request lenta: {rota} {duration_ms}ms "
+                f"({perfil.queries} queries, {perfil.db_ms:.1f}ms no banco)",
+                extra={
+                    "chave_repeticao": rota,
+                    "request_id": request_id,
+                    "path": path,
+                    "duration_ms": duration_ms,
+                    "queries": perfil.queries,
+                    "db_ms": round(perfil.db_ms, 2),
+                    "statements_lentos": [
+                        {"duracao_ms": round(d, 2), "statement": st[:300]} for d, st in perfil.lentas
+                    ],
+                },
+            )
+
+        # Log: erros e requests >= 500ms sempre; sucessos amostrados por rota
+        # (produção: 0% por padrão; rotas quentes como GPS/polling têm teto baixo)
+        if response.status_code >= 400 or duration_ms >= 500 or amostragem_logs.deve_registrar(rota, response.status_code):
+            logger.info(
+                f"{request.method} {path} {response.status_code} {duration_ms}ms",
+                extra={
+                    "request_id": request_id,
+                    "method": request.method,
+                    "path": path,
+                    "status_code": response.status_code,
+                    "duration_ms": duration_ms,
+                    "client_ip": request.client.host if request.client else "unknown",
+                },
+            )
+    finally:
+        query_profiler.finalizar_perfil(token)
+        encerrar_custo_log(token_log)
+
+    # Registra metricas (inclui o custo do logging feito neste request)
+    metrics.record_request(
+        response.status_code, duration_ms,
+        rota=rota,
+        queries=perfil.queries,
+        db_ms=perfil.db_ms,
+        statement_mais_lento=perfil.lentas[0] if perfil.lentas else None,
+        log_ms=custo_log.ms,
+    )
 
     response.headers["X-Request-ID"] = request_id
+    if query_profiler.QUERY_COUNT_HEADER:
+        response.headers["X-Query-Count"] = str(perfil.queries)
+        response.headers["X-DB-Time-Ms"] = f"{perfil.db_ms:.2f}"
     return response
 
 # Diretório do React build
@@ -820,10 +884,37 @@ async def health_ready(db: Session = Depends(get_db)):
 # ==================== Metrics Endpoint ====================
 @app.get("/metrics")
 async def get_metrics(
+    formato: str = Query("json", pattern="^(json|prometheus)$"),
+    escopo: str = Query("worker", pattern="^(worker|cluster)$"),
     current_admin: models.SuperAdmin = Depends(get_current_admin),
 ):
-    """Metricas de performance (apenas super admin)"""
-    return metrics.get_metrics()
+    """Metricas de performance (apenas super admin).
+    escopo=cluster soma todos os workers via Redis; formato=prometheus para scrape."""
+    if escopo == "cluster":
+        snap = await asyncio.to_thread(metrics.snapshot_cluster)
+    else:
+        snap = metrics.snapshot()
+    if formato == "prometheus":
+        return Response(metrics.prometheus(snap), media_type="text/plain; version=0.0.4")
+    dados = metrics.get_metrics(snap)
+    dados["rotas"] = metrics.get_rotas(snap=snap)
+    dados["slow_queries"] = query_profiler.slow_queries_recentes()
+    from .bot.transcoder import transcoder
+    dados["transcoder"] = transcoder.stats()
+    from .enderecos_service import enderecos_service
+    dados["enderecos"] = dict(enderecos_service.stats)
+    from .webhook_fila import fila_webhooks
+    dados["webhooks"] = fila_webhooks.stats()
+    dados["logging"] = estatisticas_logging()
+    dados["impressao"] = {
+        "n": impressao_latencia["total"].n,
+        "fila_p50_ms": impressao_latencia["fila"].percentil(50),
+        "fila_p95_ms": impressao_latencia["fila"].percentil(95),
+        "latencia_p50_ms": impressao_latencia["total"].percentil(50),
+        "latencia_p95_ms": impressao_latencia["total"].percentil(95),
+        "latencia_max_ms": impressao_latencia["total"].max,
+    }
+    return dados
 
 
 # ==================== WebSocket ====================
@@ -878,6 +969,11 @@ async def websocket_printer(websocket: WebSocket, restaurante_id: int, token: Op
             msg = json.loads(data)
             tipo = msg.get("tipo") if isinstance(msg, dict) else None
             if tipo == "print_ack":
+                ack = msg.get("dados") or {}
+                if ack.get("success") and isinstance(ack.get("latencia_ms"), (int, float)):
+                    impressao_latencia["total"].registrar(float(ack["latencia_ms"]))
+                    if isinstance(ack.get("fila_ms"), (int, float)):
+                        impressao_latencia["fila"].registrar(float(ack["fila_ms"]))
                 # Repassa status de impressão para o admin WS
                 await manager.broadcast(msg, restaurante_id)
             elif tipo == "status":
@@ -2,73 +2,424 @@
 
 """
 Metricas de Performance - Derekh Food API
-Contadores in-memory para monitoramento basico
+Histogramas log-bucket de memória fixa por rota e classe de status.
+
+- Cada bucket cobre ~8% (erro relativo máximo ~4% nos percentis), de
+  0.1ms a 120s. Percentil = varredura dos buckets, O(buckets) — nada de
+  ordenar listas de latência no scrape.
+- Escrita sem lock global: cada thread grava no seu próprio shard
+  (threading.local); o scrape soma os shards.
+- Histogramas são somáveis: cada worker exporta seu snapshot no Redis
+  (metrics:worker:<host>:<pid>) e /metrics?escopo=cluster agrega todos.
+- Exposição JSON (/metrics) e texto Prometheus (/metrics?formato=prometheus).
 """
 
+import os
+import json
+import math
 import time
+import socket
+import asyncio
+import logging
 import threading
 from collections import defaultdict
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Iterable
+
+logger = logging.getLogger("superfood.metrics")
+
+# Buckets: limite superior do bucket i = HIST_MIN_MS * HIST_FATOR ** i
+HIST_MIN_MS = 0.1
+HIST_MAX_MS = 120_000.0
+HIST_FATOR = 1.08
+_LOG_FATOR = math.log(HIST_FATOR)
+HIST_BUCKETS = math.ceil(math.log(HIST_MAX_MS / HIST_MIN_MS) / _LOG_FATOR) + 2
+
+# Fronteiras (segundos) expostas no Prometheus — agregadas a partir dos buckets finos
+PROMETHEUS_LE_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRICS_EXPORT_INTERVAL = int(os.getenv("METRICS_EXPORT_INTERVAL", "15"))
+METRICS_REDIS_PREFIX = "metrics:worker:"
+
+SEM_ROTA = "<sem_rota>"
+
+
+def _indice_bucket(valor_ms: float) -> int:
+    if valor_ms <= HIST_MIN_MS:
+        return 0
+    i = 1 + int(math.log(valor_ms / HIST_MIN_MS) / _LOG_FATOR)
+    return min(i, HIST_BUCKETS - 1)
+
+
+def limite_bucket_ms(indice: int) -> float:
+    """Limite superior do bucket (último bucket = overflow)."""
+    if indice >= HIST_BUCKETS - 1:
+        return math.inf
+    return HIST_MIN_MS * HIST_FATOR ** indice
+
+
+class HistogramaLog:
+    """Histograma esparso de buckets logarítmicos (memória ∝ buckets usados, máx. HIST_BUCKETS)."""
+
+    __slots__ = ("buckets", "n", "soma", "max")
+
+    def __init__(self):
+        self.buckets: Dict[int, int] = {}
+        self.n = 0
+        self.soma = 0.0
+        self.max = 0.0
+
+    def registrar(self, valor_ms: float):
+        i = _indice_bucket(valor_ms)
+        self.buckets[i] = self.buckets.get(i, 0) + 1
+        self.n += 1
+        self.soma += valor_ms
+        if valor_ms > self.max:
+            self.max = valor_ms
+
+    def mesclar(self, outro: "HistogramaLog"):
+        for i, c in list(outro.buckets.items()):
+            self.buckets[i] = self.buckets.get(i, 0) + c
+        self.n += outro.n
+        self.soma += outro.soma
+        self.max = max(self.max, outro.max)
+
+    def percentil(self, p: float) -> float:
+        if not self.n:
+            return 0.0
+        alvo = max(1, math.ceil(self.n * p / 100))
+        acumulado = 0
+        for i in sorted(self.buckets):
+            acumulado += self.buckets[i]
+            if acumulado >= alvo:
+                return round(min(limite_bucket_ms(i), self.max), 2)
+        return round(self.max, 2)
+
+    def contagem_ate(self, limite_ms: float) -> int:
+        """Observações em buckets cujo limite superior ≤ limite_ms (para o `le` do Prometheus)."""
+        return sum(c for i, c in self.buckets.items() if limite_bucket_ms(i) <= limite_ms)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "buckets": {str(i): c for i, c in self.buckets.items()},
+            "n": self.n,
+            "soma": self.soma,
+            "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, dados: Dict[str, Any]) -> "HistogramaLog":
+        h = cls()
+        h.buckets = {int(i): int(c) for i, c in dados.get("buckets", {}).items()}
+        h.n = int(dados.get("n", 0))
+        h.soma = float(dados.get("soma", 0.0))
+        h.max = float(dados.get("max", 0.0))
+        return h
+
+
+def _novo_db() -> Dict[str, Any]:
+    return {
+        "queries_total": 0, "queries_max": 0,
+        "db_ms_total": 0.0, "db_ms_max": 0.0,
+        "log_ms_total": 0.0,
+        "statement_mais_lento": None,
+    }
+
+
+class _Shard:
+    """Estado de UMA thread — só ela escreve, o scrape apenas lê."""
+
+    __slots__ = ("series", "status", "db")
+
+    def __init__(self):
+        self.series: Dict[tuple, HistogramaLog] = {}   # (rota, "2xx") → latência
+        self.status: Dict[int, int] = defaultdict(int)
+        self.db: Dict[str, Dict[str, Any]] = {}          # rota → agregados do query_profiler
 
 
 class MetricsCollector:
-    """Coleta metricas de performance in-memory"""
+    """Coleta metricas de performance in-memory (por worker, exportáveis para o cluster)"""
 
     def __init__(self):
-        self._lock = threading.Lock()
-        self._request_count = 0
-        self._error_count = 0
-        self._status_counts: Dict[int, int] = defaultdict(int)
-        self._latencies: list = []
-        self._max_latencies = 10000  # Mantém últimas 10k medições
+        self._shards_lock = threading.Lock()
+        self._local = threading.local()
+        self._shards: List[_Shard] = []
         self._start_time = time.time()
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
 
-    def record_request(self, status_code: int, duration_ms: float):
-        """Registra uma requisicao processada"""
-        with self._lock:
-            self._request_count += 1
-            self._status_counts[status_code] += 1
-            if status_code >= 400:
-                self._error_count += 1
-            self._latencies.append(duration_ms)
-            if len(self._latencies) > self._max_latencies:
-                self._latencies = self._latencies[-self._max_latencies:]
-
-    def get_percentile(self, p: float) -> float:
-        """Calcula percentil das latencias"""
-        if not self._latencies:
-            return 0.0
-        sorted_lat = sorted(self._latencies)
-        idx = int(len(sorted_lat) * p / 100)
-        idx = min(idx, len(sorted_lat) - 1)
-        return round(sorted_lat[idx], 2)
+    def _shard(self) -> _Shard:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = _Shard()
+            self._local.shard = shard
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def record_request(self, status_code: int, duration_ms: float,
+                       rota: Optional[str] = None, queries: int = 0, db_ms: float = 0.0,
+                       statement_mais_lento: Optional[tuple] = None, log_ms: float = 0.0):
+        """Registra uma requisicao processada (rota/queries/db_ms vêm do query_profiler,
+        log_ms do logging_config — custo do logging na thread do request)"""
+        shard = self._shard()
+        chave = (rota or SEM_ROTA, f"{status_code // 100}xx")
+        h = shard.series.get(chave)
+        if h is None:
+            h = shard.series[chave] = HistogramaLog()
+        h.registrar(duration_ms)
+        shard.status[status_code] += 1
+
+        if rota:
+            r = shard.db.get(rota)
+            if r is None:
+                r = shard.db[rota] = _novo_db()
+            r["queries_total"] += queries
+            r["queries_max"] = max(r["queries_max"], queries)
+            r["db_ms_total"] += db_ms
+            r["db_ms_max"] = max(r["db_ms_max"], db_ms)
+            r["log_ms_total"] += log_ms
+            if statement_mais_lento:
+                atual = r["statement_mais_lento"]
+                if atual is None or statement_mais_lento[0] > atual["duracao_ms"]:
+                    r["statement_mais_lento"] = {
+                        "duracao_ms": round(statement_mais_lento[0], 2),
+                        "statement": statement_mais_lento[1][:300],
+                    }
+
+    # ─── Snapshot (serializável, somável entre workers) ───
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Soma dos shards deste worker em formato JSON."""
+        with self._shards_lock:
+            shards = list(self._shards)
+
+        series: Dict[tuple, HistogramaLog] = {}
+        status: Dict[int, int] = defaultdict(int)
+        db: Dict[str, Dict[str, Any]] = {}
+        for shard in shards:
+            for chave, h in list(shard.series.items()):
+                if chave not in series:
+                    series[chave] = HistogramaLog()
+                series[chave].mesclar(h)
+            for code, n in list(shard.status.items()):
+                status[code] += n
+            for rota, r in list(shard.db.items()):
+                _mesclar_db(db.setdefault(rota, _novo_db()), r)
 
-    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "inicio": self._start_time,
+            "workers": 1,
+            "series": {f"{rota}|{classe}": h.to_dict() for (rota, classe), h in series.items()},
+            "status": {str(k): v for k, v in status.items()},
+            "db": db,
+        }
+
+    @staticmethod
+    def mesclar_snapshots(snapshots: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        """Soma snapshots de vários workers (histogramas de buckets fixos somam exato)."""
+        series: Dict[str, HistogramaLog] = {}
+        status: Dict[str, int] = defaultdict(int)
+        db: Dict[str, Dict[str, Any]] = {}
+        inicio = time.time()
+        workers = 0
+        for snap in snapshots:
+            workers += snap.get("workers", 1)
+            inicio = min(inicio, snap.get("inicio", inicio))
+            for chave, dados in snap.get("series", {}).items():
+                h = HistogramaLog.from_dict(dados)
+                if chave in series:
+                    series[chave].mesclar(h)
+                else:
+                    series[chave] = h
+            for code, n in snap.get("status", {}).items():
+                status[code] += n
+            for rota, r in snap.get("db", {}).items():
+                _mesclar_db(db.setdefault(rota, _novo_db()), r)
+        return {
+            "inicio": inicio,
+            "workers": workers,
+            "series": {k: h.to_dict() for k, h in series.items()},
+            "status": dict(status),
+            "db": db,
+        }
+
+    # ─── Exposição ───
+
+    def get_metrics(self, snap: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Retorna snapshot das metricas"""
-        with self._lock:
-            uptime = time.time() - self._start_time
-            return {
-                "uptime_seconds": round(uptime, 0),
-                "total_requests": self._request_count,
-                "total_errors": self._error_count,
-                "error_rate": round(self._error_count / max(self._request_count, 1) * 100, 2),
-                "requests_per_second": round(self._request_count / max(uptime, 1), 2),
-                "status_codes": dict(self._status_counts),
-                "latency": {
-                    "p50_ms": self.get_percentile(50),
-                    "p95_ms": self.get_percentile(95),
-                    "p99_ms": self.get_percentile(99),
-                    "samples": len(self._latencies),
-                },
-            }
+        snap = snap or self.snapshot()
+        uptime = time.time() - snap["inicio"]
+        status = {int(k): v for k, v in snap["status"].items()}
+        total = sum(status.values())
+        erros = sum(v for k, v in status.items() if k >= 400)
+
+        global_h = HistogramaLog()
+        for dados in snap["series"].values():
+            global_h.mesclar(HistogramaLog.from_dict(dados))
+
+        return {
+            "uptime_seconds": round(uptime, 0),
+            "workers": snap.get("workers", 1),
+            "total_requests": total,
+            "total_errors": erros,
+            "error_rate": round(erros / max(total, 1) * 100, 2),
+            "requests_per_second": round(total / max(uptime, 1), 2),
+            "status_codes": status,
+            "latency": {
+                "p50_ms": global_h.percentil(50),
+                "p95_ms": global_h.percentil(95),
+                "p99_ms": global_h.percentil(99),
+                "max_ms": round(global_h.max, 2),
+                "samples": global_h.n,
+            },
+        }
+
+    def get_rotas(self, limite: int = 30, snap: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Rotas ordenadas por tempo total de banco (quem mais segura conexão)"""
+        snap = snap or self.snapshot()
+        por_rota: Dict[str, HistogramaLog] = {}
+        erros_por_rota: Dict[str, int] = defaultdict(int)
+        for chave, dados in snap["series"].items():
+            rota, classe = chave.rsplit("|", 1)
+            h = HistogramaLog.from_dict(dados)
+            if classe in ("4xx", "5xx"):
+                erros_por_rota[rota] += h.n
+            if rota in por_rota:
+                por_rota[rota].mesclar(h)
+            else:
+                por_rota[rota] = h
+
+        resultado = []
+        for rota, r in snap["db"].items():
+            h = por_rota.get(rota) or HistogramaLog()
+            n = max(h.n, 1)
+            resultado.append({
+                "rota": rota,
+                "requests": h.n,
+                "erros": erros_por_rota.get(rota, 0),
+                "p50_ms": h.percentil(50),
+                "p95_ms": h.percentil(95),
+                "p99_ms": h.percentil(99),
+                "queries_media": round(r["queries_total"] / n, 2),
+                "queries_max": r["queries_max"],
+                "db_ms_total": round(r["db_ms_total"], 2),
+                "db_ms_media": round(r["db_ms_total"] / n, 2),
+                "db_ms_max": round(r["db_ms_max"], 2),
+                "log_ms_media": round(r.get("log_ms_total", 0.0) / n, 3),
+                "latencia_ms_media": round(h.soma / n, 2),
+                "statement_mais_lento": r["statement_mais_lento"],
+            })
+        resultado.sort(key=lambda r: r["db_ms_total"], reverse=True)
+        return resultado[:limite]
+
+    def prometheus(self, snap: Optional[Dict[str, Any]] = None) -> str:
+        """Texto no formato de exposição do Prometheus (0.0.4)."""
+        snap = snap or self.snapshot()
+        linhas = [
+            "# HELP superfood_uptime_seconds Tempo desde o start do worker mais antigo",
+            "# TYPE superfood_uptime_seconds gauge",
+            f"superfood_uptime_seconds {time.time() - snap['inicio']:.0f}",
+            "# HELP superfood_http_request_duration_seconds Latência das requests HTTP",
+            "# TYPE superfood_http_request_duration_seconds histogram",
+        ]
+        for chave in sorted(snap["series"]):
+            rota, classe = chave.rsplit("|", 1)
+            labels = f'{_labels_rota(rota)},status_class="{classe}"'
+            h = HistogramaLog.from_dict(snap["series"][chave])
+            for le in PROMETHEUS_LE_SEGUNDOS:
+                linhas.append(
+                    f'superfood_http_request_duration_seconds_bucket{{{labels},le="{le}"}} '
+                    f"{h.contagem_ate(le * 1000)}"
+                )
+            linhas.append(f'superfood_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {h.n}')
+            linhas.append(f"superfood_http_request_duration_seconds_sum{{{labels}}} {h.soma / 1000:.6f}")
+            linhas.append(f"superfood_http_request_duration_seconds_count{{{labels}}} {h.n}")
+
+        linhas += [
+            "# HELP superfood_db_queries_total Statements SQL executados por rota",
+            "# TYPE superfood_db_queries_total counter",
+        ]
+        for rota in sorted(snap["db"]):
+            linhas.append(f'superfood_db_queries_total{{{_labels_rota(rota)}}} {snap["db"][rota]["queries_total"]}')
+        linhas += [
+            "# HELP superfood_db_time_seconds_total Tempo de banco por rota",
+            "# TYPE superfood_db_time_seconds_total counter",
+        ]
+        for rota in sorted(snap["db"]):
+            linhas.append(
+                f'superfood_db_time_seconds_total{{{_labels_rota(rota)}}} '
+                f'{snap["db"][rota]["db_ms_total"] / 1000:.6f}'
+            )
+        return "\n".join(linhas) + "\n"
+
+    # ─── Cluster (Redis) ───
+
+    def exportar_redis(self, ttl_seconds: int = METRICS_EXPORT_INTERVAL * 4) -> bool:
+        """Publica o snapshot deste worker no Redis. Best-effort."""
+        from .cache import get_redis
+        r = get_redis()
+        if not r:
+            return False
+        try:
+            r.setex(f"{METRICS_REDIS_PREFIX}{self.worker_id}", ttl_seconds, json.dumps(self.snapshot()))
+            return True
+        except Exception as e:
+            logger.warning(f"Export de métricas falhou: {e}")
+            return False
+
+    def snapshot_cluster(self) -> Dict[str, Any]:
+        """Soma de todos os workers vivos; sem Redis, só este worker."""
+        from .cache import get_redis
+        local = self.snapshot()
+        r = get_redis()
+        if not r:
+            return local
+        try:
+            proprio = f"{METRICS_REDIS_PREFIX}{self.worker_id}"
+            chaves = [k for k in r.scan_iter(match=f"{METRICS_REDIS_PREFIX}*", count=100) if k != proprio]
+            outros = [json.loads(v) for v in (r.mget(chaves) if chaves else []) if v]
+        except Exception as e:
+            logger.warning(f"Leitura de métricas do cluster falhou: {e}")
+            return local
+        return self.mesclar_snapshots([local, *outros])
 
     def reset(self):
-        """Reseta contadores"""
-        with self._lock:
-            self._request_count = 0
-            self._error_count = 0
-            self._status_counts.clear()
-            self._latencies.clear()
+        """Reseta contadores (shards antigos ficam órfãos e são descartados)"""
+        with self._shards_lock:
+            self._local = threading.local()
+            self._shards = []
+            self._start_time = time.time()
+
+
+def _mesclar_db(destino: Dict[str, Any], origem: Dict[str, Any]):
+    destino["queries_total"] += origem["queries_total"]
+    destino["queries_max"] = max(destino["queries_max"], origem["queries_max"])
+    destino["db_ms_total"] += origem["db_ms_total"]
+    destino["db_ms_max"] = max(destino["db_ms_max"], origem["db_ms_max"])
+    destino["log_ms_total"] += origem.get("log_ms_total", 0.0)  # snapshots de workers antigos
+    s = origem.get("statement_mais_lento")
+    if s and (destino["statement_mais_lento"] is None
+              or s["duracao_ms"] > destino["statement_mais_lento"]["duracao_ms"]):
+        destino["statement_mais_lento"] = s
+
+
+def _escape(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels_rota(rota: str) -> str:
+    """'GET /pedidos/{id}' → method="GET",route="/pedidos/{id}"."""
+    metodo, _, path = rota.partition(" ") if " " in rota else ("", "", rota)
+    return f'method="{_escape(metodo)}",route="{_escape(path)}"'
+
+
+async def metrics_export_loop():
+    """Task periódica: publica o snapshot do worker para agregação cross-worker."""
+    while True:
+        await asyncio.sleep(METRICS_EXPORT_INTERVAL)
+        try:
+            await asyncio.to_thread(metrics.exportar_redis)
+        except Exception as e:
+            logger.warning(f"metrics_export_loop: {e}")
 
 
 # Singleton global
@@ -5,7 +5,12 @@ from sqlalchemy.orm import Session
 from .database import SessionLocal
 from .auth import get_current_restaurante
 from fastapi import HTTPException, status
+from starlette.concurrency import run_in_threadpool
+from typing import Optional
+import os
+import time
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 
@@ -54,10 +59,90 @@ def get_tenant_id(request: Request) -> int:
     return request.state.tenant_id
 
 
-class DomainTenantMiddleware(BaseHTTPMiddleware):
+SUBDOMINIO_PLATAFORMA = ".superfood.com.br"
+
+
+class DominioTenantCache:
+    """
+    Cache host → restaurante_id em memória (por worker), com TTL.
+
+    Guarda também os misses (host sem tenant) com TTL curto — scanners e
+    domínios ainda não verificados não viram query a cada request.
+    painel/admin/billing invalidam ao verificar/remover/suspender; nos
+    outros workers a entrada expira pelo TTL.
+    """
+
+    def __init__(self, ttl_seconds: int = 300, ttl_negativo_seconds: int = 60, max_hosts: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.ttl_negativo_seconds = ttl_negativo_seconds
+        self.max_hosts = max_hosts
+        self._hosts = {}  # host → (restaurante_id | None, expira_em)
+        self._lock = threading.Lock()
+
+    def get(self, host: str):
+        """Retorna (encontrado, restaurante_id)."""
+        item = self._hosts.get(host)
+        if item is None:
+            return False, None
+        tenant_id, expira_em = item
+        if expira_em < time.monotonic():
+            with self._lock:
+                self._hosts.pop(host, None)
+            return False, None
+        return True, tenant_id
+
+    def set(self, host: str, tenant_id):
+        ttl = self.ttl_seconds if tenant_id else self.ttl_negativo_seconds
+        with self._lock:
+            if len(self._hosts) >= self.max_hosts and host not in self._hosts:
+                agora = time.monotonic()
+                for h in [h for h, (_, exp) in self._hosts.items() if exp < agora]:
+                    del self._hosts[h]
+                # Ainda cheio: descarta o mais antigo (dict mantém ordem de inserção)
+                if len(self._hosts) >= self.max_hosts:
+                    self._hosts.pop(next(iter(self._hosts)))
+            self._hosts[host] = (tenant_id, time.monotonic() + ttl)
+
+    def invalidar(self, *hosts: str, restaurante_id: Optional[int] = None,
+                  codigo_acesso: Optional[str] = None):
+        """Remove hosts informados, o subdomínio do restaurante e tudo que aponta para ele."""
+        alvos = {h.strip().lower() for h in hosts if h}
+        if codigo_acesso:
+            alvos.add(f"{codigo_acesso.lower()}{SUBDOMINIO_PLATAFORMA}")
+        with self._lock:
+            if restaurante_id is not None:
+                alvos.update(h for h, (tid, _) in self._hosts.items() if tid == restaurante_id)
+            for h in alvos:
+                self._hosts.pop(h, None)
+
+    def limpar(self):
+        with self._lock:
+            self._hosts.clear()
+
+
+dominio_tenant_cache = DominioTenantCache(
+    ttl_seconds=int(os.getenv("DOMAIN_TENANT_TTL", "300")),
+    ttl_negativo_seconds=int(os.getenv("DOMAIN_TENANT_NEGATIVE_TTL", "60")),
+)
+
+
+def invalidar_dominio_tenant(*hosts: str, restaurante_id: Optional[int] = None,
+                             codigo_acesso: Optional[str] = None):
+    """Chamar após verificar/remover domínio ou suspender/reativar restaurante."""
+    dominio_tenant_cache.invalidar(*hosts, restaurante_id=restaurante_id, codigo_acesso=codigo_acesso)
+
+
+# Sentinela: falha de banco não entra no cache negativo
+_ERRO = object()
+
+
+class DomainTenantMiddleware:
     """
     Resolve restaurante por dominio customizado ou subdominio *.superfood.com.br
     Seta request.state.domain_tenant_id para uso nos endpoints do site
+
+    ASGI puro (sem BaseHTTPMiddleware) e resolução via dominio_tenant_cache:
+    tráfego do site white-label não faz query por request.
     """
 
     # Rotas que nao precisam de resolucao por dominio
@@ -74,38 +159,54 @@ class DomainTenantMiddleware(BaseHTTPMiddleware):
         "www.derekhfood.com.br",
     )
 
-    async def dispatch(self, request: Request, call_next):
-        path = request.url.path
+    def __init__(self, app, cache: Optional[DominioTenantCache] = None):
+        self.app = app
+        self.cache = cache or dominio_tenant_cache
 
-        # Bypass rotas internas
-        if any(path.startswith(prefix) for prefix in self.BYPASS_PREFIXES):
-            return await call_next(request)
-
-        host = request.headers.get("host", "").split(":")[0].lower()
-
-        # Ignora localhost e IPs
-        if host in ("localhost", "127.0.0.1", "") or host.replace(".", "").isdigit():
-            return await call_next(request)
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-        # Ignora domínios da própria plataforma
-        if host in self.PLATFORM_DOMAINS:
-            return await call_next(request)
-
-        # Tenta resolver por dominio customizado ou subdominio
-        tenant_id = self._resolve_tenant(host)
-        if tenant_id:
-            request.state.domain_tenant_id = tenant_id
+        path = scope.get("path", "")
 
-        return await call_next(request)
+        # Bypass rotas internas
+        if path.startswith(self.BYPASS_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+
+        host = ""
+        for nome, valor in scope.get("headers", ()):
+            if nome == b"host":
+                host = valor.decode("latin-1").split(":")[0].lower()
+                break
+
+        # Ignora localhost, IPs e domínios da própria plataforma
+        if (host in ("localhost", "127.0.0.1", "") or host.replace(".", "").isdigit()
+                or host in self.PLATFORM_DOMAINS):
+            await self.app(scope, receive, send)
+            return
+
+        encontrado, tenant_id = self.cache.get(host)
+        if not encontrado:
+            # Query síncrona fora do event loop
+            tenant_id = await run_in_threadpool(self._resolve_tenant, host)
+            if tenant_id is not _ERRO:
+                self.cache.set(host, tenant_id)
+
+        if tenant_id and tenant_id is not _ERRO:
+            scope.setdefault("state", {})["domain_tenant_id"] = tenant_id
+
+        await self.app(scope, receive, send)
 
     def _resolve_tenant(self, host: str):
-        """Resolve host para restaurante_id"""
+        """Resolve host para restaurante_id (None = sem tenant, _ERRO = não cachear)"""
         from . import models
 
         db = SessionLocal()
         try:
             # 1. Dominio personalizado (ex: pedidos.minhapizzaria.com.br)
-            dominio = db.query(models.DominioPersonalizado).filter(
+            dominio = db.query(models.DominioPersonalizado.restaurante_id).filter(
                 models.DominioPersonalizado.dominio == host,
                 models.DominioPersonalizado.verificado == True,
                 models.DominioPersonalizado.ativo == True,
@@ -114,9 +215,9 @@ class DomainTenantMiddleware(BaseHTTPMiddleware):
                 return dominio.restaurante_id
 
             # 2. Subdominio *.superfood.com.br
-            if host.endswith(".superfood.com.br"):
-                subdomain = host.replace(".superfood.com.br", "")
-                restaurante = db.query(models.Restaurante).filter(
+            if host.endswith(SUBDOMINIO_PLATAFORMA):
+                subdomain = host.replace(SUBDOMINIO_PLATAFORMA, "")
+                restaurante = db.query(models.Restaurante.id).filter(
                     models.Restaurante.codigo_acesso == subdomain.upper(),
                     models.Restaurante.ativo == True,
                 ).first()
@@ -126,6 +227,6 @@ class DomainTenantMiddleware(BaseHTTPMiddleware):
             return None
         except Exception as e:
             logger.warning(f"Erro ao resolver dominio {host}: {e}")
-            return None
+            return _ERRO
         finally:
-            db.close()
\ No newline at end of file
+            db.close()
@@ -106,6 +106,8 @@ from database.models import (
     PixConfig,
     PixCobranca,
     PixSaque,
+    ComandaSequencia,
+    WebhookEvento,
     PixEventLog,
 
     # Bridge Printer
@@ -188,6 +190,8 @@ __all__ = [
     'PixConfig',
     'PixCobranca',
     'PixSaque',
+    'ComandaSequencia',
+    'WebhookEvento',
     'PixEventLog',
     'BridgePattern',
     'BridgeInterceptedOrder',
@@ -9,11 +9,14 @@ Modelo de negocio:
 - Saque: R$1,00 por transferencia | Isento para saques >= R$500
 """
 
+import asyncio
 import logging
+import os
 import uuid
 from datetime import datetime, timedelta
 from typing import Optional
 
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from sqlalchemy.orm.attributes import flag_modified
 
@@ -29,6 +32,15 @@ ISENCAO_TAXA_CENTAVOS = 50000
 
 TIPOS_CHAVE_VALIDOS = ("cpf", "cnpj", "email", "celular", "aleatoria")
 
+# Saque automatico: workers simultaneos e janela de idempotencia
+SAQUE_AUTO_CONCORRENCIA = int(os.getenv("PIX_SAQUE_AUTO_CONCORRENCIA", "8"))
+JANELA_SAQUE_AUTO_MINUTOS = 30
+# Reserva "solicitado" mais velha que isso e de worker que caiu antes de confirmar
+RESERVA_SAQUE_AUTO_EXPIRA_MINUTOS = int(os.getenv("PIX_SAQUE_AUTO_RESERVA_EXPIRA_MIN", "15"))
+
+# Impede dois ciclos sobrepostos no mesmo processo
+_ciclo_saque_lock = asyncio.Lock()
+
 
 async def ativar_pix(
     restaurante_id: int,
@@ -703,15 +715,158 @@ async def atualizar_config_saque(
     )
 
 
-async def executar_saques_automaticos(db: Session):
+def chave_saque_automatico(restaurante_id: int, agora: Optional[datetime] = None) -> str:
+    """
+    Chave de idempotencia do saque automatico: restaurante + janela de 30 min.
+    Dois workers (ou dois ciclos sobrepostos) na mesma janela geram a mesma
+    chave — o indice unico em pix_saques.chave_idempotencia barra o segundo.
+    """
+    agora = agora or datetime.utcnow()
+    janela = (agora.hour * 60 + agora.minute) // JANELA_SAQUE_AUTO_MINUTOS
+    return f"auto:{restaurante_id}:{agora.strftime('%Y%m%d')}:{janela}"
+
+
+async def _saldos_em_lote(pix_keys: list) -> dict:
+    """Saldos via listagem paginada da Woovi. Falha → {} (fallback individual)."""
+    if len(pix_keys) < 2:
+        return {}
+    try:
+        return await woovi_client.consultar_saldos(pix_keys)
+    except Exception as e:
+        logger.warning(f"Consulta de saldos em lote falhou, usando consulta individual: {e}")
+        return {}
+
+
+async def _processar_saque_automatico(
+    restaurante_id: int,
+    pix_chave: str,
+    saque_minimo: int,
+    saldo: Optional[int],
+    chave: str,
+    db: Session,
+    dry_run: bool,
+) -> str:
+    """
+    Processa o saque automatico de um restaurante.
+    Retorna: concluido | falhou | ignorado | duplicado | em_andamento | simulado
+
+    Todo acesso ao BD acontece entre awaits (sem await no meio de um
+    add/commit), entao a mesma Session pode ser compartilhada pelos workers.
+    """
+    if saldo is None:
+        resp = await woovi_client.consultar_saldo(pix_chave)
+        subaccount = resp.get("subaccount", resp)
+        saldo = subaccount.get("balance", 0)
+
+    if saldo < saque_minimo:
+        return "ignorado"
+
+    taxa = 0 if saldo >= ISENCAO_TAXA_CENTAVOS else TAXA_SAQUE_CENTAVOS
+
+    if dry_run:
+        logger.info(
+            f"[dry-run] Saque automatico: restaurante {restaurante_id}, "
+            f"R${saldo/100:.2f} (taxa: R${taxa/100:.2f})"
+        )
+        return "simulado"
+
+    # Saque de um ciclo anterior ainda em voo (ciclo demorou mais que a janela).
+    # Reservas antigas sao de workers que cairam entre reservar e confirmar:
+    # marcadas como falhou para nao bloquear o restaurante para sempre
+    limite = datetime.utcnow() - timedelta(minutes=RESERVA_SAQUE_AUTO_EXPIRA_MINUTOS)
+    em_voo = db.query(models.PixSaque.id).filter(
+        models.PixSaque.restaurante_id == restaurante_id,
+        models.PixSaque.automatico == True,
+        models.PixSaque.status == "solicitado",
+        models.PixSaque.solicitado_em >= limite,
+    ).first()
+    if em_voo:
+        return "em_andamento"
+    expiradas = db.query(models.PixSaque).filter(
+        models.PixSaque.restaurante_id == restaurante_id,
+        models.PixSaque.automatico == True,
+        models.PixSaque.status == "solicitado",
+        models.PixSaque.solicitado_em < limite,
+    ).update({
+        "status": "falhou",
+        "erro": "Reserva expirada: worker interrompido antes de confirmar o saque",
+        "concluido_em": datetime.utcnow(),
+    }, synchronize_session=False)
+    if expiradas:
+        db.commit()
+        logger.warning(
+            f"Saque automatico: {expiradas} reserva(s) expirada(s) do restaurante "
+            f"{restaurante_id} marcada(s) como falhou"
+        )
+
+    # Reserva a janela: o indice unico garante um unico saque entre workers
+    saque = models.PixSaque(
+        restaurante_id=restaurante_id,
+        valor_centavos=saldo,
+        taxa_centavos=taxa,
+        status="solicitado",
+        automatico=True,
+        solicitado_em=datetime.utcnow(),
+        chave_idempotencia=chave,
+    )
+    db.add(saque)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        logger.info(f"Saque automatico {chave} ja registrado por outro worker")
+        return "duplicado"
+
+    # Executar saque total (automatico sempre saca tudo)
+    try:
+        await woovi_client.sacar_total(pix_chave)
+        saque.status = "concluido"
+        saque.concluido_em = datetime.utcnow()
+        db.commit()
+
+        logger.info(
+            f"Saque automatico concluido: restaurante {restaurante_id}, "
+            f"R${saldo/100:.2f} (taxa: R${taxa/100:.2f})"
+        )
+        return "concluido"
+    except Exception as e:
+        saque.status = "falhou"
+        saque.erro = str(e)[:500]
+        saque.concluido_em = datetime.utcnow()
+        db.commit()
+
+        logger.error(
+            f"Saque automatico falhou para restaurante {restaurante_id}: {e}"
+        )
+        return "falhou"
+
+
+async def executar_saques_automaticos(
+    db: Session,
+    dry_run: bool = False,
+    concorrencia: Optional[int] = None,
+) -> dict:
     """
     Task periodica: verifica restaurantes com saque automatico ativo
     e executa saque quando saldo >= valor minimo configurado.
 
     Roda a cada 30 minutos via pix_tasks.py.
+
+    - Saldos consultados em lote (listagem de subcontas), com fallback individual
+    - Pool limitado de workers (PIX_SAQUE_AUTO_CONCORRENCIA, padrao 8)
+    - Idempotente entre workers/ciclos via chave_idempotencia por janela
+    - dry_run: consulta saldos e calcula saques sem sacar nem gravar no BD
+
+    Retorna contagem por resultado (concluido, falhou, ignorado, ...).
     """
+    resumo = {"configs": 0}
+
     configs = (
-        db.query(models.PixConfig)
+        db.query(
+            models.PixConfig.restaurante_id,
+            models.PixConfig.pix_chave,
+            models.PixConfig.saque_minimo_centavos,
+        )
         .filter(
             models.PixConfig.ativo == True,
             models.PixConfig.saque_automatico == True,
@@ -720,72 +875,54 @@ async def executar_saques_automaticos(db: Session):
     )
 
     if not configs:
-        return
+        return resumo
 
     if not woovi_client.configured:
         logger.debug("Woovi nao configurado — saques automaticos ignorados")
-        return
-
-    total_saques = 0
-    total_erros = 0
-
-    for config in configs:
-        try:
-            # Consultar saldo
-            resp = await woovi_client.consultar_saldo(config.pix_chave)
-            subaccount = resp.get("subaccount", resp)
-            saldo = subaccount.get("balance", 0)
-
-            if saldo < config.saque_minimo_centavos:
-                continue
-
-            # Calcular taxa
-            taxa = 0 if saldo >= ISENCAO_TAXA_CENTAVOS else TAXA_SAQUE_CENTAVOS
-
-            # Criar registro de saque
-            saque = models.PixSaque(
-                restaurante_id=config.restaurante_id,
-                valor_centavos=saldo,
-                taxa_centavos=taxa,
-                status="solicitado",
-                automatico=True,
-                solicitado_em=datetime.utcnow(),
-            )
-            db.add(saque)
-            db.commit()
-            db.refresh(saque)
-
-            # Executar saque total (automatico sempre saca tudo)
-            try:
-                await woovi_client.sacar_total(config.pix_chave)
-                saque.status = "concluido"
-                saque.concluido_em = datetime.utcnow()
-                db.commit()
-                total_saques += 1
-
-                logger.info(
-                    f"Saque automatico concluido: restaurante {config.restaurante_id}, "
-                    f"R${saldo/100:.2f} (taxa: R${taxa/100:.2f})"
-                )
-            except Exception as e:
-                saque.status = "falhou"
-                saque.concluido_em = datetime.utcnow()
-                db.commit()
-                total_erros += 1
+        return resumo
+
+    if _ciclo_saque_lock.locked():
+        logger.warning("Ciclo anterior de saques automaticos ainda em execucao — ignorando")
+        return resumo
+
+    async with _ciclo_saque_lock:
+        resumo["configs"] = len(configs)
+        agora = datetime.utcnow()
+        saldos = await _saldos_em_lote([c.pix_chave for c in configs])
+        semaforo = asyncio.Semaphore(max(1, concorrencia or SAQUE_AUTO_CONCORRENCIA))
+
+        async def _worker(config) -> str:
+            async with semaforo:
+                try:
+                    return await _processar_saque_automatico(
+                        restaurante_id=config.restaurante_id,
+                        pix_chave=config.pix_chave,
+                        saque_minimo=config.saque_minimo_centavos or ISENCAO_TAXA_CENTAVOS,
+                        saldo=saldos.get(config.pix_chave),
+                        chave=chave_saque_automatico(config.restaurante_id, agora),
+                        db=db,
+                        dry_run=dry_run,
+                    )
+                except Exception as e:
+                    logger.error(
+                        f"Erro ao processar saque automatico para restaurante "
+                        f"{config.restaurante_id}: {e}"
+                    )
+                    return "erro"
 
-                logger.error(
-                    f"Saque automatico falhou para restaurante {config.restaurante_id}: {e}"
-                )
+        resultados = await asyncio.gather(*(_worker(c) for c in configs))
 
-        except Exception as e:
-            total_erros += 1
-            logger.error(
-                f"Erro ao processar saque automatico para restaurante "
-                f"{config.restaurante_id}: {e}"
-            )
+    for r in resultados:
+        resumo[r] = resumo.get(r, 0) + 1
 
-    if total_saques > 0 or total_erros > 0:
+    total_saques = resumo.get("concluido", 0)
+    total_erros = resumo.get("falhou", 0) + resumo.get("erro", 0)
+    if total_saques > 0 or total_erros > 0 or dry_run:
         logger.info(
-            f"Saques automaticos: {total_saques} concluidos, {total_erros} erros "
+            f"Saques automaticos{' [dry-run]' if dry_run else ''}: "
+            f"{total_saques} concluidos, {total_erros} erros, "
+            f"{resumo.get('simulado', 0)} simulados, {resumo.get('duplicado', 0)} duplicados "
             f"(de {len(configs)} configs ativas)"
         )
+
+    return resumo
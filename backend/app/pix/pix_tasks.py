@@ -5,13 +5,16 @@ Verifica restaurantes com saque automatico ativo e executa saques
 quando saldo >= valor minimo configurado.
 
 Roda a cada 30 minutos, em paralelo com billing_tasks.
+Com Redis, apenas um worker Gunicorn executa cada ciclo (lock por janela);
+sem Redis, todos executam e a chave de idempotencia do PixSaque evita saque duplo.
 """
 
 import asyncio
 import logging
 
+from ..cache import cache_lock
 from ..database import SessionLocal
-from .pix_service import executar_saques_automaticos
+from .pix_service import executar_saques_automaticos, chave_saque_automatico
 
 logger = logging.getLogger("superfood.pix")
 
@@ -25,11 +28,15 @@ async def verificar_pix_periodico():
 
     while True:
         try:
-            db = SessionLocal()
-            try:
-                await executar_saques_automaticos(db)
-            finally:
-                db.close()
+            # Lock do ciclo: chave da janela atual (restaurante_id=0 = ciclo global)
+            if cache_lock(f"pix:{chave_saque_automatico(0)}", ttl_seconds=INTERVALO_VERIFICACAO):
+                db = SessionLocal()
+                try:
+                    await executar_saques_automaticos(db)
+                finally:
+                    db.close()
+            else:
+                logger.debug("Ciclo de saque automatico ja executado por outro worker")
         except Exception as e:
             logger.error(f"Erro na task de Pix: {e}")
 
@@ -6,6 +6,8 @@ Suporta sandbox e producao via WOOVI_ENVIRONMENT.
 Auth: header Authorization com APP_ID (sem Bearer).
 Split de pagamentos para subconta do restaurante (valor - taxa Woovi 0,80%).
 Saque parcial via vault workaround (API so suporta saque total).
+
+WOOVI_BASE_URL sobrescreve a URL da API (ex: stub local para benchmark/dry-run).
 """
 
 import os
@@ -30,7 +32,7 @@ class WooviClient:
     def __init__(self):
         self.app_id = os.getenv("WOOVI_APP_ID", "")
         env = os.getenv("WOOVI_ENVIRONMENT", "production")
-        self.base_url = WOOVI_URLS.get(env, WOOVI_URLS["production"])
+        self.base_url = os.getenv("WOOVI_BASE_URL") or WOOVI_URLS.get(env, WOOVI_URLS["production"])
         # Suporta múltiplos secrets separados por vírgula (cada webhook Woovi tem o seu)
         raw_secret = os.getenv("WOOVI_WEBHOOK_SECRET", "")
         self.webhook_secrets = [s.strip() for s in raw_secret.split(",") if s.strip()]
@@ -92,6 +94,35 @@ class WooviClient:
         """GET /api/v1/subaccount/{pixKey} - Retorna saldo em centavos."""
         return await self._get(f"/api/v1/subaccount/{pix_key}")
 
+    async def listar_subcontas(self, skip: int = 0, limit: int = 100) -> dict:
+        """GET /api/v1/subaccount - Lista subcontas (pixKey + balance), paginado."""
+        return await self._get("/api/v1/subaccount", params={"skip": skip, "limit": limit})
+
+    async def consultar_saldos(self, pix_keys: list, page_size: int = 100) -> dict:
+        """
+        Saldo de varias subcontas em lote via listagem paginada.
+
+        Retorna {pix_key: balance} apenas para as chaves pedidas.
+        Chaves ausentes da listagem ficam de fora — o chamador decide se
+        consulta individualmente (consultar_saldo).
+        """
+        pendentes = set(pix_keys)
+        saldos = {}
+        skip = 0
+        while pendentes:
+            resp = await self.listar_subcontas(skip=skip, limit=page_size)
+            subcontas = resp.get("subAccounts") or resp.get("subaccounts") or []
+            for sub in subcontas:
+                chave = sub.get("pixKey")
+                if chave in pendentes:
+                    saldos[chave] = sub.get("balance", 0)
+                    pendentes.discard(chave)
+            page_info = resp.get("pageInfo") or {}
+            if not subcontas or not page_info.get("hasNextPage"):
+                break
+            skip += len(subcontas)
+        return saldos
+
     # --- Cobrancas ------------------------------------------------
 
     async def criar_cobranca(
@@ -0,0 +1,170 @@
+# backend/app/query_profiler.py
+
+"""
+Profiler de Queries SQL - Derekh Food API
+Atribui queries, tempo de banco e statements mais lentos a cada request.
+
+Hooks before/after_cursor_execute do engine somam no perfil da request
+corrente (ContextVar); handle_error fecha a medição do statement que falhou. O perfil é um objeto mutável criado pelo middleware
+ANTES de call_next — tasks filhas e a threadpool de endpoints sync copiam
+o contexto, então todos enxergam o mesmo objeto.
+
+Env vars:
+    QUERY_COUNT_HEADER=true         → adiciona X-Query-Count / X-DB-Time-Ms na resposta
+    SLOW_QUERY_MS=200               → statement acima disso entra no ring de lentas
+    SLOW_REQUEST_MS=1000            → request acima disso é logada com o perfil
+    SLOW_QUERY_STACK_SAMPLE_RATE=0.1 → fração das queries lentas com stack capturado
+"""
+
+import os
+import time
+import random
+import threading
+import traceback
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Optional, List, Dict, Any
+
+from sqlalchemy import event
+
+QUERY_COUNT_HEADER = os.getenv("QUERY_COUNT_HEADER", "").lower() == "true"
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "1000"))
+SLOW_QUERY_STACK_SAMPLE_RATE = float(os.getenv("SLOW_QUERY_STACK_SAMPLE_RATE", "0.1"))
+
+TOP_STATEMENTS_POR_REQUEST = 3
+MAX_SLOW_QUERIES = 50
+MAX_STATEMENT_CHARS = 300
+MAX_STACK_FRAMES = 8
+
+# Só frames do projeto interessam no stack (SQLAlchemy/Starlette são ruído)
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_PASTAS_PROJETO = tuple(
+    os.path.join(_PROJECT_ROOT, p) + os.sep for p in ("backend", "database")
+)
+
+
+class PerfilRequest:
+    """Acumulador de queries de uma request."""
+
+    __slots__ = ("path", "rota", "queries", "db_ms", "lentas")
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.rota: Optional[str] = None  # template, conhecido só após o roteamento
+        self.queries = 0
+        self.db_ms = 0.0
+        # [(duracao_ms, statement)] — só os TOP_STATEMENTS_POR_REQUEST mais lentos
+        self.lentas: List[tuple] = []
+
+    def registrar(self, statement: str, duracao_ms: float):
+        self.queries += 1
+        self.db_ms += duracao_ms
+        if len(self.lentas) < TOP_STATEMENTS_POR_REQUEST:
+            self.lentas.append((duracao_ms, statement))
+            self.lentas.sort(reverse=True)
+        elif duracao_ms > self.lentas[-1][0]:
+            self.lentas[-1] = (duracao_ms, statement)
+            self.lentas.sort(reverse=True)
+
+
+_perfil_atual: ContextVar[Optional[PerfilRequest]] = ContextVar("perfil_request", default=None)
+
+# Ring das queries lentas recentes (todas as rotas + tasks de background)
+_slow_queries: deque = deque(maxlen=MAX_SLOW_QUERIES)
+_slow_lock = threading.Lock()
+
+
+def iniciar_perfil(path: Optional[str] = None):
+    """Cria o perfil da request corrente. Retorna (perfil, token) para finalizar_perfil."""
+    perfil = PerfilRequest(path)
+    token = _perfil_atual.set(perfil)
+    return perfil, token
+
+
+def finalizar_perfil(token):
+    _perfil_atual.reset(token)
+
+
+def perfil_atual() -> Optional[PerfilRequest]:
+    return _perfil_atual.get()
+
+
+def _stack_projeto() -> List[str]:
+    """Frames do projeto (mais interno por último), formato arquivo:linha funcao."""
+    frames = []
+    for f in traceback.extract_stack()[:-3]:
+        if f.filename.startswith(_PASTAS_PROJETO) and not f.filename.endswith("query_profiler.py"):
+            frames.append(f"{os.path.relpath(f.filename, _PROJECT_ROOT)}:{f.lineno} {f.name}")
+    return frames[-MAX_STACK_FRAMES:]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("_query_inicio", []).append(time.perf_counter())
+    if context is not None:
+        context._query_em_medicao = True
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_em_medicao = False
+    _registrar_query(conn, statement)
+
+
+def _handle_error(exception_context):
+    # Statement falhou no cursor: o after não roda, mas o before já empilhou o início
+    conn, context = exception_context.connection, exception_context.execution_context
+    if conn is not None and getattr(context, "_query_em_medicao", False):
+        context._query_em_medicao = False
+        _registrar_query(conn, exception_context.statement or "")
+
+
+def _registrar_query(conn, statement: str):
+    inicios = conn.info.get("_query_inicio")
+    if not inicios:
+        return
+    duracao_ms = (time.perf_counter() - inicios.pop()) * 1000
+
+    perfil = _perfil_atual.get()
+    if perfil is not None:
+        perfil.registrar(statement, duracao_ms)
+
+    if duracao_ms >= SLOW_QUERY_MS:
+        registro = {
+            "timestamp": datetime.utcnow().isoformat(),
+            "duracao_ms": round(duracao_ms, 2),
+            "path": perfil.path if perfil else None,
+            "statement": statement[:MAX_STATEMENT_CHARS],
+        }
+        # Stack amostrado: extract_stack é caro demais para toda query lenta
+        if random.random() < SLOW_QUERY_STACK_SAMPLE_RATE:
+            registro["stack"] = _stack_projeto()
+        with _slow_lock:
+            _slow_queries.append(registro)
+
+
+def instrumentar_engine(engine):
+    """Registra os hooks no engine (idempotente)."""
+    if event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+def rota_da_request(request) -> str:
+    """Template da rota (/pedidos/{pedido_id}) — cardinalidade limitada, ao contrário do path."""
+    route = request.scope.get("route")
+    path = getattr(route, "path", None)
+    return path or "<nao_roteado>"
+
+
+def slow_queries_recentes() -> List[Dict[str, Any]]:
+    with _slow_lock:
+        return list(reversed(_slow_queries))
+
+
+def limpar_slow_queries():
+    with _slow_lock:
+        _slow_queries.clear()
@@ -21,6 +21,7 @@ import httpx
 from .. import models, database, auth
 from ..feature_flags import get_all_features, get_tier, FEATURE_LABELS, TIER_TO_PLANO
 from ..email_service import enviar_email_boas_vindas, BASE_URL
+from ..middleware import invalidar_dominio_tenant
 
 # DDDs brasileiros válidos (67 DDDs)
 DDDS_VALIDOS = {
@@ -723,6 +724,11 @@ def atualizar_status_restaurante(
                     _fly_add_certificate(d.dominio)
 
     db.commit()
+    invalidar_dominio_tenant(
+        *[d.dominio for d in dominios],
+        restaurante_id=restaurante.id,
+        codigo_acesso=restaurante.codigo_acesso,
+    )
 
     msg = f"Status atualizado para '{dados.status}'"
     if dominios_alterados > 0:
@@ -1353,14 +1359,14 @@ def obter_analytics(
 # ========== Autocomplete Endereço ==========
 
 @router.get("/autocomplete-endereco")
-def admin_autocomplete_endereco(
+async def admin_autocomplete_endereco(
     query: str = Query(..., min_length=3),
     current_admin=Depends(auth.get_current_admin),
 ):
     """Autocomplete de endereço via Mapbox (sem proximidade — super admin)."""
-    from utils.mapbox_api import autocomplete_address
+    from ..enderecos_service import enderecos_service
 
-    sugestoes = autocomplete_address(query)
+    sugestoes = await enderecos_service.autocompletar(query)
     return {"sugestoes": sugestoes}
 
 
@@ -1732,6 +1738,7 @@ def criar_dominio_restaurante(
     db.add(dominio)
     db.commit()
     db.refresh(dominio)
+    invalidar_dominio_tenant(dominio_limpo)
 
     return {
         "id": dominio.id,
@@ -1800,6 +1807,7 @@ def verificar_dns_dominio_admin(
         dominio.dns_verificado_em = datetime.utcnow()
         dominio.ssl_ativo = ssl_status == "ativo"
         db.commit()
+        invalidar_dominio_tenant(dominio.dominio)
         msg = f"DNS configurado! SSL: {ssl_status}."
         if ssl_status == "ativo":
             msg = f"DNS + SSL ativos! Site disponível em https://{dominio.dominio}"
@@ -1837,6 +1845,7 @@ def remover_dominio_admin(
 
     db.delete(dominio)
     db.commit()
+    invalidar_dominio_tenant(nome)
     return {"mensagem": f"Domínio {nome} removido com sucesso"}
 
 
@@ -18,6 +18,7 @@ from ..billing.billing_service import (
     PLANOS, _get_config,
 )
 from ..billing.asaas_client import asaas_client
+from ..middleware import invalidar_dominio_tenant
 
 router = APIRouter(prefix="/api/admin/billing", tags=["Billing Admin"])
 
@@ -256,6 +257,7 @@ def endpoint_estender_trial(
     restaurante.status = "ativo"
     restaurante.dias_vencido = 0
     db.commit()
+    invalidar_dominio_tenant(restaurante_id=restaurante.id, codigo_acesso=restaurante.codigo_acesso)
 
     registrar_audit(db, restaurante_id, "trial_extended", {
         "dias": dados.dias,
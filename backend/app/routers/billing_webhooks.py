@@ -2,6 +2,7 @@
 """
 Webhook do Asaas — recebe eventos de pagamento.
 Sem autenticação JWT (validado via asaas-access-token header).
+O endpoint só grava na webhook_fila; processar_evento_asaas roda no consumidor.
 """
 
 import logging
@@ -20,6 +21,7 @@ from ..billing.billing_service import (
     registrar_audit,
 )
 from ..billing.asaas_client import asaas_client
+from ..webhook_fila import fila_webhooks, registrar_handler
 
 logger = logging.getLogger("superfood.billing")
 
@@ -28,28 +30,49 @@ router = APIRouter(tags=["Billing Webhooks"])
 
 @router.post("/webhooks/asaas")
 async def webhook_asaas(request: Request):
-    """Recebe eventos do Asaas (pagamentos)."""
+    """Recebe eventos do Asaas (pagamentos): valida o token, grava na fila
+    durável e responde na hora. O processamento roda em processar_evento_asaas."""
     db = SessionLocal()
     try:
         # Validar token do webhook (OBRIGATÓRIO — rejeita se não configurado)
         config = db.query(models.ConfigBilling).first()
         webhook_token = config.asaas_webhook_token if config else None
+    finally:
+        db.close()
 
-        if not webhook_token:
-            raise HTTPException(status_code=403, detail="Webhook token não configurado")
+    if not webhook_token:
+        raise HTTPException(status_code=403, detail="Webhook token não configurado")
 
-        received_token = request.headers.get("asaas-access-token", "")
-        if received_token != webhook_token:
-            raise HTTPException(status_code=401, detail="Token inválido")
+    received_token = request.headers.get("asaas-access-token", "")
+    if received_token != webhook_token:
+        raise HTTPException(status_code=401, detail="Token inválido")
 
+    try:
         body = await request.json()
+    except Exception:
+        return {"status": "ignored", "reason": "invalid json"}
+    event_type = body.get("event", "")
+    payment_id = (body.get("payment") or {}).get("id", "")
+
+    if not event_type or not payment_id:
+        return {"status": "ignored", "reason": "missing event or payment id"}
+
+    try:
+        resultado = await fila_webhooks.receber("asaas", f"{event_type}_{payment_id}", body)
+    except Exception as e:
+        logger.error(f"Fila de webhooks indisponível (asaas): {e}")
+        raise HTTPException(status_code=503, detail="Indisponível")
+    return {"status": resultado["status"], "event": event_type}
+
+
+async def processar_evento_asaas(body: dict, ws_manager=None):
+    """Consumidor da webhook_fila para eventos Asaas. Exceção = nova tentativa."""
+    db = SessionLocal()
+    try:
         event_type = body.get("event", "")
         payment = body.get("payment", {})
         payment_id = payment.get("id", "")
 
-        if not event_type or not payment_id:
-            return {"status": "ignored", "reason": "missing event or payment id"}
-
         # Gerar event_id único
         event_id = f"{event_type}_{payment_id}"
 
@@ -77,7 +100,7 @@ async def webhook_asaas(request: Request):
             ).first()
 
         if not evento_log:
-            return {"status": "error", "message": "Falha ao registrar evento"}
+            raise RuntimeError(f"Falha ao registrar evento {event_id}")
 
         # Processar evento
         try:
@@ -181,16 +204,16 @@ async def webhook_asaas(request: Request):
             db.commit()
 
         except Exception as e:
+            db.rollback()
             evento_log.error_message = str(e)[:500]
             db.commit()
             logger.error(f"Erro processando webhook Asaas {event_type}: {e}")
+            raise
 
         return {"status": "processed", "event": event_type}
 
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Erro no webhook Asaas: {e}")
-        return {"status": "error", "message": str(e)[:200]}
     finally:
         db.close()
+
+
+registrar_handler("asaas", processar_evento_asaas)
@@ -10,11 +10,14 @@ from datetime import datetime, timedelta
 from typing import Optional
 import logging
 import hmac
+import json
 import os
 
 from .. import models, database
 from ..auth import get_current_restaurante, get_current_admin
 from ..feature_guard import verificar_feature
+from ..webhook_fila import fila_webhooks, registrar_handler, chave_dedup
+from ..cache import cache_get, cache_set
 
 logger = logging.getLogger("superfood.bot.router")
 
@@ -50,22 +53,48 @@ router = APIRouter(tags=["Bot WhatsApp"])
 
 @router.post("/webhooks/evolution")
 async def webhook_evolution(request: Request):
-    """Webhook público da Evolution API. Responde 200 imediatamente e processa em background."""
+    """Webhook público da Evolution API. Valida, grava na fila durável e responde 200;
+    o atendimento (STT/LLM) roda nos consumidores da webhook_fila."""
     # Validar apikey header (Evolution envia em cada webhook)
     if EVOLUTION_WEBHOOK_SECRET:
         apikey = request.headers.get("apikey", "")
         if not hmac.compare_digest(apikey, EVOLUTION_WEBHOOK_SECRET):
             return JSONResponse(status_code=401, content={"error": "unauthorized"})
 
+    body = await request.body()
     try:
-        payload = await request.json()
+        payload = json.loads(body)
     except Exception:
         return JSONResponse({"status": "ok"})
 
+    # Só mensagens recebidas viram evento (presence, status, etc. morrem aqui)
+    if not isinstance(payload, dict) or payload.get("event") != "messages.upsert":
+        return JSONResponse({"status": "ok", "fila": "ignored"})
+
+    msg_id = ((payload.get("data") or {}).get("key") or {}).get("id", "")
+    try:
+        resultado = await fila_webhooks.receber(
+            "evolution", chave_dedup(payload.get("instance"), msg_id, corpo=body), payload,
+        )
+    except Exception as e:
+        logger.error(f"Fila de webhooks indisponível (evolution): {e}")
+        return JSONResponse(status_code=503, content={"error": "unavailable"})
+
+    return JSONResponse({"status": "ok", "fila": resultado["status"]})
+
+
+async def _processar_evento_evolution(payload: dict, ws_manager=None):
     from ..bot.atendente import processar_webhook
-    resultado = await processar_webhook(payload)
+    await processar_webhook(payload, aguardar=True)
+
+
+def _conversa_evolution(payload: dict) -> Optional[str]:
+    """Instância + remoteJid: mensagens do mesmo cliente são atendidas em sequência."""
+    remote_jid = ((payload.get("data") or {}).get("key") or {}).get("remoteJid")
+    return f"{payload.get('instance', '')}:{remote_jid}" if remote_jid else None
+
 
-    return JSONResponse({"status": "ok", **resultado})
+registrar_handler("evolution", _processar_evento_evolution, chave_conversa=_conversa_evolution)
 
 
 # ==================== WEBHOOK META CLOUD API (público) ====================
@@ -114,8 +143,8 @@ async def webhook_meta_verify(request: Request):
 
 @router.post("/webhooks/meta-whatsapp")
 async def webhook_meta_receive(request: Request):
-    """Recebe mensagens via Meta Cloud API.
-    Identifica restaurante por phone_number_id:
+    """Recebe mensagens via Meta Cloud API: valida assinatura, grava na fila durável e responde 200.
+    O consumidor (_processar_evento_meta) identifica restaurante por phone_number_id:
     - Se BotConfig com provider='meta' → processa como humanoide (IA responde)
     - Se BotMetaGateway → redirect para número ativo (legado)
     """
@@ -150,12 +179,36 @@ async def webhook_meta_receive(request: Request):
         logger.warning("Meta webhook sem X-Hub-Signature-256")
 
     try:
-        payload = await request.json()
+        payload = json.loads(body)
     except Exception:
         return JSONResponse({"status": "ok"})
 
-    # Determinar modo: humanoide (BotConfig meta) ou redirect (BotMetaGateway legado)
-    import asyncio
+    # Status de entrega/leitura (a maioria dos webhooks Meta) não geram trabalho
+    msg_ids = _extrair_msg_ids(payload) if isinstance(payload, dict) else []
+    if not msg_ids:
+        return JSONResponse({"status": "ok"})
+
+    try:
+        await fila_webhooks.receber("meta", chave_dedup(",".join(msg_ids), corpo=body), payload)
+    except Exception as e:
+        logger.error(f"Fila de webhooks indisponível (meta): {e}")
+        return JSONResponse(status_code=503, content={"error": "unavailable"})
+    return JSONResponse({"status": "ok"})
+
+
+def _extrair_msg_ids(payload: dict) -> list:
+    """IDs das mensagens (wamid) do payload Meta, na ordem."""
+    ids = []
+    for entry in payload.get("entry", []):
+        for change in entry.get("changes", []):
+            for msg in change.get("value", {}).get("messages", []) or []:
+                if msg.get("id"):
+                    ids.append(msg["id"])
+    return ids
+
+
+async def _processar_evento_meta(payload: dict, ws_manager=None):
+    """Consumidor Meta: humanoide (BotConfig provider='meta') ou redirect (BotMetaGateway legado)."""
     phone_number_id = _extrair_phone_number_id(payload)
 
     if phone_number_id:
@@ -167,18 +220,31 @@ async def webhook_meta_receive(request: Request):
                 models.BotConfig.whatsapp_provider == "meta",
                 models.BotConfig.bot_ativo == True,
             ).first()
-
-            if bot_meta:
-                # Processar como humanoide IA
-                from ..bot.atendente import processar_webhook_meta
-                asyncio.create_task(processar_webhook_meta(payload))
-                return JSONResponse({"status": "ok"})
         finally:
             db_route.close()
 
+        if bot_meta:
+            # Processar como humanoide IA
+            from ..bot.atendente import processar_webhook_meta
+            await processar_webhook_meta(payload, aguardar=True)
+            return
+
     # Fallback: redirect via BotMetaGateway (legado)
-    asyncio.create_task(_processar_meta_webhook_legado(payload))
-    return JSONResponse({"status": "ok"})
+    await _processar_meta_webhook_legado(payload)
+
+
+def _conversa_meta(payload: dict) -> Optional[str]:
+    """phone_number_id + número do cliente da primeira mensagem do payload."""
+    for entry in payload.get("entry", []):
+        for change in entry.get("changes", []):
+            value = change.get("value", {})
+            for msg in value.get("messages", []) or []:
+                if msg.get("from"):
+                    return f"{(value.get('metadata') or {}).get('phone_number_id', '')}:{msg['from']}"
+    return None
+
+
+registrar_handler("meta", _processar_evento_meta, chave_conversa=_conversa_meta)
 
 
 def _extrair_phone_number_id(payload: dict) -> Optional[str]:
@@ -1087,71 +1153,167 @@ async def phone_trocar_numero(
     }
 
 
+# ==================== INBOX (keyset) ====================
+
+# Margem do cursor de mudanças: cobre transações que commitam com atualizado_em
+# um pouco anterior ao instante da consulta (o cliente aplica deltas por id)
+INBOX_MARGEM_MUDANCAS = timedelta(seconds=2)
+INBOX_LIMITE_MAX = 200
+
+
+def _cursor_conversa(c: models.BotConversa) -> str:
+    return f"{c.atualizado_em.isoformat()}_{c.id}"
+
+
+def _ler_cursor_conversa(cursor: str) -> tuple:
+    try:
+        ts, cid = cursor.rsplit("_", 1)
+        return datetime.fromisoformat(ts), int(cid)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+def _ler_data(valor: str) -> datetime:
+    try:
+        return datetime.fromisoformat(valor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Data inválida")
+
+
+def _filtro_busca_conversas(query, busca: str):
+    """Busca por nome (substring) e, com ≥4 dígitos, por telefone só com dígitos.
+
+    No Postgres os dois filtros usam os índices trigram (migration 052).
+    """
+    termo = busca.strip()
+    digitos = "".join(ch for ch in termo if ch.isdigit())
+    filtro_nome = models.BotConversa.nome_cliente.ilike(f"%{termo}%")
+    if len(digitos) >= 4:
+        return query.filter(sa.or_(models.BotConversa.telefone.contains(digitos), filtro_nome))
+    return query.filter(filtro_nome)
+
+
+def _conversa_resumo(c: models.BotConversa) -> dict:
+    return {
+        "id": c.id,
+        "telefone": c.telefone,
+        "nome_cliente": c.nome_cliente,
+        "status": c.status,
+        "msgs_enviadas": c.msgs_enviadas,
+        "msgs_recebidas": c.msgs_recebidas,
+        "pedido_ativo_id": c.pedido_ativo_id,
+        "intencao_atual": c.intencao_atual,
+        "handoff_motivo": c.handoff_motivo,
+        "handoff_em": c.handoff_em.isoformat() if c.handoff_em else None,
+        "criado_em": c.criado_em.isoformat() if c.criado_em else None,
+        "atualizado_em": c.atualizado_em.isoformat() if c.atualizado_em else None,
+    }
+
+
 @router.get("/painel/bot/conversas")
 def listar_conversas(
     status: Optional[str] = None,
     busca: Optional[str] = None,
     limit: int = 50,
+    cursor: Optional[str] = None,
     offset: int = 0,
+    incluir_total: bool = False,
     restaurante: models.Restaurante = Depends(get_current_restaurante),
     _feature: None = Depends(verificar_feature("bot_whatsapp")),
     db: Session = Depends(database.get_db),
 ):
-    """Lista conversas do bot com paginação e busca por nome/telefone."""
+    """Lista conversas do bot (mais recentes primeiro) com busca por nome/telefone.
+
+    Paginação por cursor: passe o `proximo_cursor` da resposta anterior.
+    `offset` segue aceito por compatibilidade; o total só é contado com
+    `incluir_total=true`. Para atualizar a inbox use /conversas/mudancas.
+    """
+    limit = max(1, min(limit, INBOX_LIMITE_MAX))
     query = db.query(models.BotConversa).filter(
         models.BotConversa.restaurante_id == restaurante.id
     )
     if status:
         query = query.filter(models.BotConversa.status == status)
     if busca and busca.strip():
-        termo = busca.strip()
-        # Se contém dígitos (≥4), busca por telefone OU nome; senão só nome
-        has_digits = sum(1 for ch in termo if ch.isdigit()) >= 4
-        if has_digits:
-            query = query.filter(
-                sa.or_(
-                    models.BotConversa.telefone.contains(termo),
-                    models.BotConversa.nome_cliente.ilike(f"%{termo}%"),
-                )
-            )
-        else:
-            query = query.filter(models.BotConversa.nome_cliente.ilike(f"%{termo}%"))
+        query = _filtro_busca_conversas(query, busca)
+
+    total = query.count() if incluir_total else None
+    if cursor:
+        query = query.filter(
+            sa.tuple_(models.BotConversa.atualizado_em, models.BotConversa.id) < _ler_cursor_conversa(cursor)
+        )
+    query = query.order_by(models.BotConversa.atualizado_em.desc(), models.BotConversa.id.desc())
+    if offset and not cursor:
+        query = query.offset(offset)
+    conversas = query.limit(limit + 1).all()
+
+    tem_mais = len(conversas) > limit
+    conversas = conversas[:limit]
+    resposta = {
+        "conversas": [_conversa_resumo(c) for c in conversas],
+        "proximo_cursor": _cursor_conversa(conversas[-1]) if tem_mais else None,
+        "sincronizado_em": (datetime.utcnow() - INBOX_MARGEM_MUDANCAS).isoformat(),
+    }
+    if total is not None:
+        resposta["total"] = total
+    return resposta
 
-    total = query.count()
-    conversas = query.order_by(models.BotConversa.atualizado_em.desc()).offset(offset).limit(limit).all()
 
+@router.get("/painel/bot/conversas/mudancas")
+def conversas_mudancas(
+    desde: str,
+    limit: int = INBOX_LIMITE_MAX,
+    restaurante: models.Restaurante = Depends(get_current_restaurante),
+    _feature: None = Depends(verificar_feature("bot_whatsapp")),
+    db: Session = Depends(database.get_db),
+):
+    """Conversas alteradas desde `desde` (o `sincronizado_em` da última resposta).
+
+    Resposta vazia custa uma busca no índice da inbox. Conversas alteradas nos
+    últimos segundos podem voltar na chamada seguinte — aplicar por id.
+    Com `completo=false` há mais mudanças: chamar de novo com o novo `sincronizado_em`.
+    """
+    limit = max(1, min(limit, INBOX_LIMITE_MAX))
+    agora = datetime.utcnow()
+    conversas = db.query(models.BotConversa).filter(
+        models.BotConversa.restaurante_id == restaurante.id,
+        models.BotConversa.atualizado_em > _ler_data(desde),
+    ).order_by(
+        models.BotConversa.atualizado_em, models.BotConversa.id
+    ).limit(limit + 1).all()
+
+    completo = len(conversas) <= limit
+    conversas = conversas[:limit]
+    if completo:
+        sincronizado_em = agora - INBOX_MARGEM_MUDANCAS
+    else:
+        # Página cheia: continua a partir da última devolvida
+        sincronizado_em = conversas[-1].atualizado_em - timedelta(microseconds=1)
     return {
-        "total": total,
-        "conversas": [
-            {
-                "id": c.id,
-                "telefone": c.telefone,
-                "nome_cliente": c.nome_cliente,
-                "status": c.status,
-                "msgs_enviadas": c.msgs_enviadas,
-                "msgs_recebidas": c.msgs_recebidas,
-                "pedido_ativo_id": c.pedido_ativo_id,
-                "intencao_atual": c.intencao_atual,
-                "handoff_motivo": c.handoff_motivo,
-                "handoff_em": c.handoff_em.isoformat() if c.handoff_em else None,
-                "criado_em": c.criado_em.isoformat() if c.criado_em else None,
-                "atualizado_em": c.atualizado_em.isoformat() if c.atualizado_em else None,
-            }
-            for c in conversas
-        ],
+        "conversas": [_conversa_resumo(c) for c in conversas],
+        "completo": completo,
+        "sincronizado_em": sincronizado_em.isoformat(),
     }
 
 
 @router.get("/painel/bot/conversas/{conversa_id}/mensagens")
 def listar_mensagens(
     conversa_id: int,
-    pagina: int = 1,
     limite: int = 50,
+    antes_de: Optional[int] = None,
+    depois_de: Optional[int] = None,
+    pagina: Optional[int] = None,
     restaurante: models.Restaurante = Depends(get_current_restaurante),
     _feature: None = Depends(verificar_feature("bot_whatsapp")),
     db: Session = Depends(database.get_db),
 ):
-    """Lista mensagens de uma conversa com paginação."""
+    """Lista mensagens de uma conversa em ordem cronológica.
+
+    Sem parâmetros: as `limite` mais recentes. `antes_de=<id>` carrega as
+    anteriores (rolagem para cima) e `depois_de=<id>` só as novas (polling).
+    `pagina` mantém a paginação antiga por OFFSET, com total.
+    """
+    limite = max(1, min(limite, INBOX_LIMITE_MAX))
     conversa = db.query(models.BotConversa).filter(
         models.BotConversa.id == conversa_id,
         models.BotConversa.restaurante_id == restaurante.id,
@@ -1163,9 +1325,24 @@ def listar_mensagens(
     query = db.query(models.BotMensagem).filter(
         models.BotMensagem.conversa_id == conversa_id,
     )
-    total = query.count()
-    offset = (pagina - 1) * limite
-    mensagens = query.order_by(models.BotMensagem.criado_em).offset(offset).limit(limite).all()
+    extra = {}
+    if pagina is not None:
+        total = query.count()
+        offset = (max(pagina, 1) - 1) * limite
+        mensagens = query.order_by(models.BotMensagem.criado_em).offset(offset).limit(limite).all()
+        extra = {"total": total, "paginas": (total + limite - 1) // limite}
+    elif depois_de is not None:
+        mensagens = query.filter(
+            models.BotMensagem.id > depois_de
+        ).order_by(models.BotMensagem.id).limit(limite + 1).all()
+        extra = {"tem_mais_novas": len(mensagens) > limite}
+        mensagens = mensagens[:limite]
+    else:
+        if antes_de is not None:
+            query = query.filter(models.BotMensagem.id < antes_de)
+        mensagens = query.order_by(models.BotMensagem.id.desc()).limit(limite + 1).all()
+        extra = {"tem_anteriores": len(mensagens) > limite}
+        mensagens = list(reversed(mensagens[:limite]))
 
     return {
         "conversa": {
@@ -1188,8 +1365,7 @@ def listar_mensagens(
             }
             for m in mensagens
         ],
-        "total": total,
-        "paginas": (total + limite - 1) // limite,
+        **extra,
     }
 
 
@@ -1367,6 +1543,72 @@ def devolver_para_bot(
     return {"sucesso": True, "mensagem": "Conversa devolvida para o bot"}
 
 
+# Agregados do dashboard/relatórios em cache curto por restaurante (Redis, best-effort)
+BOT_DASHBOARD_CACHE_TTL = 15
+BOT_RELATORIO_CACHE_TTL = 120
+
+
+def _dashboard_agregados(db: Session, rest_id: int, hoje: datetime, semana: datetime) -> dict:
+    """Contadores do dashboard numa única ida ao banco (subconsultas com FILTER)."""
+    conversas = db.query(
+        func.count(models.BotConversa.id).filter(models.BotConversa.criado_em >= hoje),
+        func.count(models.BotConversa.id).filter(models.BotConversa.criado_em >= semana),
+        func.count(models.BotConversa.id).filter(models.BotConversa.status == "ativa"),
+    ).filter(
+        models.BotConversa.restaurante_id == rest_id,
+        sa.or_(models.BotConversa.criado_em >= semana, models.BotConversa.status == "ativa"),
+    )
+    pedidos = db.query(
+        func.count(models.Pedido.id).filter(models.Pedido.data_criacao >= hoje),
+        func.count(models.Pedido.id),
+        func.sum(models.Pedido.valor_total).filter(models.Pedido.status != "cancelado"),
+    ).filter(
+        models.Pedido.restaurante_id == rest_id,
+        models.Pedido.origem == "whatsapp_bot",
+        models.Pedido.data_criacao >= semana,
+    )
+    avaliacoes = db.query(
+        func.avg(models.BotAvaliacao.nota),
+        func.count(models.BotAvaliacao.id),
+    ).filter(
+        models.BotAvaliacao.restaurante_id == rest_id,
+        models.BotAvaliacao.nota.isnot(None),
+    )
+    problemas = db.query(
+        func.count(models.BotProblema.id).filter(models.BotProblema.resolvido == False),
+        func.count(models.BotProblema.id).filter(models.BotProblema.criado_em >= semana),
+    ).filter(
+        models.BotProblema.restaurante_id == rest_id,
+        sa.or_(models.BotProblema.resolvido == False, models.BotProblema.criado_em >= semana),
+    )
+
+    # Cada agregado é uma linha; o SELECT externo junta as quatro
+    subs = [q.subquery() for q in (conversas, pedidos, avaliacoes, problemas)]
+    origem = subs[0]
+    for sub in subs[1:]:
+        origem = origem.join(sub, sa.true())
+    colunas = [col for sub in subs for col in sub.c]
+    (conversas_hoje, conversas_semana, conversas_ativas,
+     pedidos_bot_hoje, pedidos_bot_semana, faturamento_bot,
+     avaliacao_media, total_avaliacoes,
+     problemas_abertos, problemas_semana) = db.execute(sa.select(*colunas).select_from(origem)).one()
+
+    # Tipos nativos antes do cache: no Postgres sum/avg vêm como Decimal
+    # (que o cache serializaria como string)
+    return {
+        "conversas_hoje": int(conversas_hoje),
+        "conversas_semana": int(conversas_semana),
+        "conversas_ativas": int(conversas_ativas),
+        "pedidos_bot_hoje": int(pedidos_bot_hoje),
+        "pedidos_bot_semana": int(pedidos_bot_semana),
+        "faturamento_bot": round(float(faturamento_bot or 0), 2),
+        "avaliacao_media": round(float(avaliacao_media), 1) if avaliacao_media else None,
+        "total_avaliacoes": int(total_avaliacoes),
+        "problemas_abertos": int(problemas_abertos),
+        "problemas_semana": int(problemas_semana),
+    }
+
+
 @router.get("/painel/bot/dashboard")
 def bot_dashboard(
     restaurante: models.Restaurante = Depends(get_current_restaurante),
@@ -1378,87 +1620,18 @@ def bot_dashboard(
         models.BotConfig.restaurante_id == restaurante.id
     ).first()
 
-    hoje = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-    semana = hoje - timedelta(days=7)
-
-    # Conversas hoje
-    conversas_hoje = db.query(func.count(models.BotConversa.id)).filter(
-        models.BotConversa.restaurante_id == restaurante.id,
-        models.BotConversa.criado_em >= hoje,
-    ).scalar()
-
-    # Conversas semana
-    conversas_semana = db.query(func.count(models.BotConversa.id)).filter(
-        models.BotConversa.restaurante_id == restaurante.id,
-        models.BotConversa.criado_em >= semana,
-    ).scalar()
-
-    # Pedidos via bot hoje
-    pedidos_bot_hoje = db.query(func.count(models.Pedido.id)).filter(
-        models.Pedido.restaurante_id == restaurante.id,
-        models.Pedido.origem == "whatsapp_bot",
-        models.Pedido.data_criacao >= hoje,
-    ).scalar()
-
-    # Pedidos via bot semana
-    pedidos_bot_semana = db.query(func.count(models.Pedido.id)).filter(
-        models.Pedido.restaurante_id == restaurante.id,
-        models.Pedido.origem == "whatsapp_bot",
-        models.Pedido.data_criacao >= semana,
-    ).scalar()
-
-    # Faturamento via bot semana
-    faturamento_bot = db.query(func.sum(models.Pedido.valor_total)).filter(
-        models.Pedido.restaurante_id == restaurante.id,
-        models.Pedido.origem == "whatsapp_bot",
-        models.Pedido.data_criacao >= semana,
-        models.Pedido.status != "cancelado",
-    ).scalar() or 0
-
-    # Avaliação média
-    avaliacao_media = db.query(func.avg(models.BotAvaliacao.nota)).filter(
-        models.BotAvaliacao.restaurante_id == restaurante.id,
-        models.BotAvaliacao.nota.isnot(None),
-    ).scalar()
-
-    # Problemas abertos
-    problemas_abertos = db.query(func.count(models.BotProblema.id)).filter(
-        models.BotProblema.restaurante_id == restaurante.id,
-        models.BotProblema.resolvido == False,
-    ).scalar()
-
-    # Problemas semana
-    problemas_semana = db.query(func.count(models.BotProblema.id)).filter(
-        models.BotProblema.restaurante_id == restaurante.id,
-        models.BotProblema.criado_em >= semana,
-    ).scalar()
-
-    # Total avaliações
-    total_avaliacoes = db.query(func.count(models.BotAvaliacao.id)).filter(
-        models.BotAvaliacao.restaurante_id == restaurante.id,
-        models.BotAvaliacao.nota.isnot(None),
-    ).scalar()
-
-    # Conversas ativas agora
-    conversas_ativas = db.query(func.count(models.BotConversa.id)).filter(
-        models.BotConversa.restaurante_id == restaurante.id,
-        models.BotConversa.status == "ativa",
-    ).scalar()
+    cache_key = f"bot:dashboard:{restaurante.id}"
+    agregados = cache_get(cache_key)
+    if agregados is None:
+        hoje = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        agregados = _dashboard_agregados(db, restaurante.id, hoje, hoje - timedelta(days=7))
+        cache_set(cache_key, agregados, ttl_seconds=BOT_DASHBOARD_CACHE_TTL)
 
     return {
         "bot_ativo": config.bot_ativo if config else False,
         "tokens_usados_hoje": config.tokens_usados_hoje if config else 0,
         "max_tokens_dia": config.max_tokens_dia if config else 50000,
-        "conversas_hoje": conversas_hoje,
-        "conversas_semana": conversas_semana,
-        "conversas_ativas": conversas_ativas,
-        "pedidos_bot_hoje": pedidos_bot_hoje,
-        "pedidos_bot_semana": pedidos_bot_semana,
-        "faturamento_bot": round(faturamento_bot, 2),
-        "avaliacao_media": round(avaliacao_media, 1) if avaliacao_media else None,
-        "total_avaliacoes": total_avaliacoes,
-        "problemas_abertos": problemas_abertos,
-        "problemas_semana": problemas_semana,
+        **agregados,
     }
 
 
@@ -1479,62 +1652,50 @@ def relatorio_eficiencia(
     db: Session = Depends(database.get_db),
 ):
     """Relatório de eficiência do bot."""
-    desde = _parse_periodo(periodo)
     rest_id = restaurante.id
+    cache_key = f"bot:relatorio:eficiencia:{rest_id}:{periodo}"
+    cached = cache_get(cache_key)
+    if cached is not None:
+        return cached
+    desde = _parse_periodo(periodo)
 
-    total_conversas = db.query(func.count(models.BotConversa.id)).filter(
+    conversas = db.query(
+        func.count(models.BotConversa.id),
+        func.count(models.BotConversa.id).filter(models.BotConversa.status == "handoff"),
+    ).filter(
         models.BotConversa.restaurante_id == rest_id,
         models.BotConversa.criado_em >= desde,
-    ).scalar() or 0
-
-    total_pedidos = db.query(func.count(models.Pedido.id)).filter(
-        models.Pedido.restaurante_id == rest_id,
-        models.Pedido.origem == "whatsapp_bot",
-        models.Pedido.data_criacao >= desde,
-    ).scalar() or 0
-
-    taxa_conversao = round((total_pedidos / max(1, total_conversas)) * 100, 1)
-
-    tempo_medio_ms = db.query(func.avg(models.BotMensagem.tempo_resposta_ms)).join(
+    ).subquery()
+    tempo_medio = db.query(func.avg(models.BotMensagem.tempo_resposta_ms)).join(
         models.BotConversa, models.BotMensagem.conversa_id == models.BotConversa.id
     ).filter(
         models.BotConversa.restaurante_id == rest_id,
         models.BotMensagem.direcao == "enviada",
         models.BotMensagem.tempo_resposta_ms.isnot(None),
         models.BotMensagem.criado_em >= desde,
-    ).scalar()
-
-    escaladas = db.query(func.count(models.BotConversa.id)).filter(
-        models.BotConversa.restaurante_id == rest_id,
-        models.BotConversa.status == "handoff",
-        models.BotConversa.criado_em >= desde,
-    ).scalar() or 0
-
-    resolvidas = total_conversas - escaladas
-    taxa_resolucao = round((resolvidas / max(1, total_conversas)) * 100, 1)
-
-    # Pedidos por dia
-    pedidos_dia = db.query(
-        cast(models.Pedido.data_criacao, Date).label("data"),
+    ).scalar_subquery()
+    total_conversas, escaladas, tempo_medio_ms = db.execute(sa.select(*conversas.c, tempo_medio)).one()
+    total_conversas, escaladas = int(total_conversas), int(escaladas)
+
+    # Pedidos e faturamento por dia (faturamento sem cancelados)
+    dia = func.date(models.Pedido.data_criacao)
+    por_dia = db.query(
+        dia.label("data"),
         func.count(models.Pedido.id).label("pedidos"),
+        func.count(models.Pedido.id).filter(models.Pedido.status != "cancelado").label("validos"),
+        func.sum(models.Pedido.valor_total).filter(models.Pedido.status != "cancelado").label("valor"),
     ).filter(
         models.Pedido.restaurante_id == rest_id,
         models.Pedido.origem == "whatsapp_bot",
         models.Pedido.data_criacao >= desde,
-    ).group_by(cast(models.Pedido.data_criacao, Date)).order_by("data").all()
+    ).group_by(dia).order_by("data").all()
 
-    # Faturamento por dia
-    fat_dia = db.query(
-        cast(models.Pedido.data_criacao, Date).label("data"),
-        func.sum(models.Pedido.valor_total).label("valor"),
-    ).filter(
-        models.Pedido.restaurante_id == rest_id,
-        models.Pedido.origem == "whatsapp_bot",
-        models.Pedido.data_criacao >= desde,
-        models.Pedido.status != "cancelado",
-    ).group_by(cast(models.Pedido.data_criacao, Date)).order_by("data").all()
+    total_pedidos = sum(int(r.pedidos) for r in por_dia)
+    taxa_conversao = round((total_pedidos / max(1, total_conversas)) * 100, 1)
+    resolvidas = total_conversas - escaladas
+    taxa_resolucao = round((resolvidas / max(1, total_conversas)) * 100, 1)
 
-    return {
+    resultado = {
         "total_conversas": total_conversas,
         "total_pedidos_bot": total_pedidos,
         "taxa_conversao": taxa_conversao,
@@ -1542,9 +1703,13 @@ def relatorio_eficiencia(
         "conversas_escaladas": escaladas,
         "conversas_resolvidas_bot": resolvidas,
         "taxa_resolucao_bot": taxa_resolucao,
-        "pedidos_por_dia": [{"data": str(r.data), "pedidos": r.pedidos} for r in pedidos_dia],
-        "faturamento_por_dia": [{"data": str(r.data), "valor": round(float(r.valor or 0), 2)} for r in fat_dia],
+        "pedidos_por_dia": [{"data": str(r.data), "pedidos": int(r.pedidos)} for r in por_dia],
+        "faturamento_por_dia": [
+            {"data": str(r.data), "valor": round(float(r.valor or 0), 2)} for r in por_dia if r.validos
+        ],
     }
+    cache_set(cache_key, resultado, ttl_seconds=BOT_RELATORIO_CACHE_TTL)
+    return resultado
 
 
 @router.get("/painel/bot/relatorio/satisfacao")
@@ -1555,66 +1720,78 @@ def relatorio_satisfacao(
     db: Session = Depends(database.get_db),
 ):
     """Relatório de satisfação do bot."""
-    desde = _parse_periodo(periodo)
     rest_id = restaurante.id
+    cache_key = f"bot:relatorio:satisfacao:{rest_id}:{periodo}"
+    cached = cache_get(cache_key)
+    if cached is not None:
+        return cached
+    desde = _parse_periodo(periodo)
 
-    avaliacoes = db.query(models.BotAvaliacao).filter(
+    # Uma linha por nota (inclusive sem nota, que ainda conta nos reviews do Google)
+    por_nota = db.query(
+        models.BotAvaliacao.nota,
+        func.count(models.BotAvaliacao.id).label("total"),
+        func.count(models.BotAvaliacao.id).filter(models.BotAvaliacao.avaliou_maps == True).label("maps"),
+    ).filter(
         models.BotAvaliacao.restaurante_id == rest_id,
-        models.BotAvaliacao.nota.isnot(None),
         models.BotAvaliacao.criado_em >= desde,
-    ).all()
+    ).group_by(models.BotAvaliacao.nota).all()
 
-    total = len(avaliacoes)
-    notas = [a.nota for a in avaliacoes]
-    media = round(sum(notas) / max(1, total), 1)
+    notas = {int(r.nota): int(r.total) for r in por_nota if r.nota is not None}
+    total = sum(notas.values())
+    media = round(sum(n * c for n, c in notas.items()) / max(1, total), 1)
 
     distribuicao = {str(i): 0 for i in range(1, 6)}
-    for n in notas:
-        distribuicao[str(n)] = distribuicao.get(str(n), 0) + 1
+    for n, c in notas.items():
+        distribuicao[str(n)] = distribuicao.get(str(n), 0) + c
 
     # NPS: promotores (4-5) - detratores (1-2) / total * 100
-    promotores = sum(1 for n in notas if n >= 4)
-    detratores = sum(1 for n in notas if n <= 2)
+    promotores = sum(c for n, c in notas.items() if n >= 4)
+    detratores = sum(c for n, c in notas.items() if n <= 2)
     nps = round(((promotores - detratores) / max(1, total)) * 100)
 
     # Categorias de problemas
     problemas = db.query(
         models.BotProblema.tipo,
         func.count(models.BotProblema.id).label("total"),
-        func.sum(case((models.BotProblema.resolvido_automaticamente == True, 1), else_=0)).label("auto"),
+        func.count(models.BotProblema.id).filter(models.BotProblema.resolvido_automaticamente == True).label("auto"),
     ).filter(
         models.BotProblema.restaurante_id == rest_id,
         models.BotProblema.criado_em >= desde,
     ).group_by(models.BotProblema.tipo).all()
 
-    categorias = []
-    for p in problemas:
-        categorias.append({
-            "tipo": p.tipo,
-            "total": p.total,
-            "resolvido_bot": int(p.auto or 0),
-        })
-
-    # Google reviews solicitados
-    reviews = db.query(func.count(models.BotAvaliacao.id)).filter(
-        models.BotAvaliacao.restaurante_id == rest_id,
-        models.BotAvaliacao.avaliou_maps == True,
-        models.BotAvaliacao.criado_em >= desde,
-    ).scalar() or 0
-
-    satisfeitos = sum(1 for n in notas if n >= 4)
-    insatisfeitos = sum(1 for n in notas if n <= 2)
-
-    return {
+    resultado = {
         "nps": nps,
         "media_geral": media,
         "distribuicao_notas": distribuicao,
         "total_avaliacoes": total,
-        "categorias_problemas": categorias,
-        "google_reviews_solicitados": reviews,
-        "clientes_satisfeitos": satisfeitos,
-        "clientes_insatisfeitos": insatisfeitos,
+        "categorias_problemas": [
+            {"tipo": p.tipo, "total": int(p.total), "resolvido_bot": int(p.auto or 0)} for p in problemas
+        ],
+        "google_reviews_solicitados": sum(int(r.maps) for r in por_nota),
+        "clientes_satisfeitos": promotores,
+        "clientes_insatisfeitos": detratores,
     }
+    cache_set(cache_key, resultado, ttl_seconds=BOT_RELATORIO_CACHE_TTL)
+    return resultado
+
+
+def _mais_recente_por_cliente(db: Session, modelo, rest_id: int, cliente_ids: list, *colunas, filtro=None):
+    """Linha mais recente (criado_em) de `modelo` por cliente, numa query (ROW_NUMBER)."""
+    if not cliente_ids:
+        return {}
+    ordem = func.row_number().over(
+        partition_by=modelo.cliente_id, order_by=modelo.criado_em.desc()
+    ).label("ordem")
+    q = db.query(modelo.cliente_id.label("cliente_id"), *colunas, ordem).filter(
+        modelo.restaurante_id == rest_id,
+        modelo.cliente_id.in_(cliente_ids),
+    )
+    if filtro is not None:
+        q = q.filter(filtro)
+    sub = q.subquery()
+    linhas = db.query(sub).filter(sub.c.ordem == 1).all()
+    return {linha.cliente_id: linha for linha in linhas}
 
 
 @router.get("/painel/bot/relatorio/clientes-inativos")
@@ -1627,84 +1804,72 @@ def relatorio_clientes_inativos(
     rest_id = restaurante.id
     agora = datetime.utcnow()
 
-    from sqlalchemy import text
-
-    # Resumo por faixas de inatividade
-    clientes_raw = db.execute(text("""
-        SELECT
-            c.id, c.nome, c.telefone,
-            COUNT(p.id) as total_pedidos,
-            MAX(p.data_criacao) as ultimo_pedido,
-            MIN(p.data_criacao) as primeiro_pedido
-        FROM clientes c
-        JOIN pedidos p ON p.cliente_id = c.id
-            AND p.restaurante_id = :rest_id
-            AND p.status = 'entregue'
-        WHERE c.restaurante_id = :rest_id
-            AND c.telefone IS NOT NULL
-        GROUP BY c.id, c.nome, c.telefone
-        ORDER BY MAX(p.data_criacao) ASC
-    """), {"rest_id": rest_id}).fetchall()
-
-    total_clientes = len(clientes_raw)
-    inativos_15_30 = 0
-    inativos_30_60 = 0
-    inativos_60_plus = 0
-    lista_clientes = []
+    # Pedidos entregues por cliente
+    por_cliente = db.query(
+        models.Cliente.id.label("id"),
+        models.Cliente.nome.label("nome"),
+        models.Cliente.telefone.label("telefone"),
+        func.count(models.Pedido.id).label("total_pedidos"),
+        func.max(models.Pedido.data_criacao).label("ultimo"),
+        func.min(models.Pedido.data_criacao).label("primeiro"),
+    ).join(
+        models.Pedido, sa.and_(
+            models.Pedido.cliente_id == models.Cliente.id,
+            models.Pedido.restaurante_id == rest_id,
+            models.Pedido.status == "entregue",
+        )
+    ).filter(
+        models.Cliente.restaurante_id == rest_id,
+        models.Cliente.telefone.isnot(None),
+    ).group_by(models.Cliente.id, models.Cliente.nome, models.Cliente.telefone).subquery()
+
+    # Resumo por faixas de inatividade (dias desde o último pedido)
+    ultimo = por_cliente.c.ultimo
+    corte = {d: agora - timedelta(days=d) for d in (10, 15, 30, 60)}
+    total_clientes, inativos_15_30, inativos_30_60, inativos_60_plus = db.query(
+        func.count(),
+        func.count().filter(sa.and_(ultimo <= corte[15], ultimo > corte[30])),
+        func.count().filter(sa.and_(ultimo <= corte[30], ultimo > corte[60])),
+        func.count().filter(ultimo <= corte[60]),
+    ).select_from(por_cliente).one()
+
+    # Os 50 mais inativos (≥10 dias), com última avaliação e repescagem em lote
+    clientes = db.query(por_cliente).filter(ultimo <= corte[10]).order_by(ultimo).limit(50).all()
+    ids = [c.id for c in clientes]
+    avaliacoes = _mais_recente_por_cliente(
+        db, models.BotAvaliacao, rest_id, ids, models.BotAvaliacao.nota,
+        filtro=models.BotAvaliacao.nota.isnot(None),
+    )
+    repescagens = _mais_recente_por_cliente(db, models.BotRepescagem, rest_id, ids, models.BotRepescagem.retornou)
 
-    for row in clientes_raw:
-        cid, nome, tel, total, ultimo, primeiro = row
-        if not ultimo:
-            continue
-        dias = (agora - ultimo).days
-
-        if 15 <= dias < 30:
-            inativos_15_30 += 1
-        elif 30 <= dias < 60:
-            inativos_30_60 += 1
-        elif dias >= 60:
-            inativos_60_plus += 1
-
-        if dias >= 10:
-            media_intervalo = None
-            if total >= 2 and primeiro:
-                dias_total = max(1, (ultimo - primeiro).days)
-                media_intervalo = round(dias_total / max(1, total - 1), 1)
-
-            # Última avaliação
-            ult_av = db.query(models.BotAvaliacao.nota).filter(
-                models.BotAvaliacao.cliente_id == cid,
-                models.BotAvaliacao.restaurante_id == rest_id,
-                models.BotAvaliacao.nota.isnot(None),
-            ).order_by(models.BotAvaliacao.criado_em.desc()).first()
-
-            # Repescagem enviada?
-            reps = db.query(models.BotRepescagem).filter(
-                models.BotRepescagem.cliente_id == cid,
-                models.BotRepescagem.restaurante_id == rest_id,
-            ).order_by(models.BotRepescagem.criado_em.desc()).first()
-
-            lista_clientes.append({
-                "id": cid,
-                "nome": nome or "Cliente",
-                "telefone": tel,
-                "total_pedidos": total,
-                "ultimo_pedido": ultimo.isoformat() if ultimo else None,
-                "media_intervalo_dias": media_intervalo,
-                "dias_inativo": dias,
-                "ultima_avaliacao": ult_av[0] if ult_av else None,
-                "repescagem_enviada": reps is not None,
-                "retornou": reps.retornou if reps else False,
-            })
+    lista_clientes = []
+    for c in clientes:
+        media_intervalo = None
+        if c.total_pedidos >= 2 and c.primeiro:
+            dias_total = max(1, (c.ultimo - c.primeiro).days)
+            media_intervalo = round(dias_total / max(1, c.total_pedidos - 1), 1)
+        ult_av = avaliacoes.get(c.id)
+        reps = repescagens.get(c.id)
+        lista_clientes.append({
+            "id": c.id,
+            "nome": c.nome or "Cliente",
+            "telefone": c.telefone,
+            "total_pedidos": c.total_pedidos,
+            "ultimo_pedido": c.ultimo.isoformat() if c.ultimo else None,
+            "media_intervalo_dias": media_intervalo,
+            "dias_inativo": (agora - c.ultimo).days,
+            "ultima_avaliacao": ult_av.nota if ult_av else None,
+            "repescagem_enviada": reps is not None,
+            "retornou": bool(reps.retornou) if reps else False,
+        })
 
     # Resumo repescagens
-    total_reps = db.query(func.count(models.BotRepescagem.id)).filter(
-        models.BotRepescagem.restaurante_id == rest_id,
-    ).scalar() or 0
-    retornaram = db.query(func.count(models.BotRepescagem.id)).filter(
+    total_reps, retornaram = db.query(
+        func.count(models.BotRepescagem.id),
+        func.count(models.BotRepescagem.id).filter(models.BotRepescagem.retornou == True),
+    ).filter(
         models.BotRepescagem.restaurante_id == rest_id,
-        models.BotRepescagem.retornou == True,
-    ).scalar() or 0
+    ).one()
 
     return {
         "resumo": {
@@ -1718,7 +1883,7 @@ def relatorio_clientes_inativos(
             "retornaram": retornaram,
             "taxa_retorno": round((retornaram / max(1, total_reps)) * 100, 1),
         },
-        "clientes": lista_clientes[:50],  # Limitar a 50
+        "clientes": lista_clientes,
     }
 
 
@@ -20,6 +20,7 @@ import httpx
 from .. import models, database, auth
 from ..feature_guard import verificar_feature
 from ..utils.origem_helper import normalizar_origem
+from ..utils.comanda import proxima_comanda as alocar_comanda
 from .auth_cliente import hash_senha
 
 logger = logging.getLogger("superfood.bridge")
@@ -584,13 +585,7 @@ async def criar_pedido_from_bridge(
         pass
 
     # Gerar comanda
-    ultima = db.query(func.max(models.Pedido.comanda)).filter(
-        models.Pedido.restaurante_id == rest.id
-    ).scalar()
-    try:
-        proxima = str(int(ultima) + 1) if ultima else "1"
-    except (ValueError, TypeError):
-        proxima = "1"
+    proxima = str(alocar_comanda(db, rest.id))
 
     plataforma = intercepted.plataforma_detectada or "bridge"
     origem = f"bridge_{plataforma}"
@@ -6,13 +6,19 @@ Router Carrinho - Gerenciamento do carrinho de compras
 
 from fastapi import APIRouter, Depends, HTTPException, Header, Request
 from sqlalchemy.orm import Session
-from sqlalchemy.orm.attributes import flag_modified
 from typing import Optional
-from datetime import datetime, timedelta
+from types import SimpleNamespace
+from datetime import datetime
 import uuid
 import random
 
 from .. import models, database
+from ..carrinho_store import (
+    get_carrinho_store, obter_produto_precificado, montar_item,
+    carrinho_vazio, recalcular, resposta,
+)
+from ..utils.comanda import proxima_comanda as alocar_comanda
+from ..demo_autopilot import agendar_pedido_demo
 from ..schemas import carrinho_schemas
 from .auth_cliente import get_cliente_opcional
 
@@ -26,6 +32,15 @@ def get_or_create_sessao_id(sessao_id: Optional[str] = Header(None, alias="X-Ses
     return sessao_id
 
 
+def _restaurante_id(db: Session, codigo_acesso: str) -> Optional[int]:
+    if not codigo_acesso:
+        return None
+    restaurante = db.query(models.Restaurante.id).filter(
+        models.Restaurante.codigo_acesso == codigo_acesso.upper()
+    ).first()
+    return restaurante.id if restaurante else None
+
+
 @router.post("/adicionar", response_model=carrinho_schemas.CarrinhoResponse)
 def adicionar_item(
     item: carrinho_schemas.AdicionarItemRequest,
@@ -42,90 +57,22 @@ def adicionar_item(
     Returns:
         Carrinho atualizado com todos os itens
     """
-    # Valida produto
-    produto = db.query(models.Produto).filter(
-        models.Produto.id == item.produto_id,
-        models.Produto.disponivel == True
-    ).first()
-    
+    # Valida produto e resolve preço (mapa de preços cacheado)
+    produto = obter_produto_precificado(db, item.produto_id, item.variacoes_ids)
     if not produto:
         raise HTTPException(status_code=404, detail="Produto não disponível")
-    
-    # Busca carrinho existente
-    carrinho = db.query(models.Carrinho).filter(
-        models.Carrinho.restaurante_id == produto.restaurante_id,
-        models.Carrinho.sessao_id == sessao_id,
-        models.Carrinho.data_expiracao > datetime.utcnow()
-    ).first()
-    
-    # Calcula preço do item
-    preco_unitario = produto.preco_promocional if produto.promocao else produto.preco
-    
-    # Adiciona preço das variações
-    for variacao_id in item.variacoes_ids:
-        variacao = db.query(models.VariacaoProduto).filter(
-            models.VariacaoProduto.id == variacao_id,
-            models.VariacaoProduto.produto_id == item.produto_id
-        ).first()
-        if variacao:
-            preco_unitario += variacao.preco_adicional
-    
-    subtotal_item = preco_unitario * item.quantidade
-    
-    # Monta item JSON
-    novo_item = {
-        "produto_id": item.produto_id,
-        "nome": produto.nome,
-        "imagem_url": produto.imagem_url,
-        "variacoes": [
-            {
-                "id": v_id,
-                "nome": db.query(models.VariacaoProduto).get(v_id).nome if db.query(models.VariacaoProduto).get(v_id) else ""
-            }
-            for v_id in item.variacoes_ids
-        ],
-        "observacoes": item.observacoes,
-        "quantidade": item.quantidade,
-        "preco_unitario": preco_unitario,
-        "subtotal": subtotal_item
-    }
-    
-    if not carrinho:
-        # Cria novo carrinho
-        carrinho = models.Carrinho(
-            restaurante_id=produto.restaurante_id,
-            sessao_id=sessao_id,
-            itens_json=[novo_item],
-            data_expiracao=datetime.utcnow() + timedelta(hours=24)
-        )
-        db.add(carrinho)
-    else:
-        # Adiciona ao carrinho existente
-        itens = carrinho.itens_json or []
-        itens.append(novo_item)
-        carrinho.itens_json = itens
-        carrinho.data_atualizacao = datetime.utcnow()
-        flag_modified(carrinho, "itens_json")
-
-    # Recalcula totais
-    carrinho.valor_subtotal = sum(item['subtotal'] for item in carrinho.itens_json)
-    taxa = carrinho.valor_taxa_entrega or 0.0
-    desconto = carrinho.valor_desconto or 0.0
-    carrinho.valor_total = carrinho.valor_subtotal + taxa - desconto
 
-    db.commit()
-    db.refresh(carrinho)
+    novo_item = montar_item(
+        item.produto_id, produto, item.variacoes_ids, item.quantidade, item.observacoes,
+    )
 
-    return {
-        "id": carrinho.id,
-        "sessao_id": carrinho.sessao_id,
-        "itens": carrinho.itens_json,
-        "quantidade_itens": len(carrinho.itens_json),
-        "valor_subtotal": carrinho.valor_subtotal,
-        "valor_taxa_entrega": carrinho.valor_taxa_entrega or 0.0,
-        "valor_desconto": carrinho.valor_desconto or 0.0,
-        "valor_total": carrinho.valor_total
-    }
+    store = get_carrinho_store()
+    carrinho = store.obter(db, sessao_id, produto["restaurante_id"]) \
+        or carrinho_vazio(sessao_id, produto["restaurante_id"])
+    carrinho["itens"].append(novo_item)
+    store.salvar(db, recalcular(carrinho))
+
+    return resposta(carrinho)
 
 
 @router.post("/adicionar-combo", response_model=carrinho_schemas.CarrinhoResponse)
@@ -154,19 +101,14 @@ def adicionar_combo(
     if not combo_itens:
         raise HTTPException(status_code=400, detail="Combo sem itens")
 
-    # Busca carrinho existente
-    carrinho = db.query(models.Carrinho).filter(
-        models.Carrinho.restaurante_id == combo.restaurante_id,
-        models.Carrinho.sessao_id == sessao_id,
-        models.Carrinho.data_expiracao > datetime.utcnow()
-    ).first()
-
     # Monta itens do combo como um único item no carrinho
-    nomes_itens = []
-    for ci in combo_itens:
-        produto = db.query(models.Produto).filter(models.Produto.id == ci.produto_id).first()
-        if produto:
-            nomes_itens.append(f"{ci.quantidade}x {produto.nome}")
+    nomes_produtos = dict(db.query(models.Produto.id, models.Produto.nome).filter(
+        models.Produto.id.in_([ci.produto_id for ci in combo_itens])
+    ).all())
+    nomes_itens = [
+        f"{ci.quantidade}x {nomes_produtos[ci.produto_id]}"
+        for ci in combo_itens if ci.produto_id in nomes_produtos
+    ]
 
     novo_item = {
         "produto_id": None,
@@ -180,39 +122,13 @@ def adicionar_combo(
         "subtotal": combo.preco_combo
     }
 
-    if not carrinho:
-        carrinho = models.Carrinho(
-            restaurante_id=combo.restaurante_id,
-            sessao_id=sessao_id,
-            itens_json=[novo_item],
-            data_expiracao=datetime.utcnow() + timedelta(hours=24)
-        )
-        db.add(carrinho)
-    else:
-        itens = carrinho.itens_json or []
-        itens.append(novo_item)
-        carrinho.itens_json = itens
-        carrinho.data_atualizacao = datetime.utcnow()
-        flag_modified(carrinho, "itens_json")
+    store = get_carrinho_store()
+    carrinho = store.obter(db, sessao_id, combo.restaurante_id) \
+        or carrinho_vazio(sessao_id, combo.restaurante_id)
+    carrinho["itens"].append(novo_item)
+    store.salvar(db, recalcular(carrinho))
 
-    carrinho.valor_subtotal = sum(i['subtotal'] for i in carrinho.itens_json)
-    taxa = carrinho.valor_taxa_entrega or 0.0
-    desconto = carrinho.valor_desconto or 0.0
-    carrinho.valor_total = carrinho.valor_subtotal + taxa - desconto
-
-    db.commit()
-    db.refresh(carrinho)
-
-    return {
-        "id": carrinho.id,
-        "sessao_id": carrinho.sessao_id,
-        "itens": carrinho.itens_json,
-        "quantidade_itens": len(carrinho.itens_json),
-        "valor_subtotal": carrinho.valor_subtotal,
-        "valor_taxa_entrega": carrinho.valor_taxa_entrega or 0.0,
-        "valor_desconto": carrinho.valor_desconto or 0.0,
-        "valor_total": carrinho.valor_total
-    }
+    return resposta(carrinho)
 
 
 @router.get("/", response_model=carrinho_schemas.CarrinhoResponse)
@@ -222,44 +138,12 @@ def get_carrinho(
     db: Session = Depends(database.get_db)
 ):
     """Retorna carrinho da sessão atual"""
-    # Busca restaurante
-    restaurante = db.query(models.Restaurante).filter(
-        models.Restaurante.codigo_acesso == codigo_acesso.upper()
-    ).first()
-    
-    if not restaurante:
+    restaurante_id = _restaurante_id(db, codigo_acesso)
+    if not restaurante_id:
         raise HTTPException(status_code=404, detail="Restaurante não encontrado")
-    
-    # Busca carrinho
-    carrinho = db.query(models.Carrinho).filter(
-        models.Carrinho.restaurante_id == restaurante.id,
-        models.Carrinho.sessao_id == sessao_id,
-        models.Carrinho.data_expiracao > datetime.utcnow()
-    ).first()
-    
-    if not carrinho:
-        # Retorna carrinho vazio
-        return {
-            "id": None,
-            "sessao_id": sessao_id,
-            "itens": [],
-            "quantidade_itens": 0,
-            "valor_subtotal": 0.0,
-            "valor_taxa_entrega": 0.0,
-            "valor_desconto": 0.0,
-            "valor_total": 0.0
-        }
-    
-    return {
-        "id": carrinho.id,
-        "sessao_id": carrinho.sessao_id,
-        "itens": carrinho.itens_json,
-        "quantidade_itens": len(carrinho.itens_json or []),
-        "valor_subtotal": carrinho.valor_subtotal,
-        "valor_taxa_entrega": carrinho.valor_taxa_entrega,
-        "valor_desconto": carrinho.valor_desconto,
-        "valor_total": carrinho.valor_total
-    }
+
+    carrinho = get_carrinho_store().obter(db, sessao_id, restaurante_id)
+    return resposta(carrinho or carrinho_vazio(sessao_id, restaurante_id))
 
 
 @router.put("/atualizar-quantidade/{item_index}", response_model=carrinho_schemas.CarrinhoResponse)
@@ -271,47 +155,22 @@ def atualizar_quantidade(
     db: Session = Depends(database.get_db)
 ):
     """Atualiza quantidade de um item no carrinho"""
-    filtros = [
-        models.Carrinho.sessao_id == sessao_id,
-        models.Carrinho.data_expiracao > datetime.utcnow()
-    ]
-    if codigo_acesso:
-        restaurante = db.query(models.Restaurante).filter(
-            models.Restaurante.codigo_acesso == codigo_acesso.upper()
-        ).first()
-        if restaurante:
-            filtros.append(models.Carrinho.restaurante_id == restaurante.id)
-    carrinho = db.query(models.Carrinho).filter(*filtros).first()
-    
+    store = get_carrinho_store()
+    carrinho = store.obter(db, sessao_id, _restaurante_id(db, codigo_acesso))
+
     if not carrinho:
         raise HTTPException(status_code=404, detail="Carrinho não encontrado")
-    
-    if item_index < 0 or item_index >= len(carrinho.itens_json):
-        raise HTTPException(status_code=400, detail="Item não encontrado no carrinho")
-    
-    # Atualiza quantidade
-    carrinho.itens_json[item_index]['quantidade'] = nova_quantidade
-    carrinho.itens_json[item_index]['subtotal'] = carrinho.itens_json[item_index]['preco_unitario'] * nova_quantidade
-    flag_modified(carrinho, "itens_json")
 
-    # Recalcula totais
-    carrinho.valor_subtotal = sum(item['subtotal'] for item in carrinho.itens_json)
-    carrinho.valor_total = carrinho.valor_subtotal + (carrinho.valor_taxa_entrega or 0.0) - (carrinho.valor_desconto or 0.0)
-    carrinho.data_atualizacao = datetime.utcnow()
+    if item_index < 0 or item_index >= len(carrinho["itens"]):
+        raise HTTPException(status_code=400, detail="Item não encontrado no carrinho")
 
-    db.commit()
-    db.refresh(carrinho)
+    # Atualiza quantidade
+    item = carrinho["itens"][item_index]
+    item["quantidade"] = nova_quantidade
+    item["subtotal"] = item["preco_unitario"] * nova_quantidade
+    store.salvar(db, recalcular(carrinho))
 
-    return {
-        "id": carrinho.id,
-        "sessao_id": carrinho.sessao_id,
-        "itens": carrinho.itens_json,
-        "quantidade_itens": len(carrinho.itens_json),
-        "valor_subtotal": carrinho.valor_subtotal,
-        "valor_taxa_entrega": carrinho.valor_taxa_entrega or 0.0,
-        "valor_desconto": carrinho.valor_desconto or 0.0,
-        "valor_total": carrinho.valor_total
-    }
+    return resposta(carrinho)
 
 
 @router.delete("/remover/{item_index}", response_model=carrinho_schemas.CarrinhoResponse)
@@ -322,46 +181,20 @@ def remover_item(
     db: Session = Depends(database.get_db)
 ):
     """Remove item do carrinho"""
-    filtros = [
-        models.Carrinho.sessao_id == sessao_id,
-        models.Carrinho.data_expiracao > datetime.utcnow()
-    ]
-    if codigo_acesso:
-        restaurante = db.query(models.Restaurante).filter(
-            models.Restaurante.codigo_acesso == codigo_acesso.upper()
-        ).first()
-        if restaurante:
-            filtros.append(models.Carrinho.restaurante_id == restaurante.id)
-    carrinho = db.query(models.Carrinho).filter(*filtros).first()
-    
+    store = get_carrinho_store()
+    carrinho = store.obter(db, sessao_id, _restaurante_id(db, codigo_acesso))
+
     if not carrinho:
         raise HTTPException(status_code=404, detail="Carrinho não encontrado")
-    
-    if item_index < 0 or item_index >= len(carrinho.itens_json):
-        raise HTTPException(status_code=400, detail="Item não encontrado")
-    
-    # Remove item
-    carrinho.itens_json.pop(item_index)
-    flag_modified(carrinho, "itens_json")
 
-    # Recalcula totais
-    carrinho.valor_subtotal = sum(item['subtotal'] for item in carrinho.itens_json)
-    carrinho.valor_total = carrinho.valor_subtotal + (carrinho.valor_taxa_entrega or 0.0) - (carrinho.valor_desconto or 0.0)
-    carrinho.data_atualizacao = datetime.utcnow()
+    if item_index < 0 or item_index >= len(carrinho["itens"]):
+        raise HTTPException(status_code=400, detail="Item não encontrado")
 
-    db.commit()
-    db.refresh(carrinho)
+    # Remove item
+    carrinho["itens"].pop(item_index)
+    store.salvar(db, recalcular(carrinho))
 
-    return {
-        "id": carrinho.id,
-        "sessao_id": carrinho.sessao_id,
-        "itens": carrinho.itens_json,
-        "quantidade_itens": len(carrinho.itens_json),
-        "valor_subtotal": carrinho.valor_subtotal,
-        "valor_taxa_entrega": carrinho.valor_taxa_entrega or 0.0,
-        "valor_desconto": carrinho.valor_desconto or 0.0,
-        "valor_total": carrinho.valor_total
-    }
+    return resposta(carrinho)
 
 
 @router.delete("/limpar")
@@ -371,19 +204,7 @@ def limpar_carrinho(
     db: Session = Depends(database.get_db)
 ):
     """Limpa carrinho completamente"""
-    filtros = [models.Carrinho.sessao_id == sessao_id]
-    if codigo_acesso:
-        restaurante = db.query(models.Restaurante).filter(
-            models.Restaurante.codigo_acesso == codigo_acesso.upper()
-        ).first()
-        if restaurante:
-            filtros.append(models.Carrinho.restaurante_id == restaurante.id)
-    carrinho = db.query(models.Carrinho).filter(*filtros).first()
-    
-    if carrinho:
-        db.delete(carrinho)
-        db.commit()
-    
+    get_carrinho_store().remover(db, sessao_id, _restaurante_id(db, codigo_acesso))
     return {"mensagem": "Carrinho limpo com sucesso"}
 
 
@@ -405,26 +226,18 @@ async def finalizar_carrinho(
     Returns:
         ID do pedido criado
     """
-    # Busca restaurante pelo codigo_acesso se informado
-    restaurante_id_filtro = None
-    if finalizacao.codigo_acesso:
-        rest = db.query(models.Restaurante).filter(
-            models.Restaurante.codigo_acesso == finalizacao.codigo_acesso.upper()
-        ).first()
-        if rest:
-            restaurante_id_filtro = rest.id
-
-    # Busca carrinho
-    filtros_carrinho = [
-        models.Carrinho.sessao_id == sessao_id,
-        models.Carrinho.data_expiracao > datetime.utcnow()
-    ]
-    if restaurante_id_filtro:
-        filtros_carrinho.append(models.Carrinho.restaurante_id == restaurante_id_filtro)
-    carrinho = db.query(models.Carrinho).filter(*filtros_carrinho).first()
+    # Busca carrinho (do restaurante pelo codigo_acesso, se informado)
+    store = get_carrinho_store()
+    dados_carrinho = store.obter(db, sessao_id, _restaurante_id(db, finalizacao.codigo_acesso))
 
-    if not carrinho or not carrinho.itens_json:
+    if not dados_carrinho or not dados_carrinho["itens"]:
         raise HTTPException(status_code=400, detail="Carrinho vazio")
+    carrinho = SimpleNamespace(
+        restaurante_id=dados_carrinho["restaurante_id"],
+        itens_json=dados_carrinho["itens"],
+        valor_subtotal=dados_carrinho["valor_subtotal"],
+        valor_desconto=dados_carrinho.get("valor_desconto") or 0.0,
+    )
 
     # Verifica se é restaurante demo
     _rest_for_demo = db.query(models.Restaurante).filter(
@@ -456,12 +269,8 @@ async def finalizar_carrinho(
             detail=f"Pedido mínimo de R$ {site_config.pedido_minimo:.2f}"
         )
     
-    # Gera número da comanda
-    ultimo_pedido = db.query(models.Pedido).filter(
-        models.Pedido.restaurante_id == carrinho.restaurante_id
-    ).order_by(models.Pedido.id.desc()).first()
-    
-    proxima_comanda = str(int(ultimo_pedido.comanda) + 1) if ultimo_pedido and ultimo_pedido.comanda.isdigit() else "1"
+    # Gera número da comanda (contador atômico por restaurante)
+    proxima_comanda = str(alocar_comanda(db, carrinho.restaurante_id))
     
     # Geocodifica endereço se não veio com coordenadas
     lat_entrega = finalizacao.latitude
@@ -595,6 +404,7 @@ async def finalizar_carrinho(
             historico.append({"status": "em_preparo", "timestamp": datetime.utcnow().isoformat()})
             pedido.historico_status = historico
 
+            db.flush()  # garante pedido.id para o PedidoCozinha
             pc_novo = models.PedidoCozinha(
                 restaurante_id=carrinho.restaurante_id,
                 pedido_id=pedido.id,
@@ -605,12 +415,16 @@ async def finalizar_carrinho(
     except Exception:
         pass  # Tabelas KDS podem não existir ainda
 
-    # Limpa carrinho
-    db.delete(carrinho)
-
     db.commit()
+
+    # Limpa carrinho (depois do commit: se o pedido falhar, o carrinho continua)
+    store.remover(db, sessao_id, dados_carrinho["restaurante_id"])
     db.refresh(pedido)
 
+    # Demo: arma a progressão automática do pedido (demo_autopilot)
+    if _is_demo:
+        agendar_pedido_demo(pedido.id, pedido.status)
+
     # Broadcast WebSocket para painel admin — alerta sonoro novo pedido
     ws = getattr(request.app.state, 'ws_manager', None)
     if ws:
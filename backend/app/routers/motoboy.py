@@ -8,13 +8,19 @@ Endpoints consumidos pelo app React PWA do motoboy.
 Reutiliza funções utilitárias existentes de utils/motoboy_selector.py e utils/calculos.py.
 """
 
-from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+import hashlib
+import json
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import and_
 from sqlalchemy.orm import Session, joinedload
 from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime, date
 
 from .. import models, database, auth
+from ..cache import cache_get, cache_set, cache_delete
 
 # Importar funções utilitárias existentes — NÃO reescrever lógica
 import sys
@@ -26,10 +32,16 @@ from utils.motoboy_selector import (
     marcar_motoboy_disponivel,
     obter_estatisticas_motoboy,
 )
-from utils.calculos import obter_ganhos_dia_motoboy
+from utils.calculos import obter_ganhos_dia_motoboy, resumo_ganhos_dia_motoboy
 
 router = APIRouter(prefix="/motoboy", tags=["App Motoboy"])
 
+# Ganhos do dia corrente mudam a cada finalização (invalidada aqui), mas
+# cancelamentos/ajustes pelo painel só aparecem depois do TTL curto.
+# Dias fechados quase não mudam.
+GANHOS_HOJE_TTL = 30
+GANHOS_PASSADO_TTL = 6 * 3600
+
 
 # ========== Schemas ==========
 
@@ -112,56 +124,98 @@ def _entrega_to_response(entrega: models.Entrega, pedido: models.Pedido = None,
     return data
 
 
+def _entregas_com_pedido(db: Session, motoboy: models.Motoboy):
+    """
+    Consulta (Entrega, Pedido) das entregas do motoboy numa única ida ao
+    banco — o Pedido vem do mesmo restaurante (None se não pertencer).
+    """
+    return db.query(models.Entrega, models.Pedido).outerjoin(
+        models.Pedido,
+        and_(
+            models.Pedido.id == models.Entrega.pedido_id,
+            models.Pedido.restaurante_id == motoboy.restaurante_id,
+        )
+    ).filter(models.Entrega.motoboy_id == motoboy.id)
+
+
+def _responder_com_etag(request: Request, payload) -> Response:
+    """
+    Serializa o payload com ETag (hash do corpo). Se o app mandar o mesmo
+    ETag em If-None-Match, devolve 304 sem corpo — o polling do app em rede
+    móvel fraca só baixa a lista quando ela muda.
+    """
+    corpo = json.dumps(jsonable_encoder(payload), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    etag = f'W/"{hashlib.sha1(corpo).hexdigest()[:20]}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+    enviados = request.headers.get("if-none-match", "")
+    if enviados and (enviados.strip() == "*" or etag in [t.strip() for t in enviados.split(",")]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=corpo, media_type="application/json", headers=headers)
+
+
+def _chave_ganhos(motoboy_id: int, tipo: str, dia: date) -> str:
+    return f"motoboy:{motoboy_id}:{tipo}:{dia.isoformat()}"
+
+
+def _ttl_ganhos(dia: date) -> int:
+    return GANHOS_HOJE_TTL if dia >= date.today() else GANHOS_PASSADO_TTL
+
+
+def _resumo_dia_cacheado(db: Session, motoboy_id: int) -> dict:
+    """Totais do dia do motoboy (entregas/ganhos/km), pré-calculados no Redis."""
+    hoje = date.today()
+    chave = _chave_ganhos(motoboy_id, "resumo", hoje)
+    resumo = cache_get(chave)
+    if resumo is None:
+        resumo = resumo_ganhos_dia_motoboy(motoboy_id, data=hoje, session=db)
+        cache_set(chave, resumo, ttl_seconds=GANHOS_HOJE_TTL)
+    return resumo
+
+
+def invalidar_ganhos_motoboy(motoboy_id: int, dia: Optional[date] = None):
+    """Descarta os ganhos pré-calculados do dia (ex.: após finalizar uma entrega)."""
+    dia = dia or date.today()
+    cache_delete(_chave_ganhos(motoboy_id, "resumo", dia))
+    cache_delete(_chave_ganhos(motoboy_id, "ganhos", dia))
+
+
 # ========== Endpoints ==========
 
 @router.get("/entregas/pendentes")
 def listar_entregas_pendentes(
+    request: Request,
     current_motoboy: models.Motoboy = Depends(auth.get_current_motoboy),
     db: Session = Depends(database.get_db)
 ):
     """Lista entregas atribuídas ao motoboy que ainda não foram iniciadas ou estão em rota."""
-    entregas = db.query(models.Entrega).filter(
-        models.Entrega.motoboy_id == current_motoboy.id,
+    linhas = _entregas_com_pedido(db, current_motoboy).filter(
         models.Entrega.status.in_(['pendente', 'em_rota'])
     ).order_by(
-        models.Entrega.atribuido_em.asc()
+        models.Entrega.atribuido_em.asc(),
+        models.Entrega.id.asc()
     ).all()
 
-    resultado = []
-    for e in entregas:
-        pedido = db.query(models.Pedido).filter(
-            models.Pedido.id == e.pedido_id,
-            models.Pedido.restaurante_id == current_motoboy.restaurante_id
-        ).first()
-        resultado.append(_entrega_to_response(e, pedido, db))
-
-    return resultado
+    return _responder_com_etag(request, [_entrega_to_response(e, pedido) for e, pedido in linhas])
 
 
 @router.get("/entregas/em-rota")
 def listar_entregas_em_rota(
+    request: Request,
     current_motoboy: models.Motoboy = Depends(auth.get_current_motoboy),
     db: Session = Depends(database.get_db)
 ):
     """Lista entregas atualmente em rota do motoboy."""
-    entregas = db.query(models.Entrega).filter(
-        models.Entrega.motoboy_id == current_motoboy.id,
+    linhas = _entregas_com_pedido(db, current_motoboy).filter(
         models.Entrega.status == 'em_rota'
     ).order_by(
         models.Entrega.posicao_rota_otimizada.asc().nullslast(),
         models.Entrega.posicao_rota_original.asc().nullslast(),
-        models.Entrega.atribuido_em.asc()
+        models.Entrega.atribuido_em.asc(),
+        models.Entrega.id.asc()
     ).all()
 
-    resultado = []
-    for e in entregas:
-        pedido = db.query(models.Pedido).filter(
-            models.Pedido.id == e.pedido_id,
-            models.Pedido.restaurante_id == current_motoboy.restaurante_id
-        ).first()
-        resultado.append(_entrega_to_response(e, pedido, db))
-
-    return resultado
+    return _responder_com_etag(request, [_entrega_to_response(e, pedido) for e, pedido in linhas])
 
 
 @router.post("/entregas/{entrega_id}/iniciar")
@@ -255,6 +309,8 @@ async def finalizar_entrega(
     if not resultado.get('sucesso'):
         raise HTTPException(status_code=400, detail=resultado.get('erro', 'Erro ao finalizar entrega'))
 
+    invalidar_ganhos_motoboy(current_motoboy.id)
+
     # Atualizar dados de pagamento real e historico_status no pedido
     if pedido:
         if dados.forma_pagamento_real:
@@ -289,6 +345,7 @@ async def finalizar_entrega(
 
 @router.get("/entregas/historico")
 def historico_entregas(
+    request: Request,
     data_inicio: Optional[date] = Query(None),
     data_fim: Optional[date] = Query(None),
     page: int = Query(1, ge=1),
@@ -300,35 +357,26 @@ def historico_entregas(
     # Status que aparecem no histórico (todos que geram pagamento + cancelado_restaurante)
     status_historico = ['entregue', 'cliente_ausente', 'cancelado_cliente', 'cancelado_restaurante']
 
-    query = db.query(models.Entrega).filter(
-        models.Entrega.motoboy_id == current_motoboy.id,
-        models.Entrega.status.in_(status_historico)
-    )
-
+    filtros = [models.Entrega.status.in_(status_historico)]
     if data_inicio:
-        query = query.filter(models.Entrega.entregue_em >= datetime.combine(data_inicio, datetime.min.time()))
+        filtros.append(models.Entrega.entregue_em >= datetime.combine(data_inicio, datetime.min.time()))
     if data_fim:
-        query = query.filter(models.Entrega.entregue_em <= datetime.combine(data_fim, datetime.max.time()))
-
-    total = query.count()
-    entregas = query.order_by(
-        models.Entrega.entregue_em.desc()
+        filtros.append(models.Entrega.entregue_em <= datetime.combine(data_fim, datetime.max.time()))
+
+    total = db.query(models.Entrega).filter(
+        models.Entrega.motoboy_id == current_motoboy.id, *filtros
+    ).count()
+    linhas = _entregas_com_pedido(db, current_motoboy).filter(*filtros).order_by(
+        models.Entrega.entregue_em.desc(),
+        models.Entrega.id.desc()
     ).offset((page - 1) * limit).limit(limit).all()
 
-    resultado = []
-    for e in entregas:
-        pedido = db.query(models.Pedido).filter(
-            models.Pedido.id == e.pedido_id,
-            models.Pedido.restaurante_id == current_motoboy.restaurante_id
-        ).first()
-        resultado.append(_entrega_to_response(e, pedido, db))
-
-    return {
-        "entregas": resultado,
+    return _responder_com_etag(request, {
+        "entregas": [_entrega_to_response(e, pedido) for e, pedido in linhas],
         "total": total,
         "page": page,
         "pages": (total + limit - 1) // limit if total > 0 else 1
-    }
+    })
 
 
 @router.put("/status")
@@ -369,32 +417,41 @@ def get_config_motoboy(
 
 @router.get("/estatisticas")
 def get_estatisticas(
+    request: Request,
     current_motoboy: models.Motoboy = Depends(auth.get_current_motoboy),
     db: Session = Depends(database.get_db)
 ):
     """Estatísticas completas do motoboy (totais + dia)."""
     resultado = obter_estatisticas_motoboy(
         motoboy_id=current_motoboy.id,
-        session=db
+        session=db,
+        resumo_dia=_resumo_dia_cacheado(db, current_motoboy.id)
     )
 
     if resultado is None:
         raise HTTPException(status_code=404, detail="Motoboy não encontrado")
 
-    return resultado
+    return _responder_com_etag(request, resultado)
 
 
 @router.get("/ganhos/detalhado")
 def get_ganhos_detalhado(
+    request: Request,
     data: Optional[date] = Query(None, description="Data no formato YYYY-MM-DD (default: hoje)"),
     current_motoboy: models.Motoboy = Depends(auth.get_current_motoboy),
     db: Session = Depends(database.get_db)
 ):
     """Ganhos detalhados do dia com lista de entregas."""
-    resultado = obter_ganhos_dia_motoboy(
-        motoboy_id=current_motoboy.id,
-        data=data,
-        session=db
-    )
+    dia = data or date.today()
+    chave = _chave_ganhos(current_motoboy.id, "ganhos", dia)
 
-    return resultado
+    resultado = cache_get(chave)
+    if resultado is None:
+        resultado = obter_ganhos_dia_motoboy(
+            motoboy_id=current_motoboy.id,
+            data=dia,
+            session=db
+        )
+        cache_set(chave, resultado, ttl_seconds=_ttl_ganhos(dia))
+
+    return _responder_com_etag(request, resultado)
@@ -6,6 +6,8 @@ Sprint 1 da migração v4.0
 Todos os endpoints requerem auth JWT do restaurante.
 """
 
+import asyncio
+
 from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import func, and_, or_, desc
@@ -15,8 +17,10 @@ from datetime import datetime, timedelta, date
 
 from .. import models, database, auth
 from ..cache import invalidate_cardapio
+from ..middleware import invalidar_dominio_tenant
 from ..feature_guard import verificar_feature
 from ..utils.origem_helper import normalizar_origem, get_plataforma_label
+from ..utils.comanda import proxima_comanda as alocar_comanda
 
 router = APIRouter(prefix="/painel", tags=["Painel Restaurante"])
 
@@ -1311,7 +1315,7 @@ def reordenar_categorias(
         ).first()
         if cat:
             cat.ordem_exibicao = idx
-    db.commit()
+    _commit_and_invalidate(db, rest.id)
     return {"mensagem": "Categorias reordenadas"}
 
 
@@ -1482,10 +1486,10 @@ def listar_variacoes(
     ).first()
     if not prod:
         raise HTTPException(404, "Produto não encontrado")
-    vars = db.query(models.VariacaoProdutoProduto).filter(
-        models.VariacaoProdutoProduto.produto_id == prod_id,
-        models.VariacaoProdutoProduto.ativo == True
-    ).order_by(models.VariacaoProdutoProduto.ordem).all()
+    vars = db.query(models.VariacaoProduto).filter(
+        models.VariacaoProduto.produto_id == prod_id,
+        models.VariacaoProduto.ativo == True
+    ).order_by(models.VariacaoProduto.ordem).all()
     return [{
         "id": v.id, "tipo_variacao": v.tipo_variacao, "nome": v.nome,
         "descricao": v.descricao, "preco_adicional": v.preco_adicional,
@@ -1504,9 +1508,9 @@ def criar_variacao(
     ).first()
     if not prod:
         raise HTTPException(404, "Produto não encontrado")
-    var = models.VariacaoProdutoProduto(produto_id=prod_id, **dados.model_dump())
+    var = models.VariacaoProduto(produto_id=prod_id, **dados.model_dump())
     db.add(var)
-    db.commit()
+    _commit_and_invalidate(db, rest.id)
     db.refresh(var)
     return {"id": var.id, "nome": var.nome}
 
@@ -1524,15 +1528,15 @@ def aplicar_max_sabores_em_massa(
 ):
     """Aplica max_sabores a TODAS as variações de tamanho com o mesmo nome no restaurante"""
     # Subquery necessária porque PostgreSQL não suporta UPDATE com JOIN direto
-    ids_variacoes = db.query(models.VariacaoProdutoProduto.id).join(models.Produto).filter(
+    ids_variacoes = db.query(models.VariacaoProduto.id).join(models.Produto).filter(
         models.Produto.restaurante_id == rest.id,
-        models.VariacaoProdutoProduto.tipo_variacao == "tamanho",
-        models.VariacaoProdutoProduto.nome == dados.nome_tamanho,
+        models.VariacaoProduto.tipo_variacao == "tamanho",
+        models.VariacaoProduto.nome == dados.nome_tamanho,
     ).subquery()
-    total = db.query(models.VariacaoProdutoProduto).filter(
-        models.VariacaoProdutoProduto.id.in_(ids_variacoes)
+    total = db.query(models.VariacaoProduto).filter(
+        models.VariacaoProduto.id.in_(ids_variacoes)
     ).update({"max_sabores": dados.max_sabores}, synchronize_session=False)
-    db.commit()
+    _commit_and_invalidate(db, rest.id)
     return {"mensagem": f"Atualizado {total} variações '{dados.nome_tamanho}' para {dados.max_sabores} sabores", "total": total}
 
 
@@ -1542,15 +1546,15 @@ def editar_variacao(
     rest: models.Restaurante = Depends(get_rest),
     db: Session = Depends(database.get_db)
 ):
-    var = db.query(models.VariacaoProdutoProduto).join(models.Produto).filter(
-        models.VariacaoProdutoProduto.id == var_id,
+    var = db.query(models.VariacaoProduto).join(models.Produto).filter(
+        models.VariacaoProduto.id == var_id,
         models.Produto.restaurante_id == rest.id
     ).first()
     if not var:
         raise HTTPException(404, "Variação não encontrada")
     for campo, valor in dados.model_dump(exclude_unset=True).items():
         setattr(var, campo, valor)
-    db.commit()
+    _commit_and_invalidate(db, rest.id)
     return {"id": var.id, "nome": var.nome}
 
 
@@ -1560,14 +1564,14 @@ def desativar_variacao(
     rest: models.Restaurante = Depends(get_rest),
     db: Session = Depends(database.get_db)
 ):
-    var = db.query(models.VariacaoProdutoProduto).join(models.Produto).filter(
-        models.VariacaoProdutoProduto.id == var_id,
+    var = db.query(models.VariacaoProduto).join(models.Produto).filter(
+        models.VariacaoProduto.id == var_id,
         models.Produto.restaurante_id == rest.id
     ).first()
     if not var:
         raise HTTPException(404, "Variação não encontrada")
     var.ativo = False
-    db.commit()
+    _commit_and_invalidate(db, rest.id)
     return {"mensagem": "Variação desativada"}
 
 
@@ -1631,7 +1635,7 @@ def criar_combo(
     db.flush()
     for item in dados.itens:
         db.add(models.ComboItem(combo_id=combo.id, produto_id=item.produto_id, quantidade=item.quantidade))
-    db.commit()
+    _commit_and_invalidate(db, rest.id)
     db.refresh(combo)
     return {"id": combo.id, "nome": combo.nome}
 
@@ -1660,7 +1664,7 @@ def editar_combo(
     db.query(models.ComboItem).filter(models.ComboItem.combo_id == combo.id).delete()
     for item in dados.itens:
         db.add(models.ComboItem(combo_id=combo.id, produto_id=item.produto_id, quantidade=item.quantidade))
-    db.commit()
+    _commit_and_invalidate(db, rest.id)
     return {"id": combo.id, "nome": combo.nome}
 
 
@@ -1676,7 +1680,7 @@ def desativar_combo(
     if not combo:
         raise HTTPException(404, "Combo não encontrado")
     combo.ativo = False
-    db.commit()
+    _commit_and_invalidate(db, rest.id)
     return {"mensagem": "Combo desativado"}
 
 
@@ -2938,6 +2942,7 @@ def criar_dominio(
     db.add(dominio)
     db.commit()
     db.refresh(dominio)
+    invalidar_dominio_tenant(dominio_limpo)
 
     return {
         "id": dominio.id,
@@ -2976,6 +2981,7 @@ def verificar_dns_dominio(
             dominio.dns_verificado_em = datetime.utcnow()
             dominio.ssl_ativo = True
             db.commit()
+            invalidar_dominio_tenant(dominio.dominio)
             return {
                 "verificado": True,
                 "mensagem": f"DNS configurado com sucesso! Seu site estara disponivel em https://{dominio.dominio}"
@@ -3006,6 +3012,7 @@ def remover_dominio(
 
     db.delete(dominio)
     db.commit()
+    invalidar_dominio_tenant(dominio.dominio)
     return {"mensagem": f"Dominio {dominio.dominio} removido com sucesso"}
 
 
@@ -3646,20 +3653,23 @@ def relatorio_analytics(
 # ============================================================
 
 @router.get("/autocomplete-endereco")
-def painel_autocomplete_endereco(
+async def painel_autocomplete_endereco(
     query: str = Query(..., min_length=3),
     rest: models.Restaurante = Depends(get_rest),
     db: Session = Depends(database.get_db)
 ):
-    """Autocomplete de endereço via Mapbox, com proximidade do restaurante."""
-    from utils.mapbox_api import autocomplete_address
+    """Autocomplete de endereço (histórico do restaurante + Mapbox cacheado), com proximidade do restaurante."""
+    from ..enderecos_service import enderecos_service
 
     proximity = None
     if rest.latitude and rest.longitude:
         proximity = (rest.latitude, rest.longitude)
 
-    pais = _detectar_pais_restaurante(rest, db)
-    sugestoes = autocomplete_address(query, proximity, country=pais)
+    # Reverse geocoding usa requests síncrono: fora do event loop
+    pais = await asyncio.to_thread(_detectar_pais_restaurante, rest, db)
+    sugestoes = await enderecos_service.autocompletar(
+        query, proximity, country=pais, db=db, restaurante_id=rest.id,
+    )
     return {"sugestoes": sugestoes}
 
 
@@ -3930,13 +3940,8 @@ async def adicionar_pedido_mesa(
 # ============================================================
 
 def _gerar_proxima_comanda(db: Session, restaurante_id: int) -> int:
-    """Gera próxima comanda usando o último pedido por ID + lock para evitar duplicatas."""
-    ultimo = db.query(models.Pedido).filter(
-        models.Pedido.restaurante_id == restaurante_id,
-    ).order_by(desc(models.Pedido.id)).with_for_update().first()
-    if ultimo and ultimo.comanda and str(ultimo.comanda).isdigit():
-        return int(ultimo.comanda) + 1
-    return 1
+    """Próxima comanda do contador atômico do restaurante (utils/comanda.py)."""
+    return alocar_comanda(db, restaurante_id)
 
 
 # ============================================================
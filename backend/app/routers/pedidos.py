@@ -13,6 +13,7 @@ import requests
 import os
 
 from .. import models, schemas, database, auth
+from ..utils.comanda import proxima_comanda as alocar_comanda
 
 try:
     from backend.app.utils.despacho import despachar_pedidos_automatico
@@ -50,10 +51,7 @@ def criar_pedido(
         raise HTTPException(status_code=400, detail="Endereço cliente inválido")
 
     # Gerar comanda sequencial
-    ultimo_pedido = db.query(models.Pedido).filter(
-        models.Pedido.restaurante_id == current_restaurante.id
-    ).order_by(models.Pedido.id.desc()).first()
-    proxima_comanda = (ultimo_pedido.comanda + 1) if ultimo_pedido and ultimo_pedido.comanda else 1
+    proxima_comanda = str(alocar_comanda(db, current_restaurante.id))
 
     novo_pedido = models.Pedido(
         restaurante_id=current_restaurante.id,
@@ -2,8 +2,10 @@
 """
 Webhook da Woovi/OpenPix — recebe eventos de pagamento Pix.
 Sem autenticação JWT (validado via HMAC-SHA256 no header x-webhook-signature).
+O endpoint só grava na webhook_fila; processar_evento_woovi roda no consumidor.
 """
 
+import json
 import logging
 from datetime import datetime
 
@@ -15,6 +17,7 @@ from .. import models
 from ..database import SessionLocal
 from ..pix import pix_service
 from ..pix.woovi_client import woovi_client
+from ..webhook_fila import fila_webhooks, registrar_handler
 
 logger = logging.getLogger("superfood.pix")
 
@@ -29,24 +32,42 @@ async def webhook_woovi_verificacao():
 
 @router.post("/webhooks/woovi")
 async def webhook_woovi(request: Request):
-    """Recebe eventos da Woovi/OpenPix (pagamentos Pix)."""
-    db = SessionLocal()
+    """Recebe eventos da Woovi/OpenPix (pagamentos Pix): valida a assinatura,
+    grava na fila durável e responde na hora. O processamento roda em processar_evento_woovi."""
+    body_bytes = await request.body()
+
+    # Validar assinatura HMAC-SHA256
+    signature = request.headers.get("x-webhook-signature", "")
+    if not woovi_client.validar_webhook(body_bytes, signature):
+        raise HTTPException(status_code=401, detail="Assinatura inválida")
+
     try:
-        body_bytes = await request.body()
+        body = json.loads(body_bytes)
+    except Exception:
+        return {"status": "ignored", "reason": "invalid json"}
+    event_type = body.get("event", "")  # OPENPIX:CHARGE_COMPLETED, OPENPIX:CHARGE_EXPIRED
+    charge = body.get("charge") or {}
+    charge_id = charge.get("correlationID", "") or charge.get("identifier", "")
+
+    if not event_type or not charge_id:
+        return {"status": "ignored", "reason": "missing event or charge id"}
+
+    try:
+        resultado = await fila_webhooks.receber("woovi", f"{event_type}_{charge_id}", body)
+    except Exception as e:
+        logger.error(f"Fila de webhooks indisponível (woovi): {e}")
+        raise HTTPException(status_code=503, detail="Indisponível")
+    return {"status": resultado["status"], "event": event_type}
 
-        # Validar assinatura HMAC-SHA256
-        signature = request.headers.get("x-webhook-signature", "")
-        if not woovi_client.validar_webhook(body_bytes, signature):
-            raise HTTPException(status_code=401, detail="Assinatura inválida")
 
-        body = await request.json()
-        event_type = body.get("event", "")  # OPENPIX:CHARGE_COMPLETED, OPENPIX:CHARGE_EXPIRED
+async def processar_evento_woovi(body: dict, ws_manager=None):
+    """Consumidor da webhook_fila para eventos Woovi. Exceção = nova tentativa."""
+    db = SessionLocal()
+    try:
+        event_type = body.get("event", "")
         charge = body.get("charge", {})
         charge_id = charge.get("correlationID", "") or charge.get("identifier", "")
 
-        if not event_type or not charge_id:
-            return {"status": "ignored", "reason": "missing event or charge id"}
-
         # Gerar event_id único
         event_id = f"{event_type}_{charge_id}"
 
@@ -94,13 +115,12 @@ async def webhook_woovi(request: Request):
             )
 
         if not evento_log:
-            return {"status": "error", "message": "Falha ao registrar evento"}
+            raise RuntimeError(f"Falha ao registrar evento {event_id}")
 
         # Processar evento
         try:
             if event_type == "OPENPIX:CHARGE_COMPLETED":
-                # Obter ws_manager do app state para notificar restaurante
-                ws_manager = getattr(request.app.state, "ws_manager", None)
+                # ws_manager vem do consumidor (app.state.ws_manager no startup)
                 await pix_service.processar_pagamento_confirmado(
                     charge_id, db, ws_manager
                 )
@@ -112,16 +132,16 @@ async def webhook_woovi(request: Request):
             db.commit()
 
         except Exception as e:
+            db.rollback()
             evento_log.error_message = str(e)[:500]
             db.commit()
             logger.error(f"Erro processando webhook Woovi {event_type}: {e}")
+            raise
 
         return {"status": "processed", "event": event_type}
 
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Erro no webhook Woovi: {e}")
-        return {"status": "error"}
     finally:
         db.close()
+
+
+registrar_handler("woovi", processar_evento_woovi)
@@ -11,11 +11,13 @@ from typing import List, Optional
 from datetime import datetime
 import json
 import os
+import asyncio
 
 from .. import models, database
 from ..schemas import site_schemas
 from ..cache import cache_get, cache_set
-from utils.mapbox_api import autocomplete_address, check_coverage_zone, _cache_key_dist
+from ..enderecos_service import enderecos_service
+from utils.mapbox_api import check_coverage_zone, _cache_key_dist
 from .auth_cliente import get_cliente_atual, get_cliente_opcional
 
 
@@ -556,13 +558,16 @@ def validar_endereco_entrega(
 
 
 @router.get("/{codigo_acesso}/autocomplete-endereco")
-def autocomplete_endereco(
+async def autocomplete_endereco(
     codigo_acesso: str,
     query: str = Query(..., min_length=3, description="Texto do endereço"),
+    cliente: Optional[models.Cliente] = Depends(get_cliente_opcional),
     db: Session = Depends(database.get_db)
 ):
     """
     Retorna sugestões de endereços conforme o usuário digita
+    (endereços do próprio cliente logado → cache por prefixo → Mapbox).
+    Rota pública: nunca sugere endereços de outros clientes do restaurante.
     
     Args:
         codigo_acesso: Código do restaurante
@@ -571,9 +576,16 @@ def autocomplete_endereco(
     Returns:
         Lista de sugestões com place_name e coordinates
     """
-    restaurante = db.query(models.Restaurante).filter(
-        models.Restaurante.codigo_acesso == codigo_acesso.upper()
-    ).first()
+    def _restaurante_e_pais():
+        # Consulta + reverse geocoding (requests síncrono) fora do event loop
+        restaurante = db.query(models.Restaurante).filter(
+            models.Restaurante.codigo_acesso == codigo_acesso.upper()
+        ).first()
+        if not restaurante:
+            return None, None
+        return restaurante, _detectar_pais_restaurante(restaurante, db)
+
+    restaurante, pais = await asyncio.to_thread(_restaurante_e_pais)
     
     if not restaurante:
         raise HTTPException(status_code=404, detail="Restaurante não encontrado")
@@ -581,8 +593,12 @@ def autocomplete_endereco(
     # Proximity: prioriza resultados próximos ao restaurante
     proximity = (restaurante.latitude, restaurante.longitude) if restaurante.latitude else None
     
-    pais = _detectar_pais_restaurante(restaurante, db)
-    sugestoes = autocomplete_address(query, proximity, country=pais)
+    if cliente and cliente.restaurante_id == restaurante.id:
+        sugestoes = await enderecos_service.autocompletar(
+            query, proximity, country=pais, db=db, restaurante_id=restaurante.id, cliente_id=cliente.id,
+        )
+    else:
+        sugestoes = await enderecos_service.autocompletar(query, proximity, country=pais)
 
     return {"sugestoes": sugestoes}
 
@@ -33,6 +33,11 @@ class StorageBackend(ABC):
         """Retorna URL publica do arquivo"""
         ...
 
+    @abstractmethod
+    def download(self, key: str) -> Optional[bytes]:
+        """Le o arquivo pelo key (None se nao existe)"""
+        ...
+
 
 class LocalStorageBackend(StorageBackend):
     """Armazenamento local em filesystem (desenvolvimento)"""
@@ -59,6 +64,12 @@ class LocalStorageBackend(StorageBackend):
     def get_url(self, key: str) -> str:
         return f"/static/uploads/{key}"
 
+    def download(self, key: str) -> Optional[bytes]:
+        filepath = self.upload_dir / key
+        if filepath.exists():
+            return filepath.read_bytes()
+        return None
+
 
 class R2StorageBackend(StorageBackend):
     """Armazenamento em Cloudflare R2 (producao) - compativel S3"""
@@ -102,6 +113,16 @@ class R2StorageBackend(StorageBackend):
             return f"{self.cdn_url}/{key}"
         return f"https://{self.bucket_name}.r2.cloudflarestorage.com/{key}"
 
+    def download(self, key: str) -> Optional[bytes]:
+        try:
+            obj = self.client.get_object(Bucket=self.bucket_name, Key=key)
+            return obj["Body"].read()
+        except self.client.exceptions.NoSuchKey:
+            return None
+        except Exception as e:
+            logger.error(f"Erro ao baixar R2 {key}: {e}")
+            return None
+
 
 # Factory — singleton
 _storage_instance: Optional[StorageBackend] = None
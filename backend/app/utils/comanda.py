@@ -0,0 +1,190 @@
+"""
+Alocação de número de comanda por restaurante.
+
+Todas as origens de pedido (site, painel, mesa, bot, bridge, integrações)
+pegam o próximo número daqui. Substitui o "último pedido por id + 1":
+uma query a menos por pedido e sem comanda duplicada em checkouts simultâneos.
+
+- Redis (fast path): INCR em `comanda:{restaurante_id}` — atômico, sem lock no banco
+- Banco: UPDATE comanda_sequencias ... RETURNING num pool pequeno e dedicado em
+  autocommit (Postgres), então o lock da linha dura só o próprio UPDATE, não a
+  transação do checkout, e o contador não disputa conexões com as sessões.
+  Comanda de pedido que deu rollback vira "buraco", como numa sequence
+- Chave Redis perdida (restart/eviction) ou primeiro pedido do restaurante:
+  semeia a partir da maior comanda recente em `pedidos` (inclusive "WA{n}" do bot)
+- Redis falhou e o banco atendeu: a chave Redis é descartada (na hora ou quando
+  o Redis voltar) para re-semear acima do que o banco emitiu
+- COMANDA_RESET_DIARIO=1: numeração volta a 1 a cada dia
+"""
+
+import os
+import re
+import logging
+from datetime import date, datetime
+from typing import Optional
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..cache import get_redis
+
+logger = logging.getLogger("superfood.comanda")
+
+COMANDA_REDIS = os.getenv("COMANDA_REDIS", "1") == "1"
+COMANDA_RESET_DIARIO = os.getenv("COMANDA_RESET_DIARIO", "0") == "1"
+COMANDA_REDIS_TTL_DIARIO = 2 * 86400
+
+# Quantos pedidos recentes olhar ao semear
+_JANELA_SEMENTE = 50
+# Parte numérica da comanda: "123" ou com prefixo de origem ("WA123" do bot)
+_RE_COMANDA = re.compile(r"[A-Za-z]*(\d{1,9})")
+
+# Chaves Redis a descartar quando o Redis voltar: o banco emitiu números
+# enquanto ele falhava, então o valor guardado ficou para trás
+_chaves_invalidar: set = set()
+
+# Engines autocommit do contador por URL (Postgres)
+_engines_contador: dict = {}
+
+stats = {"redis": 0, "banco": 0, "sementes": 0}
+
+_SQL_INCREMENTAR = text("""
+    UPDATE comanda_sequencias
+    SET ultimo = CASE
+            WHEN :reset AND (dia IS NULL OR dia <> :hoje) THEN :piso + 1
+            WHEN ultimo < :piso THEN :piso + 1
+            ELSE ultimo + 1
+        END,
+        dia = :hoje,
+        atualizado_em = :agora
+    WHERE restaurante_id = :rid
+    RETURNING ultimo
+""")
+
+_SQL_CRIAR = text("""
+    INSERT INTO comanda_sequencias (restaurante_id, ultimo, dia, atualizado_em)
+    VALUES (:rid, :piso + 1, :hoje, :agora)
+    ON CONFLICT (restaurante_id) DO UPDATE
+    SET ultimo = comanda_sequencias.ultimo + 1,
+        dia = excluded.dia,
+        atualizado_em = excluded.atualizado_em
+    RETURNING ultimo
+""")
+
+
+def _maior_comanda_recente(db: Session, restaurante_id: int, hoje: date) -> int:
+    """Maior comanda numérica entre os últimos pedidos (semente do contador)."""
+    q = db.query(models.Pedido.comanda, models.Pedido.data_criacao).filter(
+        models.Pedido.restaurante_id == restaurante_id,
+    )
+    if COMANDA_RESET_DIARIO:
+        q = q.filter(models.Pedido.data_criacao >= datetime.combine(hoje, datetime.min.time()))
+    maior = 0
+    for comanda, _ in q.order_by(models.Pedido.id.desc()).limit(_JANELA_SEMENTE):
+        m = _RE_COMANDA.fullmatch(str(comanda or ""))
+        if m:
+            maior = max(maior, int(m.group(1)))
+    return maior
+
+
+def _engine_contador(bind):
+    """Pool pequeno só do contador: o UPDATE em autocommit não tira uma
+    segunda conexão do pool das sessões (que já seguram a do checkout)."""
+    chave = bind.url.render_as_string(hide_password=False)
+    engine = _engines_contador.get(chave)
+    if engine is None:
+        engine = _engines_contador.setdefault(chave, create_engine(
+            bind.url,
+            isolation_level="AUTOCOMMIT",
+            pool_pre_ping=True,
+            pool_size=int(os.getenv("COMANDA_POOL_SIZE", "2")),
+            max_overflow=int(os.getenv("COMANDA_POOL_OVERFLOW", "3")),
+            pool_recycle=1800,
+        ))
+    return engine
+
+
+def _executar_contador(db: Session, sql, params: dict) -> Optional[int]:
+    """Postgres: pool dedicado em autocommit (lock de linha só durante o UPDATE).
+    Outros bancos (SQLite nos testes): na transação da sessão."""
+    bind = db.get_bind()
+    if bind.dialect.name == "postgresql":
+        with _engine_contador(bind).connect() as conn:
+            row = conn.execute(sql, params).first()
+    else:
+        row = db.execute(sql, params).first()
+    return int(row[0]) if row else None
+
+
+def _alocar_banco(db: Session, restaurante_id: int, hoje: date, piso: Optional[int] = None) -> int:
+    params = {
+        "rid": restaurante_id,
+        "hoje": hoje.isoformat(),
+        "agora": datetime.utcnow(),
+        "reset": COMANDA_RESET_DIARIO,
+        "piso": piso or 0,
+    }
+    numero = _executar_contador(db, _SQL_INCREMENTAR, params)
+    if numero is None:
+        # Primeiro pedido com o contador: semeia do histórico
+        if piso is None:
+            params["piso"] = _maior_comanda_recente(db, restaurante_id, hoje)
+        numero = _executar_contador(db, _SQL_CRIAR, params)
+        stats["sementes"] += 1
+    stats["banco"] += 1
+    return numero
+
+
+def _chave_redis(restaurante_id: int, hoje: date) -> str:
+    if COMANDA_RESET_DIARIO:
+        return f"comanda:{restaurante_id}:{hoje.strftime('%Y%m%d')}"
+    return f"comanda:{restaurante_id}"
+
+
+def _alocar_redis(r, db: Session, restaurante_id: int, hoje: date) -> int:
+    chave = _chave_redis(restaurante_id, hoje)
+    if r.exists(chave):
+        numero = r.incr(chave)
+        # Corrida com um DEL/expiração entre exists e incr deixaria 1 — re-semeia
+        if numero > 1:
+            stats["redis"] += 1
+            return numero
+
+    # Chave nova: o banco aloca o número de semente (com piso do histórico, pois o
+    # contador do banco fica parado enquanto o Redis atende). Só o vencedor do
+    # SET NX devolve a semente; os demais seguem o INCR — nenhum número repete.
+    piso = _maior_comanda_recente(db, restaurante_id, hoje)
+    semente = _alocar_banco(db, restaurante_id, hoje, piso=piso)
+    ttl = COMANDA_REDIS_TTL_DIARIO if COMANDA_RESET_DIARIO else None
+    if r.set(chave, semente, nx=True, ex=ttl):
+        return semente
+    stats["redis"] += 1
+    return r.incr(chave)
+
+
+def proxima_comanda(db: Session, restaurante_id: int) -> int:
+    """Próximo número de comanda do restaurante (atômico entre workers)."""
+    hoje = date.today()
+    r = get_redis() if COMANDA_REDIS else None
+    if r is not None:
+        try:
+            for chave in list(_chaves_invalidar):
+                r.delete(chave)
+                _chaves_invalidar.discard(chave)
+            return int(_alocar_redis(r, db, restaurante_id, hoje))
+        except Exception as e:
+            logger.warning(f"Redis indisponível para comanda (restaurante {restaurante_id}): {e}")
+    redis_configurado = COMANDA_REDIS and (r is not None or os.getenv("REDIS_URL"))
+    # Sem Redis: se ele já atendeu antes, o contador do banco pode estar atrás
+    piso = _maior_comanda_recente(db, restaurante_id, hoje) if redis_configurado else None
+    numero = _alocar_banco(db, restaurante_id, hoje, piso=piso)
+    if redis_configurado:
+        # A chave Redis não viu este número: descarta para o próximo INCR
+        # re-semear do banco (max(contador, piso)) em vez de repetir comandas
+        chave = _chave_redis(restaurante_id, hoje)
+        try:
+            r.delete(chave)
+        except Exception:  # Redis fora (ou r None): descarta quando ele voltar
+            _chaves_invalidar.add(chave)
+    return numero
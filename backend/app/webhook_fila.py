@@ -0,0 +1,449 @@
+# backend/app/webhook_fila.py
+
+"""
+Fila de Webhooks - Derekh Food API
+Ingestão com ack rápido para Evolution, Meta, Asaas e Woovi.
+
+Antes o processamento (turno LLM/STT, billing, Pix) rodava dentro do request
+ou em create_task sem limite: webhook lento → provedor reenvia → mais carga.
+Agora o endpoint só valida a assinatura, grava o evento bruto em
+`webhook_eventos` (INSERT ... ON CONFLICT DO NOTHING na chave de dedup) e
+responde 200 em poucos ms. Consumidores em background processam:
+
+- Fila local (asyncio.Queue) acorda o consumidor do próprio worker na hora
+- Varredura periódica pega pendentes de qualquer worker (restart, retry,
+  evento gravado por outro processo) e destrava "processando" órfãos
+- Posse atômica: UPDATE ... WHERE status='pendente' — um evento, um worker
+- Concorrência limitada por grupo (bot: evolution/meta; pagamentos: asaas/woovi)
+- Uma conversa por vez: eventos com a mesma chave de conversa (instância +
+  número) rodam em sequência, na ordem de chegada (a vez é reservada no
+  receber, antes da posse no banco); esperando a vez, o evento devolve a vaga
+- Falha → retry com backoff exponencial; após WEBHOOK_MAX_TENTATIVAS fica 'erro'
+- Retry não repete resposta: se a tentativa que falhou (ex.: timeout no meio
+  do turno) já enviou mensagem ao cliente, o evento fica 'erro' sem retry
+
+Handlers são registrados pelos routers (registrar_handler) e recebem o
+payload; exceção = nova tentativa. Os clientes WhatsApp chamam
+registrar_resposta_enviada() a cada envio.
+"""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import contextvars
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Callable, Awaitable, Any
+
+from sqlalchemy import text
+
+from .database import SessionLocal
+from .metrics import HistogramaLog
+
+logger = logging.getLogger("superfood.webhooks")
+
+WEBHOOK_CONCORRENCIA_BOT = int(os.getenv("WEBHOOK_CONCORRENCIA_BOT", "16"))
+WEBHOOK_CONCORRENCIA_PAGAMENTOS = int(os.getenv("WEBHOOK_CONCORRENCIA_PAGAMENTOS", "4"))
+WEBHOOK_TIMEOUT = float(os.getenv("WEBHOOK_TIMEOUT", "120"))
+WEBHOOK_MAX_TENTATIVAS = int(os.getenv("WEBHOOK_MAX_TENTATIVAS", "6"))
+WEBHOOK_VARREDURA_SEGUNDOS = float(os.getenv("WEBHOOK_VARREDURA_SEGUNDOS", "5"))
+WEBHOOK_PROCESSANDO_TIMEOUT = int(os.getenv("WEBHOOK_PROCESSANDO_TIMEOUT", "600"))
+WEBHOOK_RETENCAO_DIAS = int(os.getenv("WEBHOOK_RETENCAO_DIAS", "7"))
+
+_BACKOFF_BASE_SEGUNDOS = 5
+_BACKOFF_MAX_SEGUNDOS = 600
+_VARREDURA_LOTE = 200
+_LIMPEZA_A_CADA = 720  # varreduras (~1h com o intervalo padrão)
+
+GRUPOS = {"evolution": "bot", "meta": "bot", "asaas": "pagamentos", "woovi": "pagamentos"}
+
+Handler = Callable[..., Awaitable[Any]]
+_handlers: Dict[str, Handler] = {}
+_chaves_conversa: Dict[str, Callable[[dict], Optional[str]]] = {}
+
+# Respostas enviadas pela tentativa em andamento (visível nas tasks do handler)
+_respostas_enviadas: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar(
+    "webhook_respostas_enviadas", default=None,
+)
+
+_SQL_ENFILEIRAR = text("""
+    INSERT INTO webhook_eventos (origem, dedup_key, payload_json, status, tentativas, criado_em, atualizado_em)
+    VALUES (:origem, :dedup_key, :payload, 'pendente', 0, :agora, :agora)
+    ON CONFLICT (origem, dedup_key) DO NOTHING
+    RETURNING id
+""")
+
+_SQL_ASSUMIR = text("""
+    UPDATE webhook_eventos
+    SET status = 'processando', tentativas = tentativas + 1, atualizado_em = :agora
+    WHERE id = :id AND status = 'pendente'
+    RETURNING origem, payload_json, criado_em, tentativas
+""")
+
+_SQL_PENDENTES = text("""
+    SELECT id, origem FROM webhook_eventos
+    WHERE status = 'pendente' AND (proxima_tentativa_em IS NULL OR proxima_tentativa_em <= :agora)
+    ORDER BY id
+    LIMIT :lote
+""")
+
+
+def registrar_handler(
+    origem: str,
+    handler: Handler,
+    chave_conversa: Optional[Callable[[dict], Optional[str]]] = None,
+):
+    """
+    handler(payload, ws_manager=None) — levantar exceção agenda nova tentativa.
+    chave_conversa(payload) agrupa eventos que precisam rodar em sequência.
+    """
+    _handlers[origem] = handler
+    if chave_conversa:
+        _chaves_conversa[origem] = chave_conversa
+
+
+def registrar_resposta_enviada():
+    """Marca que o evento em processamento já respondeu o cliente (retry não repete)."""
+    respostas = _respostas_enviadas.get()
+    if respostas is not None:
+        respostas["n"] += 1
+
+
+def chave_dedup(*partes, corpo: bytes = b"") -> str:
+    """Chave de dedup a partir dos ids do provedor; sem ids, hash do corpo."""
+    chave = ":".join(str(p) for p in partes if p)
+    if chave:
+        return chave[:200]
+    return "sha1:" + hashlib.sha1(corpo).hexdigest()
+
+
+def _como_datetime(valor) -> Optional[datetime]:
+    if valor is None or isinstance(valor, datetime):
+        return valor
+    try:
+        return datetime.fromisoformat(str(valor))
+    except ValueError:
+        return None
+
+
+class _Vaga:
+    """Vaga do evento no semáforo do grupo; devolvida enquanto espera a vez da conversa."""
+
+    def __init__(self, semaforo: asyncio.Semaphore):
+        self._semaforo = semaforo
+        self.ocupada = True
+
+    def liberar(self):
+        if self.ocupada:
+            self.ocupada = False
+            self._semaforo.release()
+
+    async def retomar(self):
+        if not self.ocupada:
+            await self._semaforo.acquire()
+            self.ocupada = True
+
+
+class FilaWebhooks:
+    def __init__(self):
+        self._filas: Dict[str, asyncio.Queue] = {}
+        self._semaforos: Dict[str, asyncio.Semaphore] = {}
+        self._conversas: Dict[str, OrderedDict] = {}  # chave → {evento_id: asyncio.Event da vez}
+        self._vez_de: Dict[int, str] = {}
+        self._na_fila: set = set()
+        self._em_processamento: set = set()
+        self._tasks: list = []
+        self._ativos: set = set()
+        self.ws_manager = None
+        self._espera = HistogramaLog()
+        self._processamento = {origem: HistogramaLog() for origem in GRUPOS}
+        self.contadores = {
+            "recebidos": 0, "duplicados": 0, "processados": 0,
+            "retries": 0, "falhas": 0, "recuperados": 0, "sem_retry": 0,
+        }
+
+    # ==================== INGESTÃO (request) ====================
+
+    def gravar(self, origem: str, dedup_key: str, payload: dict) -> Optional[int]:
+        """Grava o evento bruto. None se já existia (reenvio do provedor)."""
+        agora = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            row = db.execute(_SQL_ENFILEIRAR, {
+                "origem": origem, "dedup_key": dedup_key,
+                "payload": json.dumps(payload, default=str), "agora": agora,
+            }).first()
+            db.commit()
+            return int(row[0]) if row else None
+        finally:
+            db.close()
+
+    async def receber(self, origem: str, dedup_key: str, payload: dict) -> dict:
+        """Grava e avisa o consumidor local. Exceção = banco indisponível (responder 5xx)."""
+        evento_id = await asyncio.to_thread(self.gravar, origem, dedup_key, payload)
+        if evento_id is None:
+            self.contadores["duplicados"] += 1
+            return {"status": "duplicate"}
+        self.contadores["recebidos"] += 1
+        self._avisar(evento_id, origem, self._chave_conversa(origem, payload))
+        return {"status": "queued", "evento_id": evento_id}
+
+    def _avisar(self, evento_id: int, origem: str, chave_conversa: Optional[str] = None):
+        fila = self._filas.get(GRUPOS.get(origem, "bot"))
+        if fila is None or evento_id in self._na_fila:
+            return
+        self._na_fila.add(evento_id)
+        self._reservar_vez(evento_id, chave_conversa)
+        fila.put_nowait(evento_id)
+
+    # ==================== CONSUMO ====================
+
+    def _assumir(self, evento_id: int):
+        db = SessionLocal()
+        try:
+            row = db.execute(_SQL_ASSUMIR, {"id": evento_id, "agora": datetime.utcnow()}).first()
+            db.commit()
+            return row
+        finally:
+            db.close()
+
+    def _finalizar(self, evento_id: int, tentativas: int, erro: Optional[str] = None, retry: bool = True):
+        agora = datetime.utcnow()
+        if erro is None:
+            sql, params = (
+                "UPDATE webhook_eventos SET status = 'ok', erro = NULL, processado_em = :agora, "
+                "atualizado_em = :agora WHERE id = :id"
+            ), {}
+        elif not retry or tentativas >= WEBHOOK_MAX_TENTATIVAS:
+            sql, params = (
+                "UPDATE webhook_eventos SET status = 'erro', erro = :erro, atualizado_em = :agora WHERE id = :id"
+            ), {"erro": erro[:500]}
+        else:
+            espera = min(_BACKOFF_BASE_SEGUNDOS * 2 ** (tentativas - 1), _BACKOFF_MAX_SEGUNDOS)
+            sql, params = (
+                "UPDATE webhook_eventos SET status = 'pendente', erro = :erro, proxima_tentativa_em = :proxima, "
+                "atualizado_em = :agora WHERE id = :id"
+            ), {"erro": erro[:500], "proxima": agora + timedelta(seconds=espera)}
+        db = SessionLocal()
+        try:
+            db.execute(text(sql), {"id": evento_id, "agora": agora, **params})
+            db.commit()
+        finally:
+            db.close()
+
+    @staticmethod
+    def _chave_conversa(origem: str, payload: dict) -> Optional[str]:
+        extrair = _chaves_conversa.get(origem)
+        if extrair is None:
+            return None
+        try:
+            chave = extrair(payload)
+        except Exception as e:
+            logger.debug(f"Chave de conversa indisponível ({origem}): {e}")
+            return None
+        return f"{origem}:{chave}" if chave else None
+
+    def _reservar_vez(self, evento_id: int, chave: Optional[str]):
+        """Entra no fim da fila da conversa; o primeiro da fila tem a vez."""
+        if chave is None or evento_id in self._vez_de:
+            return
+        fila = self._conversas.setdefault(chave, OrderedDict())
+        fila[evento_id] = asyncio.Event()
+        self._vez_de[evento_id] = chave
+        if len(fila) == 1:
+            fila[evento_id].set()
+
+    def _liberar_vez(self, evento_id: int):
+        """Sai da fila da conversa e passa a vez ao próximo (idempotente)."""
+        chave = self._vez_de.pop(evento_id, None)
+        if chave is None:
+            return
+        fila = self._conversas[chave]
+        fila.pop(evento_id, None)
+        if fila:
+            next(iter(fila.values())).set()
+        else:
+            del self._conversas[chave]
+
+    async def _aguardar_vez(self, evento_id: int, chave: Optional[str], vaga: Optional[_Vaga] = None):
+        """Um evento por conversa por vez (neste processo)."""
+        if chave is None:
+            return
+        self._reservar_vez(evento_id, chave)  # vindo da varredura: entra agora
+        vez = self._conversas[chave][evento_id]
+        if not vez.is_set():
+            # Esperar a vez sem ocupar vaga: rajada de uma conversa não trava as outras
+            if vaga is not None:
+                vaga.liberar()
+            await vez.wait()
+        if vaga is not None:
+            await vaga.retomar()
+
+    async def processar(self, evento_id: int, vaga: Optional[_Vaga] = None) -> bool:
+        """Assume e processa um evento. False se outro worker já pegou ou se falhou."""
+        row = await asyncio.to_thread(self._assumir, evento_id)
+        if row is None:
+            return False
+        origem, payload, criado_em, tentativas = row
+        if isinstance(payload, str):
+            payload = json.loads(payload)
+        criado_em = _como_datetime(criado_em)
+        if criado_em and tentativas == 1:
+            self._espera.registrar((datetime.utcnow() - criado_em).total_seconds() * 1000)
+
+        self._em_processamento.add(evento_id)
+        respostas = {"n": 0}
+        erro = None
+        await self._aguardar_vez(evento_id, self._chave_conversa(origem, payload), vaga)
+        inicio = time.perf_counter()
+        token = _respostas_enviadas.set(respostas)
+        try:
+            handler = _handlers.get(origem)
+            if handler is None:
+                raise RuntimeError(f"sem handler para origem '{origem}'")
+            await asyncio.wait_for(handler(payload, ws_manager=self.ws_manager), timeout=WEBHOOK_TIMEOUT)
+        except asyncio.CancelledError:
+            raise  # shutdown: continua em _em_processamento e o stop() devolve à fila
+        except Exception as e:
+            erro = f"{type(e).__name__}: {e}"
+            logger.warning(f"Webhook {origem} #{evento_id} falhou (tentativa {tentativas}): {erro}")
+        finally:
+            _respostas_enviadas.reset(token)
+            self._liberar_vez(evento_id)
+        if origem in self._processamento:
+            self._processamento[origem].registrar((time.perf_counter() - inicio) * 1000)
+
+        retry = erro is None or not respostas["n"]
+        if not retry:
+            erro = f"{erro} ({respostas['n']} resposta(s) já enviada(s), sem retry)"
+        await asyncio.to_thread(self._finalizar, evento_id, tentativas, erro, retry)
+        self._em_processamento.discard(evento_id)
+        if erro is None:
+            self.contadores["processados"] += 1
+            return True
+        if not retry:
+            self.contadores["sem_retry"] += 1
+            logger.error(f"Webhook {origem} #{evento_id} não será reprocessado: {erro}")
+        elif tentativas >= WEBHOOK_MAX_TENTATIVAS:
+            self.contadores["falhas"] += 1
+            logger.error(f"Webhook {origem} #{evento_id} desistido após {tentativas} tentativas: {erro}")
+        else:
+            self.contadores["retries"] += 1
+        return False
+
+    async def _executar(self, evento_id: int, semaforo: asyncio.Semaphore):
+        vaga = _Vaga(semaforo)
+        try:
+            await self.processar(evento_id, vaga)
+        except Exception as e:
+            logger.error(f"Erro no consumidor de webhooks (#{evento_id}): {e}", exc_info=True)
+        finally:
+            vaga.liberar()
+            self._liberar_vez(evento_id)  # posse perdida ou erro antes da vez
+            self._na_fila.discard(evento_id)
+
+    async def _despachar(self, grupo: str):
+        """Um despachante por grupo: só tira da fila quando há vaga (backpressure)."""
+        fila, semaforo = self._filas[grupo], self._semaforos[grupo]
+        while True:
+            evento_id = await fila.get()
+            await semaforo.acquire()
+            task = asyncio.create_task(self._executar(evento_id, semaforo))
+            self._ativos.add(task)
+            task.add_done_callback(self._ativos.discard)
+
+    # ==================== VARREDURA ====================
+
+    def _varrer(self, limpar: bool = False) -> list:
+        agora = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            # "processando" órfão: worker morreu no meio
+            recuperados = db.execute(text(
+                "UPDATE webhook_eventos SET status = 'pendente', proxima_tentativa_em = NULL, atualizado_em = :agora "
+                "WHERE status = 'processando' AND atualizado_em < :limite"
+            ), {"agora": agora, "limite": agora - timedelta(seconds=WEBHOOK_PROCESSANDO_TIMEOUT)}).rowcount
+            if recuperados:
+                self.contadores["recuperados"] += recuperados
+                logger.warning(f"{recuperados} webhook(s) órfão(s) devolvido(s) à fila")
+            if limpar:
+                db.execute(text(
+                    "DELETE FROM webhook_eventos WHERE status = 'ok' AND criado_em < :limite"
+                ), {"limite": agora - timedelta(days=WEBHOOK_RETENCAO_DIAS)})
+            pendentes = db.execute(_SQL_PENDENTES, {"agora": agora, "lote": _VARREDURA_LOTE}).fetchall()
+            db.commit()
+            return [(int(r[0]), r[1]) for r in pendentes]
+        finally:
+            db.close()
+
+    async def _varredura_loop(self):
+        ciclo = 0
+        while True:
+            try:
+                pendentes = await asyncio.to_thread(self._varrer, ciclo % _LIMPEZA_A_CADA == 0)
+                for evento_id, origem in pendentes:
+                    self._avisar(evento_id, origem)
+            except Exception as e:
+                logger.error(f"Erro na varredura de webhooks: {e}")
+            ciclo += 1
+            await asyncio.sleep(WEBHOOK_VARREDURA_SEGUNDOS)
+
+    # ==================== CICLO DE VIDA ====================
+
+    async def start(self, ws_manager=None):
+        self.ws_manager = ws_manager
+        limites = {"bot": WEBHOOK_CONCORRENCIA_BOT, "pagamentos": WEBHOOK_CONCORRENCIA_PAGAMENTOS}
+        for grupo, limite in limites.items():
+            self._filas[grupo] = asyncio.Queue()
+            self._semaforos[grupo] = asyncio.Semaphore(max(1, limite))
+            self._tasks.append(asyncio.create_task(self._despachar(grupo)))
+        self._tasks.append(asyncio.create_task(self._varredura_loop()))
+        logger.info(f"Fila de webhooks iniciada (bot={limites['bot']}, pagamentos={limites['pagamentos']})")
+
+    async def stop(self):
+        for task in self._tasks + list(self._ativos):
+            task.cancel()
+        for task in self._tasks + list(self._ativos):
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+        # Interrompidos no shutdown voltam a pendente (sem esperar o timeout de órfão)
+        if self._em_processamento:
+            ids = list(self._em_processamento)
+            db = SessionLocal()
+            try:
+                for evento_id in ids:
+                    db.execute(text(
+                        "UPDATE webhook_eventos SET status = 'pendente' WHERE id = :id AND status = 'processando'"
+                    ), {"id": evento_id})
+                db.commit()
+            except Exception as e:
+                logger.warning(f"Não foi possível devolver webhooks em processamento: {e}")
+            finally:
+                db.close()
+        self._tasks, self._filas, self._semaforos, self._conversas = [], {}, {}, {}
+        self._vez_de.clear()
+        self._na_fila.clear()
+        self._em_processamento.clear()
+
+    def stats(self) -> dict:
+        return {
+            "concorrencia": {"bot": WEBHOOK_CONCORRENCIA_BOT, "pagamentos": WEBHOOK_CONCORRENCIA_PAGAMENTOS},
+            "na_fila": len(self._na_fila),
+            "em_processamento": len(self._em_processamento),
+            "conversas_ativas": len(self._conversas),
+            "espera_p50_ms": self._espera.percentil(50),
+            "espera_p95_ms": self._espera.percentil(95),
+            "processamento": {
+                origem: {"n": h.n, "p50_ms": h.percentil(50), "p95_ms": h.percentil(95)}
+                for origem, h in self._processamento.items() if h.n
+            },
+            **self.contadores,
+        }
+
+
+fila_webhooks = FilaWebhooks()
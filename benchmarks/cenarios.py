@@ -0,0 +1,160 @@
+"""
+Cenários dos caminhos quentes da API.
+Cada função faz UMA request e retorna o status HTTP.
+"""
+
+import uuid
+
+from .dataset import criar_pedido_para_despacho
+from .harness import Cenario
+
+
+def _auth(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+async def _site_produtos(client, ctx, i):
+    r = await client.get(f"/site/{ctx['codigo_acesso']}/produtos")
+    return r.status_code
+
+
+async def _site_info(client, ctx, i):
+    r = await client.get(f"/site/{ctx['codigo_acesso']}")
+    return r.status_code
+
+
+async def _carrinho_adicionar(client, ctx, i):
+    # Carrinhos realistas: sessão nova a cada 5 itens
+    produto_id = ctx["produto_ids"][i % len(ctx["produto_ids"])]
+    r = await client.post(
+        "/carrinho/adicionar",
+        json={"produto_id": produto_id, "quantidade": 1},
+        headers={"X-Session-ID": f"bench-add-{ctx['_rodada']}-{i // 5}"},
+    )
+    return r.status_code
+
+
+async def _carrinho_get(client, ctx, i):
+    sessao = f"bench-get-{ctx['_rodada']}"
+    if i == 0:
+        for n in range(3):
+            await client.post(
+                "/carrinho/adicionar",
+                json={"produto_id": ctx["produto_ids"][n], "quantidade": 1},
+                headers={"X-Session-ID": sessao},
+            )
+    r = await client.get(
+        "/carrinho/",
+        params={"codigo_acesso": ctx["codigo_acesso"]},
+        headers={"X-Session-ID": sessao},
+    )
+    return r.status_code
+
+
+async def _checkout(client, ctx, i):
+    # Carrinho novo por iteração, criado em _preparar_checkout (fora da medição)
+    sessao = ctx["_preparo"]
+    r = await client.post(
+        "/carrinho/finalizar",
+        json={
+            "codigo_acesso": ctx["codigo_acesso"],
+            "cliente_nome": "Cliente Benchmark",
+            "cliente_telefone": "11999990000",
+            "tipo_entrega": "retirada",
+            "forma_pagamento": "Dinheiro",
+        },
+        headers={"X-Session-ID": sessao},
+    )
+    return r.status_code
+
+
+def _preparar_checkout(ctx, i):
+    """Cria carrinho com 2 itens direto no BD (fora da medição)."""
+    from backend.app import models
+    from backend.app.database import SessionLocal
+    from datetime import datetime, timedelta
+
+    sessao = str(uuid.uuid4())
+    db = SessionLocal()
+    try:
+        itens = []
+        for pid in ctx["produto_ids"][:2]:
+            p = db.query(models.Produto).filter(models.Produto.id == pid).first()
+            itens.append({
+                "produto_id": p.id, "nome": p.nome, "variacoes": [], "observacoes": None,
+                "quantidade": 1, "preco_unitario": p.preco, "subtotal": p.preco,
+            })
+        subtotal = sum(i["subtotal"] for i in itens)
+        db.add(models.Carrinho(
+            restaurante_id=ctx["restaurante_id"],
+            sessao_id=sessao,
+            itens_json=itens,
+            valor_subtotal=subtotal,
+            valor_total=subtotal,
+            data_expiracao=datetime.utcnow() + timedelta(hours=24),
+        ))
+        db.commit()
+    finally:
+        db.close()
+    return sessao
+
+
+async def _gps_update(client, ctx, i):
+    motoboy_id = ctx["motoboy_ids"][i % len(ctx["motoboy_ids"])]
+    r = await client.post("/api/gps/update", json={
+        "motoboy_id": motoboy_id,
+        "restaurante_id": ctx["restaurante_id"],
+        "latitude": -23.5505 + (i % 50) * 0.0001,
+        "longitude": -46.6333,
+        "velocidade": 32.5,
+    })
+    return r.status_code
+
+
+async def _kds_listar(client, ctx, i):
+    r = await client.get("/kds/pedidos", headers=_auth(ctx["token_cozinheiro"]))
+    return r.status_code
+
+
+async def _despachar(client, ctx, i):
+    motoboy_id = ctx["motoboy_ids"][i % len(ctx["motoboy_ids"])]
+    r = await client.post(
+        f"/painel/pedidos/{ctx['_preparo']}/despachar",
+        json={"motoboy_id": motoboy_id},
+        headers=_auth(ctx["token_restaurante"]),
+    )
+    return r.status_code
+
+
+async def _motoboy_pendentes(client, ctx, i):
+    r = await client.get("/motoboy/entregas/pendentes", headers=_auth(ctx["token_motoboy"]))
+    return r.status_code
+
+
+async def _bot_webhook(client, ctx, i):
+    r = await client.post("/webhooks/evolution", json={
+        "event": "messages.upsert",
+        "instance": "bench-instancia-inexistente",
+        "data": {
+            "key": {"id": f"bench-{uuid.uuid4().hex}", "fromMe": False,
+                    "remoteJid": "5511999990000@s.whatsapp.net"},
+            "message": {"conversation": "Oi, quero fazer um pedido"},
+        },
+    })
+    return r.status_code
+
+
+CENARIOS = [
+    Cenario("site_produtos", "GET /site/{codigo}/produtos (cardápio público)", _site_produtos),
+    Cenario("site_info", "GET /site/{codigo}", _site_info),
+    Cenario("carrinho_adicionar", "POST /carrinho/adicionar", _carrinho_adicionar),
+    Cenario("carrinho_get", "GET /carrinho/", _carrinho_get),
+    Cenario("checkout", "POST /carrinho/finalizar", _checkout, preparar=_preparar_checkout),
+    Cenario("gps_update", "POST /api/gps/update", _gps_update),
+    Cenario("kds_listar", "GET /kds/pedidos", _kds_listar),
+    # Leitura antes do despacho: despachar acrescenta entregas aos motoboys
+    Cenario("motoboy_pendentes", "GET /motoboy/entregas/pendentes", _motoboy_pendentes),
+    Cenario("despachar", "POST /painel/pedidos/{id}/despachar",
+            _despachar, preparar=lambda ctx, i: criar_pedido_para_despacho(ctx)),
+    Cenario("bot_webhook", "POST /webhooks/evolution", _bot_webhook),
+]
@@ -0,0 +1,200 @@
+"""
+Dataset realista para os benchmarks.
+
+Usa os seeds oficiais (database/seed) para super admin, planos, restaurante
+de teste, categorias, config e cardápio de pizzaria, e completa com o que os
+caminhos quentes precisam: motoboys online com GPS, cozinheiro + KDS ativo,
+histórico de pedidos, pedidos na cozinha e entregas pendentes.
+
+Importar este módulo SÓ depois de DATABASE_URL estar definido (runner.py).
+"""
+
+import random
+from datetime import datetime, timedelta
+
+import database.models  # noqa: F401  (registra models no Base)
+from database.seed import run_all_seeds
+from database.seed.seed_003_restaurante_teste import RestauranteTesteSeed
+
+from backend.app import models
+from backend.app.auth import create_access_token, get_password_hash
+from backend.app.database import engine, Base, SessionLocal
+
+# Volume padrão (ajustável via runner --escala)
+PEDIDOS_HISTORICO = 2000
+PEDIDOS_COZINHA = 40
+MOTOBOYS = 8
+ENTREGAS_PENDENTES_POR_MOTOBOY = 3
+
+
+def _pedido(rest, comanda: int, produtos: list, status: str, criado_em: datetime) -> models.Pedido:
+    escolhidos = random.sample(produtos, k=min(len(produtos), random.randint(1, 4)))
+    itens = [
+        {
+            "produto_id": p.id,
+            "nome": p.nome,
+            "quantidade": 1,
+            "preco_unitario": p.preco,
+            "subtotal": p.preco,
+            "variacoes": [],
+        }
+        for p in escolhidos
+    ]
+    total = round(sum(i["subtotal"] for i in itens), 2)
+    return models.Pedido(
+        restaurante_id=rest.id,
+        comanda=str(comanda),
+        tipo="Entrega",
+        origem="site",
+        tipo_entrega="entrega",
+        cliente_nome=f"Cliente Bench {comanda}",
+        cliente_telefone=f"119{comanda:08d}"[:11],
+        endereco_entrega="Rua Bench, 100 - Centro, São Paulo - SP",
+        latitude_entrega=rest.latitude + random.uniform(-0.02, 0.02),
+        longitude_entrega=rest.longitude + random.uniform(-0.02, 0.02),
+        itens="\n".join(f"1x {i['nome']}" for i in itens),
+        carrinho_json=itens,
+        valor_subtotal=total,
+        valor_total=total,
+        forma_pagamento="Dinheiro",
+        status=status,
+        historico_status=[{"status": status, "timestamp": criado_em.isoformat()}],
+        data_criacao=criado_em,
+    )
+
+
+def preparar_dataset(escala: float = 1.0, seed_aleatoria: int = 42) -> dict:
+    """
+    Cria tabelas, roda os seeds e popula o volume de benchmark.
+    Retorna o contexto usado pelos cenários (ids, códigos e tokens).
+    """
+    random.seed(seed_aleatoria)
+    Base.metadata.create_all(bind=engine)
+
+    db = SessionLocal()
+    try:
+        # 1ª passada: globais (admin, planos, restaurante teste); 2ª: seeds multi-tenant
+        run_all_seeds(db, verbose=False)
+        rest = db.query(models.Restaurante).filter(
+            models.Restaurante.email == RestauranteTesteSeed.EMAIL_TESTE
+        ).first()
+        run_all_seeds(db, verbose=False, restaurante_id=rest.id)
+        rest.billing_status = "active"
+        rest.plano = "Premium"
+        rest.plano_tier = 4
+
+        config = db.query(models.ConfigRestaurante).filter(
+            models.ConfigRestaurante.restaurante_id == rest.id
+        ).first()
+        config.status_atual = "aberto"
+        config.impressao_automatica = False
+
+        if not db.query(models.SiteConfig).filter(models.SiteConfig.restaurante_id == rest.id).first():
+            db.add(models.SiteConfig(restaurante_id=rest.id, tipo_restaurante="pizzaria"))
+        if not db.query(models.ConfigCozinha).filter(models.ConfigCozinha.restaurante_id == rest.id).first():
+            db.add(models.ConfigCozinha(restaurante_id=rest.id, kds_ativo=True))
+
+        cozinheiro = db.query(models.Cozinheiro).filter(
+            models.Cozinheiro.restaurante_id == rest.id
+        ).first()
+        if not cozinheiro:
+            cozinheiro = models.Cozinheiro(
+                restaurante_id=rest.id,
+                nome="Chef Bench",
+                login="chef",
+                senha_hash=get_password_hash("123456"),
+                modo="todos",
+            )
+            db.add(cozinheiro)
+
+        motoboys = db.query(models.Motoboy).filter(models.Motoboy.restaurante_id == rest.id).all()
+        agora = datetime.utcnow()
+        for i in range(len(motoboys), max(1, int(MOTOBOYS * escala))):
+            m = models.Motoboy(
+                restaurante_id=rest.id,
+                nome=f"Motoboy Bench {i}",
+                usuario=f"moto{i}",
+                telefone=f"1198888{i:04d}",
+                status="ativo",
+                disponivel=True,
+                latitude_atual=rest.latitude,
+                longitude_atual=rest.longitude,
+                ultima_atualizacao_gps=agora,
+                ordem_hierarquia=i,
+            )
+            m.set_senha("123456")
+            db.add(m)
+            motoboys.append(m)
+        db.flush()
+
+        produtos = db.query(models.Produto).filter(
+            models.Produto.restaurante_id == rest.id,
+            models.Produto.disponivel == True,
+        ).all()
+
+        ja_criados = db.query(models.Pedido).filter(models.Pedido.restaurante_id == rest.id).count()
+        total_historico = int(PEDIDOS_HISTORICO * escala)
+        if ja_criados < total_historico:
+            comanda = ja_criados
+            # Histórico: últimos 90 dias, maioria entregue
+            for _ in range(total_historico - ja_criados):
+                comanda += 1
+                criado = agora - timedelta(minutes=random.randint(60, 90 * 24 * 60))
+                db.add(_pedido(rest, comanda, produtos, "entregue", criado))
+
+            # Cozinha: pedidos ativos no KDS
+            for _ in range(int(PEDIDOS_COZINHA * escala)):
+                comanda += 1
+                p = _pedido(rest, comanda, produtos, "em_preparo", agora - timedelta(minutes=random.randint(1, 50)))
+                db.add(p)
+                db.flush()
+                db.add(models.PedidoCozinha(
+                    restaurante_id=rest.id,
+                    pedido_id=p.id,
+                    status=random.choice(["NOVO", "FAZENDO", "FEITO"]),
+                    criado_em=p.data_criacao,
+                ))
+
+            # Entregas pendentes por motoboy (lista do app do entregador)
+            for m in motoboys:
+                for _ in range(ENTREGAS_PENDENTES_POR_MOTOBOY):
+                    comanda += 1
+                    p = _pedido(rest, comanda, produtos, "saiu_entrega", agora - timedelta(minutes=20))
+                    p.despachado = True
+                    db.add(p)
+                    db.flush()
+                    db.add(models.Entrega(
+                        pedido_id=p.id,
+                        motoboy_id=m.id,
+                        status="pendente",
+                        atribuido_em=agora - timedelta(minutes=10),
+                    ))
+
+        db.commit()
+
+        return {
+            "restaurante_id": rest.id,
+            "codigo_acesso": rest.codigo_acesso,
+            "produto_ids": [p.id for p in produtos],
+            "motoboy_ids": [m.id for m in motoboys],
+            "token_restaurante": create_access_token({"sub": str(rest.id), "role": "restaurante"}),
+            "token_cozinheiro": create_access_token({"sub": str(cozinheiro.id), "role": "cozinheiro"}),
+            "token_motoboy": create_access_token({"sub": str(motoboys[0].id), "role": "motoboy"}),
+        }
+    finally:
+        db.close()
+
+
+def criar_pedido_para_despacho(ctx: dict) -> int:
+    """Pedido pronto para despacho (setup fora da medição)."""
+    db = SessionLocal()
+    try:
+        rest = db.query(models.Restaurante).filter(models.Restaurante.id == ctx["restaurante_id"]).first()
+        produtos = db.query(models.Produto).filter(models.Produto.id.in_(ctx["produto_ids"][:10])).all()
+        ultimo = db.query(models.Pedido.id).order_by(models.Pedido.id.desc()).first()
+        pedido = _pedido(rest, (ultimo[0] if ultimo else 0) + 100000, produtos, "pronto", datetime.utcnow())
+        db.add(pedido)
+        db.commit()
+        return pedido.id
+    finally:
+        db.close()
@@ -0,0 +1,181 @@
+"""
+Núcleo do harness: contador de queries, medição de latência e baseline JSON.
+"""
+
+import json
+import math
+import platform
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import event
+
+BASELINES_DIR = Path(__file__).resolve().parent / "baselines"
+
+# Tolerâncias da comparação com o baseline. As de latência só absorvem ruído
+# de uma máquina ociosa; com carga concorrente use comparar(..., latencia=False).
+TOLERANCIA_LATENCIA_PCT = 25.0   # p95 pode piorar até 25% (ruído de máquina)
+TOLERANCIA_LATENCIA_MS = 5.0     # ...e sempre até 5ms (cenários rápidos são ruidosos)
+TOLERANCIA_QUERIES = 0           # queries/request é determinístico: qualquer aumento é regressão
+
+
+class QueryCounter:
+    """Conta statements SQL executados no engine (before_cursor_execute)."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.total = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.total += 1
+
+    def close(self):
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
+
+
+class Cenario:
+    """
+    Um caminho quente da API.
+
+    executar(client, ctx, i) faz UMA request e retorna o status HTTP.
+    preparar(ctx, i), se informado, roda antes de cada iteração fora da medição
+    (ex: criar pedido para despacho) e o retorno fica em ctx["_preparo"].
+    """
+
+    def __init__(
+        self,
+        nome: str,
+        descricao: str,
+        executar: Callable[..., Awaitable[int]],
+        preparar: Optional[Callable[[dict, int], object]] = None,
+        status_esperado: tuple = (200,),
+    ):
+        self.nome = nome
+        self.descricao = descricao
+        self.executar = executar
+        self.preparar = preparar
+        self.status_esperado = status_esperado
+
+
+def percentil(valores: List[float], p: float) -> float:
+    """Percentil por nearest-rank sobre valores já ordenados."""
+    if not valores:
+        return 0.0
+    idx = max(0, min(len(valores) - 1, math.ceil(len(valores) * p / 100) - 1))
+    return valores[idx]
+
+
+async def medir(cenario: Cenario, client, ctx: dict, contador: QueryCounter,
+                iteracoes: int, aquecimento: int = 5) -> Dict:
+    """Roda o cenário N vezes e retorna latências (ms) e queries por request."""
+    latencias = []
+    queries = []
+    erros = 0
+
+    for i in range(aquecimento + iteracoes):
+        if cenario.preparar:
+            ctx["_preparo"] = cenario.preparar(ctx, i)
+
+        antes = contador.total
+        inicio = time.perf_counter()
+        status = await cenario.executar(client, ctx, i)
+        duracao_ms = (time.perf_counter() - inicio) * 1000
+        n_queries = contador.total - antes
+
+        if i < aquecimento:
+            continue
+        if status not in cenario.status_esperado:
+            erros += 1
+        latencias.append(duracao_ms)
+        queries.append(n_queries)
+
+    latencias.sort()
+    return {
+        "iteracoes": iteracoes,
+        "erros": erros,
+        "p50_ms": round(percentil(latencias, 50), 3),
+        "p95_ms": round(percentil(latencias, 95), 3),
+        "p99_ms": round(percentil(latencias, 99), 3),
+        "media_ms": round(sum(latencias) / max(len(latencias), 1), 3),
+        "queries_por_request": round(sum(queries) / max(len(queries), 1), 2),
+        "queries_max": max(queries) if queries else 0,
+    }
+
+
+def caminho_baseline(dialeto: str) -> Path:
+    return BASELINES_DIR / f"{dialeto}.json"
+
+
+def carregar_baseline(dialeto: str) -> Optional[dict]:
+    caminho = caminho_baseline(dialeto)
+    if not caminho.exists():
+        return None
+    return json.loads(caminho.read_text(encoding="utf-8"))
+
+
+def salvar_baseline(dialeto: str, resultados: Dict[str, dict], parametros: dict):
+    BASELINES_DIR.mkdir(parents=True, exist_ok=True)
+    dados = {
+        "gerado_em": datetime.utcnow().replace(microsecond=0).isoformat() + "Z",
+        "python": platform.python_version(),
+        "parametros": parametros,
+        "cenarios": resultados,
+    }
+    caminho_baseline(dialeto).write_text(
+        json.dumps(dados, indent=2, ensure_ascii=False, sort_keys=True) + "\n",
+        encoding="utf-8",
+    )
+
+
+def comparar(resultados: Dict[str, dict], baseline: Optional[dict],
+             parametros: Optional[dict] = None, latencia: bool = True) -> List[str]:
+    """
+    Retorna lista de regressões (vazia = OK).
+
+    Queries/request só é comparado com os mesmos parâmetros do baseline:
+    cenários de escrita (ex: despachar) acumulam dados a cada iteração.
+    latencia=False ignora o p95 (máquinas compartilhadas/CI).
+    """
+    if not baseline:
+        return []
+    regressoes = []
+    base = baseline.get("cenarios", {})
+    mesmos_parametros = parametros is None or parametros == baseline.get("parametros")
+    for nome, atual in resultados.items():
+        ref = base.get(nome)
+        if not ref:
+            continue
+        if mesmos_parametros and atual["queries_por_request"] > ref["queries_por_request"] + TOLERANCIA_QUERIES:
+            regressoes.append(
+                f"{nome}: queries/request {ref['queries_por_request']} → {atual['queries_por_request']}"
+            )
+        limite = max(ref["p95_ms"] * (1 + TOLERANCIA_LATENCIA_PCT / 100),
+                     ref["p95_ms"] + TOLERANCIA_LATENCIA_MS)
+        if latencia and atual["p95_ms"] > limite:
+            regressoes.append(
+                f"{nome}: p95 {ref['p95_ms']}ms → {atual['p95_ms']}ms (limite {limite:.1f}ms)"
+            )
+        # Só erros novos: um cenário já quebrado no baseline não bloqueia os demais
+        if atual["erros"] > ref.get("erros", 0):
+            regressoes.append(f"{nome}: {atual['erros']} respostas com status inesperado")
+    return regressoes
+
+
+def formatar_tabela(resultados: Dict[str, dict], baseline: Optional[dict]) -> str:
+    base = (baseline or {}).get("cenarios", {})
+    linhas = [
+        f"{'cenário':<24}{'p50':>9}{'p95':>9}{'p99':>9}{'q/req':>8}{'Δq':>6}{'Δp95':>8}{'erros':>7}",
+        "-" * 80,
+    ]
+    for nome, r in resultados.items():
+        ref = base.get(nome)
+        dq = f"{r['queries_por_request'] - ref['queries_por_request']:+.0f}" if ref else "-"
+        dp = f"{(r['p95_ms'] / ref['p95_ms'] - 1) * 100:+.0f}%" if ref and ref["p95_ms"] else "-"
+        linhas.append(
+            f"{nome:<24}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}"
+            f"{r['queries_por_request']:>8.1f}{dq:>6}{dp:>8}{r['erros']:>7}"
+        )
+    return "\n".join(linhas)
@@ -0,0 +1,114 @@
+"""
+CLI do benchmark: prepara o banco, roda os cenários e compara com o baseline.
+"""
+
+import os
+import sys
+import uuid
+import asyncio
+import logging
+import argparse
+import tempfile
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+
+def _configurar_ambiente(database_url: str):
+    """Env ANTES de importar a app (database.py lê DATABASE_URL no import)."""
+    sys.path.insert(0, str(PROJECT_ROOT))
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("SECRET_KEY", "benchmark-secret-key")
+    os.environ.setdefault("ENVIRONMENT", "testing")
+    # Sem Redis/Mapbox: mede o caminho do banco, sem rede externa
+    os.environ.pop("REDIS_URL", None)
+    os.environ.pop("MAPBOX_TOKEN", None)
+
+
+async def _rodar(args, dialeto: str) -> int:
+    import httpx
+
+    from backend.app.main import app
+    from backend.app.database import engine
+    from .dataset import preparar_dataset
+    from .cenarios import CENARIOS
+    from . import harness
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    ctx = preparar_dataset(escala=args.escala)
+    ctx["_rodada"] = uuid.uuid4().hex[:8]
+
+    selecionados = CENARIOS
+    if args.cenarios:
+        nomes = {n.strip() for n in args.cenarios.split(",") if n.strip()}
+        selecionados = [c for c in CENARIOS if c.nome in nomes]
+        desconhecidos = nomes - {c.nome for c in selecionados}
+        if desconhecidos:
+            print(f"Cenários desconhecidos: {', '.join(sorted(desconhecidos))}")
+            return 2
+
+    contador = harness.QueryCounter(engine)
+    resultados = {}
+    # Exceções da app viram 500 (contadas como erro) em vez de abortar o benchmark
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench.local") as client:
+            for cenario in selecionados:
+                resultados[cenario.nome] = await harness.medir(
+                    cenario, client, ctx, contador, iteracoes=args.iteracoes,
+                )
+                print(f"  ✓ {cenario.nome:<22} {cenario.descricao}")
+    finally:
+        contador.close()
+
+    baseline = harness.carregar_baseline(dialeto)
+    print()
+    print(harness.formatar_tabela(resultados, baseline))
+    print()
+
+    parametros = {"iteracoes": args.iteracoes, "escala": args.escala}
+    if args.salvar_baseline:
+        harness.salvar_baseline(dialeto, resultados, parametros)
+        print(f"Baseline salvo em {harness.caminho_baseline(dialeto)}")
+        return 0
+
+    regressoes = harness.comparar(resultados, baseline, parametros,
+                                   latencia=not args.so_queries)
+    if baseline is None:
+        print(f"Sem baseline para '{dialeto}' — rode com --salvar-baseline")
+        return 0
+    if regressoes:
+        print("REGRESSÕES:")
+        for r in regressoes:
+            print(f"  ✗ {r}")
+        return 1
+    print("Sem regressões em relação ao baseline")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dos caminhos quentes da API")
+    parser.add_argument("--iteracoes", type=int, default=100)
+    parser.add_argument("--escala", type=float, default=1.0, help="Multiplicador do volume do dataset")
+    parser.add_argument("--cenarios", default="", help="Lista separada por vírgula (padrão: todos)")
+    parser.add_argument("--database-url", default="", help="Padrão: SQLite temporário")
+    parser.add_argument("--salvar-baseline", action="store_true")
+    parser.add_argument("--so-queries", action="store_true",
+                        help="Compara só queries/request e erros (p95 exige máquina ociosa)")
+    args = parser.parse_args()
+
+    tmp_db = None
+    database_url = args.database_url
+    if not database_url:
+        tmp_db = Path(tempfile.mkdtemp()) / "benchmark.db"
+        database_url = f"sqlite:///{tmp_db}"
+    dialeto = "sqlite" if database_url.startswith("sqlite") else "postgresql"
+
+    _configurar_ambiente(database_url)
+    try:
+        codigo = asyncio.run(_rodar(args, dialeto))
+    finally:
+        if tmp_db and tmp_db.exists():
+            tmp_db.unlink()
+    sys.exit(codigo)
@@ -19,7 +19,7 @@ DEFAULT_CONFIG = {
     "ignorar_prefixo": "Derekh_",
     "auto_criar_pedido": False,
     "codepage": "CP860",
-    "poll_interval": 2.0,
+    "rescan_interval": 5.0,  # varredura de segurança; a captura é por notificação do spooler
 }
 
 
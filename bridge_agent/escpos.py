@@ -0,0 +1,331 @@
+# escpos.py — cópia idêntica em bridge_agent/ e virtual_printer/ (cada ferramenta é
+# distribuída sozinha); tests/test_escpos_golden.py garante que não divergem.
+
+"""
+Decodificador ESC/POS compartilhado (Bridge Agent e impressora virtual).
+
+Passada única sobre os bytes:
+- Trechos de texto entre comandos são copiados em bloco (bytes.find do
+  próximo prefixo + translate dos controles soltos), sem andar byte a byte
+- Comandos são pulados pela tabela de tamanhos (ESC, GS, FS, DLE), inclusive
+  os de tamanho variável (imagens raster, bit image, barcode, GS ( / FS ()
+- Texto e texto anotado ([ALIGN:CENTER], [CUT:FULL]...) saem da mesma passada
+"""
+
+from typing import Callable, Dict, Optional, Tuple, Union
+
+ESC, GS, FS, DLE = 0x1B, 0x1D, 0x1C, 0x10
+
+# Controles soltos no meio do texto (tudo < 0x20 exceto TAB, LF e CR) são descartados
+_SOLTOS = bytes(b for b in range(0x20) if b not in (0x09, 0x0A, 0x0D))
+
+
+# ── Tamanhos variáveis (retornam o total de bytes a partir do prefixo) ───────
+
+def _u16(data: bytes, pos: int) -> int:
+    if pos + 1 >= len(data):
+        return 0
+    return data[pos] + (data[pos + 1] << 8)
+
+
+def _com_bloco(offset_tamanho: int) -> Callable[[bytes, int], int]:
+    """Comandos "<prefixo> <cmd> fn pL pH d1..dk" (GS ( / FS ()."""
+    def tamanho(data: bytes, i: int) -> int:
+        return offset_tamanho + 2 + _u16(data, i + offset_tamanho)
+    return tamanho
+
+
+def _esc_bit_image(data: bytes, i: int) -> int:
+    # ESC * m nL nH d1..dk — k = n (8 pontos) ou 3n (24 pontos)
+    if i + 2 >= len(data):
+        return 2
+    n = _u16(data, i + 3)
+    return 5 + (n * 3 if data[i + 2] in (32, 33) else n)
+
+
+def _esc_tabulacao(data: bytes, i: int) -> int:
+    # ESC D n1..nk NUL
+    fim = data.find(b"\x00", i + 2, i + 35)
+    return (fim + 1 - i) if fim != -1 else 2
+
+
+def _esc_caracteres_usuario(data: bytes, i: int) -> int:
+    # ESC & y c1 c2 [x d1..d(y*x)]...
+    if i + 4 >= len(data):
+        return len(data) - i
+    y, c1, c2 = data[i + 2], data[i + 3], data[i + 4]
+    pos = i + 5
+    for _ in range(max(0, c2 - c1 + 1)):
+        if pos >= len(data):
+            break
+        pos += 1 + y * data[pos]
+    return pos - i
+
+
+def _gs_corte(data: bytes, i: int) -> int:
+    # GS V m | GS V m n (m = 65/66/97/98/103/104)
+    if i + 2 >= len(data):
+        return 2
+    return 4 if data[i + 2] >= 65 else 3
+
+
+def _gs_barcode(data: bytes, i: int) -> int:
+    # GS k m d1..dk NUL (m <= 6) | GS k m n d1..dn
+    if i + 2 >= len(data):
+        return 2
+    if data[i + 2] <= 6:
+        fim = data.find(b"\x00", i + 3)
+        return (fim + 1 - i) if fim != -1 else len(data) - i
+    if i + 3 >= len(data):
+        return 3
+    return 4 + data[i + 3]
+
+
+def _gs_raster(data: bytes, i: int) -> int:
+    # GS v 0 m xL xH yL yH d1..dk — k = x * y
+    return 8 + _u16(data, i + 4) * _u16(data, i + 6)
+
+
+def _gs_imagem_definida(data: bytes, i: int) -> int:
+    # GS * x y d1..d(x*y*8)
+    if i + 3 >= len(data):
+        return len(data) - i
+    return 4 + data[i + 2] * data[i + 3] * 8
+
+
+def _gs_bloco_longo(data: bytes, i: int) -> int:
+    # GS 8 L p1 p2 p3 p4 ... — tamanho em 32 bits
+    if i + 6 >= len(data):
+        return len(data) - i
+    return 7 + int.from_bytes(data[i + 3:i + 7], "little")
+
+
+def _fs_imagem_nv(data: bytes, i: int) -> int:
+    # FS q n [xL xH yL yH d1..d(x*y*8)]...
+    if i + 2 >= len(data):
+        return 2
+    pos = i + 3
+    for _ in range(data[i + 2]):
+        if pos + 3 >= len(data):
+            break
+        pos += 4 + _u16(data, pos) * _u16(data, pos + 2) * 8
+    return pos - i
+
+
+# ── Tabela de comandos: byte do comando → (nome, parâmetros fixos | função) ──
+
+Tamanho = Union[int, Callable[[bytes, int], int]]
+
+COMANDOS: Dict[int, Dict[int, Tuple[str, Tamanho]]] = {
+    ESC: {
+        0x0C: ("PRINT_PAGE", 0),
+        0x20: ("CHAR_SPACING", 1),
+        0x21: ("STYLE", 1),
+        0x24: ("POSITION", 2),
+        0x25: ("USER_CHARSET", 1),
+        0x26: ("DEFINE_CHARS", _esc_caracteres_usuario),
+        0x2A: ("BIT_IMAGE", _esc_bit_image),
+        0x2D: ("UNDERLINE", 1),
+        0x32: ("LINE_SPACING_DEF", 0),
+        0x33: ("LINE_SPACING", 1),
+        0x3D: ("PERIPHERAL", 1),
+        0x3F: ("CANCEL_CHARS", 1),
+        0x40: ("INIT", 0),
+        0x44: ("TABS", _esc_tabulacao),
+        0x45: ("EMPHASIZE", 1),
+        0x47: ("DOUBLE_STRIKE", 1),
+        0x4A: ("FEED_DOTS", 1),
+        0x4B: ("REVERSE_FEED_DOTS", 1),
+        0x4C: ("PAGE_MODE", 0),
+        0x4D: ("FONT", 1),
+        0x52: ("CHARSET", 1),
+        0x53: ("STANDARD_MODE", 0),
+        0x54: ("PRINT_DIRECTION", 1),
+        0x56: ("ROTATE", 1),
+        0x57: ("PRINT_AREA", 8),
+        0x5C: ("RELATIVE_POSITION", 2),
+        0x61: ("ALIGN", 1),
+        0x63: ("PANEL_BUTTON", 2),        # ESC c 3/4/5 n
+        0x64: ("FEED_N", 1),
+        0x65: ("REVERSE_FEED_N", 1),
+        0x69: ("CUT_PARTIAL", 0),
+        0x6D: ("CUT_PARTIAL", 0),
+        0x70: ("PULSE", 3),               # ESC p m t1 t2
+        0x72: ("COLOR", 1),
+        0x74: ("CODEPAGE", 1),
+        0x75: ("PERIPHERAL_STATUS", 1),
+        0x76: ("PAPER_STATUS", 0),
+        0x7B: ("UPSIDE_DOWN", 1),
+    },
+    GS: {
+        0x21: ("SIZE", 1),
+        0x24: ("VERTICAL_POSITION", 2),
+        0x28: ("GS_EXT", _com_bloco(3)),
+        0x2A: ("DEFINE_IMAGE", _gs_imagem_definida),
+        0x2F: ("PRINT_IMAGE", 1),
+        0x3A: ("MACRO", 0),
+        0x38: ("GS_EXT_LONG", _gs_bloco_longo),
+        0x42: ("REVERSE", 1),
+        0x48: ("HRI_POSITION", 1),
+        0x49: ("PRINTER_ID", 1),
+        0x4C: ("LEFT_MARGIN", 2),
+        0x50: ("MOTION_UNITS", 2),
+        0x56: ("CUT", _gs_corte),
+        0x57: ("PRINT_WIDTH", 2),
+        0x5C: ("RELATIVE_VERTICAL", 2),
+        0x5E: ("RUN_MACRO", 3),
+        0x61: ("AUTO_STATUS", 1),
+        0x62: ("SMOOTHING", 1),
+        0x63: ("COUNTER", 0),
+        0x66: ("HRI_FONT", 1),
+        0x68: ("BARCODE_HEIGHT", 1),
+        0x6B: ("BARCODE", _gs_barcode),
+        0x72: ("STATUS", 1),
+        0x76: ("RASTER_IMAGE", _gs_raster),
+        0x77: ("BARCODE_WIDTH", 1),
+    },
+    FS: {
+        0x21: ("KANJI_MODE", 1),
+        0x26: ("KANJI_ON", 0),
+        0x28: ("FS_EXT", _com_bloco(3)),
+        0x2D: ("KANJI_UNDERLINE", 1),
+        0x2E: ("KANJI_OFF", 0),
+        0x32: ("DEFINE_KANJI", 74),
+        0x43: ("KANJI_CODE", 1),
+        0x53: ("KANJI_SPACING", 2),
+        0x57: ("KANJI_QUAD", 1),
+        0x70: ("PRINT_NV_IMAGE", 2),
+        0x71: ("DEFINE_NV_IMAGE", _fs_imagem_nv),
+    },
+    DLE: {
+        0x04: ("STATUS_REQUEST", 1),
+        0x05: ("REALTIME_REQUEST", 1),
+        0x14: ("REALTIME_COMMAND", 3),
+    },
+}
+
+PREFIXOS = {ESC: "ESC", GS: "GS", FS: "FS", DLE: "DLE"}
+
+ALIGN_NAMES = {0: "LEFT", 1: "CENTER", 2: "RIGHT", 48: "LEFT", 49: "CENTER", 50: "RIGHT"}
+CUT_NAMES = {0: "FULL", 1: "PARTIAL", 48: "FULL", 49: "PARTIAL", 65: "FULL", 66: "PARTIAL"}
+CODEPAGE_NAMES = {0: "CP437", 2: "CP850", 3: "CP860", 19: "CP858", 255: "UTF-8"}
+SIZE_NAMES = {
+    0x00: "NORMAL",
+    0x10: "DOUBLE_W",
+    0x01: "DOUBLE_H",
+    0x11: "DOUBLE_WH",
+}
+
+
+def _anotacao(nome: str, data: bytes, i: int, tamanho: Tamanho) -> str:
+    """Anotação legível de um comando: [NOME] ou [NOME:VALOR]."""
+    if not isinstance(tamanho, int) and nome != "CUT":
+        return f"[{nome}]"
+    if tamanho == 0 or i + 2 >= len(data):
+        return f"[{nome}]"
+    param = data[i + 2]
+
+    if nome == "ALIGN":
+        return f"[ALIGN:{ALIGN_NAMES.get(param, param)}]"
+    if nome == "STYLE":
+        partes = ["BOLD:ON" if param & 0x08 else "BOLD:OFF"]
+        if param & 0x10:
+            partes.append("DOUBLE_H")
+        if param & 0x20:
+            partes.append("DOUBLE_W")
+        return f"[STYLE:{'+'.join(partes)}]"
+    if nome == "CODEPAGE":
+        return f"[CODEPAGE:{CODEPAGE_NAMES.get(param, f'0x{param:02X}')}]"
+    if nome == "EMPHASIZE":
+        return f"[BOLD:{'ON' if param & 1 else 'OFF'}]"
+    if nome == "SIZE":
+        return f"[SIZE:{SIZE_NAMES.get(param, f'0x{param:02X}')}]"
+    if nome == "CUT":
+        return f"[CUT:{CUT_NAMES.get(param, f'0x{param:02X}')}]"
+    return f"[{nome}:{param}]"
+
+
+# (prefixo << 8 | comando) → (nome, tamanho): uma consulta por comando no laço
+_TABELA_PLANA = {
+    (prefixo << 8) | cmd: info
+    for prefixo, tabela in COMANDOS.items()
+    for cmd, info in tabela.items()
+}
+
+
+def separar(raw_bytes: bytes, anotar: bool = False) -> Tuple[bytes, Optional[bytes]]:
+    """
+    Separa texto de comandos numa passada.
+    Retorna (bytes do texto, bytes do texto com anotações ASCII ou None).
+    """
+    data = bytes(raw_bytes)
+    n = len(data)
+    find = data.find
+    tabela = _TABELA_PLANA
+    texto = []
+    anotado = [] if anotar else None
+
+    # Próxima ocorrência de cada prefixo (bytes.find = memchr, sem laço Python no
+    # texto); o módulo transforma o -1 de "não achou" em n
+    p_esc = find(b"\x1b") % (n + 1)
+    p_gs = find(b"\x1d") % (n + 1)
+    p_fs = find(b"\x1c") % (n + 1)
+    p_dle = find(b"\x10") % (n + 1)
+    i = 0
+
+    while i < n:
+        j = min(p_esc, p_gs, p_fs, p_dle)
+        if j > i:
+            texto.append(data[i:j])
+            if anotar:
+                anotado.append(data[i:j])
+        if j + 1 >= n:
+            # Fim do buffer (ou prefixo sem comando no último byte)
+            break
+
+        prefixo = data[j]
+        cmd = data[j + 1]
+        info = tabela.get((prefixo << 8) | cmd)
+        if info is not None:
+            tamanho = info[1]
+            i = j + (2 + tamanho if isinstance(tamanho, int) else max(2, tamanho(data, j)))
+            if anotar:
+                anotado.append(_anotacao(info[0], data, j, tamanho).encode())
+        elif prefixo == DLE:
+            # DLE sem comando conhecido: só o DLE é descartado
+            i = j + 1
+        else:
+            i = j + 2
+            if anotar:
+                anotado.append(f"[{PREFIXOS[prefixo]}:0x{cmd:02X}]".encode())
+
+        if p_esc < i:
+            p_esc = find(b"\x1b", i) % (n + 1)
+        if p_gs < i:
+            p_gs = find(b"\x1d", i) % (n + 1)
+        if p_fs < i:
+            p_fs = find(b"\x1c", i) % (n + 1)
+        if p_dle < i:
+            p_dle = find(b"\x10", i) % (n + 1)
+
+    # Controles soltos saem de uma vez (anotações são ASCII imprimível)
+    return (
+        b"".join(texto).translate(None, _SOLTOS),
+        b"".join(anotado).translate(None, _SOLTOS) if anotar else None,
+    )
+
+
+def decodificar(raw: bytes, codepage: str = "CP860") -> str:
+    """Decodifica bytes de texto com fallback de codepages."""
+    for cp in (codepage, "utf-8", "latin-1"):
+        try:
+            return raw.decode(cp)
+        except (UnicodeDecodeError, LookupError):
+            continue
+    return raw.decode("ascii", errors="replace")
+
+
+def tem_comandos(raw_bytes: bytes, amostra: int = 200) -> bool:
+    """Detecta se os bytes contêm prefixos de comando ESC/POS."""
+    inicio = raw_bytes[:amostra]
+    return any(p in inicio for p in (b"\x1b", b"\x1d", b"\x1c", b"\x10"))
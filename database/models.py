@@ -1324,6 +1324,36 @@ class PixCobranca(Base):
     )
 
 
+class ComandaSequencia(Base):
+    """Contador de comandas por restaurante (alocação atômica via UPDATE ... RETURNING)"""
+    __tablename__ = "comanda_sequencias"
+    restaurante_id = Column(Integer, ForeignKey("restaurantes.id", ondelete="CASCADE"), primary_key=True)
+    ultimo = Column(Integer, nullable=False, default=0)
+    dia = Column(Date)  # Último dia com comanda emitida (reset diário)
+    atualizado_em = Column(DateTime, default=datetime.utcnow)
+
+
+class WebhookEvento(Base):
+    """Fila durável de webhooks recebidos (Evolution, Meta, Asaas, Woovi).
+    O endpoint só valida, grava aqui e responde; consumidores processam com retry."""
+    __tablename__ = "webhook_eventos"
+    id = Column(Integer, primary_key=True, index=True)
+    origem = Column(String(20), nullable=False)  # evolution | meta | asaas | woovi
+    dedup_key = Column(String(200), nullable=False)
+    payload_json = Column(JSON)
+    status = Column(String(20), default="pendente")  # pendente | processando | ok | erro
+    tentativas = Column(Integer, default=0)
+    proxima_tentativa_em = Column(DateTime)
+    erro = Column(Text)
+    criado_em = Column(DateTime, default=datetime.utcnow)
+    atualizado_em = Column(DateTime, default=datetime.utcnow)
+    processado_em = Column(DateTime)
+    __table_args__ = (
+        UniqueConstraint('origem', 'dedup_key', name='uq_webhook_evento_dedup'),
+        Index('idx_webhook_evento_status', 'status', 'proxima_tentativa_em'),
+    )
+
+
 class PixSaque(Base):
     """Histórico de saques Pix do restaurante"""
     __tablename__ = "pix_saques"
@@ -1336,6 +1366,8 @@ class PixSaque(Base):
     solicitado_em = Column(DateTime, default=datetime.utcnow)
     concluido_em = Column(DateTime)
     erro = Column(Text)
+    # Saque automatico: "auto:{restaurante_id}:{janela}" — impede saque duplo entre workers
+    chave_idempotencia = Column(String(100), unique=True)
     restaurante = relationship("Restaurante")
     __table_args__ = (
         Index('idx_pix_saque_restaurante', 'restaurante_id'),
@@ -1746,6 +1778,9 @@ class BotConversa(Base):
         Index('idx_bot_conversas_restaurante', 'restaurante_id', 'status'),
         Index('idx_bot_conversas_telefone', 'restaurante_id', 'telefone'),
         Index('idx_bot_conversas_cliente', 'cliente_id'),
+        # Inbox: keyset por (atualizado_em, id), com e sem filtro de status
+        Index('idx_bot_conversas_inbox', 'restaurante_id', 'atualizado_em', 'id'),
+        Index('idx_bot_conversas_inbox_status', 'restaurante_id', 'status', 'atualizado_em', 'id'),
     )
 
 
@@ -1771,6 +1806,7 @@ class BotMensagem(Base):
     conversa = relationship("BotConversa", back_populates="mensagens")
     __table_args__ = (
         Index('idx_bot_mensagens_conversa', 'conversa_id', 'criado_em'),
+        Index('idx_bot_mensagens_conversa_id', 'conversa_id', 'id'),
     )
 
 
@@ -0,0 +1,30 @@
+# migrations/versions/049_pix_saque_idempotencia.py
+"""Adiciona chave_idempotencia ao PixSaque.
+
+O saque automatico roda em todos os workers Gunicorn; a chave unica
+(restaurante + janela de 30 min) garante no maximo um saque por janela.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "049_pix_saque_idempotencia"
+down_revision = "048_pedido_pago_online"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        ALTER TABLE pix_saques
+        ADD COLUMN IF NOT EXISTS chave_idempotencia VARCHAR(100);
+    """)
+    op.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_pix_saque_chave_idempotencia
+        ON pix_saques (chave_idempotencia);
+    """)
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS uq_pix_saque_chave_idempotencia;")
+    op.execute("ALTER TABLE pix_saques DROP COLUMN IF EXISTS chave_idempotencia;")
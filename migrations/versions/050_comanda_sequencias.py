@@ -0,0 +1,38 @@
+# migrations/versions/050_comanda_sequencias.py
+"""Contador de comandas por restaurante.
+
+Substitui o "último pedido + 1" (query extra por pedido e colisão entre
+checkouts simultâneos) por um contador atômico (UPDATE ... RETURNING).
+O backfill parte da maior comanda numérica já emitida por restaurante.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "050_comanda_sequencias"
+down_revision = "049_pix_saque_idempotencia"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS comanda_sequencias (
+            restaurante_id INTEGER PRIMARY KEY REFERENCES restaurantes(id) ON DELETE CASCADE,
+            ultimo INTEGER NOT NULL DEFAULT 0,
+            dia DATE,
+            atualizado_em TIMESTAMP DEFAULT NOW()
+        );
+    """)
+    op.execute("""
+        INSERT INTO comanda_sequencias (restaurante_id, ultimo, dia)
+        SELECT restaurante_id, MAX(comanda::bigint)::int, MAX(data_criacao)::date
+        FROM pedidos
+        WHERE comanda ~ '^[0-9]{1,9}$'
+        GROUP BY restaurante_id
+        ON CONFLICT (restaurante_id) DO NOTHING;
+    """)
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS comanda_sequencias;")
@@ -0,0 +1,42 @@
+# migrations/versions/051_webhook_eventos.py
+"""Fila durável de webhooks (ingestão com ack rápido).
+
+Evolution, Meta, Asaas e Woovi passam a só validar a assinatura, gravar o
+evento bruto aqui (dedup por origem + chave) e responder 200; consumidores
+em background processam com concorrência limitada e retry com backoff.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "051_webhook_eventos"
+down_revision = "050_comanda_sequencias"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS webhook_eventos (
+            id SERIAL PRIMARY KEY,
+            origem VARCHAR(20) NOT NULL,
+            dedup_key VARCHAR(200) NOT NULL,
+            payload_json JSON,
+            status VARCHAR(20) DEFAULT 'pendente',
+            tentativas INTEGER DEFAULT 0,
+            proxima_tentativa_em TIMESTAMP,
+            erro TEXT,
+            criado_em TIMESTAMP DEFAULT NOW(),
+            atualizado_em TIMESTAMP DEFAULT NOW(),
+            processado_em TIMESTAMP,
+            CONSTRAINT uq_webhook_evento_dedup UNIQUE (origem, dedup_key)
+        );
+    """)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS idx_webhook_evento_status
+        ON webhook_eventos (status, proxima_tentativa_em);
+    """)
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS webhook_eventos;")
@@ -0,0 +1,60 @@
+# migrations/versions/052_bot_inbox_indices.py
+"""Índices da inbox do bot WhatsApp (keyset + busca).
+
+A listagem de conversas passa a paginar por cursor em (atualizado_em, id) e a
+de mensagens por id, sem OFFSET nem COUNT a cada chamada. A busca por nome e
+telefone (substring) usa trigramas quando a extensão pg_trgm está disponível;
+sem permissão para criá-la, a migration segue só com os índices B-tree.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "052_bot_inbox_indices"
+down_revision = "051_webhook_eventos"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS idx_bot_conversas_inbox
+        ON bot_conversas (restaurante_id, atualizado_em, id);
+    """)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS idx_bot_conversas_inbox_status
+        ON bot_conversas (restaurante_id, status, atualizado_em, id);
+    """)
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS idx_bot_mensagens_conversa_id
+        ON bot_mensagens (conversa_id, id);
+    """)
+    op.execute("""
+        DO $$
+        BEGIN
+            CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        EXCEPTION WHEN insufficient_privilege THEN
+            RAISE NOTICE 'pg_trgm indisponível — busca da inbox sem índice trigram';
+        END
+        $$;
+    """)
+    op.execute("""
+        DO $$
+        BEGIN
+            IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN
+                CREATE INDEX IF NOT EXISTS idx_bot_conversas_nome_trgm
+                ON bot_conversas USING gin (nome_cliente gin_trgm_ops);
+                CREATE INDEX IF NOT EXISTS idx_bot_conversas_telefone_trgm
+                ON bot_conversas USING gin (telefone gin_trgm_ops);
+            END IF;
+        END
+        $$;
+    """)
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS idx_bot_conversas_telefone_trgm;")
+    op.execute("DROP INDEX IF EXISTS idx_bot_conversas_nome_trgm;")
+    op.execute("DROP INDEX IF EXISTS idx_bot_mensagens_conversa_id;")
+    op.execute("DROP INDEX IF EXISTS idx_bot_conversas_inbox_status;")
+    op.execute("DROP INDEX IF EXISTS idx_bot_conversas_inbox;")
@@ -10,6 +10,7 @@ Fluxo:
 3. Inicia system tray icon
 4. Conecta WebSocket ao backend
 5. Recebe pedidos → busca dados via REST → enfileira → imprime
+   (um consumidor por impressora, acordado pelo enqueue)
 """
 
 import asyncio
@@ -77,7 +78,10 @@ class PrinterAgent:
         self.api: ApiClient = None  # type: ignore
         self.ws: WebSocketClient = None  # type: ignore
         self._tray = None
-        self._print_thread = None
+        self._workers: dict = {}  # impressora → thread consumidora
+        self._workers_lock = threading.Lock()
+        self._imprimindo = 0
+        self._ws_loop: asyncio.AbstractEventLoop = None  # type: ignore
         self._running = False
 
     def iniciar(self):
@@ -120,10 +124,10 @@ class PrinterAgent:
                 return
             self.api = ApiClient(self.config["server_url"], self.config["token"])
 
-        # Iniciar thread de processamento da fila
+        # Consumidores das impressoras com jobs pendentes (os demais sobem no enqueue)
         self._running = True
-        self._print_thread = threading.Thread(target=self._processar_fila_loop, daemon=True)
-        self._print_thread.start()
+        for impressora in self.queue.impressoras_pendentes():
+            self._garantir_worker(impressora)
 
         # Iniciar tray icon em thread separada
         tray_thread = threading.Thread(target=self._iniciar_tray, daemon=True)
@@ -136,6 +140,7 @@ class PrinterAgent:
             logger.info("Encerrado pelo usuário")
         finally:
             self._running = False
+            self.queue.acordar_todos()
             self.queue.close()
             if self._tray:
                 self._tray.parar()
@@ -162,6 +167,7 @@ class PrinterAgent:
 
     async def _iniciar_ws(self):
         """Inicia conexão WebSocket."""
+        self._ws_loop = asyncio.get_running_loop()
         self.ws = WebSocketClient(
             server_url=self.config["server_url"],
             restaurante_id=self.config["restaurante_id"],
@@ -201,6 +207,7 @@ class PrinterAgent:
 
             largura = self.config.get("largura_mm", 80)
             codepage = self.config.get("codepage", "CP860")
+            jobs = []
 
             if has_multiple_printers(self.config):
                 # Split por setor
@@ -215,10 +222,10 @@ class PrinterAgent:
                     if not printer:
                         continue
                     formatted = format_sector_receipt(data, setor, setor_itens, largura, codepage)
-                    self.queue.enqueue(pedido_id, printer, {
+                    jobs.append((printer, {
                         "raw_bytes_hex": formatted.hex(),
                         "doc_name": f"Pedido_{data.get('comanda', pedido_id)}_{setor}",
-                    }, reimpressao=reimpressao)
+                    }))
             else:
                 # Uma impressora para tudo
                 printer = get_printer_for_setor(self.config, "geral")
@@ -227,32 +234,61 @@ class PrinterAgent:
                     self._enviar_ack(pedido_id, False, "Nenhuma impressora configurada")
                     return
                 formatted = format_full_receipt(data, largura, codepage)
-                self.queue.enqueue(pedido_id, printer, {
+                jobs.append((printer, {
                     "raw_bytes_hex": formatted.hex(),
                     "doc_name": f"Pedido_{data.get('comanda', pedido_id)}",
-                }, reimpressao=reimpressao)
+                }))
+
+            # Todos os setores numa transação; o enqueue acorda os consumidores
+            for printer in self.queue.enqueue_lote(pedido_id, jobs, reimpressao=reimpressao):
+                self._garantir_worker(printer)
 
         except Exception as e:
             logger.error(f"Erro ao processar pedido #{pedido_id}: {e}")
             self._enviar_ack(pedido_id, False, str(e))
 
-    def _processar_fila_loop(self):
-        """Thread que processa a fila de impressão continuamente."""
+    def _garantir_worker(self, impressora: str):
+        """Sobe o consumidor da impressora se ainda não existir."""
+        with self._workers_lock:
+            worker = self._workers.get(impressora)
+            if worker and worker.is_alive():
+                return
+            worker = threading.Thread(
+                target=self._worker_impressora, args=(impressora,),
+                name=f"impressao-{impressora}", daemon=True,
+            )
+            self._workers[impressora] = worker
+            worker.start()
+
+    def _worker_impressora(self, impressora: str):
+        """
+        Consumidor de uma impressora: dorme até o enqueue acordar e imprime em
+        ordem FIFO. Impressoras diferentes imprimem em paralelo.
+        """
+        job = None
         while self._running:
             try:
-                job = self.queue.get_next()
-                if not job:
-                    time.sleep(0.5)
-                    continue
-
-                self._atualizar_tray("imprimindo")
-                self.queue.mark_printing(job["id"])
+                if job is None:
+                    job = self.queue.aguardar_proximo(impressora)
+                    if job is None:
+                        continue
+                job = self._imprimir_job(job)
+            except Exception as e:
+                logger.error(f"Erro no loop de impressão ({impressora}): {e}")
+                job = None
+                time.sleep(1)
 
+    def _imprimir_job(self, job: dict):
+        """Imprime um job e retorna o próximo da mesma impressora (se houver)."""
+        self._marcar_imprimindo(1)
+        try:
+            inicio = time.time()
+            printer_name = job["impressora"]
+            try:
                 dados = json.loads(job["dados_json"])
                 raw_bytes = bytes.fromhex(dados.get("raw_bytes_hex", ""))
                 doc_name_raw = dados.get("doc_name", "Comanda")
                 doc_name = f"Derekh_{doc_name_raw}" if not doc_name_raw.startswith("Derekh_") else doc_name_raw
-                printer_name = job["impressora"]
 
                 # Imprimir N cópias
                 copias = self.config.get("copias", 1)
@@ -261,28 +297,50 @@ class PrinterAgent:
                     if not imprimir_raw(printer_name, raw_bytes, doc_name):
                         success = False
                         break
-
-                if success:
-                    self.queue.mark_done(job["id"], job["pedido_id"], printer_name)
-                    self._enviar_ack(job["pedido_id"], True)
-                    logger.info(f"Pedido #{job['pedido_id']} impresso com sucesso em {printer_name}")
-                else:
-                    self.queue.mark_failed(job["id"])
-                    self._enviar_ack(job["pedido_id"], False, f"Falha ao imprimir em {printer_name}")
-
-                self._atualizar_tray("conectado")
-
+                erro = None if success else f"Falha ao imprimir em {printer_name}"
             except Exception as e:
-                logger.error(f"Erro no loop de impressão: {e}")
-                time.sleep(1)
-
-    def _enviar_ack(self, pedido_id: int, success: bool, error: str = None):
-        """Envia ACK de impressão via WebSocket."""
-        if self.ws:
+                # Sem isso o job ficaria 'imprimindo' até o agente reiniciar
+                logger.error(f"Erro ao imprimir pedido #{job['pedido_id']} em {printer_name}: {e}")
+                erro = f"Erro ao imprimir em {printer_name}: {e}"
+
+            if erro:
+                self.queue.mark_failed(job["id"])
+                self._enviar_ack(job["pedido_id"], False, erro)
+                return None
+
+            # Latência enqueue → papel (inclui retries); fila = espera até começar a imprimir
+            impresso_em = time.time()
+            metricas = {
+                "fila_ms": round((inicio - job["criado_em"]) * 1000),
+                "latencia_ms": round((impresso_em - job["criado_em"]) * 1000),
+            }
+            proximo = self.queue.concluir(job)
+            self._enviar_ack(job["pedido_id"], True, metricas=metricas)
+            logger.info(
+                f"Pedido #{job['pedido_id']} impresso com sucesso em {printer_name} "
+                f"({metricas['latencia_ms']}ms desde o enqueue)"
+            )
+            return proximo
+        finally:
+            self._marcar_imprimindo(-1)
+
+    def _marcar_imprimindo(self, delta: int):
+        with self._workers_lock:
+            self._imprimindo += delta
+            ativos = self._imprimindo
+        if delta > 0 and ativos == 1:
+            self._atualizar_tray("imprimindo")
+        elif delta < 0 and ativos == 0:
+            self._atualizar_tray("conectado")
+
+    def _enviar_ack(self, pedido_id: int, success: bool, error: str = None, metricas: dict = None):
+        """Envia ACK de impressão via WebSocket (agendado no loop do WS, de qualquer thread)."""
+        loop = self._ws_loop
+        if self.ws and loop and not loop.is_closed():
             try:
-                loop = asyncio.new_event_loop()
-                loop.run_until_complete(self.ws.enviar_ack(pedido_id, success, error))
-                loop.close()
+                asyncio.run_coroutine_threadsafe(
+                    self.ws.enviar_ack(pedido_id, success, error, metricas), loop,
+                )
             except Exception as e:
                 logger.warning(f"Erro ao enviar ACK: {e}")
 
@@ -1276,19 +1276,54 @@ export function useBotDashboard() {
   });
 }
 
-export function useBotConversas(params?: { status?: string; busca?: string; limit?: number }) {
-  return useQuery({
-    queryKey: [...ADMIN_QUERY_KEYS.botConversas, params],
+type BotConversasParams = { status?: string; busca?: string; limit?: number };
+
+// Aplica o delta de /conversas/mudancas na lista já carregada (upsert por id)
+function mesclarMudancasConversas(atual: any, delta: any, params?: BotConversasParams) {
+  const porId = new Map<number, any>(atual.conversas.map((c: any) => [c.id, c]));
+  for (const c of delta.conversas) {
+    if (params?.status && c.status !== params.status) porId.delete(c.id);
+    else porId.set(c.id, c);
+  }
+  const conversas = Array.from(porId.values())
+    .sort((a, b) => (b.atualizado_em || "").localeCompare(a.atualizado_em || "") || b.id - a.id)
+    .slice(0, params?.limit ?? 50);
+  return { ...atual, conversas, sincronizado_em: delta.sincronizado_em };
+}
+
+export function useBotConversas(params?: BotConversasParams) {
+  const qc = useQueryClient();
+  const queryKey = [...ADMIN_QUERY_KEYS.botConversas, params] as const;
+  const incremental = !params?.busca;
+  const lista = useQuery({
+    queryKey,
     queryFn: () => api.getBotConversas(params),
     staleTime: 15_000,
-    refetchInterval: 30_000,
+    // Com busca recarrega a lista; sem busca só os deltas abaixo
+    refetchInterval: incremental ? false : 30_000,
+  });
+
+  useQuery({
+    queryKey: [...queryKey, "mudancas"],
+    queryFn: async () => {
+      const atual = qc.getQueryData<any>(queryKey);
+      if (!atual?.sincronizado_em) return null;
+      const delta = await api.getBotConversasMudancas(atual.sincronizado_em);
+      qc.setQueryData(queryKey, mesclarMudancasConversas(atual, delta, params));
+      return delta.sincronizado_em;
+    },
+    enabled: incremental && !!lista.data,
+    refetchInterval: 10_000,
   });
+
+  return lista;
 }
 
-export function useBotMensagens(conversaId: number, pagina: number = 1) {
+export function useBotMensagens(conversaId: number) {
   return useQuery({
-    queryKey: ["admin", "bot", "mensagens", conversaId, pagina] as const,
-    queryFn: () => api.getBotMensagens(conversaId, { pagina }),
+    // Sem `pagina`: API devolve as mensagens mais recentes (keyset)
+    queryKey: ["admin", "bot", "mensagens", conversaId] as const,
+    queryFn: () => api.getBotMensagens(conversaId),
     enabled: !!conversaId,
     staleTime: 10_000,
   });
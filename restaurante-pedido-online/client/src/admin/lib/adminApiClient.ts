@@ -844,12 +844,17 @@ export async function getBotDashboard() {
   return data;
 }
 
-export async function getBotConversas(params?: { status?: string; busca?: string; limit?: number; offset?: number }) {
+export async function getBotConversas(params?: { status?: string; busca?: string; limit?: number; cursor?: string; offset?: number }) {
   const { data } = await adminApi.get("/painel/bot/conversas", { params });
   return data;
 }
 
-export async function getBotMensagens(conversaId: number, params?: { pagina?: number; limite?: number }) {
+export async function getBotConversasMudancas(desde: string) {
+  const { data } = await adminApi.get("/painel/bot/conversas/mudancas", { params: { desde } });
+  return data;
+}
+
+export async function getBotMensagens(conversaId: number, params?: { limite?: number; antes_de?: number; depois_de?: number; pagina?: number }) {
   const { data } = await adminApi.get(`/painel/bot/conversas/${conversaId}/mensagens`, { params });
   return data;
 }
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# scripts/benchmark_escpos.py
+
+"""
+Benchmark do decodificador ESC/POS compartilhado (bridge_agent/escpos.py).
+
+Compara as implementações antigas (byte a byte, tabelas parciais: o
+strip_escpos_commands do Bridge e o _parse da impressora virtual, que ainda
+parseava o buffer duas vezes para texto + anotado) com a passada única atual.
+
+Entrada: arquivos .bin capturados (ex.: virtual_printer/output/job_*.bin ou
+spool salvo pelo Bridge). Sem arquivos, gera um spool sintético com recibos
+das 4 plataformas e um logo raster (GS v 0) por recibo.
+
+Uso:
+    python scripts/benchmark_escpos.py [arquivos.bin | diretorio ...] [--recibos 2000] [--repeticoes 5]
+"""
+
+import sys
+import time
+import random
+import argparse
+from pathlib import Path
+from typing import List, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from bridge_agent import escpos
+from bridge_agent import text_extractor
+from virtual_printer.escpos_decoder import ESCPOSDecoder
+
+
+# ── Réplicas das implementações anteriores ───────────────────────────────────
+
+def strip_antigo(raw_bytes: bytes) -> bytes:
+    """Réplica do strip_escpos_commands anterior do Bridge."""
+    result = bytearray()
+    i = 0
+    length = len(raw_bytes)
+    while i < length:
+        b = raw_bytes[i]
+        if b == 0x1B:
+            i += 2
+            if i < length and raw_bytes[i - 1] in (0x21, 0x45, 0x47, 0x4D, 0x61):
+                i += 1
+            continue
+        if b == 0x1D:
+            i += 2
+            if i < length:
+                cmd = raw_bytes[i - 1]
+                if cmd in (0x21, 0x42, 0x48, 0x66, 0x68, 0x77):
+                    i += 1
+                elif cmd == 0x6B:
+                    if i < length:
+                        i += raw_bytes[i] + 1
+                elif cmd == 0x28:
+                    if i + 1 < length:
+                        i += 2 + raw_bytes[i] + (raw_bytes[i + 1] << 8)
+            continue
+        if b in (0x1C, 0x10):
+            i += 2
+            continue
+        if b < 0x20 and b not in (0x0A, 0x0D, 0x09):
+            i += 1
+            continue
+        result.append(b)
+        i += 1
+    return bytes(result)
+
+
+_ESC_ANTIGO = {0x40: 0, 0x61: 1, 0x21: 1, 0x74: 1, 0x45: 1, 0x4D: 1, 0x64: 1,
+               0x4A: 1, 0x33: 1, 0x32: 0, 0x70: 2, 0x63: 1}
+_GS_ANTIGO = {0x21: 1, 0x56: 1, 0x42: 1, 0x48: 1, 0x66: 1, 0x68: 1, 0x77: 1}
+
+
+def parse_antigo(raw_bytes: bytes) -> List[Tuple[str, str]]:
+    """Réplica do laço do ESCPOSDecoder._parse anterior (custo equivalente)."""
+    segments = []
+    text_buf = bytearray()
+    i, n = 0, len(raw_bytes)
+
+    def _flush():
+        if text_buf:
+            segments.append(("TEXT", bytes(text_buf).decode("CP860")))
+            text_buf.clear()
+
+    while i < n:
+        b = raw_bytes[i]
+        if b == 0x1B and i + 1 < n:
+            _flush()
+            cmd = raw_bytes[i + 1]
+            params = _ESC_ANTIGO.get(cmd)
+            segments.append(("CMD", f"[ESC:0x{cmd:02X}]"))
+            i += 2 + (params or 0)
+        elif b == 0x1D and i + 1 < n:
+            _flush()
+            cmd = raw_bytes[i + 1]
+            if cmd == 0x6B:
+                m = raw_bytes[i + 2] if i + 2 < n else 0
+                if m <= 6:
+                    j = i + 3
+                    while j < n and raw_bytes[j] != 0x00:
+                        j += 1
+                    i = j + 1
+                else:
+                    i += 4 + (raw_bytes[i + 3] if i + 3 < n else 0)
+            elif cmd == 0x28:
+                i += 5 + ((raw_bytes[i + 3] + (raw_bytes[i + 4] << 8)) if i + 4 < n else 0)
+            else:
+                i += 2 + _GS_ANTIGO.get(cmd, 0)
+            segments.append(("CMD", f"[GS:0x{cmd:02X}]"))
+        elif b in (0x1C, 0x10) and i + 1 < n:
+            _flush()
+            i += 2
+        elif b < 0x20 and b not in (0x0A, 0x0D, 0x09):
+            i += 1
+        else:
+            text_buf.append(b)
+            i += 1
+    _flush()
+    return segments
+
+
+# ── Spool ────────────────────────────────────────────────────────────────────
+
+def _logo_raster(largura_px: int = 384, altura_px: int = 96) -> bytes:
+    x = largura_px // 8
+    cabecalho = bytes([0x1D, 0x76, 0x30, 0x00, x & 0xFF, x >> 8, altura_px & 0xFF, altura_px >> 8])
+    return cabecalho + bytes(random.getrandbits(8) for _ in range(x * altura_px))
+
+
+def spool_sintetico(recibos: int) -> List[bytes]:
+    from virtual_printer import receipt_printer as rp
+
+    geradores = [rp.gerar_recibo_ifood, rp.gerar_recibo_rappi, rp.gerar_recibo_99food, rp.gerar_recibo_uber_eats]
+    logo = _logo_raster()
+    return [logo + geradores[i % len(geradores)]() for i in range(recibos)]
+
+
+def carregar_spool(caminhos: List[str]) -> List[bytes]:
+    arquivos: List[Path] = []
+    for c in caminhos:
+        p = Path(c)
+        arquivos.extend(sorted(p.glob("*.bin")) if p.is_dir() else [p])
+    return [a.read_bytes() for a in arquivos]
+
+
+def _medir(nome: str, fn, jobs: List[bytes], repeticoes: int) -> float:
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        t0 = time.perf_counter()
+        for job in jobs:
+            fn(job)
+        melhor = min(melhor, time.perf_counter() - t0)
+    total_mb = sum(len(j) for j in jobs) / 1e6
+    print(f"  {nome:<42} {melhor * 1000:9.1f} ms  {total_mb / melhor:8.1f} MB/s")
+    return melhor
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do decodificador ESC/POS")
+    parser.add_argument("arquivos", nargs="*", help="Arquivos .bin ou diretórios com .bin")
+    parser.add_argument("--recibos", type=int, default=2000, help="Recibos do spool sintético")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    args = parser.parse_args()
+
+    random.seed(42)
+    jobs = carregar_spool(args.arquivos) if args.arquivos else spool_sintetico(args.recibos)
+    if not jobs:
+        print("Nenhum job para medir")
+        return 1
+    print(f"\n  {len(jobs)} jobs, {sum(len(j) for j in jobs) / 1e6:.1f} MB\n")
+
+    decoder = ESCPOSDecoder()
+    print("  Bridge (texto)")
+    antigo = _medir("strip_escpos_commands antigo", strip_antigo, jobs, args.repeticoes)
+    novo = _medir("escpos.separar", escpos.separar, jobs, args.repeticoes)
+    print(f"  {'':<42} {antigo / novo:9.1f}x\n")
+
+    print("  Impressora virtual (texto + anotado)")
+
+    def _decode_antigo(job: bytes):
+        texto = decoder._clean("".join(c for t, c in parse_antigo(job) if t == "TEXT"))
+        anotado = decoder._clean("".join(c for _, c in parse_antigo(job)))
+        return texto, anotado
+
+    antigo = _medir("_parse antigo x2", _decode_antigo, jobs, args.repeticoes)
+    novo = _medir("ESCPOSDecoder.decode (passada única)", decoder.decode, jobs, args.repeticoes)
+    print(f"  {'':<42} {antigo / novo:9.1f}x\n")
+
+    # Os dois agentes devem extrair o mesmo texto
+    divergentes = sum(
+        1 for j in jobs
+        if text_extractor.decode_text(text_extractor.strip_escpos_commands(j))
+        != escpos.decodificar(escpos.separar(j, anotar=True)[0])
+    )
+    print(f"  Divergências Bridge x impressora virtual: {divergentes}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
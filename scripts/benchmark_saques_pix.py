@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# scripts/benchmark_saques_pix.py
+
+"""
+Benchmark / dry-run do saque automatico Pix contra um stub local da Woovi.
+
+Cria um banco SQLite temporario com N restaurantes com saque automatico,
+simula a API Woovi (latencia configuravel) e mede o ciclo completo com
+concorrencia 1 (serial) e com o pool configurado.
+
+Uso:
+    python scripts/benchmark_saques_pix.py [--restaurantes 300] [--latencia-ms 80]
+        [--concorrencia 8] [--dry-run] [--woovi-url http://localhost:8088]
+
+--woovi-url aponta para um stub HTTP externo; sem ele o stub roda em processo.
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+_tmp_db = Path(tempfile.mkdtemp()) / "bench_saques.db"
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp_db}"
+os.environ.setdefault("SECRET_KEY", "bench-saques-pix")
+os.environ.setdefault("WOOVI_APP_ID", "bench-app-id")
+
+import httpx
+
+import database.models  # noqa: F401  (registra models no Base)
+from backend.app.database import engine, Base, SessionLocal
+from backend.app import models
+from backend.app.pix import pix_service
+from backend.app.pix.woovi_client import woovi_client
+
+
+def criar_stub_woovi(chaves: list, latencia_ms: float, saldo_centavos: int) -> httpx.MockTransport:
+    """Stub da Woovi: listagem de subcontas, saldo individual e saque total."""
+    saldos = {k: saldo_centavos for k in chaves}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(latencia_ms / 1000)
+        path = request.url.path
+        if path == "/api/v1/subaccount" and request.method == "GET":
+            skip = int(request.url.params.get("skip", 0))
+            limit = int(request.url.params.get("limit", 100))
+            pagina = chaves[skip:skip + limit]
+            return httpx.Response(200, json={
+                "subAccounts": [
+                    {"pixKey": k, "name": k, "balance": saldos[k]}
+                    for k in pagina
+                ],
+                "pageInfo": {"skip": skip, "limit": limit, "hasNextPage": skip + limit < len(chaves)},
+            })
+        if path.endswith("/withdraw"):
+            chave = path.split("/")[-2]
+            saldos[chave] = 0
+            return httpx.Response(200, json={"transaction": {"status": "CREATED"}})
+        if path.startswith("/api/v1/subaccount/"):
+            chave = path.rsplit("/", 1)[-1]
+            return httpx.Response(200, json={
+                "subaccount": {"pixKey": chave, "balance": saldos.get(chave, 0)}
+            })
+        return httpx.Response(404, json={"error": "not found"})
+
+    return httpx.MockTransport(handler)
+
+
+def seed(n: int) -> list:
+    """Cria N restaurantes com PixConfig de saque automatico. Retorna as chaves Pix."""
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    chaves = []
+    try:
+        agora = datetime.utcnow()
+        for i in range(1, n + 1):
+            rest = models.Restaurante(
+                nome=f"Bench {i}",
+                nome_fantasia=f"Bench {i}",
+                email=f"bench{i}@bench.test",
+                telefone="11999999999",
+                endereco_completo="Rua Bench 1",
+                codigo_acesso=f"BENCH{i:04d}",
+                senha="hashed",
+            )
+            db.add(rest)
+            db.flush()
+            chaves.append(f"chave{i}@bench.test")
+            db.add(models.PixConfig(
+                restaurante_id=rest.id,
+                ativo=True,
+                pix_chave=f"chave{i}@bench.test",
+                tipo_chave="email",
+                nome_subconta=f"Bench {i}",
+                termos_aceitos_em=agora,
+                saque_automatico=True,
+                saque_minimo_centavos=50000,
+            ))
+        db.commit()
+    finally:
+        db.close()
+    return chaves
+
+
+async def rodar_ciclo(concorrencia: int, dry_run: bool) -> tuple:
+    db = SessionLocal()
+    try:
+        # Limpa saques da rodada anterior (mesma janela de idempotencia)
+        db.query(models.PixSaque).delete()
+        db.commit()
+        inicio = time.perf_counter()
+        resumo = await pix_service.executar_saques_automaticos(
+            db, dry_run=dry_run, concorrencia=concorrencia,
+        )
+        return time.perf_counter() - inicio, resumo
+    finally:
+        db.close()
+
+
+async def main_async(args):
+    chaves = seed(args.restaurantes)
+
+    if args.woovi_url:
+        woovi_client.base_url = args.woovi_url
+
+    print(f"Restaurantes: {args.restaurantes} | latencia stub: {args.latencia_ms}ms | dry-run: {args.dry_run}")
+    for conc in (1, args.concorrencia):
+        if not args.woovi_url:
+            # Reinicia saldos do stub entre rodadas
+            woovi_client._client = httpx.AsyncClient(
+                base_url="http://woovi-stub",
+                transport=criar_stub_woovi(chaves, args.latencia_ms, saldo_centavos=60000),
+            )
+        duracao, resumo = await rodar_ciclo(conc, args.dry_run)
+        print(f"  concorrencia={conc:<3} {duracao:8.2f}s  {resumo}")
+
+    await woovi_client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do saque automatico Pix")
+    parser.add_argument("--restaurantes", type=int, default=300)
+    parser.add_argument("--latencia-ms", type=float, default=80.0)
+    parser.add_argument("--concorrencia", type=int, default=pix_service.SAQUE_AUTO_CONCORRENCIA)
+    parser.add_argument("--dry-run", action="store_true", help="Nao saca nem grava PixSaque")
+    parser.add_argument("--woovi-url", default="", help="Stub HTTP externo (opcional)")
+    args = parser.parse_args()
+    try:
+        asyncio.run(main_async(args))
+    finally:
+        if _tmp_db.exists():
+            _tmp_db.unlink()
+
+
+if __name__ == "__main__":
+    main()
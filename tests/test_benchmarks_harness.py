@@ -0,0 +1,66 @@
+"""
+Testes do harness de benchmark — Derekh Food
+Valida percentis e a comparação com o baseline (sem rodar a app).
+
+Execução: pytest tests/test_benchmarks_harness.py -v
+"""
+
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from benchmarks.harness import percentil, comparar
+
+
+def _resultado(p95=10.0, queries=5.0, erros=0):
+    return {"p95_ms": p95, "queries_por_request": queries, "erros": erros}
+
+
+class TestPercentil:
+    def test_nearest_rank(self):
+        valores = [float(v) for v in range(1, 101)]
+        assert percentil(valores, 50) == 50.0
+        assert percentil(valores, 95) == 95.0
+        assert percentil(valores, 99) == 99.0
+
+    def test_vazio(self):
+        assert percentil([], 95) == 0.0
+
+
+class TestComparar:
+    def _baseline(self, **kw):
+        return {"parametros": {"iteracoes": 100, "escala": 1.0},
+                "cenarios": {"site": _resultado(**kw)}}
+
+    def test_sem_baseline(self):
+        assert comparar({"site": _resultado()}, None) == []
+
+    def test_query_a_mais_e_regressao(self):
+        regressoes = comparar({"site": _resultado(queries=6.0)}, self._baseline(),
+                              {"iteracoes": 100, "escala": 1.0})
+        assert len(regressoes) == 1
+        assert "queries/request" in regressoes[0]
+
+    def test_queries_ignoradas_com_parametros_diferentes(self):
+        regressoes = comparar({"site": _resultado(queries=6.0)}, self._baseline(),
+                              {"iteracoes": 30, "escala": 1.0})
+        assert regressoes == []
+
+    def test_latencia_dentro_da_tolerancia(self):
+        assert comparar({"site": _resultado(p95=12.0)}, self._baseline()) == []
+
+    def test_latencia_acima_da_tolerancia(self):
+        regressoes = comparar({"site": _resultado(p95=100.0)}, self._baseline())
+        assert any("p95" in r for r in regressoes)
+
+    def test_so_queries_ignora_latencia(self):
+        assert comparar({"site": _resultado(p95=100.0)}, self._baseline(), latencia=False) == []
+        assert comparar({"site": _resultado(p95=100.0, queries=6.0)}, self._baseline(), latencia=False)
+
+    def test_erros_ja_no_baseline_nao_bloqueiam(self):
+        base = self._baseline(erros=100)
+        assert comparar({"site": _resultado(erros=100)}, base) == []
+        assert comparar({"site": _resultado(erros=0)}, self._baseline()) == []
+        assert comparar({"site": _resultado(erros=3)}, self._baseline())
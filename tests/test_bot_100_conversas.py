@@ -15,7 +15,7 @@ import random
 import sys
 from collections import Counter, defaultdict
 from datetime import datetime, timedelta
-from unittest.mock import patch
+from unittest.mock import patch, AsyncMock
 
 os.environ["DATABASE_URL"] = "sqlite://"
 os.environ["SECRET_KEY"] = "test-secret-key"
@@ -514,7 +514,7 @@ async def fluxo_cliente_valida_endereco(db, bot_config, cliente, conversa):
         "coordinates": (-23.55 + random.uniform(-0.01, 0.01), -46.63 + random.uniform(-0.01, 0.01)),
     }]
 
-    with patch("utils.mapbox_api.autocomplete_address", return_value=mock_sugestoes), \
+    with patch("utils.mapbox_api.autocomplete_address_async", new=AsyncMock(return_value=mock_sugestoes)), \
          patch("utils.mapbox_api._cache_key_dist", return_value=f"mock_{random.randint(1, 9999)}"), \
          patch("backend.app.cache.cache_get", return_value=None), \
          patch("backend.app.cache.cache_set"):
@@ -13,7 +13,7 @@ import json
 import os
 import sys
 from datetime import datetime, timedelta
-from unittest.mock import patch
+from unittest.mock import patch, AsyncMock
 
 # Configurar env ANTES de qualquer import do projeto
 os.environ["DATABASE_URL"] = "sqlite://"
@@ -582,7 +582,7 @@ async def run_all_tests():
         "place_name": "Rua Augusta, 123, Consolação, São Paulo - SP, 01305-100, Brasil",
         "coordinates": (-23.5534, -46.6546),
     }]
-    with patch("utils.mapbox_api.autocomplete_address", return_value=mock_sugestoes), \
+    with patch("utils.mapbox_api.autocomplete_address_async", new=AsyncMock(return_value=mock_sugestoes)), \
          patch("utils.mapbox_api._cache_key_dist", return_value="mock_key"), \
          patch("backend.app.cache.cache_get", return_value=None), \
          patch("backend.app.cache.cache_set"):
@@ -0,0 +1,212 @@
+"""
+Testes do dashboard e relatórios agregados do bot — Derekh Food
+Valida os números do dashboard, da eficiência, da satisfação e dos clientes
+inativos contra uma base conhecida, o número de idas ao banco (independente
+do histórico) e o cache curto por restaurante.
+
+Execução: pytest tests/test_bot_dashboard.py -v
+"""
+
+import sys
+import os
+import json
+from decimal import Decimal
+from pathlib import Path
+from types import SimpleNamespace
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key-bot-dashboard")
+os.environ.setdefault("ENVIRONMENT", "testing")
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from database.base import Base
+from database.models import (
+    Restaurante, Cliente, Pedido, BotConversa, BotMensagem, BotAvaliacao,
+    BotProblema, BotRepescagem, BotConfig,
+)
+from backend.app.routers import bot_whatsapp as bw
+
+AGORA = datetime.utcnow()
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'dashboard.db'}")
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db(engine):
+    sessao = sessionmaker(bind=engine)()
+    yield sessao
+    sessao.close()
+
+
+@pytest.fixture
+def consultas(engine):
+    contagem = [0]
+
+    def _contar(*args):
+        contagem[0] += 1
+
+    event.listen(engine, "before_cursor_execute", _contar)
+    yield contagem
+    event.remove(engine, "before_cursor_execute", _contar)
+
+
+@pytest.fixture(autouse=True)
+def sem_redis():
+    with patch.object(bw, "cache_get", return_value=None), patch.object(bw, "cache_set"):
+        yield
+
+
+def _restaurante(db, codigo="DASH01"):
+    r = Restaurante(
+        nome=codigo, nome_fantasia=codigo, email=f"{codigo}@t.com", telefone="11999990000",
+        endereco_completo="Rua 1", codigo_acesso=codigo, senha="x", ativo=True,
+    )
+    db.add(r)
+    db.commit()
+    return r
+
+
+def _pedido(db, r, dias_atras, valor, status="entregue", origem="whatsapp_bot", cliente_id=None):
+    db.add(Pedido(
+        restaurante_id=r.id, comanda="1", tipo="Entrega", cliente_nome="X", itens="1x",
+        valor_total=valor, status=status, origem=origem, cliente_id=cliente_id,
+        data_criacao=AGORA - timedelta(days=dias_atras),
+    ))
+
+
+@pytest.fixture
+def base(db):
+    r = _restaurante(db)
+    outro = _restaurante(db, "OUTRO1")
+    db.add(BotConfig(restaurante_id=r.id, bot_ativo=True, tokens_usados_hoje=123, max_tokens_dia=1000))
+
+    # Conversas: 2 hoje (1 ativa), 1 há 3 dias (handoff), 1 há 20 dias (ativa)
+    for dias, status in ((0, "ativa"), (0, "encerrada"), (3, "handoff"), (20, "ativa")):
+        db.add(BotConversa(restaurante_id=r.id, telefone="55", status=status,
+                           criado_em=AGORA - timedelta(days=dias, minutes=1)))
+    db.add(BotConversa(restaurante_id=outro.id, telefone="55", status="ativa", criado_em=AGORA))
+    db.flush()
+    conversa = db.query(BotConversa).filter(BotConversa.restaurante_id == r.id).first()
+    for ms in (100, 300):
+        db.add(BotMensagem(conversa_id=conversa.id, direcao="enviada", tempo_resposta_ms=ms, criado_em=AGORA))
+
+    # Pedidos bot: hoje 50 + 30 (cancelado), há 2 dias 20, há 3 dias 99 (cancelado); site e outro restaurante não contam
+    _pedido(db, r, 0, 50.0)
+    _pedido(db, r, 0, 30.0, status="cancelado")
+    _pedido(db, r, 2, 20.0)
+    _pedido(db, r, 3, 99.0, status="cancelado")
+    _pedido(db, r, 0, 70.0, origem="site")
+    _pedido(db, outro, 0, 10.0)
+
+    # Avaliações: notas 5, 4, 1 e uma sem nota que foi ao Google
+    for nota, maps in ((5, True), (4, False), (1, False), (None, True)):
+        db.add(BotAvaliacao(restaurante_id=r.id, nota=nota, avaliou_maps=maps, criado_em=AGORA))
+
+    # Problemas: 1 aberto desta semana, 1 resolvido antigo, 1 aberto antigo
+    db.add(BotProblema(restaurante_id=r.id, tipo="atraso", resolvido=False, resolvido_automaticamente=True,
+                       criado_em=AGORA - timedelta(days=1)))
+    db.add(BotProblema(restaurante_id=r.id, tipo="atraso", resolvido=True, criado_em=AGORA - timedelta(days=40)))
+    db.add(BotProblema(restaurante_id=r.id, tipo="qualidade", resolvido=False, criado_em=AGORA - timedelta(days=40)))
+    db.commit()
+    db.refresh(r)
+    return r
+
+
+class TestDashboard:
+    def test_numeros(self, db, base):
+        d = bw.bot_dashboard(restaurante=base, _feature=None, db=db)
+        assert d == {
+            "bot_ativo": True, "tokens_usados_hoje": 123, "max_tokens_dia": 1000,
+            "conversas_hoje": 2, "conversas_semana": 3, "conversas_ativas": 2,
+            "pedidos_bot_hoje": 2, "pedidos_bot_semana": 4, "faturamento_bot": 70.0,
+            "avaliacao_media": 3.3, "total_avaliacoes": 3,
+            "problemas_abertos": 2, "problemas_semana": 1,
+        }
+
+    def test_duas_idas_ao_banco(self, db, base, consultas):
+        bw.bot_dashboard(restaurante=base, _feature=None, db=db)
+        assert consultas[0] == 2  # config + agregados
+
+    def test_cache_por_restaurante(self, db, base, consultas):
+        cache = {}
+        with patch.object(bw, "cache_get", side_effect=cache.get), \
+                patch.object(bw, "cache_set", side_effect=lambda k, v, ttl_seconds: cache.__setitem__(k, v)):
+            primeiro = bw.bot_dashboard(restaurante=base, _feature=None, db=db)
+            antes = consultas[0]
+            assert bw.bot_dashboard(restaurante=base, _feature=None, db=db) == primeiro
+        assert consultas[0] - antes == 1  # só a config (bot_ativo/tokens sempre frescos)
+        assert list(cache) == [f"bot:dashboard:{base.id}"]
+
+    def test_decimal_do_postgres_vira_numero(self, db):
+        # sum/avg no Postgres chegam como Decimal; o cache gravaria string
+        linha = (1, 2, 1, 1, 2, Decimal("70.50"), Decimal("3.3333"), 3, 0, 1)
+        with patch.object(db, "execute", return_value=SimpleNamespace(one=lambda: linha)):
+            d = bw._dashboard_agregados(db, 1, datetime.utcnow(), datetime.utcnow())
+        assert d["faturamento_bot"] == 70.5 and type(d["faturamento_bot"]) is float
+        assert d["avaliacao_media"] == 3.3 and type(d["avaliacao_media"]) is float
+        assert json.loads(json.dumps(d)) == d
+
+
+class TestRelatorios:
+    def test_eficiencia(self, db, base, consultas):
+        r = bw.relatorio_eficiencia(periodo="30d", restaurante=base, _feature=None, db=db)
+        assert consultas[0] == 2
+        assert r["total_conversas"] == 4 and r["conversas_escaladas"] == 1
+        assert r["total_pedidos_bot"] == 4 and r["taxa_conversao"] == 100.0
+        assert r["tempo_medio_resposta_ms"] == 200
+        assert [p["pedidos"] for p in r["pedidos_por_dia"]] == [1, 1, 2]
+        # Dia só com cancelado não aparece no faturamento
+        assert [f["valor"] for f in r["faturamento_por_dia"]] == [20.0, 50.0]
+
+    def test_satisfacao(self, db, base, consultas):
+        r = bw.relatorio_satisfacao(periodo="30d", restaurante=base, _feature=None, db=db)
+        assert consultas[0] == 2
+        assert r["total_avaliacoes"] == 3 and r["media_geral"] == 3.3
+        assert r["distribuicao_notas"] == {"1": 1, "2": 0, "3": 0, "4": 1, "5": 1}
+        assert r["nps"] == 33
+        assert r["google_reviews_solicitados"] == 2
+        assert r["clientes_satisfeitos"] == 2 and r["clientes_insatisfeitos"] == 1
+        assert sorted((c["tipo"], c["total"], c["resolvido_bot"]) for c in r["categorias_problemas"]) == [
+            ("atraso", 1, 1),
+        ]
+
+
+class TestClientesInativos:
+    def test_faixas_lista_e_consultas_constantes(self, db, consultas):
+        r = _restaurante(db)
+        for i, dias in enumerate((5, 12, 20, 45, 90)):
+            c = Cliente(restaurante_id=r.id, nome=f"C{i}", telefone=f"1199{i}", senha_hash="x")
+            db.add(c)
+            db.flush()
+            _pedido(db, r, dias, 10.0, cliente_id=c.id)
+            _pedido(db, r, dias + 10, 10.0, cliente_id=c.id)
+            db.add(BotAvaliacao(restaurante_id=r.id, cliente_id=c.id, nota=2, criado_em=AGORA - timedelta(days=30)))
+            db.add(BotAvaliacao(restaurante_id=r.id, cliente_id=c.id, nota=5, criado_em=AGORA - timedelta(days=1)))
+            if dias == 45:
+                db.add(BotRepescagem(restaurante_id=r.id, cliente_id=c.id, retornou=True))
+        db.commit()
+        db.refresh(r)
+
+        consultas[0] = 0
+        rel = bw.relatorio_clientes_inativos(restaurante=r, _feature=None, db=db)
+        assert consultas[0] == 5
+
+        assert rel["resumo"] == {"total_clientes": 5, "inativos_15_30": 1, "inativos_30_60": 1, "inativos_60_plus": 1}
+        assert rel["repescagens"] == {"enviadas_total": 1, "retornaram": 1, "taxa_retorno": 100.0}
+        assert [c["dias_inativo"] for c in rel["clientes"]] == [90, 45, 20, 12]
+        assert {c["ultima_avaliacao"] for c in rel["clientes"]} == {5}
+        assert [c["repescagem_enviada"] for c in rel["clientes"]] == [False, True, False, False]
+        assert rel["clientes"][0]["media_intervalo_dias"] == 10.0
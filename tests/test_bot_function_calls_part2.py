@@ -1746,10 +1746,10 @@ class TestValidarEndereco:
     """Funcao 21: validar_endereco (MOCK Mapbox)"""
 
     def _mock_autocomplete(self, results):
-        """Cria mock para autocomplete_address (importado localmente de utils.mapbox_api)."""
+        """Cria mock para autocomplete_address_async (chamado pelo enderecos_service)."""
         return patch(
-            "utils.mapbox_api.autocomplete_address",
-            return_value=results,
+            "utils.mapbox_api.autocomplete_address_async",
+            new=AsyncMock(return_value=results),
         )
 
     def _mock_haversine(self, distance=2.0):
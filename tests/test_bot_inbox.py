@@ -0,0 +1,177 @@
+"""
+Testes da inbox do bot WhatsApp (keyset) — Derekh Food
+Valida a paginação por cursor de conversas e mensagens (sem OFFSET/COUNT),
+a busca por telefone normalizado e por nome, o endpoint de mudanças
+incremental e a compatibilidade com os parâmetros antigos (offset/pagina).
+
+Execução: pytest tests/test_bot_inbox.py -v
+"""
+
+import sys
+import os
+from pathlib import Path
+from datetime import datetime, timedelta
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key-bot-inbox")
+os.environ.setdefault("ENVIRONMENT", "testing")
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from database.base import Base
+from database.models import Restaurante, BotConversa, BotMensagem
+from backend.app.routers import bot_whatsapp as bw
+
+BASE = datetime(2026, 1, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'inbox.db'}")
+    Base.metadata.create_all(bind=engine)
+    sessao = sessionmaker(bind=engine)()
+    yield sessao
+    sessao.close()
+    engine.dispose()
+
+
+@pytest.fixture
+def restaurante(db):
+    r = Restaurante(
+        nome="Inbox", nome_fantasia="Inbox", email="inbox@t.com", telefone="11999990000",
+        endereco_completo="Rua 1", codigo_acesso="INBOX1", senha="x", ativo=True,
+    )
+    db.add(r)
+    db.commit()
+    return r
+
+
+def _conversas(db, restaurante, n, **campos):
+    for i in range(n):
+        db.add(BotConversa(
+            restaurante_id=restaurante.id, telefone=f"55119{i:08d}", nome_cliente=f"Cliente {i}",
+            status="handoff" if i % 3 == 0 else "ativa",
+            criado_em=BASE, atualizado_em=BASE + timedelta(minutes=i // 2),  # empates de atualizado_em
+            **campos,
+        ))
+    db.commit()
+
+
+def _listar(db, restaurante, **kw):
+    params = dict(status=None, busca=None, limit=50, cursor=None, offset=0, incluir_total=False)
+    params.update(kw)
+    return bw.listar_conversas(restaurante=restaurante, _feature=None, db=db, **params)
+
+
+def _mensagens(db, restaurante, conversa_id, **kw):
+    params = dict(limite=50, antes_de=None, depois_de=None, pagina=None)
+    params.update(kw)
+    return bw.listar_mensagens(conversa_id, restaurante=restaurante, _feature=None, db=db, **params)
+
+
+class TestConversas:
+    def test_cursor_percorre_tudo_sem_repetir(self, db, restaurante):
+        _conversas(db, restaurante, 25)
+        vistos, cursor = [], None
+        while True:
+            r = _listar(db, restaurante, limit=7, cursor=cursor)
+            vistos += [c["id"] for c in r["conversas"]]
+            cursor = r["proximo_cursor"]
+            if not cursor:
+                break
+        esperado = [c.id for c in db.query(BotConversa).order_by(
+            BotConversa.atualizado_em.desc(), BotConversa.id.desc())]
+        assert vistos == esperado
+        assert "total" not in r
+
+    def test_filtro_status_e_total_opcional(self, db, restaurante):
+        _conversas(db, restaurante, 10)
+        r = _listar(db, restaurante, status="handoff", incluir_total=True)
+        assert r["total"] == 4
+        assert {c["status"] for c in r["conversas"]} == {"handoff"}
+
+    def test_busca_telefone_normalizado_e_nome(self, db, restaurante):
+        _conversas(db, restaurante, 5)
+        r = _listar(db, restaurante, busca="(11) 9000-00003")
+        assert [c["telefone"] for c in r["conversas"]] == ["5511900000003"]
+        r = _listar(db, restaurante, busca="cliente 4")
+        assert [c["nome_cliente"] for c in r["conversas"]] == ["Cliente 4"]
+
+    def test_offset_legado(self, db, restaurante):
+        _conversas(db, restaurante, 6)
+        todas = _listar(db, restaurante)["conversas"]
+        assert _listar(db, restaurante, offset=2, limit=2)["conversas"] == todas[2:4]
+
+    def test_cursor_invalido(self, db, restaurante):
+        with pytest.raises(HTTPException) as e:
+            _listar(db, restaurante, cursor="lixo")
+        assert e.value.status_code == 400
+
+
+class TestMudancas:
+    def _mudancas(self, db, restaurante, desde, limit=200):
+        return bw.conversas_mudancas(desde=desde, limit=limit, restaurante=restaurante, _feature=None, db=db)
+
+    def test_so_alteradas_desde_o_ultimo_sync(self, db, restaurante):
+        _conversas(db, restaurante, 3)
+        desde = _listar(db, restaurante)["sincronizado_em"]
+        assert self._mudancas(db, restaurante, desde)["conversas"] == []
+
+        conversa = db.query(BotConversa).first()
+        conversa.status = "encerrada"
+        conversa.atualizado_em = datetime.utcnow()
+        db.commit()
+        r = self._mudancas(db, restaurante, desde)
+        assert [c["id"] for c in r["conversas"]] == [conversa.id]
+        assert r["completo"] is True
+
+    def test_pagina_cheia_continua_do_ultimo(self, db, restaurante):
+        _conversas(db, restaurante, 9)
+        desde = (BASE - timedelta(seconds=1)).isoformat()
+        vistos = set()
+        for _ in range(10):
+            r = self._mudancas(db, restaurante, desde, limit=4)
+            vistos |= {c["id"] for c in r["conversas"]}
+            desde = r["sincronizado_em"]
+            if r["completo"]:
+                break
+        assert len(vistos) == 9
+
+
+class TestMensagens:
+    @pytest.fixture
+    def conversa(self, db, restaurante):
+        c = BotConversa(restaurante_id=restaurante.id, telefone="5511988887777", status="ativa")
+        db.add(c)
+        db.commit()
+        for i in range(12):
+            db.add(BotMensagem(conversa_id=c.id, direcao="recebida", conteudo=f"m{i}",
+                               criado_em=BASE + timedelta(seconds=i)))
+        db.commit()
+        return c
+
+    def test_padrao_mais_recentes_em_ordem(self, db, restaurante, conversa):
+        r = _mensagens(db, restaurante, conversa.id, limite=5)
+        assert [m["conteudo"] for m in r["mensagens"]] == ["m7", "m8", "m9", "m10", "m11"]
+        assert r["tem_anteriores"] is True
+
+    def test_antes_de_e_depois_de(self, db, restaurante, conversa):
+        ultimas = _mensagens(db, restaurante, conversa.id, limite=5)["mensagens"]
+        anteriores = _mensagens(db, restaurante, conversa.id, limite=5, antes_de=ultimas[0]["id"])
+        assert [m["conteudo"] for m in anteriores["mensagens"]] == ["m2", "m3", "m4", "m5", "m6"]
+
+        db.add(BotMensagem(conversa_id=conversa.id, direcao="enviada", conteudo="nova"))
+        db.commit()
+        novas = _mensagens(db, restaurante, conversa.id, depois_de=ultimas[-1]["id"])
+        assert [m["conteudo"] for m in novas["mensagens"]] == ["nova"]
+        assert novas["tem_mais_novas"] is False
+
+    def test_pagina_legada(self, db, restaurante, conversa):
+        r = _mensagens(db, restaurante, conversa.id, limite=5, pagina=1)
+        assert [m["conteudo"] for m in r["mensagens"]] == ["m0", "m1", "m2", "m3", "m4"]
+        assert r["total"] == 12 and r["paginas"] == 3
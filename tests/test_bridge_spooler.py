@@ -0,0 +1,144 @@
+"""
+Testes do monitor de spooler do Bridge Agent — Derekh Food
+Roda o caminho de captura inteiro no Linux com o MemorySpooler: notificação
+em vez de polling, pausa/retomada do job, leitura só depois do spool
+completo, prefixo ignorado, histórico limitado e callback fora da thread
+de captura.
+
+Execução: pytest tests/test_bridge_spooler.py -v
+"""
+
+import sys
+import time
+import threading
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import pytest
+
+from bridge_agent import spooler_monitor as sm
+from bridge_agent.spooler_monitor import JanelaJobs, MemorySpooler, SpoolerMonitor
+
+IMPRESSORA = "EPSON TM-T20"
+
+
+def _esperar(condicao, timeout=2.0):
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if condicao():
+            return True
+        time.sleep(0.005)
+    return False
+
+
+@pytest.fixture
+def spooler():
+    return MemorySpooler()
+
+
+@pytest.fixture
+def capturados():
+    return []
+
+
+@pytest.fixture
+def monitor(spooler, capturados):
+    m = SpoolerMonitor(
+        [IMPRESSORA], rescan_interval=5.0, backend=spooler,
+        on_job_captured=lambda imp, dados: capturados.append((imp, dados, time.monotonic())),
+    )
+    m.start()
+    yield m
+    m.stop()
+
+
+class TestCaptura:
+    def test_captura_por_notificacao(self, monitor, spooler, capturados):
+        inicio = time.monotonic()
+        job_id = spooler.enviar(IMPRESSORA, b"\x1b@PEDIDO 123\n\x1dV\x00")
+        assert _esperar(lambda: capturados)
+        imp, dados, em = capturados[0]
+        assert (imp, dados) == (IMPRESSORA, b"\x1b@PEDIDO 123\n\x1dV\x00")
+        assert em - inicio < 0.1
+        assert spooler.pausados == [job_id] and spooler.retomados == [job_id]
+        assert monitor.stats["capturados"] == 1
+
+    def test_job_spoolando_so_e_lido_completo(self, monitor, spooler, capturados):
+        bloco = bytes(range(256)) * 1024
+        job_id = spooler.enviar(IMPRESSORA, bloco, spooling=True)
+        for _ in range(3):
+            time.sleep(0.03)
+            spooler.escrever(IMPRESSORA, job_id, bloco)
+        assert capturados == []
+        spooler.escrever(IMPRESSORA, job_id, b"FIM", fim=True)
+        assert _esperar(lambda: capturados)
+        assert capturados[0][1] == bloco * 4 + b"FIM"
+        assert spooler.retomados == [job_id]
+
+    def test_ignora_prefixo_e_nao_repete(self, monitor, spooler, capturados):
+        spooler.enviar(IMPRESSORA, b"proprio", documento="Derekh_Pedido_1")
+        spooler.enviar(IMPRESSORA, b"externo")
+        assert _esperar(lambda: capturados)
+        spooler.enviar(IMPRESSORA, b"outro")
+        assert _esperar(lambda: len(capturados) == 2)
+        time.sleep(0.05)
+        assert [d for _, d, _ in capturados] == [b"externo", b"outro"]
+        assert monitor.stats["ignorados"] == 1
+
+    def test_job_cancelado_antes_da_captura(self, monitor, spooler, capturados):
+        job_id = spooler.enviar(IMPRESSORA, b"", spooling=True)
+        assert _esperar(lambda: job_id in spooler.pausados)
+        spooler.remover(IMPRESSORA, job_id)
+        assert _esperar(lambda: monitor.stats["falhas"] == 1)
+        assert capturados == []
+
+    def test_ocioso_nao_faz_polling(self, monitor, spooler):
+        assert _esperar(lambda: spooler.chamadas_listar >= 1)
+        antes = spooler.chamadas_listar
+        time.sleep(0.3)
+        assert spooler.chamadas_listar == antes
+
+    def test_callback_lento_nao_atrasa_captura(self, spooler):
+        liberar = threading.Event()
+        recebidos = []
+
+        def lento(imp, dados):
+            liberar.wait(2)
+            recebidos.append(dados)
+
+        m = SpoolerMonitor([IMPRESSORA], backend=spooler, on_job_captured=lento)
+        m.start()
+        try:
+            for i in range(3):
+                spooler.enviar(IMPRESSORA, f"job {i}".encode())
+            assert _esperar(lambda: m.stats["capturados"] == 3)
+            assert recebidos == []
+            liberar.set()
+            assert _esperar(lambda: len(recebidos) == 3)
+            assert recebidos == [b"job 0", b"job 1", b"job 2"]
+        finally:
+            m.stop()
+
+
+class TestJanelaJobs:
+    def test_limite_de_tamanho(self):
+        janela = JanelaJobs(max_itens=3)
+        for i in range(5):
+            janela.adicionar(f"p:{i}")
+        assert len(janela) == 3
+        assert "p:0" not in janela and "p:4" in janela
+
+    def test_ttl(self, monkeypatch):
+        agora = [1000.0]
+        monkeypatch.setattr(sm.time, "monotonic", lambda: agora[0])
+        janela = JanelaJobs(ttl=60)
+        janela.adicionar("p:1")
+        agora[0] += 30
+        janela.adicionar("p:2")
+        agora[0] += 31
+        assert "p:1" not in janela
+        assert janela.podar() == 0 and len(janela) == 1
+        agora[0] += 60
+        assert janela.podar() == 1 and len(janela) == 0
@@ -0,0 +1,279 @@
+"""
+Testes do carrinho com store plugável (Redis / banco) — Derekh Food
+Valida que, com Redis, nenhuma escrita de carrinho chega ao banco, que o preço
+vem do mapa cacheado (sem queries de variação por item), o fallback para a
+tabela `carrinho` sem Redis e a persistência só no finalizar (Pedido).
+
+Execução: pytest tests/test_carrinho_store.py -v
+"""
+
+import sys
+import os
+import fnmatch
+from pathlib import Path
+from unittest.mock import patch
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key-carrinho-store")
+os.environ.setdefault("ENVIRONMENT", "testing")
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from database.base import Base
+from database.models import (
+    Restaurante, Produto, VariacaoProduto, Carrinho, Pedido, ConfigRestaurante,
+)
+
+
+class FakeRedis:
+    """Redis em memória: strings, hashes e pipeline."""
+
+    def __init__(self):
+        self._store = {}
+
+    # strings
+    def get(self, key):
+        v = self._store.get(key)
+        return None if v is None else str(v)
+
+    def setex(self, key, ttl, value):
+        self._store[key] = str(value)
+
+    # hashes
+    def hget(self, key, campo):
+        return self._store.get(key, {}).get(campo)
+
+    def hgetall(self, key):
+        return dict(self._store.get(key, {}))
+
+    def hset(self, key, campo=None, valor=None, mapping=None):
+        h = self._store.setdefault(key, {})
+        if mapping:
+            h.update(mapping)
+        if campo is not None:
+            h[campo] = valor
+
+    def hdel(self, key, campo):
+        self._store.get(key, {}).pop(campo, None)
+
+    # genéricas
+    def exists(self, key):
+        return int(key in self._store)
+
+    def expire(self, key, ttl):
+        return key in self._store
+
+    def delete(self, *keys):
+        for k in keys:
+            self._store.pop(k, None)
+
+    def scan(self, cursor, match="*", count=100):
+        return 0, [k for k in list(self._store) if fnmatch.fnmatch(k, match)]
+
+    def pipeline(self):
+        return _Pipeline(self)
+
+
+class _Pipeline:
+    def __init__(self, r):
+        self._r, self._ops = r, []
+
+    def __getattr__(self, nome):
+        return lambda *a, **kw: self._ops.append((nome, a, kw))
+
+    def execute(self):
+        return [getattr(self._r, n)(*a, **kw) for n, a, kw in self._ops]
+
+
+@pytest.fixture
+def ambiente():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    Sessao = sessionmaker(bind=engine)
+    db = Sessao()
+    rest = Restaurante(
+        nome="Pizzaria Store", nome_fantasia="Pizzaria Store", email="store@t.com",
+        telefone="11999990000", endereco_completo="Rua 1", codigo_acesso="STORE1",
+        senha="x", ativo=True,
+    )
+    db.add(rest)
+    db.flush()
+    db.add(ConfigRestaurante(restaurante_id=rest.id, status_atual="aberto"))
+    pizza = Produto(restaurante_id=rest.id, nome="Pizza", preco=40.0, disponivel=True)
+    db.add(pizza)
+    db.flush()
+    db.add_all([
+        VariacaoProduto(produto_id=pizza.id, tipo_variacao="tamanho", nome="Grande", preco_adicional=10.0),
+        VariacaoProduto(produto_id=pizza.id, tipo_variacao="borda", nome="Catupiry", preco_adicional=5.0),
+    ])
+    db.commit()
+    ids = {"produto": pizza.id, "variacoes": [v.id for v in pizza.variacoes]}
+    db.close()
+
+    from backend.app import database
+    from backend.app.routers import carrinho as carrinho_router
+    from backend.app.routers.auth_cliente import get_cliente_opcional
+
+    app = FastAPI()
+    app.include_router(carrinho_router.router)
+
+    def _get_db():
+        s = Sessao()
+        try:
+            yield s
+        finally:
+            s.close()
+
+    app.dependency_overrides[database.get_db] = _get_db
+    app.dependency_overrides[get_cliente_opcional] = lambda: None
+
+    queries = []
+    event.listen(engine, "before_cursor_execute",
+                 lambda conn, cur, sql, *a: queries.append(sql))
+    yield TestClient(app), Sessao, ids, queries
+    engine.dispose()
+
+
+@pytest.fixture
+def redis_fake():
+    fake = FakeRedis()
+    with patch("backend.app.carrinho_store.get_redis", return_value=fake):
+        yield fake
+
+
+HEADERS = {"X-Session-ID": "sessao-1"}
+
+
+def _adicionar(client, ids, variacoes=None, quantidade=1):
+    return client.post("/carrinho/adicionar", headers=HEADERS, json={
+        "produto_id": ids["produto"],
+        "variacoes_ids": ids["variacoes"] if variacoes is None else variacoes,
+        "quantidade": quantidade,
+    })
+
+
+class TestRedis:
+    def test_adicionar_sem_escrita_no_banco(self, ambiente, redis_fake):
+        client, Sessao, ids, queries = ambiente
+        r = _adicionar(client, ids, quantidade=2)
+        assert r.status_code == 200
+        corpo = r.json()
+        assert corpo["itens"][0]["preco_unitario"] == 55.0
+        assert {v["nome"] for v in corpo["itens"][0]["variacoes"]} == {"Grande", "Catupiry"}
+        assert corpo["valor_total"] == 110.0
+
+        assert not any(q.lstrip().upper().startswith(("INSERT", "UPDATE", "DELETE")) for q in queries)
+        db = Sessao()
+        assert db.query(Carrinho).count() == 0
+        db.close()
+
+    def test_preco_do_mapa_cacheado(self, ambiente, redis_fake):
+        client, _, ids, queries = ambiente
+        _adicionar(client, ids)  # aquece produto → restaurante
+        _adicionar(client, ids)  # aquece mapa de preços
+        queries.clear()
+        _adicionar(client, ids)
+        assert queries == []  # nem produto nem variações no banco
+
+    def test_mapa_invalidado_com_o_cardapio(self, ambiente, redis_fake):
+        client, Sessao, ids, _ = ambiente
+        _adicionar(client, ids, variacoes=[])
+        _adicionar(client, ids, variacoes=[])
+        db = Sessao()
+        db.query(Produto).update({"preco": 50.0})
+        db.commit()
+        rid = db.query(Restaurante.id).scalar()
+        db.close()
+
+        from backend.app.cache import invalidate_cardapio
+        with patch("backend.app.cache.get_redis", return_value=redis_fake):
+            invalidate_cardapio(rid)
+        assert _adicionar(client, ids, variacoes=[]).json()["itens"][-1]["preco_unitario"] == 50.0
+
+    def test_variacao_editada_no_painel_reprecifica(self, ambiente, redis_fake):
+        from backend.app.routers import painel
+
+        client, Sessao, ids, _ = ambiente
+        _adicionar(client, ids)
+        assert _adicionar(client, ids).json()["itens"][-1]["preco_unitario"] == 55.0  # mapa aquecido
+
+        db = Sessao()
+        rest = db.query(Restaurante).one()
+        grande = db.query(VariacaoProduto.id).filter(VariacaoProduto.nome == "Grande").scalar()
+        with patch("backend.app.cache.get_redis", return_value=redis_fake):
+            painel.editar_variacao(
+                grande,
+                painel.VariacaoRequest(tipo_variacao="tamanho", nome="Grande", preco_adicional=15.0),
+                rest=rest, db=db,
+            )
+            nova = painel.criar_variacao(
+                ids["produto"],
+                painel.VariacaoRequest(tipo_variacao="adicional", nome="Bacon", preco_adicional=7.0),
+                rest=rest, db=db,
+            )
+        db.close()
+
+        item = _adicionar(client, ids, variacoes=ids["variacoes"] + [nova["id"]]).json()["itens"][-1]
+        assert item["preco_unitario"] == 40.0 + 15.0 + 5.0 + 7.0
+        assert "Bacon" in {v["nome"] for v in item["variacoes"]}
+
+    def test_atualizar_remover_limpar(self, ambiente, redis_fake):
+        client, _, ids, _ = ambiente
+        _adicionar(client, ids, variacoes=[])
+        _adicionar(client, ids)
+        r = client.put("/carrinho/atualizar-quantidade/0?nova_quantidade=3&codigo_acesso=store1", headers=HEADERS)
+        assert r.json()["valor_subtotal"] == 3 * 40.0 + 55.0
+        r = client.delete("/carrinho/remover/1", headers=HEADERS)
+        assert r.json()["quantidade_itens"] == 1
+        assert client.get("/carrinho/?codigo_acesso=STORE1", headers=HEADERS).json()["valor_total"] == 120.0
+        client.delete("/carrinho/limpar", headers=HEADERS)
+        assert client.get("/carrinho/?codigo_acesso=STORE1", headers=HEADERS).json()["itens"] == []
+
+    def test_produto_indisponivel(self, ambiente, redis_fake):
+        client, _, ids, _ = ambiente
+        r = client.post("/carrinho/adicionar", headers=HEADERS, json={"produto_id": 9999})
+        assert r.status_code == 404
+
+    def test_finalizar_persiste_no_pedido(self, ambiente, redis_fake):
+        client, Sessao, ids, _ = ambiente
+        _adicionar(client, ids, quantidade=2)
+        r = client.post("/carrinho/finalizar", headers=HEADERS, json={
+            "codigo_acesso": "STORE1",
+            "cliente_nome": "Ana",
+            "cliente_telefone": "11988887777",
+            "tipo_entrega": "retirada",
+            "forma_pagamento": "dinheiro",
+        })
+        assert r.status_code == 200, r.text
+
+        db = Sessao()
+        pedido = db.query(Pedido).one()
+        assert pedido.carrinho_json[0]["preco_unitario"] == 55.0
+        assert pedido.valor_subtotal == 110.0
+        assert db.query(Carrinho).count() == 0
+        db.close()
+        assert client.get("/carrinho/?codigo_acesso=STORE1", headers=HEADERS).json()["itens"] == []
+
+
+class TestBanco:
+    def test_fallback_sem_redis(self, ambiente):
+        client, Sessao, ids, _ = ambiente
+        with patch("backend.app.carrinho_store.get_redis", return_value=None):
+            _adicionar(client, ids)
+            r = _adicionar(client, ids, variacoes=[])
+            assert r.json()["id"] is not None
+            assert r.json()["valor_subtotal"] == 95.0
+            db = Sessao()
+            assert db.query(Carrinho).count() == 1
+            db.close()
+            client.delete("/carrinho/remover/0", headers=HEADERS)
+            assert client.get("/carrinho/?codigo_acesso=STORE1", headers=HEADERS).json()["valor_total"] == 40.0
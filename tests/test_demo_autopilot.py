@@ -0,0 +1,225 @@
+"""
+Testes do demo autopilot por prazos — Derekh Food
+Valida a progressão completa de um pedido demo a partir do prazo armado na
+criação, a transição única entre workers (banco e Redis), o re-agendamento
+quando o status muda por fora, a recuperação de prazos órfãos e que sem
+pedido demo ativo o loop não consulta o banco.
+
+Execução: pytest tests/test_demo_autopilot.py -v
+"""
+
+import sys
+import os
+import asyncio
+import threading
+from pathlib import Path
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key-demo-autopilot")
+os.environ.setdefault("ENVIRONMENT", "testing")
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from database.base import Base
+from database.models import Restaurante, Pedido, Entrega
+from backend.app import demo_autopilot as da
+from backend.app.demo_autopilot import DemoAutopilot
+
+DELAYS_RAPIDOS = {s: 0.02 for s in da.DEMO_DELAYS}
+
+
+class FakeRedis:
+    """Redis em memória com o ZSET usado pelos prazos (zadd/zrem/zrangebyscore)."""
+
+    def __init__(self):
+        self._zset = {}
+        self._lock = threading.Lock()
+
+    def zadd(self, key, mapping):
+        with self._lock:
+            self._zset.update(mapping)
+
+    def zrem(self, key, membro):
+        with self._lock:
+            return int(self._zset.pop(membro, None) is not None)
+
+    def zrangebyscore(self, key, minimo, maximo):
+        with self._lock:
+            return [m for m, s in sorted(self._zset.items(), key=lambda i: i[1]) if s <= maximo]
+
+
+class ContadorSessoes:
+    def __init__(self, fabrica):
+        self.fabrica = fabrica
+        self.n = 0
+
+    def __call__(self):
+        self.n += 1
+        return self.fabrica()
+
+
+@pytest.fixture
+def Sessao(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'demo.db'}",
+        connect_args={"check_same_thread": False, "timeout": 30},
+    )
+    Base.metadata.create_all(bind=engine)
+    fabrica = ContadorSessoes(sessionmaker(bind=engine))
+    with patch.object(da, "SessionLocal", fabrica), patch.object(da, "get_redis", return_value=None):
+        yield fabrica
+    engine.dispose()
+
+
+def _restaurante(Sessao, email="pizza@superfood.test") -> int:
+    db = Sessao.fabrica()
+    r = Restaurante(
+        nome="Demo", nome_fantasia="Demo", email=email, telefone="11999990000",
+        endereco_completo="Rua 1", codigo_acesso=email[:6].upper(), senha="x", ativo=True,
+        latitude=-23.5, longitude=-46.6,
+    )
+    db.add(r)
+    db.commit()
+    rid = r.id
+    db.close()
+    return rid
+
+
+def _pedido(Sessao, restaurante_id, status="pendente", atualizado_em=None) -> int:
+    db = Sessao.fabrica()
+    p = Pedido(
+        restaurante_id=restaurante_id, comanda="1", tipo="Entrega", cliente_nome="Ana",
+        itens="1x Pizza", valor_total=10.0, status=status,
+        historico_status=[{"status": status, "timestamp": datetime.utcnow().isoformat()}],
+        data_criacao=datetime.utcnow(), atualizado_em=atualizado_em or datetime.utcnow(),
+    )
+    db.add(p)
+    db.commit()
+    pid = p.id
+    db.close()
+    return pid
+
+
+def _ler(Sessao, pedido_id) -> Pedido:
+    db = Sessao.fabrica()
+    try:
+        return db.query(Pedido).filter(Pedido.id == pedido_id).first()
+    finally:
+        db.close()
+
+
+async def _rodar(autopilot, ate, timeout=3.0):
+    tarefa = asyncio.create_task(autopilot.executar())
+    try:
+        limite = asyncio.get_running_loop().time() + timeout
+        while not ate() and asyncio.get_running_loop().time() < limite:
+            await asyncio.sleep(0.01)
+    finally:
+        tarefa.cancel()
+        await asyncio.gather(tarefa, return_exceptions=True)
+
+
+class TestProgressao:
+    def test_pedido_percorre_fluxo_ate_entregue(self, Sessao):
+        rid = _restaurante(Sessao)
+        pid = _pedido(Sessao, rid)
+        autopilot = DemoAutopilot()
+
+        with patch.dict(da.DEMO_DELAYS, DELAYS_RAPIDOS):
+            autopilot.agendar(pid, "pendente")
+            asyncio.run(_rodar(autopilot, lambda: _ler(Sessao, pid).status == "entregue"))
+
+        pedido = _ler(Sessao, pid)
+        assert pedido.status == "entregue"
+        assert [h["status"] for h in pedido.historico_status] == [
+            "pendente", "confirmado", "em_preparo", "pronto", "em_entrega", "entregue",
+        ]
+        assert autopilot.stats["transicoes"] == 5
+
+        db = Sessao.fabrica()
+        entrega = db.query(Entrega).filter(Entrega.pedido_id == pid).first()
+        assert entrega.status == "entregue" and entrega.delivery_finished_at is not None
+        db.close()
+
+    def test_reconciliacao_arma_pedidos_existentes(self, Sessao):
+        rid = _restaurante(Sessao)
+        pid = _pedido(Sessao, rid, status="pronto", atualizado_em=datetime.utcnow() - timedelta(minutes=5))
+        _pedido(Sessao, _restaurante(Sessao, email="real@loja.com"))  # não demo
+        autopilot = DemoAutopilot()
+        autopilot.reconciliar()
+        assert list(autopilot._prazos) == [f"{pid}:pronto"]
+        assert autopilot._proximo_prazo() <= da.time.time()  # já vencido
+
+
+class TestUnicidade:
+    def test_transicao_unica_entre_workers(self, Sessao):
+        rid = _restaurante(Sessao)
+        pid = _pedido(Sessao, rid)
+
+        async def cenario():
+            return await asyncio.gather(
+                DemoAutopilot().disparar(pid, "pendente"),
+                DemoAutopilot().disparar(pid, "pendente"),
+            )
+
+        assert sorted(asyncio.run(cenario())) == [False, True]
+        pedido = _ler(Sessao, pid)
+        assert pedido.status == "confirmado"
+        assert [h["status"] for h in pedido.historico_status] == ["pendente", "confirmado"]
+
+    def test_status_mudado_por_fora_reagenda(self, Sessao):
+        rid = _restaurante(Sessao)
+        pid = _pedido(Sessao, rid, status="em_preparo")
+        autopilot = DemoAutopilot()
+        assert asyncio.run(autopilot.disparar(pid, "pendente")) is False
+        assert _ler(Sessao, pid).status == "em_preparo"
+        assert f"{pid}:em_preparo" in autopilot._prazos
+
+    def test_redis_decide_quem_dispara(self, Sessao):
+        redis = FakeRedis()
+        with patch.object(da, "get_redis", return_value=redis):
+            a, b = DemoAutopilot(), DemoAutopilot()
+            a.agendar(7, "pendente")
+            assert [a._assumir("7:pendente"), b._assumir("7:pendente")] == [True, False]
+
+    def test_prazo_orfao_assumido_por_outro_worker(self, Sessao):
+        rid = _restaurante(Sessao)
+        pid = _pedido(Sessao, rid)
+        redis = FakeRedis()
+        with patch.object(da, "get_redis", return_value=redis), \
+                patch.object(da, "DEMO_TOLERANCIA_ORFAO", 0), patch.object(da, "DEMO_ORFAOS_INTERVAL", 0.05), \
+                patch.dict(da.DEMO_DELAYS, DELAYS_RAPIDOS):
+            DemoAutopilot().agendar(pid, "pendente")  # worker que armou e morreu
+            sobrevivente = DemoAutopilot()
+            sobrevivente.reconciliar = lambda: None  # prazo só existe no Redis
+            asyncio.run(_rodar(sobrevivente, lambda: _ler(Sessao, pid).status == "entregue"))
+        assert _ler(Sessao, pid).status == "entregue"
+        assert sobrevivente.stats["orfaos"] >= 1
+
+
+class TestOcioso:
+    @pytest.mark.parametrize("com_demo", [False, True])
+    def test_sem_pedido_demo_ativo_nao_consulta_banco(self, Sessao, com_demo):
+        if com_demo:
+            _restaurante(Sessao)
+        autopilot = DemoAutopilot()
+        asyncio.run(_rodar(autopilot, lambda: False, timeout=0.3))
+        assert Sessao.n == 1  # só a reconciliação inicial
+        assert autopilot._heap == []
+
+    def test_cache_de_restaurantes_demo(self, Sessao):
+        rid = _restaurante(Sessao)
+        autopilot = DemoAutopilot()
+        db = Sessao.fabrica()
+        try:
+            assert autopilot.restaurantes_demo(db) == [rid]
+            _restaurante(Sessao, email="outro@superfood.test")
+            assert autopilot.restaurantes_demo(db) == [rid]  # dentro do TTL
+        finally:
+            db.close()
@@ -0,0 +1,202 @@
+"""
+Testes do cache host → tenant do DomainTenantMiddleware — Derekh Food
+Valida cache positivo/negativo, TTL, invalidação e que o tráfego do site
+white-label não faz query por request.
+
+Execução: pytest tests/test_domain_tenant_cache.py -v
+"""
+
+import sys
+import os
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key-domain-cache")
+os.environ.setdefault("ENVIRONMENT", "testing")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{PROJECT_ROOT}/test_domain_cache.db")
+
+DB_PATH = PROJECT_ROOT / "test_domain_cache.db"
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+
+# ==================== FIXTURES ====================
+
+@pytest.fixture(scope="module")
+def db_session():
+    """Banco isolado: o middleware usa o SessionLocal deste módulo."""
+    import database.models  # noqa: F401
+    from backend.app.database import Base
+
+    test_engine = create_engine(
+        f"sqlite:///{DB_PATH}",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=test_engine)
+    TestSession = sessionmaker(autocommit=False, autoflush=False, bind=test_engine)
+    db = TestSession()
+    with patch("backend.app.middleware.SessionLocal", TestSession):
+        yield db
+    db.close()
+    test_engine.dispose()
+
+    if DB_PATH.exists():
+        try:
+            DB_PATH.unlink()
+        except Exception:
+            pass
+
+
+@pytest.fixture(scope="module")
+def restaurante(db_session):
+    from database.models import Restaurante, DominioPersonalizado
+    db = db_session
+    rest = db.query(Restaurante).filter(Restaurante.email == "dominio_cache@test.com").first()
+    if not rest:
+        rest = Restaurante(
+            nome="Pizzaria Dominio",
+            nome_fantasia="Pizzaria Dominio",
+            email="dominio_cache@test.com",
+            telefone="11999990000",
+            endereco_completo="Rua Dominio 1",
+            codigo_acesso="DOMCACHE",
+            senha="hashed",
+            ativo=True,
+        )
+        db.add(rest)
+        db.flush()
+        db.add(DominioPersonalizado(
+            restaurante_id=rest.id,
+            dominio="pedidos.pizzariadominio.com.br",
+            verificado=True,
+            ativo=True,
+        ))
+        db.commit()
+    return rest
+
+
+@pytest.fixture
+def cache():
+    from backend.app.middleware import DominioTenantCache
+    return DominioTenantCache(ttl_seconds=300, ttl_negativo_seconds=60)
+
+
+@pytest.fixture
+def client(cache):
+    from backend.app.middleware import DomainTenantMiddleware
+
+    async def site(request: Request):
+        return JSONResponse({"tenant": getattr(request.state, "domain_tenant_id", None)})
+
+    app = Starlette(routes=[
+        Route("/", site),
+        Route("/assets/app.js", site),
+        Route("/api/x", site),
+    ])
+    app.add_middleware(DomainTenantMiddleware, cache=cache)
+    return TestClient(app)
+
+
+def _contar_resolucoes():
+    from backend.app.middleware import DomainTenantMiddleware
+    return patch.object(
+        DomainTenantMiddleware, "_resolve_tenant",
+        autospec=True, side_effect=DomainTenantMiddleware._resolve_tenant,
+    )
+
+
+# ==================== TESTES ====================
+
+class TestMiddleware:
+    def test_dominio_personalizado_uma_query(self, client, restaurante):
+        host = {"host": "pedidos.pizzariadominio.com.br"}
+        with _contar_resolucoes() as resolve:
+            for path in ("/", "/assets/app.js", "/", "/assets/app.js"):
+                assert client.get(path, headers=host).json()["tenant"] == restaurante.id
+        assert resolve.call_count == 1
+
+    def test_subdominio(self, client, restaurante):
+        r = client.get("/", headers={"host": "domcache.superfood.com.br:443"})
+        assert r.json()["tenant"] == restaurante.id
+
+    def test_cache_negativo(self, client, restaurante):
+        with _contar_resolucoes() as resolve:
+            for _ in range(5):
+                assert client.get("/", headers={"host": "scanner.exemplo.com"}).json()["tenant"] is None
+        assert resolve.call_count == 1
+
+    def test_bypass_e_plataforma_sem_query(self, client, restaurante):
+        with _contar_resolucoes() as resolve:
+            client.get("/api/x", headers={"host": "pedidos.pizzariadominio.com.br"})
+            client.get("/", headers={"host": "derekhfood.com.br"})
+            client.get("/", headers={"host": "127.0.0.1"})
+        assert resolve.call_count == 0
+
+    def test_erro_de_banco_nao_cacheia(self, client, cache, restaurante):
+        from unittest.mock import MagicMock
+        from backend.app import middleware
+        sessao = MagicMock()
+        sessao.query.side_effect = RuntimeError("db fora")
+        with patch.object(middleware, "SessionLocal", return_value=sessao):
+            r = client.get("/", headers={"host": "outro.exemplo.com"})
+        assert r.json()["tenant"] is None
+        # Falha transitória não vira cache negativo
+        assert cache.get("outro.exemplo.com") == (False, None)
+
+
+class TestDominioTenantCache:
+    def test_ttl_positivo_e_negativo(self, cache):
+        cache.set("a.com", 7)
+        cache.set("b.com", None)
+        assert cache.get("a.com") == (True, 7)
+        assert cache.get("b.com") == (True, None)
+
+        agora = time.monotonic()
+        with patch("backend.app.middleware.time.monotonic", return_value=agora + 61):
+            assert cache.get("a.com") == (True, 7)
+            assert cache.get("b.com") == (False, None)
+        with patch("backend.app.middleware.time.monotonic", return_value=agora + 301):
+            assert cache.get("a.com") == (False, None)
+
+    def test_invalidacao_por_host_restaurante_e_subdominio(self, cache):
+        cache.set("pedidos.x.com", 7)
+        cache.set("outro.x.com", 7)
+        cache.set("abc123.superfood.com.br", None)
+        cache.set("y.com", 8)
+
+        cache.invalidar("PEDIDOS.X.COM")
+        assert cache.get("pedidos.x.com") == (False, None)
+        assert cache.get("outro.x.com") == (True, 7)
+
+        cache.invalidar(restaurante_id=7, codigo_acesso="ABC123")
+        assert cache.get("outro.x.com") == (False, None)
+        assert cache.get("abc123.superfood.com.br") == (False, None)
+        assert cache.get("y.com") == (True, 8)
+
+    def test_limite_de_hosts(self):
+        from backend.app.middleware import DominioTenantCache
+        cache = DominioTenantCache(max_hosts=3)
+        for i in range(5):
+            cache.set(f"h{i}.com", i)
+        assert len(cache._hosts) == 3
+        assert cache.get("h4.com") == (True, 4)
+        assert cache.get("h0.com") == (False, None)
+
+    def test_invalidar_dominio_tenant_global(self):
+        from backend.app.middleware import dominio_tenant_cache, invalidar_dominio_tenant
+        dominio_tenant_cache.set("global.com", None)
+        invalidar_dominio_tenant("global.com")
+        assert dominio_tenant_cache.get("global.com") == (False, None)
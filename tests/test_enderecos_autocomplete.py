@@ -0,0 +1,262 @@
+"""
+Testes do autocomplete de endereços (enderecos_service) — Derekh Food
+Valida o histórico local do restaurante (sem chamada externa quando basta,
+mesclado com o Mapbox quando não) e o recorte só com os endereços do
+próprio cliente (site público), o cache Redis
+exato e por prefixo, a separação por país/célula de proximidade, a
+coalescência de consultas idênticas em voo e que falha do Mapbox não é cacheada.
+
+Execução: pytest tests/test_enderecos_autocomplete.py -v
+"""
+
+import sys
+import os
+import asyncio
+from pathlib import Path
+from unittest.mock import patch
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key-enderecos")
+os.environ.setdefault("ENVIRONMENT", "testing")
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from database.base import Base
+from database.models import Restaurante, Pedido, Cliente, EnderecoCliente
+from backend.app import enderecos_service as mod
+from backend.app.enderecos_service import EnderecoService, normalizar
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+class FakeRedis:
+    def __init__(self):
+        self._store = {}
+
+    def mget(self, keys):
+        return [self._store.get(k) for k in keys]
+
+    def setex(self, key, ttl, value):
+        self._store[key] = value
+
+
+class FakeMapbox:
+    """Substitui utils.mapbox_api.autocomplete_address_async contando chamadas."""
+
+    def __init__(self, resultado=None, atraso=0.0):
+        self.resultado = resultado
+        self.atraso = atraso
+        self.chamadas = []
+
+    async def __call__(self, query, proximity=None, country=None, limite=5, client=None):
+        self.chamadas.append((query, proximity, country))
+        if self.atraso:
+            await asyncio.sleep(self.atraso)
+        return self.resultado
+
+
+AUGUSTA = [
+    {"place_name": "Rua Augusta, 12, Consolação, São Paulo - SP", "coordinates": [-23.55, -46.66]},
+    {"place_name": "Rua Augusta, 1200, Jardins, São Paulo - SP", "coordinates": [-23.56, -46.66]},
+    {"place_name": "Rua Augusto Tolle, 5, Santana, São Paulo - SP", "coordinates": [-23.48, -46.62]},
+]
+
+
+@pytest.fixture
+def servico():
+    return EnderecoService()
+
+
+@pytest.fixture
+def redis_fake():
+    fake = FakeRedis()
+    with patch.object(mod, "get_redis", return_value=fake):
+        yield fake
+
+
+def _mapbox(fake):
+    return patch("utils.mapbox_api.autocomplete_address_async", new=fake)
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    sessao = sessionmaker(bind=engine)()
+    sessao.add(Restaurante(
+        nome="Rest End", nome_fantasia="Rest End", email="end@t.com", telefone="11999990000",
+        endereco_completo="Rua 1", codigo_acesso="END001", senha="x", ativo=True,
+    ))
+    sessao.flush()
+    for _ in range(2):
+        sessao.add(Pedido(
+            restaurante_id=1, comanda="1", tipo="Entrega", cliente_nome="Ana", itens="x", valor_total=10.0,
+            endereco_entrega="Rua São João, 45, Centro", latitude_entrega=-23.54, longitude_entrega=-46.63,
+        ))
+    # Sem coordenadas: não entra no histórico
+    sessao.add(Pedido(
+        restaurante_id=1, comanda="2", tipo="Entrega", cliente_nome="Bia", itens="x", valor_total=10.0,
+        endereco_entrega="Rua Sem Geo, 1",
+    ))
+    cliente = Cliente(restaurante_id=1, nome="Caio", telefone="11988887777", senha_hash="x")
+    sessao.add(cliente)
+    sessao.flush()
+    sessao.add(EnderecoCliente(
+        cliente_id=cliente.id, endereco_completo="Avenida Paulista", numero="900", bairro="Bela Vista",
+        latitude=-23.56, longitude=-46.65, ativo=True,
+    ))
+    sessao.commit()
+    yield sessao
+    sessao.close()
+    engine.dispose()
+
+
+class TestNormalizacao:
+    def test_sem_acento_e_pontuacao(self):
+        assert normalizar("  Rua São João, 12 ") == "rua sao joao 12"
+
+
+class TestHistorico:
+    def test_busca_longa_responde_sem_mapbox(self, servico, db):
+        fake = FakeMapbox([])
+        with _mapbox(fake):
+            r = _run(servico.autocompletar("rua sao joao 45", db=db, restaurante_id=1))
+        assert [s["place_name"] for s in r] == ["Rua São João, 45, Centro"]
+        assert r[0]["coordinates"] == (-23.54, -46.63)
+        assert fake.chamadas == []
+        assert servico.stats["historico"] == 1
+
+    def test_sugestoes_suficientes_responde_sem_mapbox(self, servico, db, monkeypatch):
+        monkeypatch.setattr(mod, "HISTORICO_MIN_SUGESTOES", 1)
+        fake = FakeMapbox([])
+        with _mapbox(fake):
+            r = _run(servico.autocompletar("rua sao jo", db=db, restaurante_id=1))
+        assert [s["place_name"] for s in r] == ["Rua São João, 45, Centro"]
+        assert fake.chamadas == []
+
+    def test_poucas_sugestoes_mescla_com_mapbox(self, servico, db, redis_fake):
+        fake = FakeMapbox([
+            {"place_name": "Rua São João 45 Centro", "coordinates": [-23.54, -46.63]},
+            {"place_name": "Rua São Joaquim, 10, Liberdade, São Paulo - SP", "coordinates": [-23.56, -46.63]},
+        ])
+        with _mapbox(fake):
+            r = _run(servico.autocompletar("rua sao jo", db=db, restaurante_id=1))
+        # Histórico primeiro; a mesma rua vinda do Mapbox não repete
+        assert [s["place_name"] for s in r] == [
+            "Rua São João, 45, Centro", "Rua São Joaquim, 10, Liberdade, São Paulo - SP",
+        ]
+        assert len(fake.chamadas) == 1
+        assert servico.stats["historico"] == 0 and servico.stats["historico_mesclado"] == 1
+
+    def test_mapbox_fora_devolve_historico(self, servico, db, redis_fake):
+        with _mapbox(FakeMapbox(None)):
+            r = _run(servico.autocompletar("rua sao jo", db=db, restaurante_id=1))
+        assert [s["place_name"] for s in r] == ["Rua São João, 45, Centro"]
+        assert servico.stats["falhas"] == 1
+
+    def test_endereco_salvo_do_cliente(self, servico, db):
+        r = servico.buscar_historico(db, 1, "av paulista 900")
+        assert r == [{"place_name": "Avenida Paulista, 900, Bela Vista", "coordinates": (-23.56, -46.65)}]
+
+    def test_ignora_sem_coordenadas_e_outro_restaurante(self, servico, db):
+        assert servico.buscar_historico(db, 1, "rua sem geo") == []
+        assert servico.buscar_historico(db, 2, "rua sao joao") == []
+
+    def test_cliente_so_ve_os_proprios_enderecos(self, servico, db):
+        caio = db.query(Cliente).filter(Cliente.nome == "Caio").first()
+        outro = Cliente(restaurante_id=1, nome="Dani", telefone="11977776666", senha_hash="x")
+        db.add(outro)
+        db.flush()
+        db.add(Pedido(
+            restaurante_id=1, comanda="3", tipo="Entrega", cliente_nome="Dani", itens="x", valor_total=10.0,
+            cliente_id=outro.id, endereco_entrega="Rua Augusta, 77", latitude_entrega=-23.55,
+            longitude_entrega=-46.66,
+        ))
+        db.commit()
+
+        fake = FakeMapbox([])
+        with _mapbox(fake):
+            proprio = _run(servico.autocompletar("av paulista", db=db, restaurante_id=1, cliente_id=caio.id))
+            alheio = _run(servico.autocompletar("rua augusta", db=db, restaurante_id=1, cliente_id=caio.id))
+            sem_pedido = _run(servico.autocompletar("rua sao joao", db=db, restaurante_id=1, cliente_id=caio.id))
+        assert [s["place_name"] for s in proprio] == ["Avenida Paulista, 900, Bela Vista"]
+        assert alheio == [] and sem_pedido == []  # pedidos de outros (ou sem cliente) não vazam
+        assert servico.buscar_enderecos_cliente(db, 1, outro.id, "rua augusta")[0]["place_name"] == "Rua Augusta, 77"
+
+    def test_sem_match_vai_ao_mapbox(self, servico, db, redis_fake):
+        fake = FakeMapbox(AUGUSTA)
+        with _mapbox(fake):
+            r = _run(servico.autocompletar("rua augusta", db=db, restaurante_id=1))
+        assert len(r) == 3 and len(fake.chamadas) == 1
+
+
+class TestCache:
+    def test_consulta_exata_cacheada(self, servico, redis_fake):
+        fake = FakeMapbox(AUGUSTA)
+        with _mapbox(fake):
+            a = _run(servico.autocompletar("Rua Augusta", (-23.5, -46.6), "BR"))
+            b = _run(servico.autocompletar("rua  augusta", (-23.5, -46.6), "br"))
+        assert a == b
+        assert len(fake.chamadas) == 1
+        assert servico.stats["cache"] == 1
+
+    def test_prefixo_filtrado_localmente(self, servico, redis_fake):
+        fake = FakeMapbox(AUGUSTA)
+        with _mapbox(fake):
+            _run(servico.autocompletar("rua augu", (-23.5, -46.6), "BR"))
+            r = _run(servico.autocompletar("rua augusta 12", (-23.5, -46.6), "BR"))
+        # Prefixo veio incompleto (3 < limite): filtrar é suficiente
+        assert [s["place_name"] for s in r] == [AUGUSTA[0]["place_name"], AUGUSTA[1]["place_name"]]
+        assert len(fake.chamadas) == 1
+        assert servico.stats["prefixo"] == 1
+
+    def test_prefixo_insuficiente_consulta_mapbox(self, servico, redis_fake):
+        cheio = AUGUSTA + [
+            {"place_name": f"Rua Augusta, {n}, São Paulo - SP", "coordinates": [-23.5, -46.6]} for n in (300, 400)
+        ]
+        fake = FakeMapbox(cheio)
+        with _mapbox(fake):
+            _run(servico.autocompletar("rua augu", None, "BR"))
+            _run(servico.autocompletar("rua augusto", None, "BR"))
+        # Só 1 sugestão sobra do prefixo, que veio cheio do Mapbox
+        assert len(fake.chamadas) == 2
+
+    def test_pais_e_celula_separados(self, servico, redis_fake):
+        fake = FakeMapbox(AUGUSTA)
+        with _mapbox(fake):
+            _run(servico.autocompletar("rua augusta", (-23.5, -46.6), "BR"))
+            _run(servico.autocompletar("rua augusta", (-23.5, -46.6), "PT"))
+            _run(servico.autocompletar("rua augusta", (38.7, -9.1), "BR"))
+            _run(servico.autocompletar("rua augusta", (-23.501, -46.602), "BR"))  # mesma célula
+        assert len(fake.chamadas) == 3
+
+    def test_falha_nao_cacheada(self, servico, redis_fake):
+        fake = FakeMapbox(None)
+        with _mapbox(fake):
+            assert _run(servico.autocompletar("rua augusta")) == []
+            fake.resultado = AUGUSTA
+            assert len(_run(servico.autocompletar("rua augusta"))) == 3
+        assert len(fake.chamadas) == 2
+        assert servico.stats["falhas"] == 1
+
+
+class TestCoalescencia:
+    def test_consultas_identicas_em_voo(self, servico):
+        fake = FakeMapbox(AUGUSTA, atraso=0.05)
+
+        async def cenario():
+            return await asyncio.gather(*[servico.autocompletar("rua augusta", None, "BR") for _ in range(10)])
+
+        with patch.object(mod, "get_redis", return_value=None), _mapbox(fake):
+            resultados = _run(cenario())
+        assert len(fake.chamadas) == 1
+        assert all(r == AUGUSTA for r in resultados)
+        assert servico.stats["coalescidas"] == 9
+        assert servico._voando == {}
@@ -0,0 +1,136 @@
+"""
+Testes do decodificador ESC/POS unificado — Derekh Food
+Recibos "golden" cobrindo o que os dois decodificadores antigos tratavam
+(text_extractor do Bridge e escpos_decoder da impressora virtual): estilos,
+alinhamento, tamanho, codepage CP860, avanço, corte, barcode, QR (GS ( k),
+gaveta, imagens raster/bit image e comandos desconhecidos. Também garante
+que as cópias de escpos.py (bridge e impressora virtual) não divergem.
+
+Execução: pytest tests/test_escpos_golden.py -v
+"""
+
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import pytest
+
+from bridge_agent import text_extractor
+from virtual_printer.escpos_decoder import ESCPOSDecoder
+
+ESC, GS = b"\x1b", b"\x1d"
+
+RECIBOS = {
+    "ifood": (
+        ESC + b"@" + ESC + b"t\x03" + ESC + b"a\x01" + ESC + b"E\x01" + b"IFOOD\n"
+        + ESC + b"E\x00" + ESC + b"a\x00" + b"Pedido #1234\n"
+        + GS + b"!\x11" + b"2x Pizza Calabresa\n" + GS + b"!\x00"
+        + "Observação: sem cebola\n".encode("cp860") + b"------------\n"
+        + b"Total: R$ 89,90\n" + ESC + b"d\x03" + GS + b"V\x00"
+    ),
+    "rappi": (
+        ESC + b"@" + ESC + b"!\x08" + b"RAPPI\n" + ESC + b"!\x00" + ESC + b"M\x01"
+        + "Cliente: João\n".encode("cp860") + GS + b"B\x01" + b"ENTREGA\n" + GS + b"B\x00"
+        + ESC + b"J\x20" + b"Item A  10,00\n" + GS + b"V\x01"
+    ),
+    "barcode": (
+        b"Pedido 77\n" + GS + b"h\x50" + GS + b"w\x02" + GS + b"H\x02" + GS + b"f\x00"
+        + GS + b"k\x04" + b"12345\x00" + b"apos barcode\n"
+        + GS + b"k\x49\x05" + b"ABCDE" + b"fim\n"
+    ),
+    "qrcode": (
+        b"Pague via Pix\n" + GS + b"(k\x03\x001C\x05" + GS + b"(k\x09\x001P0pix123"
+        + b"obrigado\n" + ESC + b"p\x00\x19\xfa" + b"gaveta\n"
+    ),
+    "imagens": (
+        b"logo\n" + GS + b"v0\x00\x02\x00\x02\x00" + b"\x1b\x1d\xff\x00" + b"depois\n"
+        + ESC + b"*\x00\x02\x00" + b"\x1d\x1b" + b"bit\n"
+    ),
+    "espacos": (
+        ESC + b"3\x18" + b"linha 1\n" + ESC + b"2" + b"\x07linha 2\r\n\n\n\nlinha 3\n"
+        + ESC + b"\x99" + b"x\n"
+    ),
+}
+
+# Texto do Bridge (extrair_texto: sem separadores, no máximo 1 linha vazia)
+TEXTO_BRIDGE = {
+    "ifood": "IFOOD\nPedido #1234\n2x Pizza Calabresa\nObservação: sem cebola\nTotal: R$ 89,90",
+    # o extrator antigo deixava um espaço do ESC J e o "5" do GS k m=4
+    "rappi": "RAPPI\nCliente: João\nENTREGA\nItem A  10,00",
+    "barcode": "Pedido 77\napos barcode\nfim",
+    "qrcode": "Pague via Pix\nobrigado\ngaveta",
+    # os dois antigos vazavam bytes das imagens como texto
+    "imagens": "logo\ndepois\nbit",
+    "espacos": "linha 1\nlinha 2\n\nlinha 3\nx",
+}
+
+# Anotado da impressora virtual (mesmas anotações do decodificador antigo)
+ANOTADO = {
+    "ifood": (
+        "[INIT][CODEPAGE:CP860][ALIGN:CENTER][BOLD:ON]IFOOD\n[BOLD:OFF][ALIGN:LEFT]Pedido #1234\n"
+        "[SIZE:DOUBLE_WH]2x Pizza Calabresa\n[SIZE:NORMAL]Observação: sem cebola\n------------\n"
+        "Total: R$ 89,90\n[FEED_N:3][CUT:FULL]"
+    ),
+    "rappi": (
+        "[INIT][STYLE:BOLD:ON]RAPPI\n[STYLE:BOLD:OFF][FONT:1]Cliente: João\n[REVERSE:1]ENTREGA\n"
+        "[REVERSE:0][FEED_DOTS:32]Item A  10,00\n[CUT:PARTIAL]"
+    ),
+    "barcode": (
+        "Pedido 77\n[BARCODE_HEIGHT:80][BARCODE_WIDTH:2][HRI_POSITION:2][HRI_FONT:0][BARCODE]"
+        "apos barcode\n[BARCODE]fim"
+    ),
+    # ESC p tem 3 parâmetros (m t1 t2): o antigo deixava t2 como texto
+    "qrcode": "Pague via Pix\n[GS_EXT][GS_EXT]obrigado\n[PULSE:0]gaveta",
+    "imagens": "logo\n[RASTER_IMAGE]depois\n[BIT_IMAGE]bit",
+    "espacos": "[LINE_SPACING:24]linha 1\n[LINE_SPACING_DEF]linha 2\n\n\nlinha 3\n[ESC:0x99]x",
+}
+
+
+@pytest.mark.parametrize("nome", sorted(RECIBOS))
+class TestRecibosGolden:
+    def test_texto_bridge(self, nome):
+        assert text_extractor.extrair_texto(RECIBOS[nome]) == TEXTO_BRIDGE[nome]
+
+    def test_anotado_impressora_virtual(self, nome):
+        assert ESCPOSDecoder().decode_annotated(RECIBOS[nome]) == ANOTADO[nome]
+
+    def test_decode_numa_passada_igual_aos_modos_separados(self, nome):
+        decoder = ESCPOSDecoder()
+        texto, anotado = decoder.decode(RECIBOS[nome])
+        assert texto == decoder.decode_text_only(RECIBOS[nome])
+        assert anotado == ANOTADO[nome]
+
+
+class TestDecodificador:
+    def test_buffer_truncado_nao_quebra(self):
+        for nome, recibo in RECIBOS.items():
+            for corte in range(len(recibo)):
+                ESCPOSDecoder().decode(recibo[:corte])
+
+    def test_texto_puro_passa_direto(self):
+        assert text_extractor.extrair_texto("Pedido 1\nCoca 2L\n".encode("cp860")) == "Pedido 1\nCoca 2L"
+
+    def test_hex_dump(self):
+        dump = ESCPOSDecoder().hex_dump(b"AB\x1b@" * 5)
+        linhas = dump.split("\n")
+        assert linhas[0] == "00000000  41 42 1B 40 41 42 1B 40 41 42 1B 40 41 42 1B 40   |AB.@AB.@AB.@AB.@|"
+        assert linhas[1].startswith("00000010  41 42 1B 40 ") and linhas[1].endswith("|AB.@|")
+
+
+class TestCopias:
+    def test_copias_identicas(self):
+        """A pasta virtual_printer é distribuída sem o bridge: escpos.py é vendorizado nas duas."""
+        copias = [
+            PROJECT_ROOT / "bridge_agent" / "escpos.py",
+            PROJECT_ROOT / "virtual_printer" / "escpos.py",
+            PROJECT_ROOT / "DerekhFood-Windows" / "bridge_agent" / "escpos.py",
+            PROJECT_ROOT / "DerekhFood-Windows" / "virtual_printer" / "escpos.py",
+        ]
+        conteudos = {c.read_bytes() for c in copias}
+        assert len(conteudos) == 1
+
+    def test_impressora_virtual_nao_depende_do_bridge(self):
+        fonte = (PROJECT_ROOT / "virtual_printer" / "escpos_decoder.py").read_text(encoding="utf-8")
+        assert "bridge_agent" not in fonte.split('"""', 2)[2]
@@ -0,0 +1,169 @@
+"""
+Testes do pipeline de logging — Derekh Food
+Valida o QueueHandler não-bloqueante (fila cheia descarta e conta), o JSON
+rápido, o limite de warnings repetidos, a amostragem de sucessos por rota
+e a medição do custo de logging por request (ContextVar).
+
+Execução: pytest tests/test_logging_config.py -v
+"""
+
+import sys
+import json
+import queue
+import asyncio
+import logging
+from pathlib import Path
+from unittest.mock import patch
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import pytest
+
+from backend.app import logging_config as lc
+from backend.app.logging_config import (
+    AmostragemRotas, FilaLogHandler, JSONFormatter, LimiteRepeticaoFilter,
+)
+from backend.app.metrics import MetricsCollector
+
+
+def _record(msg="ok", nivel=logging.INFO, linha=10, **extra):
+    record = logging.LogRecord("superfood.teste", nivel, "/app/x.py", linha, msg, None, None)
+    record.__dict__.update(extra)
+    return record
+
+
+@pytest.fixture
+def logger_fila():
+    fila = queue.Queue(maxsize=3)
+    handler = FilaLogHandler(fila)
+    logger = logging.getLogger("superfood.teste_fila")
+    logger.propagate = False
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    yield logger, handler, fila
+    logger.removeHandler(handler)
+    logger.propagate = True
+
+
+class TestFilaLogHandler:
+    def test_fila_cheia_descarta_sem_bloquear(self, logger_fila):
+        logger, handler, fila = logger_fila
+        for i in range(5):
+            logger.info("msg %s", i)
+        assert (handler.enfileirados, handler.descartados) == (3, 2)
+        assert [fila.get_nowait().msg for _ in range(3)] == ["msg 0", "msg 1", "msg 2"]
+
+    def test_prepare_resolve_mensagem_e_traceback(self, logger_fila):
+        logger, handler, fila = logger_fila
+        try:
+            raise ValueError("quebrou")
+        except ValueError:
+            logger.exception("falha %s", "x")
+        record = fila.get_nowait()
+        assert record.msg == "falha x" and record.args is None
+        assert record.exc_info is None and "ValueError: quebrou" in record.exc_text
+
+        dados = json.loads(JSONFormatter().format(record))
+        assert dados["message"] == "falha x" and "quebrou" in dados["exception"]
+
+
+class TestJSONFormatter:
+    def test_campos_extra_e_timestamp(self):
+        record = _record("GET /x 200", request_id="ab12", status_code=200, duration_ms=1.5, outro="ignorado")
+        record.created = 0.25
+        dados = json.loads(JSONFormatter().format(record))
+        assert dados["timestamp"] == "1970-01-01T00:00:00.250000Z"
+        assert dados["request_id"] == "ab12" and dados["status_code"] == 200
+        assert "outro" not in dados
+
+    def test_fallback_stdlib(self):
+        record = _record("ação", request_id="x")
+        with patch.object(lc, "orjson", None):
+            sem = JSONFormatter().format(record)
+        assert json.loads(sem) == json.loads(JSONFormatter().format(record))
+        assert "ação" in sem
+
+
+class TestLimiteRepeticao:
+    def test_limita_por_janela_e_informa_suprimidos(self, monkeypatch):
+        agora = [100.0]
+        monkeypatch.setattr(lc.time, "monotonic", lambda: agora[0])
+        filtro = LimiteRepeticaoFilter(maximo=2, janela_s=60)
+
+        passaram = [filtro.filter(_record(f"aviso {i}", logging.WARNING)) for i in range(5)]
+        assert passaram == [True, True, False, False, False]
+        assert filtro.suprimidos_total == 3
+
+        agora[0] += 61
+        record = _record("aviso de novo", logging.WARNING)
+        assert filtro.filter(record)
+        assert record.suprimidos == 3 and record.getMessage().endswith("(+3 repetidos suprimidos)")
+
+    def test_erros_e_pontos_distintos_nao_limitados(self):
+        filtro = LimiteRepeticaoFilter(maximo=1, janela_s=60)
+        assert all(filtro.filter(_record("erro", logging.ERROR)) for _ in range(5))
+        assert filtro.filter(_record("a", logging.WARNING, linha=1))
+        assert filtro.filter(_record("b", logging.WARNING, linha=2))
+        assert filtro.filter(_record("c", logging.WARNING, linha=3, chave_repeticao="GET /a"))
+        assert filtro.filter(_record("c", logging.WARNING, linha=3, chave_repeticao="GET /b"))
+        assert not filtro.filter(_record("c", logging.WARNING, linha=3, chave_repeticao="GET /a"))
+
+
+class TestAmostragem:
+    def test_regras_so_reduzem_e_erros_sempre_entram(self):
+        a = AmostragemRotas(padrao=1.0, regras=AmostragemRotas.parse_regras(
+            "POST /api/gps/*=0, GET /motoboy/*=0.5, lixo, GET /x=abc"))
+        assert a.regras == {"POST /api/gps/*": 0.0, "GET /motoboy/*": 0.5}
+        assert a.taxa("POST /api/gps/update-auth") == 0.0
+        assert a.taxa("GET /motoboy/entregas/pendentes") == 0.5
+        assert a.taxa("GET /painel/config") == 1.0
+        assert not a.deve_registrar("POST /api/gps/update-auth", 200)
+        assert a.deve_registrar("POST /api/gps/update-auth", 500)
+        assert AmostragemRotas(padrao=0.2, regras={"GET /*": 0.9}).taxa("GET /a") == 0.2
+
+    def test_taxa_aproximada(self):
+        lc.random.seed(3)
+        a = AmostragemRotas(padrao=1.0, regras={"GET /motoboy/*": 0.1})
+        n = sum(a.deve_registrar("GET /motoboy/entregas/em-rota", 200) for _ in range(5000))
+        assert 400 < n < 600
+        assert a.amostrados + a.descartados == 5000
+
+    def test_producao_sem_sucessos_por_padrao(self, monkeypatch):
+        monkeypatch.setenv("ENVIRONMENT", "production")
+        monkeypatch.delenv("LOG_AMOSTRAGEM_PADRAO", raising=False)
+        assert AmostragemRotas.from_env().taxa("GET /painel/config") == 0.0
+        monkeypatch.setenv("ENVIRONMENT", "development")
+        a = AmostragemRotas.from_env()
+        assert a.taxa("GET /painel/config") == 1.0 and a.taxa("POST /api/gps/update") == 0.02
+
+
+class TestCustoPorRequest:
+    def test_custo_isolado_por_request_inclusive_threadpool(self, logger_fila):
+        logger, handler, _ = logger_fila
+
+        async def request(n):
+            custo, token = lc.medir_custo_log()
+            try:
+                logger.info("inline")
+                await asyncio.to_thread(lambda: [logger.info("sync") for _ in range(n - 1)])
+            finally:
+                lc.encerrar_custo_log(token)
+            return custo
+
+        async def cenario():
+            return await asyncio.gather(request(1), request(3))
+
+        um, tres = asyncio.run(cenario())
+        assert (um.records, tres.records) == (1, 3)
+        assert um.ms > 0 and tres.ms > 0
+        assert lc._custo_atual.get() is None
+
+    def test_metricas_por_rota(self):
+        m = MetricsCollector()
+        m.record_request(200, 10.0, rota="GET /a", log_ms=0.2)
+        m.record_request(200, 10.0, rota="GET /a", log_ms=0.4)
+        assert m.get_rotas()[0]["log_ms_media"] == 0.3
+        snap = m.snapshot()
+        del snap["db"]["GET /a"]["log_ms_total"]  # snapshot de worker antigo
+        assert MetricsCollector.mesclar_snapshots([snap, m.snapshot()])["db"]["GET /a"]["log_ms_total"] == pytest.approx(0.6)
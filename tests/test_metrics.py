@@ -0,0 +1,178 @@
+"""
+Testes das métricas — Derekh Food
+Valida histogramas log-bucket (precisão dos percentis, memória fixa),
+shards por thread, agregação cross-worker via Redis e texto Prometheus.
+
+Execução: pytest tests/test_metrics.py -v
+"""
+
+import sys
+import json
+import random
+import fnmatch
+import threading
+from pathlib import Path
+from unittest.mock import patch
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import pytest
+
+from backend.app.metrics import MetricsCollector, HistogramaLog, HIST_BUCKETS, HIST_FATOR
+
+
+class FakeRedis:
+    """Redis em memória (setex/mget/scan_iter)."""
+
+    def __init__(self):
+        self._store = {}
+
+    def setex(self, key, ttl, value):
+        self._store[key] = value
+
+    def mget(self, keys):
+        return [self._store.get(k) for k in keys]
+
+    def scan_iter(self, match="*", count=100):
+        return [k for k in list(self._store) if fnmatch.fnmatch(k, match)]
+
+
+@pytest.fixture
+def fake_redis():
+    fake = FakeRedis()
+    with patch("backend.app.cache.get_redis", return_value=fake):
+        yield fake
+
+
+class TestHistogramaLog:
+    def test_percentis_com_erro_relativo_limitado(self):
+        random.seed(7)
+        valores = [random.lognormvariate(3, 1) for _ in range(50_000)]
+        h = HistogramaLog()
+        for v in valores:
+            h.registrar(v)
+
+        valores.sort()
+        for p in (50, 95, 99):
+            exato = valores[int(len(valores) * p / 100) - 1]
+            assert abs(h.percentil(p) - exato) / exato <= HIST_FATOR - 1
+        assert h.n == 50_000
+
+    def test_memoria_fixa(self):
+        h = HistogramaLog()
+        for i in range(200_000):
+            h.registrar((i % 5000) * 0.37)
+        assert len(h.buckets) <= HIST_BUCKETS
+
+    def test_extremos(self):
+        h = HistogramaLog()
+        h.registrar(0.0)
+        h.registrar(10_000_000.0)  # acima do máximo → bucket de overflow
+        assert h.percentil(50) == 0.1
+        assert h.percentil(100) == 10_000_000.0
+
+    def test_vazio(self):
+        assert HistogramaLog().percentil(99) == 0.0
+
+    def test_serializacao(self):
+        h = HistogramaLog()
+        for v in (1.0, 5.0, 50.0):
+            h.registrar(v)
+        copia = HistogramaLog.from_dict(json.loads(json.dumps(h.to_dict())))
+        assert copia.buckets == h.buckets
+        assert copia.percentil(99) == h.percentil(99)
+
+
+class TestMetricsCollector:
+    def test_series_por_rota_e_classe(self):
+        m = MetricsCollector()
+        for _ in range(9):
+            m.record_request(200, 10.0, rota="GET /pedidos/{id}", queries=3, db_ms=2.0)
+        m.record_request(500, 900.0, rota="GET /pedidos/{id}", queries=3, db_ms=2.0)
+        m.record_request(404, 1.0)
+
+        dados = m.get_metrics()
+        assert dados["total_requests"] == 11
+        assert dados["total_errors"] == 2
+        assert dados["status_codes"] == {200: 9, 500: 1, 404: 1}
+        assert dados["latency"]["samples"] == 11
+
+        rota = m.get_rotas()[0]
+        assert rota["requests"] == 10
+        assert rota["erros"] == 1
+        assert rota["queries_media"] == 3
+        assert 9.2 <= rota["p50_ms"] <= 10.8
+
+    def test_shards_por_thread(self):
+        m = MetricsCollector()
+
+        def gravar():
+            for _ in range(1000):
+                m.record_request(200, 5.0, rota="GET /x")
+
+        threads = [threading.Thread(target=gravar) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert len(m._shards) == 4
+        assert m.get_metrics()["total_requests"] == 4000
+
+    def test_reset(self):
+        m = MetricsCollector()
+        m.record_request(200, 5.0, rota="GET /x")
+        m.reset()
+        assert m.get_metrics()["total_requests"] == 0
+        m.record_request(200, 5.0, rota="GET /x")
+        assert m.get_metrics()["total_requests"] == 1
+
+
+class TestCluster:
+    def test_agrega_workers_via_redis(self, fake_redis):
+        a, b = MetricsCollector(), MetricsCollector()
+        a.worker_id, b.worker_id = "host:1", "host:2"
+        for _ in range(100):
+            a.record_request(200, 10.0, rota="GET /x", queries=2, db_ms=1.0)
+        for _ in range(100):
+            b.record_request(200, 100.0, rota="GET /x", queries=4, db_ms=3.0)
+
+        assert a.exportar_redis() and b.exportar_redis()
+        # Snapshot do próprio worker vem da memória, não do Redis (sem contar duas vezes)
+        a.record_request(200, 10.0, rota="GET /x", queries=2, db_ms=1.0)
+
+        snap = a.snapshot_cluster()
+        dados = a.get_metrics(snap)
+        assert dados["workers"] == 2
+        assert dados["total_requests"] == 201
+        assert dados["latency"]["p99_ms"] >= 90
+        rota = a.get_rotas(snap=snap)[0]
+        assert rota["queries_max"] == 4
+
+    def test_sem_redis_usa_local(self):
+        m = MetricsCollector()
+        m.record_request(200, 5.0, rota="GET /x")
+        with patch("backend.app.cache.get_redis", return_value=None):
+            assert m.exportar_redis() is False
+            assert m.get_metrics(m.snapshot_cluster())["total_requests"] == 1
+
+
+class TestPrometheus:
+    def test_exposicao(self):
+        m = MetricsCollector()
+        m.record_request(200, 3.0, rota="GET /site/{codigo}", queries=5, db_ms=1.5)
+        m.record_request(200, 30.0, rota="GET /site/{codigo}", queries=5, db_ms=1.5)
+        texto = m.prometheus()
+
+        labels = 'method="GET",route="/site/{codigo}",status_class="2xx"'
+        assert "# TYPE superfood_http_request_duration_seconds histogram" in texto
+        assert f'superfood_http_request_duration_seconds_bucket{{{labels},le="0.005"}} 1' in texto
+        assert f'superfood_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2' in texto
+        assert f"superfood_http_request_duration_seconds_count{{{labels}}} 2" in texto
+        assert 'superfood_db_queries_total{method="GET",route="/site/{codigo}"} 10' in texto
+
+    def test_escape_de_labels(self):
+        m = MetricsCollector()
+        m.record_request(200, 1.0, rota='GET /a"b')
+        assert 'route="/a\\"b"' in m.prometheus()
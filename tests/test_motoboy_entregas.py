@@ -0,0 +1,204 @@
+"""
+Testes das listagens do app motoboy — Derekh Food
+Valida que pendentes, em rota e histórico trazem os dados do pedido numa
+única consulta (sem ida ao banco por entrega), o ETag/If-None-Match com 304
+quando nada mudou e os ganhos do dia pré-calculados no cache por motoboy.
+
+Execução: pytest tests/test_motoboy_entregas.py -v
+"""
+
+import sys
+import os
+import json
+from pathlib import Path
+from datetime import datetime, date, timedelta
+from unittest.mock import patch
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key-motoboy-entregas")
+os.environ.setdefault("ENVIRONMENT", "testing")
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from starlette.requests import Request
+
+from database.base import Base
+from database.models import Restaurante, Motoboy, Pedido, Entrega
+from backend.app.routers import motoboy as mr
+
+AGORA = datetime.now()
+
+
+def _request(etag=None):
+    headers = [(b"if-none-match", etag.encode())] if etag else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers, "query_string": b""})
+
+
+def _json(resposta):
+    assert resposta.status_code == 200
+    return json.loads(resposta.body)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'motoboy.db'}")
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db(engine):
+    sessao = sessionmaker(bind=engine)()
+    yield sessao
+    sessao.close()
+
+
+@pytest.fixture
+def consultas(engine):
+    contagem = [0]
+
+    def _contar(*args):
+        contagem[0] += 1
+
+    event.listen(engine, "before_cursor_execute", _contar)
+    yield contagem
+    event.remove(engine, "before_cursor_execute", _contar)
+
+
+@pytest.fixture
+def cache():
+    dados = {}
+    with patch.object(mr, "cache_get", side_effect=dados.get), \
+            patch.object(mr, "cache_set", side_effect=lambda k, v, ttl_seconds: dados.__setitem__(k, v)), \
+            patch.object(mr, "cache_delete", side_effect=lambda k: dados.pop(k, None)):
+        yield dados
+
+
+def _restaurante(db, codigo):
+    r = Restaurante(
+        nome=codigo, nome_fantasia=codigo, email=f"{codigo}@t.com", telefone="11999990000",
+        endereco_completo="Rua 1", codigo_acesso=codigo, senha="x", ativo=True,
+    )
+    db.add(r)
+    db.flush()
+    return r
+
+
+def _entrega(db, restaurante, motoboy, n, status="pendente", **campos):
+    pedido = Pedido(
+        restaurante_id=restaurante.id, comanda=str(n), tipo="Entrega", cliente_nome=f"Cliente {n}",
+        itens="1x Pizza", valor_total=10.0 * n, endereco_entrega=f"Rua {n}",
+    )
+    db.add(pedido)
+    db.flush()
+    entrega = Entrega(pedido_id=pedido.id, motoboy_id=motoboy.id, status=status,
+                      atribuido_em=AGORA + timedelta(minutes=n), **campos)
+    db.add(entrega)
+    return entrega
+
+
+@pytest.fixture
+def motoboy(db):
+    r = _restaurante(db, "MOTO01")
+    m = Motoboy(restaurante_id=r.id, nome="Zé", usuario="ze", telefone="11988887777")
+    db.add(m)
+    db.flush()
+    for n in range(1, 6):
+        _entrega(db, r, m, n, status="em_rota" if n % 2 else "pendente", posicao_rota_otimizada=6 - n)
+    db.commit()
+    db.refresh(m)
+    return m
+
+
+class TestListagens:
+    def test_pendentes_com_pedido_em_uma_consulta(self, db, motoboy, consultas):
+        itens = _json(mr.listar_entregas_pendentes(_request(), current_motoboy=motoboy, db=db))
+        assert consultas[0] == 1
+        assert [e["comanda"] for e in itens] == ["1", "2", "3", "4", "5"]
+        assert itens[0]["endereco_entrega"] == "Rua 1" and itens[0]["pago_online"] is False
+
+    def test_em_rota_ordem_otimizada(self, db, motoboy, consultas):
+        itens = _json(mr.listar_entregas_em_rota(_request(), current_motoboy=motoboy, db=db))
+        assert consultas[0] == 1
+        assert [e["comanda"] for e in itens] == ["5", "3", "1"]
+
+    def test_pedido_de_outro_restaurante_nao_vaza(self, db, motoboy):
+        outro = _restaurante(db, "OUTRO1")
+        _entrega(db, outro, motoboy, 9)
+        db.commit()
+        itens = _json(mr.listar_entregas_pendentes(_request(), current_motoboy=motoboy, db=db))
+        estranha = [e for e in itens if e["atribuido_em"] == (AGORA + timedelta(minutes=9)).isoformat()]
+        assert len(estranha) == 1 and "cliente_nome" not in estranha[0]
+
+    def test_historico_paginado(self, db, motoboy, consultas):
+        for e in db.query(Entrega).all():
+            e.status, e.entregue_em = "entregue", e.atribuido_em
+        db.commit()
+        db.refresh(motoboy)
+        consultas[0] = 0
+        r = _json(mr.historico_entregas(
+            _request(), data_inicio=None, data_fim=None, page=2, limit=2, current_motoboy=motoboy, db=db))
+        assert consultas[0] == 2  # count + página com pedidos
+        assert [e["comanda"] for e in r["entregas"]] == ["3", "2"]
+        assert (r["total"], r["pages"]) == (5, 3)
+
+
+class TestETag:
+    def test_304_quando_nada_mudou(self, db, motoboy):
+        primeira = mr.listar_entregas_pendentes(_request(), current_motoboy=motoboy, db=db)
+        etag = primeira.headers["etag"]
+        repetida = mr.listar_entregas_pendentes(_request(etag), current_motoboy=motoboy, db=db)
+        assert repetida.status_code == 304 and repetida.body == b""
+        assert repetida.headers["etag"] == etag
+
+    def test_mudanca_gera_novo_etag(self, db, motoboy):
+        etag = mr.listar_entregas_em_rota(_request(), current_motoboy=motoboy, db=db).headers["etag"]
+        pedido = db.query(Pedido).filter(Pedido.comanda == "3").first()
+        pedido.observacoes = "Portão azul"
+        db.commit()
+        resposta = mr.listar_entregas_em_rota(_request(etag), current_motoboy=motoboy, db=db)
+        assert resposta.status_code == 200 and resposta.headers["etag"] != etag
+
+
+class TestGanhos:
+    @pytest.fixture
+    def finalizadas(self, db, motoboy):
+        for e in db.query(Entrega).all():
+            e.status, e.entregue_em = "entregue", AGORA
+            e.valor_motoboy, e.distancia_km = 5.5, 2.0
+        ontem = db.query(Entrega).first()
+        ontem.entregue_em = AGORA - timedelta(days=1)
+        db.commit()
+        db.refresh(motoboy)
+        return motoboy
+
+    def test_estatisticas_do_cache_nao_consultam_entregas(self, db, finalizadas, cache, consultas):
+        r = _json(mr.get_estatisticas(_request(), current_motoboy=finalizadas, db=db))
+        assert (r["entregas_hoje"], r["ganhos_hoje"], r["km_hoje"]) == (4, 22.0, 8.0)
+        assert consultas[0] == 1  # só o agregado do dia
+        assert mr.get_estatisticas(_request(), current_motoboy=finalizadas, db=db).body
+        assert consultas[0] == 1
+
+    def test_ganhos_detalhado_cacheado_e_invalidado(self, db, finalizadas, cache, consultas):
+        r = _json(mr.get_ganhos_detalhado(_request(), data=None, current_motoboy=finalizadas, db=db))
+        assert consultas[0] == 1
+        assert r["total_entregas"] == 4 and r["total_ganhos"] == 22.0
+        assert {e["endereco"] for e in r["entregas"]} == {"Rua 2", "Rua 3", "Rua 4", "Rua 5"}
+
+        mr.get_ganhos_detalhado(_request(), data=None, current_motoboy=finalizadas, db=db)
+        assert consultas[0] == 1
+
+        mr.invalidar_ganhos_motoboy(finalizadas.id)
+        assert not cache
+        mr.get_ganhos_detalhado(_request(), data=None, current_motoboy=finalizadas, db=db)
+        assert consultas[0] == 2
+
+    def test_dia_passado(self, db, finalizadas, cache):
+        ontem = date.today() - timedelta(days=1)
+        r = _json(mr.get_ganhos_detalhado(_request(), data=ontem, current_motoboy=finalizadas, db=db))
+        assert r["total_entregas"] == 1 and r["data"] == ontem.isoformat()
+        assert list(cache) == [f"motoboy:{finalizadas.id}:ganhos:{ontem.isoformat()}"]
@@ -0,0 +1,269 @@
+"""
+Testes do saque automatico Pix — Derekh Food
+Valida pool de workers, saldo em lote, idempotencia entre workers e dry-run.
+
+Execução: pytest tests/test_pix_saque_automatico.py -v
+"""
+
+import sys
+import os
+import asyncio
+from pathlib import Path
+from datetime import datetime, timedelta
+from unittest.mock import patch, AsyncMock
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key-pix-saque")
+os.environ.setdefault("ENVIRONMENT", "testing")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{PROJECT_ROOT}/test_pix_saque.db")
+
+import pytest
+
+
+# ==================== FIXTURES ====================
+
+@pytest.fixture(scope="module")
+def db_session():
+    import database.models  # noqa: F401
+    from backend.app.database import engine, Base, SessionLocal
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    yield db
+    db.close()
+
+    db_path = PROJECT_ROOT / "test_pix_saque.db"
+    if db_path.exists():
+        try:
+            db_path.unlink()
+        except Exception:
+            pass
+
+
+@pytest.fixture(scope="module")
+def pix_configs(db_session):
+    """Cria 5 restaurantes com saque automatico ativo."""
+    from database.models import Restaurante, PixConfig
+    db = db_session
+    chaves = []
+    for i in range(5):
+        email = f"pix_saque_auto_{i}@test.com"
+        rest = db.query(Restaurante).filter(Restaurante.email == email).first()
+        if not rest:
+            rest = Restaurante(
+                nome=f"Pix Saque {i}",
+                nome_fantasia=f"Pix Saque {i}",
+                email=email,
+                telefone="11999990000",
+                endereco_completo="Rua Pix 1",
+                codigo_acesso=f"PIXAUT{i}",
+                senha="hashed",
+            )
+            db.add(rest)
+            db.flush()
+            db.add(PixConfig(
+                restaurante_id=rest.id,
+                ativo=True,
+                pix_chave=f"saqueauto{i}@test.com",
+                tipo_chave="email",
+                nome_subconta=f"Pix Saque {i}",
+                termos_aceitos_em=datetime.utcnow(),
+                saque_automatico=True,
+                saque_minimo_centavos=50000,
+            ))
+        chaves.append(f"saqueauto{i}@test.com")
+    db.commit()
+    return chaves
+
+
+@pytest.fixture(autouse=True)
+def limpar_saques(db_session):
+    from database.models import PixSaque
+    db_session.query(PixSaque).delete()
+    db_session.commit()
+    yield
+
+
+def _woovi_mock(saldos: dict, latencia: float = 0.0):
+    """Mock do woovi_client com saldo em lote e saque total."""
+    async def consultar_saldos(pix_keys, page_size=100):
+        await asyncio.sleep(latencia)
+        return {k: saldos[k] for k in pix_keys if k in saldos}
+
+    async def consultar_saldo(pix_key):
+        await asyncio.sleep(latencia)
+        return {"subaccount": {"balance": saldos.get(pix_key, 0)}}
+
+    async def sacar_total(pix_key):
+        await asyncio.sleep(latencia)
+        return {"ok": True}
+
+    mock = AsyncMock()
+    mock.configured = True
+    mock.consultar_saldos = AsyncMock(side_effect=consultar_saldos)
+    mock.consultar_saldo = AsyncMock(side_effect=consultar_saldo)
+    mock.sacar_total = AsyncMock(side_effect=sacar_total)
+    return mock
+
+
+# ==================== TESTES ====================
+
+class TestChaveIdempotencia:
+    def test_mesma_janela_mesma_chave(self):
+        from backend.app.pix.pix_service import chave_saque_automatico
+        a = chave_saque_automatico(7, datetime(2026, 5, 1, 10, 0))
+        b = chave_saque_automatico(7, datetime(2026, 5, 1, 10, 29))
+        assert a == b
+
+    def test_janelas_diferentes(self):
+        from backend.app.pix.pix_service import chave_saque_automatico
+        a = chave_saque_automatico(7, datetime(2026, 5, 1, 10, 29))
+        b = chave_saque_automatico(7, datetime(2026, 5, 1, 10, 30))
+        assert a != b
+        assert chave_saque_automatico(8, datetime(2026, 5, 1, 10, 0)) != a
+
+
+class TestSaquesAutomaticos:
+    def test_saca_acima_do_minimo(self, db_session, pix_configs):
+        from backend.app.pix import pix_service
+        from database.models import PixSaque
+
+        saldos = {k: 60000 for k in pix_configs}
+        saldos[pix_configs[0]] = 100  # abaixo do minimo
+        mock = _woovi_mock(saldos)
+        with patch.object(pix_service, "woovi_client", mock):
+            resumo = asyncio.run(pix_service.executar_saques_automaticos(db_session))
+
+        assert resumo["concluido"] == 4
+        assert resumo["ignorado"] == 1
+        mock.consultar_saldos.assert_awaited_once()
+        mock.consultar_saldo.assert_not_awaited()
+        saques = db_session.query(PixSaque).all()
+        assert len(saques) == 4
+        assert all(s.status == "concluido" and s.chave_idempotencia for s in saques)
+
+    def test_fallback_saldo_individual(self, db_session, pix_configs):
+        from backend.app.pix import pix_service
+
+        mock = _woovi_mock({k: 60000 for k in pix_configs})
+        mock.consultar_saldos = AsyncMock(side_effect=RuntimeError("listagem indisponivel"))
+        with patch.object(pix_service, "woovi_client", mock):
+            resumo = asyncio.run(pix_service.executar_saques_automaticos(db_session))
+
+        assert resumo["concluido"] == 5
+        assert mock.consultar_saldo.await_count == 5
+
+    def test_dois_workers_nao_sacam_duas_vezes(self, db_session, pix_configs):
+        """Dois ciclos simultaneos na mesma janela (ex: dois workers) → um saque por restaurante."""
+        from backend.app.pix import pix_service
+        from backend.app.database import SessionLocal
+        from database.models import PixSaque
+
+        mock = _woovi_mock({k: 60000 for k in pix_configs}, latencia=0.01)
+
+        async def dois_workers():
+            db_a, db_b = SessionLocal(), SessionLocal()
+            try:
+                return await asyncio.gather(
+                    pix_service.executar_saques_automaticos(db_a),
+                    # Outro processo: lock de ciclo local nao se aplica
+                    _sem_lock_local(pix_service, db_b),
+                )
+            finally:
+                db_a.close()
+                db_b.close()
+
+        with patch.object(pix_service, "woovi_client", mock):
+            asyncio.run(dois_workers())
+
+        assert mock.sacar_total.await_count == 5
+        assert db_session.query(PixSaque).count() == 5
+
+    def test_ciclo_repetido_na_janela_e_idempotente(self, db_session, pix_configs):
+        from backend.app.pix import pix_service
+        from database.models import PixSaque
+
+        mock = _woovi_mock({k: 60000 for k in pix_configs})
+        with patch.object(pix_service, "woovi_client", mock):
+            asyncio.run(pix_service.executar_saques_automaticos(db_session))
+            resumo = asyncio.run(pix_service.executar_saques_automaticos(db_session))
+
+        assert resumo.get("duplicado") == 5
+        assert mock.sacar_total.await_count == 5
+        assert db_session.query(PixSaque).count() == 5
+
+    def test_concorrencia_limitada(self, db_session, pix_configs):
+        from backend.app.pix import pix_service
+
+        em_voo = 0
+        pico = 0
+
+        async def sacar_total(pix_key):
+            nonlocal em_voo, pico
+            em_voo += 1
+            pico = max(pico, em_voo)
+            await asyncio.sleep(0.01)
+            em_voo -= 1
+            return {}
+
+        mock = _woovi_mock({k: 60000 for k in pix_configs})
+        mock.sacar_total = AsyncMock(side_effect=sacar_total)
+        with patch.object(pix_service, "woovi_client", mock):
+            resumo = asyncio.run(
+                pix_service.executar_saques_automaticos(db_session, concorrencia=2)
+            )
+
+        assert resumo["concluido"] == 5
+        assert pico == 2
+
+    def test_reserva_antiga_expira_e_recente_bloqueia(self, db_session, pix_configs):
+        """Worker que caiu entre reservar e confirmar nao bloqueia o restaurante para sempre."""
+        from backend.app.pix import pix_service
+        from database.models import PixConfig, PixSaque
+
+        rids = [
+            db_session.query(PixConfig.restaurante_id).filter(PixConfig.pix_chave == k).scalar()
+            for k in pix_configs[:2]
+        ]
+        agora = datetime.utcnow()
+        antiga = PixSaque(restaurante_id=rids[0], valor_centavos=60000, status="solicitado",
+                          automatico=True, solicitado_em=agora - timedelta(hours=2),
+                          chave_idempotencia="auto:teste:antiga")
+        recente = PixSaque(restaurante_id=rids[1], valor_centavos=60000, status="solicitado",
+                           automatico=True, solicitado_em=agora - timedelta(minutes=1),
+                           chave_idempotencia="auto:teste:recente")
+        db_session.add_all([antiga, recente])
+        db_session.commit()
+
+        mock = _woovi_mock({k: 60000 for k in pix_configs})
+        with patch.object(pix_service, "woovi_client", mock):
+            resumo = asyncio.run(pix_service.executar_saques_automaticos(db_session))
+
+        assert resumo["concluido"] == 4
+        assert resumo["em_andamento"] == 1
+        db_session.refresh(antiga)
+        db_session.refresh(recente)
+        assert antiga.status == "falhou" and "expirada" in antiga.erro
+        assert recente.status == "solicitado"
+
+    def test_dry_run_nao_saca_nem_grava(self, db_session, pix_configs):
+        from backend.app.pix import pix_service
+        from database.models import PixSaque
+
+        mock = _woovi_mock({k: 60000 for k in pix_configs})
+        with patch.object(pix_service, "woovi_client", mock):
+            resumo = asyncio.run(
+                pix_service.executar_saques_automaticos(db_session, dry_run=True)
+            )
+
+        assert resumo["simulado"] == 5
+        mock.sacar_total.assert_not_awaited()
+        assert db_session.query(PixSaque).count() == 0
+
+
+async def _sem_lock_local(pix_service, db):
+    """Executa o ciclo ignorando o lock por processo (simula outro worker)."""
+    with patch.object(pix_service, "_ciclo_saque_lock", asyncio.Lock()):
+        return await pix_service.executar_saques_automaticos(db)
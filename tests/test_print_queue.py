@@ -0,0 +1,229 @@
+"""
+Testes da fila de impressão do Printer Agent — Derekh Food
+Exclusividade do claim (um job nunca é assumido por dois consumidores),
+limite de tentativas, backoff entre retries e recuperação de jobs presos
+em 'imprimindo' (crash do agente ou exceção durante a impressão).
+
+Execução: pytest tests/test_print_queue.py -v
+"""
+
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import pytest
+
+from printer_agent import print_queue
+from printer_agent.main import PrinterAgent
+from printer_agent.print_queue import PrintQueue, MAX_RETRIES
+
+
+@pytest.fixture
+def fila(tmp_path):
+    q = PrintQueue(db_path=str(tmp_path / "fila.db"))
+    yield q
+    q.close()
+
+
+@pytest.fixture
+def sem_backoff(monkeypatch):
+    monkeypatch.setattr(print_queue, "RETRY_BACKOFF_SECONDS", 0)
+
+
+def _dados(pedido_id):
+    return {"raw_bytes_hex": f"Pedido {pedido_id}\n".encode().hex(), "doc_name": f"Pedido_{pedido_id}"}
+
+
+class TestClaim:
+    def test_job_assumido_uma_unica_vez(self, fila):
+        fila.enqueue(1, "Cozinha", _dados(1))
+        resultados = []
+        barreira = threading.Barrier(8)
+
+        def consumidor():
+            barreira.wait()
+            resultados.append(fila.aguardar_proximo("Cozinha", timeout=0.2))
+
+        threads = [threading.Thread(target=consumidor) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assumidos = [j for j in resultados if j]
+        assert len(assumidos) == 1
+        assert assumidos[0]["status"] == "imprimindo"
+        assert assumidos[0]["tentativas"] == 1
+
+    def test_consumidores_concorrentes_dividem_sem_repetir(self, fila):
+        for pedido_id in range(1, 51):
+            fila.enqueue(pedido_id, "Cozinha", _dados(pedido_id))
+        vistos = []
+        lock = threading.Lock()
+
+        def consumidor():
+            while True:
+                job = fila.aguardar_proximo("Cozinha", timeout=0.1)
+                if not job:
+                    return
+                with lock:
+                    vistos.append(job["pedido_id"])
+                fila.concluir(job, proximo=False)
+
+        threads = [threading.Thread(target=consumidor) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert sorted(vistos) == list(range(1, 51))
+        assert all(fila.ja_impresso(p, "Cozinha") for p in range(1, 51))
+
+    def test_concluir_assume_proximo_na_mesma_transacao(self, fila):
+        fila.enqueue(1, "Cozinha", _dados(1))
+        fila.enqueue(2, "Cozinha", _dados(2))
+        job = fila.aguardar_proximo("Cozinha", timeout=0)
+        seguinte = fila.concluir(job)
+        assert seguinte["pedido_id"] == 2
+        assert fila.aguardar_proximo("Cozinha", timeout=0) is None
+
+    def test_enqueue_acorda_consumidor(self, fila):
+        resultado = []
+        t = threading.Thread(target=lambda: resultado.append(fila.aguardar_proximo("Bar", timeout=5)))
+        t.start()
+        time.sleep(0.05)
+        inicio = time.monotonic()
+        fila.enqueue(7, "Bar", _dados(7))
+        t.join()
+        assert resultado[0]["pedido_id"] == 7
+        assert time.monotonic() - inicio < 1
+
+
+class TestRetry:
+    def test_limite_de_tentativas(self, fila, sem_backoff):
+        fila.enqueue(1, "Cozinha", _dados(1))
+        for _ in range(MAX_RETRIES):
+            job = fila.aguardar_proximo("Cozinha", timeout=0)
+            assert job is not None
+            fila.mark_failed(job["id"])
+        assert fila.aguardar_proximo("Cozinha", timeout=0) is None
+        falhos = fila.get_failed_jobs()
+        assert [j["pedido_id"] for j in falhos] == [1]
+        assert falhos[0]["tentativas"] == MAX_RETRIES
+        assert fila.impressoras_pendentes() == []
+
+    def test_falha_espera_backoff_antes_do_retry(self, fila, monkeypatch):
+        monkeypatch.setattr(print_queue, "RETRY_BACKOFF_SECONDS", 0.3)
+        fila.enqueue(1, "Cozinha", _dados(1))
+        job = fila.aguardar_proximo("Cozinha", timeout=0)
+        fila.mark_failed(job["id"])
+
+        assert fila.aguardar_proximo("Cozinha", timeout=0) is None
+        inicio = time.monotonic()
+        job = fila.aguardar_proximo("Cozinha", timeout=5)
+        esperou = time.monotonic() - inicio
+        assert job["tentativas"] == 2
+        # Acordou pelo fim do backoff, não pelo timeout
+        assert 0.15 < esperou < 2
+
+    def test_backoff_dobra_a_cada_falha(self, fila, monkeypatch):
+        monkeypatch.setattr(print_queue, "RETRY_BACKOFF_SECONDS", 10)
+        fila.enqueue(1, "Cozinha", _dados(1))
+        esperas = []
+        for _ in range(MAX_RETRIES - 1):
+            fila._conn.execute("UPDATE print_jobs SET proximo_tentativa = 0")
+            job = fila.aguardar_proximo("Cozinha", timeout=0)
+            antes = time.time()
+            fila.mark_failed(job["id"])
+            row = fila._conn.execute("SELECT proximo_tentativa FROM print_jobs WHERE id = ?", (job["id"],)).fetchone()
+            esperas.append(round(row["proximo_tentativa"] - antes))
+        assert esperas == [10, 20]
+
+    def test_job_em_backoff_nao_bloqueia_outra_impressora(self, fila, monkeypatch):
+        monkeypatch.setattr(print_queue, "RETRY_BACKOFF_SECONDS", 60)
+        fila.enqueue_lote(1, [("Cozinha", _dados(1)), ("Bar", _dados(1))])
+        fila.mark_failed(fila.aguardar_proximo("Cozinha", timeout=0)["id"])
+        assert fila.aguardar_proximo("Bar", timeout=0)["pedido_id"] == 1
+
+    def test_banco_antigo_ganha_coluna_de_backoff(self, tmp_path):
+        caminho = str(tmp_path / "antigo.db")
+        conn = sqlite3.connect(caminho)
+        conn.execute(
+            "CREATE TABLE print_jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, pedido_id INTEGER NOT NULL, "
+            "impressora TEXT NOT NULL, dados_json TEXT NOT NULL, status TEXT DEFAULT 'pendente', "
+            "tentativas INTEGER DEFAULT 0, reimpressao INTEGER DEFAULT 0, criado_em REAL NOT NULL, "
+            "UNIQUE(pedido_id, impressora) ON CONFLICT IGNORE)"
+        )
+        conn.execute(
+            "INSERT INTO print_jobs (pedido_id, impressora, dados_json, criado_em) VALUES (1, 'Cozinha', '{}', ?)",
+            (time.time(),)
+        )
+        conn.commit()
+        conn.close()
+        q = PrintQueue(db_path=caminho)
+        try:
+            assert q.aguardar_proximo("Cozinha", timeout=0)["pedido_id"] == 1
+        finally:
+            q.close()
+
+
+class TestRecuperacao:
+    def test_job_imprimindo_volta_para_fila_apos_crash(self, tmp_path):
+        caminho = str(tmp_path / "fila.db")
+        q = PrintQueue(db_path=caminho)
+        q.enqueue(1, "Cozinha", _dados(1))
+        assert q.aguardar_proximo("Cozinha", timeout=0)["status"] == "imprimindo"
+        q.close()  # agente caiu sem concluir
+
+        q = PrintQueue(db_path=caminho)
+        try:
+            job = q.aguardar_proximo("Cozinha", timeout=0)
+            assert job["pedido_id"] == 1
+            assert job["tentativas"] == 2
+        finally:
+            q.close()
+
+    def _agente(self, fila):
+        agente = PrinterAgent.__new__(PrinterAgent)
+        agente.config = {"copias": 1}
+        agente.queue = fila
+        agente._workers_lock = threading.Lock()
+        agente._imprimindo = 0
+        agente._atualizar_tray = MagicMock()
+        agente._enviar_ack = MagicMock()
+        return agente
+
+    def test_excecao_na_impressao_marca_falha(self, fila, sem_backoff):
+        fila.enqueue(1, "Cozinha", _dados(1))
+        job = fila.aguardar_proximo("Cozinha", timeout=0)
+        agente = self._agente(fila)
+
+        with patch("printer_agent.main.imprimir_raw", side_effect=OSError("spooler parado")):
+            assert agente._imprimir_job(job) is None
+
+        assert agente._enviar_ack.call_args.args[:2] == (1, False)
+        assert agente._imprimindo == 0
+        retry = fila.aguardar_proximo("Cozinha", timeout=0)
+        assert retry["pedido_id"] == 1 and retry["tentativas"] == 2
+
+    def test_dados_corrompidos_nao_prendem_job(self, fila, sem_backoff):
+        fila.enqueue(1, "Cozinha", {"raw_bytes_hex": "zz"})
+        agente = self._agente(fila)
+        with patch("printer_agent.main.imprimir_raw") as imprimir:
+            for _ in range(MAX_RETRIES):
+                agente._imprimir_job(fila.aguardar_proximo("Cozinha", timeout=0))
+        imprimir.assert_not_called()
+        assert [j["pedido_id"] for j in fila.get_failed_jobs()] == [1]
+
+    def test_sucesso_conclui_e_registra_historico(self, fila):
+        fila.enqueue(1, "Cozinha", _dados(1))
+        agente = self._agente(fila)
+        with patch("printer_agent.main.imprimir_raw", return_value=True) as imprimir:
+            agente._imprimir_job(fila.aguardar_proximo("Cozinha", timeout=0))
+        assert fila._conn.execute("SELECT COUNT(*) AS n FROM print_jobs").fetchone()["n"] == 0
+        assert imprimir.call_args.args[1] == b"Pedido 1\n"
+        assert fila.ja_impresso(1, "Cozinha")
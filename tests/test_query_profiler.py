@@ -0,0 +1,154 @@
+"""
+Testes do profiler de queries — Derekh Food
+Valida atribuição de queries por request (ContextVar), ring de queries
+lentas com stack amostrado e agregados por rota no MetricsCollector.
+
+Execução: pytest tests/test_query_profiler.py -v
+"""
+
+import sys
+import asyncio
+from pathlib import Path
+from unittest.mock import patch
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import StaticPool
+
+
+@pytest.fixture
+def engine():
+    from backend.app import query_profiler
+    eng = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool,
+    )
+    query_profiler.instrumentar_engine(eng)
+    query_profiler.instrumentar_engine(eng)  # idempotente
+    query_profiler.limpar_slow_queries()
+    yield eng
+    eng.dispose()
+
+
+def _executar(engine, n):
+    with engine.connect() as conn:
+        for _ in range(n):
+            conn.execute(text("SELECT 1"))
+
+
+class TestPerfilRequest:
+    def test_conta_queries_da_request(self, engine):
+        from backend.app import query_profiler
+        perfil, token = query_profiler.iniciar_perfil("/teste")
+        try:
+            _executar(engine, 4)
+        finally:
+            query_profiler.finalizar_perfil(token)
+
+        assert perfil.queries == 4
+        assert perfil.db_ms > 0
+        assert len(perfil.lentas) == query_profiler.TOP_STATEMENTS_POR_REQUEST
+        assert query_profiler.perfil_atual() is None
+
+    def test_fora_de_request_nao_conta(self, engine):
+        from backend.app import query_profiler
+        _executar(engine, 2)
+        assert query_profiler.perfil_atual() is None
+
+    def test_requests_concorrentes_isoladas(self, engine):
+        """Cada task tem seu perfil; threadpool (endpoints sync) herda o contexto."""
+        from backend.app import query_profiler
+
+        async def request(n):
+            perfil, token = query_profiler.iniciar_perfil()
+            try:
+                await asyncio.sleep(0)
+                await asyncio.to_thread(_executar, engine, n)
+            finally:
+                query_profiler.finalizar_perfil(token)
+            return perfil.queries
+
+        async def rodar():
+            return await asyncio.gather(request(1), request(3), request(5))
+
+        assert asyncio.run(rodar()) == [1, 3, 5]
+
+
+    def test_statement_com_erro_fecha_medicao(self, engine):
+        """Erro no cursor não deixa início pendurado na conexão (pool reaproveita)."""
+        from backend.app import query_profiler
+        from sqlalchemy.exc import OperationalError
+        perfil, token = query_profiler.iniciar_perfil("/teste")
+        try:
+            with engine.connect() as conn:
+                for _ in range(3):
+                    with pytest.raises(OperationalError):
+                        conn.execute(text("SELECT * FROM tabela_inexistente"))
+                conn.execute(text("SELECT 1"))
+                assert conn.connection.dbapi_connection is not None
+                assert not conn.info.get("_query_inicio")
+        finally:
+            query_profiler.finalizar_perfil(token)
+        assert perfil.queries == 4
+
+
+class TestSlowQueries:
+    def test_registra_lenta_com_stack_amostrado(self, engine):
+        from backend.app import query_profiler
+        with patch.object(query_profiler, "SLOW_QUERY_MS", 0.0), \
+             patch.object(query_profiler, "SLOW_QUERY_STACK_SAMPLE_RATE", 1.0):
+            perfil, token = query_profiler.iniciar_perfil("/pedidos/1")
+            try:
+                _executar(engine, 1)
+            finally:
+                query_profiler.finalizar_perfil(token)
+
+        lentas = query_profiler.slow_queries_recentes()
+        assert len(lentas) == 1
+        assert lentas[0]["path"] == "/pedidos/1"
+        assert lentas[0]["statement"] == "SELECT 1"
+        # Só frames do projeto (backend/, database/) — nada de SQLAlchemy/pytest
+        assert isinstance(lentas[0]["stack"], list)
+        assert all(f.startswith(("backend", "database")) for f in lentas[0]["stack"])
+
+    def test_sem_amostragem_sem_stack(self, engine):
+        from backend.app import query_profiler
+        with patch.object(query_profiler, "SLOW_QUERY_MS", 0.0), \
+             patch.object(query_profiler, "SLOW_QUERY_STACK_SAMPLE_RATE", 0.0):
+            _executar(engine, 3)
+
+        lentas = query_profiler.slow_queries_recentes()
+        assert len(lentas) == 3
+        assert all("stack" not in r for r in lentas)
+
+    def test_abaixo_do_limite_ignora(self, engine):
+        from backend.app import query_profiler
+        with patch.object(query_profiler, "SLOW_QUERY_MS", 10_000.0):
+            _executar(engine, 3)
+        assert query_profiler.slow_queries_recentes() == []
+
+
+class TestMetricasPorRota:
+    def test_agrega_e_ordena_por_tempo_de_banco(self):
+        from backend.app.metrics import MetricsCollector
+        m = MetricsCollector()
+        m.record_request(200, 10.0, rota="GET /site/{codigo}/produtos", queries=200, db_ms=80.0,
+                         statement_mais_lento=(5.0, "SELECT * FROM produtos"))
+        m.record_request(200, 20.0, rota="GET /site/{codigo}/produtos", queries=100, db_ms=40.0)
+        m.record_request(200, 5.0, rota="GET /carrinho/", queries=3, db_ms=1.0)
+        m.record_request(200, 1.0)  # sem rota (compatível com chamadas antigas)
+
+        rotas = m.get_rotas()
+        assert [r["rota"] for r in rotas] == ["GET /site/{codigo}/produtos", "GET /carrinho/"]
+        produtos = rotas[0]
+        assert produtos["requests"] == 2
+        assert produtos["queries_media"] == 150
+        assert produtos["queries_max"] == 200
+        assert produtos["db_ms_max"] == 80.0
+        assert produtos["statement_mais_lento"]["statement"] == "SELECT * FROM produtos"
+        assert m.get_metrics()["total_requests"] == 4
+
+        m.reset()
+        assert m.get_rotas() == []
@@ -0,0 +1,151 @@
+"""
+Testes do serviço de transcodificação MP3 → OGG/Opus — Derekh Food
+Valida limite de concorrência, backpressure da fila, fallback PyAV → ffmpeg,
+falha de ffmpeg e métricas de espera/encode.
+
+Execução: pytest tests/test_transcoder.py -v
+"""
+
+import sys
+import os
+import time
+import asyncio
+import threading
+from pathlib import Path
+from unittest.mock import patch
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key-transcoder")
+os.environ.setdefault("ENVIRONMENT", "testing")
+
+import pytest
+
+from backend.app.bot import transcoder as tc
+from backend.app.bot.transcoder import Transcoder, TranscoderOcupado
+
+OGG = b"OggS" + b"\x00" * 200
+
+
+@pytest.fixture
+def t():
+    inst = Transcoder(workers=2, fila_max=2, timeout=5, inprocess=False)
+    yield inst
+    inst.shutdown()
+
+
+class TestPool:
+    def test_limita_processos_simultaneos(self, t):
+        ativos, pico = [0], [0]
+        lock = threading.Lock()
+
+        def fake_ffmpeg(mp3, timeout):
+            with lock:
+                ativos[0] += 1
+                pico[0] = max(pico[0], ativos[0])
+            time.sleep(0.05)
+            with lock:
+                ativos[0] -= 1
+            return OGG
+
+        async def cenario():
+            return await asyncio.gather(*[t.mp3_para_ogg_opus_async(b"mp3") for _ in range(4)])
+
+        with patch.object(tc, "_ffmpeg_mp3_para_ogg", fake_ffmpeg):
+            resultados = asyncio.run(cenario())
+        assert resultados == [OGG] * 4
+        assert pico[0] == 2
+        assert t.stats()["ok"] == 4
+
+    def test_fila_cheia_recusa(self, t):
+        liberar = threading.Event()
+
+        def fake_ffmpeg(mp3, timeout):
+            liberar.wait(5)
+            return OGG
+
+        with patch.object(tc, "_ffmpeg_mp3_para_ogg", fake_ffmpeg):
+            futuros = []
+            executor = t._get_executor()
+            for _ in range(4):  # 2 workers + 2 na fila
+                t._reservar()
+                futuros.append(executor.submit(t._converter, b"mp3", time.perf_counter()))
+            with pytest.raises(TranscoderOcupado):
+                t.mp3_para_ogg_opus(b"mp3")
+            liberar.set()
+            assert [f.result() for f in futuros] == [OGG] * 4
+
+        assert t.stats()["recusados"] == 1
+        assert t.stats()["pendentes"] == 0
+        # Vaga liberada: volta a aceitar
+        with patch.object(tc, "_ffmpeg_mp3_para_ogg", return_value=OGG):
+            assert t.mp3_para_ogg_opus(b"mp3") == OGG
+
+    def test_submit_falho_devolve_vaga(self, t):
+        executor = t._get_executor()
+        executor.shutdown(wait=False)  # submit passa a levantar RuntimeError
+        for _ in range(t.workers + t.fila_max + 1):
+            with pytest.raises(RuntimeError):
+                t.mp3_para_ogg_opus(b"mp3")
+        assert t.stats()["pendentes"] == 0
+        assert t.stats()["recusados"] == 0
+
+    def test_cancelado_na_fila_devolve_vaga(self, t):
+        liberar = threading.Event()
+
+        def fake_ffmpeg(mp3, timeout):
+            liberar.wait(5)
+            return OGG
+
+        async def cenario():
+            ocupando = [asyncio.ensure_future(t.mp3_para_ogg_opus_async(b"mp3")) for _ in range(2)]
+            await asyncio.sleep(0.05)
+            # Os dois workers estão ocupados: este fica na fila e é cancelado lá
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(t.mp3_para_ogg_opus_async(b"mp3"), timeout=0.05)
+            liberar.set()
+            return await asyncio.gather(*ocupando)
+
+        with patch.object(tc, "_ffmpeg_mp3_para_ogg", fake_ffmpeg):
+            assert asyncio.run(cenario()) == [OGG] * 2
+        assert t.stats()["pendentes"] == 0
+
+
+class TestBackends:
+    def test_pyav_falha_cai_no_ffmpeg(self, t):
+        t.inprocess = True
+        with patch.object(tc, "_pyav_mp3_para_ogg", side_effect=RuntimeError("codec")), \
+             patch.object(tc, "_ffmpeg_mp3_para_ogg", return_value=OGG):
+            assert t.mp3_para_ogg_opus(b"mp3") == OGG
+        stats = t.stats()
+        assert stats["fallback_ffmpeg"] == 1
+        assert stats["encode"]["ffmpeg"]["n"] == 1
+
+    def test_pyav_sem_fork(self, t):
+        t.inprocess = True
+        with patch.object(tc, "_pyav_mp3_para_ogg", return_value=OGG), \
+             patch.object(tc, "_ffmpeg_mp3_para_ogg") as ffmpeg:
+            assert t.mp3_para_ogg_opus(b"mp3") == OGG
+        ffmpeg.assert_not_called()
+        assert t.stats()["encode"]["pyav"]["n"] == 1
+
+    def test_ffmpeg_ausente(self, t):
+        with patch.object(tc, "_ffmpeg_mp3_para_ogg", side_effect=FileNotFoundError("ffmpeg")):
+            assert t.mp3_para_ogg_opus(b"mp3") is None
+        assert t.stats()["falhas"] == 1
+
+    def test_saida_pequena_descartada(self, t):
+        with patch.object(tc, "_ffmpeg_mp3_para_ogg", return_value=b"OggS"):
+            assert t.mp3_para_ogg_opus(b"mp3") is None
+
+
+class TestIntegracao:
+    def test_whatsapp_client_trata_fila_cheia(self):
+        from backend.app.bot import whatsapp_client
+
+        async def ocupado(mp3):
+            raise TranscoderOcupado("cheio")
+
+        with patch.object(tc.transcoder, "mp3_para_ogg_opus_async", ocupado):
+            assert asyncio.run(whatsapp_client._mp3_to_ogg_opus(b"mp3")) is None
@@ -0,0 +1,218 @@
+"""
+Testes do cache de áudio TTS (bot WhatsApp) — Derekh Food
+Valida chave por conteúdo, hit/miss em disco, despejo LRU por tamanho,
+single-flight, OGG/Opus cacheado (sem ffmpeg) e fallback Fish → xAI.
+
+Execução: pytest tests/test_tts_audio_cache.py -v
+"""
+
+import sys
+import os
+import asyncio
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import patch
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key-tts-cache")
+os.environ.setdefault("ENVIRONMENT", "testing")
+
+import pytest
+
+from backend.app.bot import audio_cache as ac
+from backend.app.bot.audio_cache import AudioCache, chave_audio
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return AudioCache(diretorio=str(tmp_path / "tts"), max_bytes=1024 * 1024, usar_r2=False)
+
+
+def _gerador(chamadas, dados=b"ID3-mp3", atraso=0.0):
+    async def gerar():
+        chamadas.append(1)
+        if atraso:
+            await asyncio.sleep(atraso)
+        return dados
+    return gerar
+
+
+class TestChave:
+    def test_espacos_normalizados(self):
+        a = chave_audio("Seu pedido  saiu!\n", "xai", "ara", "pt-BR")
+        b = chave_audio(" Seu pedido saiu!", "xai", "ara", "pt-BR")
+        assert a == b
+
+    def test_parametros_mudam_a_chave(self):
+        base = chave_audio("Oi", "fish", "voz1", "pt-BR", "")
+        assert base != chave_audio("Oi", "fish", "voz2", "pt-BR", "")
+        assert base != chave_audio("Oi", "fish", "voz1", "pt-BR", "feliz")
+        assert base != chave_audio("Oi", "xai", "voz1", "pt-BR", "")
+        assert base != chave_audio("Oi!", "fish", "voz1", "pt-BR", "")
+
+
+class TestAudioCache:
+    def test_diretorio_padrao_fora_do_static(self):
+        padrao = Path(ac.TTS_CACHE_DIR).resolve()
+        assert (PROJECT_ROOT / "backend" / "static") not in padrao.parents
+
+    def test_miss_depois_hit(self, cache):
+        chamadas = []
+        primeiro = _run(cache.obter_ou_gerar("k1", _gerador(chamadas)))
+        segundo = _run(cache.obter_ou_gerar("k1", _gerador(chamadas)))
+        assert primeiro.mp3 == segundo.mp3 == b"ID3-mp3"
+        assert not primeiro.do_cache and segundo.do_cache
+        assert len(chamadas) == 1
+        assert cache.stats["hits"] == 1 and cache.stats["misses"] == 1
+
+    def test_falha_de_tts_nao_cacheia(self, cache):
+        chamadas = []
+        assert _run(cache.obter_ou_gerar("k1", _gerador(chamadas, dados=None))) is None
+        assert cache.get("k1") is None
+        _run(cache.obter_ou_gerar("k1", _gerador(chamadas)))
+        assert len(chamadas) == 2
+
+    def test_indice_sobrevive_a_restart(self, cache):
+        _run(cache.put("k1", "mp3", b"x" * 10))
+        novo = AudioCache(diretorio=str(cache.diretorio), max_bytes=cache.max_bytes, usar_r2=False)
+        assert novo.get("k1") == b"x" * 10
+        assert novo._total == 10
+
+    def test_despejo_lru_por_tamanho(self, tmp_path):
+        cache = AudioCache(diretorio=str(tmp_path / "tts"), max_bytes=250, usar_r2=False)
+        for chave in ("a", "b"):
+            _run(cache.put(chave, "mp3", b"x" * 100))
+        cache.get("a")  # "a" fica mais recente que "b"
+        _run(cache.put("c", "mp3", b"x" * 100))
+
+        assert cache.get("b") is None
+        assert cache.get("a") is not None and cache.get("c") is not None
+        assert cache._total <= 250
+        assert cache.stats["despejados"] == 1
+
+    def test_single_flight(self, cache):
+        chamadas = []
+
+        async def cenario():
+            return await asyncio.gather(*[
+                cache.obter_ou_gerar("k1", _gerador(chamadas, atraso=0.05)) for _ in range(10)
+            ])
+
+        resultados = _run(cenario())
+        assert len(chamadas) == 1
+        assert all(r.mp3 == b"ID3-mp3" for r in resultados)
+
+    def test_r2_reidrata_disco(self, tmp_path):
+        cache = AudioCache(diretorio=str(tmp_path / "tts"), usar_r2=True)
+
+        class FakeStorage:
+            def download(self, key):
+                assert key.startswith("tts-cache/")
+                return b"do-r2"
+
+        with patch("backend.app.storage.get_storage", return_value=FakeStorage()):
+            audio = _run(cache.obter_ou_gerar("k1", _gerador([])))
+        assert audio.mp3 == b"do-r2" and audio.do_cache
+        assert cache.get("k1") == b"do-r2"
+        assert cache.stats["hits_r2"] == 1
+
+    def test_upload_r2_em_background_guardado(self, tmp_path):
+        cache = AudioCache(diretorio=str(tmp_path / "tts"), usar_r2=True)
+        enviados = []
+
+        class FakeStorage:
+            def upload(self, dados, key, content_type):
+                enviados.append((key, content_type))
+
+        async def cenario():
+            await cache.put("k1", "mp3", b"ID3-mp3")
+            assert len(ac._uploads_r2) == 1  # referência forte enquanto roda
+            await asyncio.gather(*ac._uploads_r2)
+            await asyncio.sleep(0)
+
+        with patch("backend.app.storage.get_storage", return_value=FakeStorage()):
+            _run(cenario())
+        assert enviados == [("tts-cache/k1.mp3", "audio/mpeg")]
+        assert not ac._uploads_r2
+
+    def test_falha_no_upload_r2_logada(self, tmp_path, caplog):
+        cache = AudioCache(diretorio=str(tmp_path / "tts"), usar_r2=True)
+
+        class FakeStorage:
+            def upload(self, dados, key, content_type):
+                raise ConnectionError("R2 fora")
+
+        async def cenario():
+            await cache.put("k1", "mp3", b"ID3-mp3")
+            await asyncio.gather(*ac._uploads_r2, return_exceptions=True)
+            await asyncio.sleep(0)
+
+        with patch("backend.app.storage.get_storage", return_value=FakeStorage()), \
+             caplog.at_level("WARNING", logger="superfood.bot.audio_cache"):
+            _run(cenario())
+        assert "R2 fora" in caplog.text
+        assert not ac._uploads_r2
+        assert cache.get("k1") == b"ID3-mp3"  # disco gravado mesmo sem R2
+
+
+class TestOggOpus:
+    def test_transcodifica_uma_vez(self, cache):
+        conversoes = []
+
+        async def fake_ffmpeg(mp3):
+            conversoes.append(mp3)
+            return b"OggS-opus"
+
+        with patch("backend.app.bot.whatsapp_client._mp3_to_ogg_opus", fake_ffmpeg):
+            audio = _run(cache.obter_ou_gerar("k1", _gerador([])))
+            assert _run(audio.ogg_opus()) == b"OggS-opus"
+            # Nova conversa, mesma frase: OGG sai do disco
+            outro = _run(cache.obter_ou_gerar("k1", _gerador([])))
+            assert _run(outro.ogg_opus()) == b"OggS-opus"
+        assert len(conversoes) == 1
+
+    def test_base64_para_evolution(self, cache):
+        audio = _run(cache.obter_ou_gerar("k1", _gerador([], dados=b"\x00\x01")))
+        assert audio.base64_mp3() == "AAE="
+
+
+class TestSintetizar:
+    @pytest.fixture
+    def cache_global(self, cache):
+        with patch.object(ac, "audio_cache", cache):
+            yield cache
+
+    def _config(self, provider="fish"):
+        return SimpleNamespace(tts_provider=provider, voz_tts="voz1", idioma="pt-BR")
+
+    def test_fish_falha_cai_no_xai(self, cache_global):
+        async def fish(*a, **kw):
+            return None
+
+        async def xai(*a, **kw):
+            return b"mp3-xai"
+
+        with patch.dict(os.environ, {"FISH_API_KEY": "k"}), \
+             patch("backend.app.bot.fish_tts.gerar_audio_bytes", fish), \
+             patch("backend.app.bot.xai_tts.gerar_audio_bytes", xai):
+            audio = _run(ac.sintetizar("Olá", self._config()))
+        assert audio.mp3 == b"mp3-xai"
+        assert audio.chave == chave_audio("Olá", "xai", "voz1", "pt-BR")
+
+    def test_repeticao_nao_chama_tts(self, cache_global):
+        chamadas = []
+
+        async def xai(*a, **kw):
+            chamadas.append(a)
+            return b"mp3-xai"
+
+        with patch("backend.app.bot.xai_tts.gerar_audio_bytes", xai):
+            for _ in range(3):
+                assert _run(ac.sintetizar("Seu pedido saiu!", self._config("xai"))).mp3 == b"mp3-xai"
+        assert len(chamadas) == 1
@@ -0,0 +1,175 @@
+"""
+Testes do servidor TCP da impressora virtual — Derekh Food
+Fronteira de job (EOF, corte + pausa curta, ociosidade sem corte, corte
+partido entre leituras) e o servidor asyncio ponta a ponta: vários jobs
+na mesma conexão, conexões simultâneas e arquivos gravados.
+
+Execução: pytest tests/test_virtual_printer_tcp.py -v
+"""
+
+import asyncio
+import socket
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from virtual_printer import tcp_server
+from virtual_printer.tcp_server import TCPPrinterServer
+
+CORTE = b"\x1dV\x00"
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def _servidor(tmp_path, **kwargs) -> TCPPrinterServer:
+    kwargs.setdefault("idle_gap", 0.3)
+    return TCPPrinterServer(output_dir=str(tmp_path), quiet=True, **kwargs)
+
+
+async def _ler_jobs(servidor, envios):
+    """Alimenta um StreamReader com (atraso, bytes) e coleta os jobs lidos."""
+    reader = asyncio.StreamReader()
+
+    async def alimentar():
+        for atraso, dados in envios:
+            await asyncio.sleep(atraso)
+            reader.feed_data(dados)
+        reader.feed_eof()
+
+    tarefa = asyncio.create_task(alimentar())
+    jobs = []
+    while True:
+        job = await servidor._ler_job(reader)
+        if job is None:
+            break
+        jobs.append(job)
+    await tarefa
+    return jobs
+
+
+class TestFronteiraDeJob:
+    def test_eof_encerra_job(self, tmp_path):
+        jobs = _run(_ler_jobs(_servidor(tmp_path), [(0, b"Pedido 1\n"), (0.01, b"Coca\n")]))
+        assert jobs == [b"Pedido 1\nCoca\n"]
+
+    def test_conexao_sem_bytes_retorna_none(self, tmp_path):
+        assert _run(_ler_jobs(_servidor(tmp_path), [])) == []
+
+    def test_corte_seguido_de_pausa_separa_jobs(self, tmp_path):
+        pausa = tcp_server.CUT_GRACE_SECONDS * 3
+        jobs = _run(_ler_jobs(_servidor(tmp_path), [
+            (0, b"Job A\n" + CORTE),
+            (pausa, b"Job B\n" + CORTE),
+        ]))
+        assert jobs == [b"Job A\n" + CORTE, b"Job B\n" + CORTE]
+
+    def test_bytes_finais_logo_apos_corte_ficam_no_mesmo_job(self, tmp_path):
+        jobs = _run(_ler_jobs(_servidor(tmp_path), [
+            (0, b"Job A\n" + CORTE),
+            (0.01, b"\x1b@"),
+        ]))
+        assert jobs == [b"Job A\n" + CORTE + b"\x1b@"]
+
+    def test_corte_partido_entre_leituras(self, tmp_path):
+        pausa = tcp_server.CUT_GRACE_SECONDS * 3
+        jobs = _run(_ler_jobs(_servidor(tmp_path, idle_gap=5), [
+            (0, b"Job A\n\x1d"),
+            (0.01, b"V\x42\x03"),
+            (pausa, b"Job B\n"),
+        ]))
+        assert jobs == [b"Job A\n\x1dV\x42\x03", b"Job B\n"]
+
+    def test_ociosidade_sem_corte_encerra_job(self, tmp_path):
+        servidor = _servidor(tmp_path, idle_gap=0.1)
+        jobs = _run(_ler_jobs(servidor, [(0, b"Job A\n"), (0.3, b"Job B\n")]))
+        assert jobs == [b"Job A\n", b"Job B\n"]
+
+    def test_dados_dentro_da_ociosidade_continuam_o_job(self, tmp_path):
+        jobs = _run(_ler_jobs(_servidor(tmp_path, idle_gap=0.5), [(0, b"Job "), (0.05, b"A\n")]))
+        assert jobs == [b"Job A\n"]
+
+    def test_primeiro_byte_espera_sem_timeout(self, tmp_path):
+        """Conexão aberta e calada não gera job vazio por ociosidade."""
+        servidor = _servidor(tmp_path, idle_gap=0.05)
+        jobs = _run(_ler_jobs(servidor, [(0.3, b"Job A\n")]))
+        assert jobs == [b"Job A\n"]
+
+
+def _porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _com_servidor(servidor, cenario):
+    tarefa = asyncio.create_task(servidor.serve())
+    for _ in range(200):
+        if servidor._running:
+            break
+        await asyncio.sleep(0.01)
+    try:
+        await cenario()
+    finally:
+        servidor.stop()
+        await asyncio.wait_for(tarefa, timeout=5)
+
+
+class TestServidorAsyncio:
+    def test_varios_jobs_na_mesma_conexao(self, tmp_path, capsys):
+        servidor = _servidor(tmp_path, port=_porta_livre())
+
+        async def cenario():
+            _, writer = await asyncio.open_connection("127.0.0.1", servidor.port)
+            writer.write(b"\x1b@Pedido 1\n" + CORTE)
+            await writer.drain()
+            await asyncio.sleep(tcp_server.CUT_GRACE_SECONDS * 3)
+            writer.write(b"\x1b@Pedido 2\n" + CORTE)
+            await writer.drain()
+            writer.close()
+            await writer.wait_closed()
+            await asyncio.sleep(0.2)
+
+        _run(_com_servidor(servidor, cenario))
+        assert servidor._job_counter == 2
+        assert (tmp_path / "job_0001.txt").read_text(encoding="utf-8") == "Pedido 1"
+        assert (tmp_path / "job_0002.txt").read_text(encoding="utf-8") == "Pedido 2"
+        assert (tmp_path / "job_0002.bin").read_bytes() == b"\x1b@Pedido 2\n" + CORTE
+        assert "[CUT:FULL]" in (tmp_path / "job_0001_annotated.txt").read_text(encoding="utf-8")
+
+    def test_conexoes_simultaneas(self, tmp_path, capsys):
+        servidor = _servidor(tmp_path, port=_porta_livre(), workers=2)
+
+        async def enviar(i):
+            _, writer = await asyncio.open_connection("127.0.0.1", servidor.port)
+            writer.write(f"Pedido {i}\n".encode() + CORTE)
+            await writer.drain()
+            writer.close()
+            await writer.wait_closed()
+
+        async def cenario():
+            await asyncio.gather(*[enviar(i) for i in range(30)])
+            await asyncio.sleep(0.3)
+
+        _run(_com_servidor(servidor, cenario))
+        assert servidor._job_counter == 30
+        textos = {p.read_text(encoding="utf-8") for p in tmp_path.glob("job_*[0-9].txt")}
+        assert textos == {f"Pedido {i}" for i in range(30)}
+        assert servidor._bytes_total == sum(len(f"Pedido {i}\n".encode() + CORTE) for i in range(30))
+
+    def test_stop_espera_jobs_em_andamento(self, tmp_path, capsys):
+        servidor = _servidor(tmp_path, port=_porta_livre())
+
+        async def cenario():
+            _, writer = await asyncio.open_connection("127.0.0.1", servidor.port)
+            writer.write(b"Pedido final\n")
+            await writer.drain()
+            writer.close()
+            await writer.wait_closed()
+            await asyncio.sleep(0.05)
+
+        _run(_com_servidor(servidor, cenario))
+        assert (tmp_path / "job_0001.txt").read_text(encoding="utf-8") == "Pedido final"
@@ -0,0 +1,371 @@
+"""
+Testes da fila durável de webhooks (webhook_fila) — Derekh Food
+Valida o ack rápido dos endpoints (Evolution, Meta, Woovi) sem executar o
+processamento no request, a dedup por chave do provedor, a posse atômica do
+evento, a concorrência limitada dos consumidores, a serialização por
+conversa, o retry com backoff (sem repetir respostas já enviadas) e a
+recuperação de eventos órfãos.
+
+Execução: pytest tests/test_webhook_fila.py -v
+"""
+
+import sys
+import os
+import asyncio
+from pathlib import Path
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key-webhook-fila")
+os.environ.setdefault("ENVIRONMENT", "testing")
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from database.base import Base
+from database.models import WebhookEvento
+from backend.app import webhook_fila as wf
+from backend.app.webhook_fila import FilaWebhooks
+
+
+@pytest.fixture
+def Sessao(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'webhooks.db'}",
+        connect_args={"check_same_thread": False, "timeout": 30},
+    )
+    Base.metadata.create_all(bind=engine)
+    fabrica = sessionmaker(bind=engine)
+    with patch.object(wf, "SessionLocal", fabrica):
+        yield fabrica
+    engine.dispose()
+
+
+@pytest.fixture
+def fila(Sessao):
+    return FilaWebhooks()
+
+
+def _eventos(Sessao):
+    db = Sessao()
+    try:
+        return db.query(WebhookEvento).order_by(WebhookEvento.id).all()
+    finally:
+        db.close()
+
+
+def _handlers(**handlers):
+    return patch.dict(wf._handlers, handlers)
+
+
+class TestIngestao:
+    def test_grava_e_deduplica(self, fila, Sessao):
+        r1 = asyncio.run(fila.receber("asaas", "PAYMENT_RECEIVED_pay_1", {"event": "PAYMENT_RECEIVED"}))
+        r2 = asyncio.run(fila.receber("asaas", "PAYMENT_RECEIVED_pay_1", {"event": "PAYMENT_RECEIVED"}))
+        assert r1["status"] == "queued" and r2["status"] == "duplicate"
+        eventos = _eventos(Sessao)
+        assert len(eventos) == 1
+        assert eventos[0].status == "pendente" and eventos[0].payload_json["event"] == "PAYMENT_RECEIVED"
+
+    def test_mesma_chave_origens_diferentes(self, fila, Sessao):
+        asyncio.run(fila.receber("asaas", "x", {}))
+        asyncio.run(fila.receber("woovi", "x", {}))
+        assert len(_eventos(Sessao)) == 2
+
+    def test_chave_dedup_sem_ids_usa_hash_do_corpo(self):
+        assert wf.chave_dedup("inst", "MSG1") == "inst:MSG1"
+        assert wf.chave_dedup(None, "", corpo=b"{}").startswith("sha1:")
+
+
+class TestEndpoints:
+    @pytest.fixture
+    def client(self, Sessao):
+        from backend.app.routers import bot_whatsapp, pix_webhooks
+        app = FastAPI()
+        app.include_router(bot_whatsapp.router)
+        app.include_router(pix_webhooks.router)
+        return TestClient(app)
+
+    def _evolution(self, msg_id="MSG1", event="messages.upsert"):
+        return {
+            "event": event, "instance": "rest1",
+            "data": {"key": {"id": msg_id, "remoteJid": "5511999990000@s.whatsapp.net", "fromMe": False},
+                     "message": {"conversation": "oi"}},
+        }
+
+    def test_evolution_ack_sem_processar(self, client, Sessao):
+        chamado = []
+
+        async def handler(payload, ws_manager=None):
+            chamado.append(payload)
+
+        with _handlers(evolution=handler):
+            r = client.post("/webhooks/evolution", json=self._evolution())
+            r2 = client.post("/webhooks/evolution", json=self._evolution())  # reenvio
+        assert r.status_code == 200 and r.json()["fila"] == "queued"
+        assert r2.json()["fila"] == "duplicate"
+        assert chamado == []  # processamento é do consumidor, não do request
+        eventos = _eventos(Sessao)
+        assert [(e.origem, e.dedup_key) for e in eventos] == [("evolution", "rest1:MSG1")]
+
+    def test_evolution_eventos_sem_mensagem_nao_gravam(self, client, Sessao):
+        r = client.post("/webhooks/evolution", json=self._evolution(event="presence.update"))
+        assert r.status_code == 200
+        assert _eventos(Sessao) == []
+
+    def test_meta_status_nao_grava_mensagem_grava(self, client, Sessao):
+        status = {"entry": [{"changes": [{"value": {
+            "messaging_product": "whatsapp", "metadata": {"phone_number_id": "PN1"},
+            "statuses": [{"id": "wamid.S", "status": "read"}]}}]}]}
+        mensagem = {"entry": [{"changes": [{"value": {
+            "messaging_product": "whatsapp", "metadata": {"phone_number_id": "PN1"},
+            "messages": [{"id": "wamid.M1", "from": "5511", "type": "text", "text": {"body": "oi"}}]}}]}]}
+        assert client.post("/webhooks/meta-whatsapp", json=status).status_code == 200
+        assert client.post("/webhooks/meta-whatsapp", json=mensagem).status_code == 200
+        assert [e.dedup_key for e in _eventos(Sessao)] == ["wamid.M1"]
+
+    def test_woovi_assinatura(self, client, Sessao):
+        corpo = {"event": "OPENPIX:CHARGE_COMPLETED", "charge": {"correlationID": "c1"}}
+        from backend.app.routers import pix_webhooks
+        with patch.object(pix_webhooks.woovi_client, "validar_webhook", return_value=False):
+            assert client.post("/webhooks/woovi", json=corpo).status_code == 401
+        assert _eventos(Sessao) == []
+        with patch.object(pix_webhooks.woovi_client, "validar_webhook", return_value=True):
+            r = client.post("/webhooks/woovi", json=corpo)
+        assert r.json() == {"status": "queued", "event": "OPENPIX:CHARGE_COMPLETED"}
+        assert _eventos(Sessao)[0].dedup_key == "OPENPIX:CHARGE_COMPLETED_c1"
+
+    def test_banco_fora_responde_503(self, client):
+        with patch.object(wf.fila_webhooks, "gravar", side_effect=RuntimeError("db caiu")):
+            r = client.post("/webhooks/evolution", json=self._evolution())
+        assert r.status_code == 503
+
+
+class TestConsumo:
+    def test_processa_e_marca_ok(self, fila, Sessao):
+        recebidos = []
+
+        async def handler(payload, ws_manager=None):
+            recebidos.append(payload["n"])
+
+        async def cenario():
+            evento = await fila.receber("asaas", "e1", {"n": 1})
+            return await fila.processar(evento["evento_id"])
+
+        with _handlers(asaas=handler):
+            assert asyncio.run(cenario()) is True
+        e = _eventos(Sessao)[0]
+        assert recebidos == [1]
+        assert e.status == "ok" and e.tentativas == 1 and e.processado_em is not None
+
+    def test_posse_atomica(self, fila, Sessao):
+        chamadas = []
+
+        async def handler(payload, ws_manager=None):
+            chamadas.append(1)
+            await asyncio.sleep(0.05)
+
+        async def cenario():
+            evento = await fila.receber("asaas", "e1", {})
+            return await asyncio.gather(*[fila.processar(evento["evento_id"]) for _ in range(3)])
+
+        with _handlers(asaas=handler):
+            resultados = asyncio.run(cenario())
+        assert sorted(resultados) == [False, False, True]
+        assert chamadas == [1]
+
+    def test_retry_com_backoff_e_desistencia(self, fila, Sessao):
+        async def handler(payload, ws_manager=None):
+            raise ValueError("asaas fora")
+
+        async def cenario():
+            evento = await fila.receber("asaas", "e1", {})
+            return evento["evento_id"], await fila.processar(evento["evento_id"])
+
+        with _handlers(asaas=handler), patch.object(wf, "WEBHOOK_MAX_TENTATIVAS", 2):
+            evento_id, ok = asyncio.run(cenario())
+            assert ok is False
+            e = _eventos(Sessao)[0]
+            assert e.status == "pendente" and e.tentativas == 1
+            assert e.proxima_tentativa_em > datetime.utcnow()
+            assert "asaas fora" in e.erro
+            # Fora da janela de backoff a varredura não pega
+            assert fila._varrer() == []
+
+            db = Sessao()
+            db.query(WebhookEvento).update({"proxima_tentativa_em": datetime.utcnow() - timedelta(seconds=1)})
+            db.commit()
+            db.close()
+            assert fila._varrer() == [(evento_id, "asaas")]
+            asyncio.run(fila.processar(evento_id))
+
+        e = _eventos(Sessao)[0]
+        assert e.status == "erro" and e.tentativas == 2
+        assert fila.contadores["retries"] == 1 and fila.contadores["falhas"] == 1
+
+    def test_orfao_volta_para_fila(self, fila, Sessao):
+        asyncio.run(fila.receber("meta", "m1", {}))
+        db = Sessao()
+        db.query(WebhookEvento).update({
+            "status": "processando", "atualizado_em": datetime.utcnow() - timedelta(hours=1),
+        })
+        db.commit()
+        db.close()
+        assert [origem for _, origem in fila._varrer()] == ["meta"]
+        assert fila.contadores["recuperados"] == 1
+
+    def test_concorrencia_limitada(self, fila, Sessao):
+        ativos, pico = [0], [0]
+
+        async def handler(payload, ws_manager=None):
+            ativos[0] += 1
+            pico[0] = max(pico[0], ativos[0])
+            await asyncio.sleep(0.02)
+            ativos[0] -= 1
+
+        async def cenario():
+            await fila.start()
+            try:
+                for i in range(8):
+                    await fila.receber("woovi", f"e{i}", {"i": i})
+                for _ in range(200):
+                    if fila.contadores["processados"] == 8:
+                        break
+                    await asyncio.sleep(0.02)
+            finally:
+                await fila.stop()
+
+        with _handlers(woovi=handler), patch.object(wf, "WEBHOOK_CONCORRENCIA_PAGAMENTOS", 2):
+            asyncio.run(cenario())
+        assert fila.contadores["processados"] == 8
+        assert pico[0] == 2
+        assert all(e.status == "ok" for e in _eventos(Sessao))
+        assert fila.stats()["processamento"]["woovi"]["n"] == 8
+
+
+def _conversas(**extratores):
+    return patch.dict(wf._chaves_conversa, extratores)
+
+
+async def _processar_todos(fila, eventos, origem="evolution"):
+    await fila.start()
+    try:
+        for i, payload in enumerate(eventos):
+            await fila.receber(origem, f"e{i}", payload)
+        for _ in range(300):
+            if fila.contadores["processados"] == len(eventos):
+                break
+            await asyncio.sleep(0.02)
+    finally:
+        await fila.stop()
+
+
+class TestConversa:
+    def test_mesma_conversa_em_sequencia_conversas_diferentes_em_paralelo(self, fila, Sessao):
+        ativos, pico_conversa, pico_total, ordem = {}, [0], [0], []
+
+        async def handler(payload, ws_manager=None):
+            c = payload["c"]
+            ordem.append((c, payload["n"]))
+            ativos[c] = ativos.get(c, 0) + 1
+            pico_conversa[0] = max(pico_conversa[0], ativos[c])
+            pico_total[0] = max(pico_total[0], sum(ativos.values()))
+            await asyncio.sleep(0.03)
+            ativos[c] -= 1
+
+        eventos = [{"c": "A", "n": i} for i in range(5)] + [{"c": "B", "n": i} for i in range(5)]
+        with _handlers(evolution=handler), _conversas(evolution=lambda p: p["c"]), \
+                patch.object(wf, "WEBHOOK_CONCORRENCIA_BOT", 8):
+            asyncio.run(_processar_todos(fila, eventos))
+        assert fila.contadores["processados"] == 10
+        assert pico_conversa[0] == 1
+        assert pico_total[0] == 2
+        # Ordem de chegada preservada dentro da conversa
+        assert [n for c, n in ordem if c == "A"] == list(range(5))
+        assert [n for c, n in ordem if c == "B"] == list(range(5))
+        assert fila._conversas == {} and fila._vez_de == {}
+
+    def test_evento_esperando_a_vez_devolve_a_vaga(self, fila, Sessao):
+        fim = {}
+
+        async def handler(payload, ws_manager=None):
+            await asyncio.sleep(0.2)
+            fim[payload["id"]] = asyncio.get_running_loop().time()
+
+        # 2 vagas: A1 roda, A2/A3 esperam a vez sem segurar vaga e B1 passa na
+        # frente de A2 (segurando a vaga, B1 só começaria depois de A2)
+        eventos = [{"c": "A", "id": "A1"}, {"c": "A", "id": "A2"}, {"c": "A", "id": "A3"}, {"c": "B", "id": "B1"}]
+        with _handlers(evolution=handler), _conversas(evolution=lambda p: p["c"]), \
+                patch.object(wf, "WEBHOOK_CONCORRENCIA_BOT", 2):
+            asyncio.run(_processar_todos(fila, eventos))
+        assert fila.contadores["processados"] == 4
+        assert fim["B1"] < fim["A2"]
+
+    def test_sem_chave_nao_serializa(self, fila, Sessao):
+        ativos, pico = [0], [0]
+
+        async def handler(payload, ws_manager=None):
+            ativos[0] += 1
+            pico[0] = max(pico[0], ativos[0])
+            await asyncio.sleep(0.03)
+            ativos[0] -= 1
+
+        with _handlers(evolution=handler), _conversas(evolution=lambda p: None), \
+                patch.object(wf, "WEBHOOK_CONCORRENCIA_BOT", 4):
+            asyncio.run(_processar_todos(fila, [{} for _ in range(4)]))
+        assert pico[0] == 4
+
+    def test_chaves_de_conversa_dos_provedores(self):
+        from backend.app.routers import bot_whatsapp
+        evolution = {"instance": "rest1", "data": {"key": {"remoteJid": "5511999990000@s.whatsapp.net"}}}
+        meta = {"entry": [{"changes": [{"value": {
+            "metadata": {"phone_number_id": "PN1"}, "messages": [{"from": "5511988887777", "id": "w1"}],
+        }}]}]}
+        assert bot_whatsapp._conversa_evolution(evolution) == "rest1:5511999990000@s.whatsapp.net"
+        assert bot_whatsapp._conversa_meta(meta) == "PN1:5511988887777"
+        assert bot_whatsapp._conversa_meta({"entry": []}) is None
+
+
+class TestRetryIdempotente:
+    def test_timeout_depois_de_responder_nao_reprocessa(self, fila, Sessao):
+        async def enviar():
+            wf.registrar_resposta_enviada()
+
+        async def handler(payload, ws_manager=None):
+            await asyncio.gather(enviar())  # envio em task filha também conta
+            await asyncio.sleep(1)
+
+        async def cenario():
+            evento = await fila.receber("evolution", "e1", {})
+            return await fila.processar(evento["evento_id"])
+
+        with _handlers(evolution=handler), patch.object(wf, "WEBHOOK_TIMEOUT", 0.05):
+            assert asyncio.run(cenario()) is False
+        e = _eventos(Sessao)[0]
+        assert e.status == "erro" and e.tentativas == 1
+        assert "1 resposta(s) já enviada(s)" in e.erro
+        assert fila.contadores["sem_retry"] == 1 and fila.contadores["retries"] == 0
+        assert fila._varrer() == []
+
+    def test_timeout_sem_resposta_agenda_retry(self, fila, Sessao):
+        async def handler(payload, ws_manager=None):
+            await asyncio.sleep(1)
+
+        async def cenario():
+            evento = await fila.receber("evolution", "e1", {})
+            return await fila.processar(evento["evento_id"])
+
+        with _handlers(evolution=handler), patch.object(wf, "WEBHOOK_TIMEOUT", 0.05):
+            asyncio.run(cenario())
+        e = _eventos(Sessao)[0]
+        assert e.status == "pendente" and "TimeoutError" in e.erro
+        assert fila.contadores["retries"] == 1
+
+    def test_envio_fora_de_evento_e_ignorado(self):
+        wf.registrar_resposta_enviada()
@@ -18,6 +18,7 @@ from .calculos import (
     calcular_ganho_motoboy,
     registrar_ganho_motoboy,
     obter_ganhos_dia_motoboy,
+    resumo_ganhos_dia_motoboy,
     detectar_cidade_endereco,
     atualizar_cidade_restaurante,
     calcular_entrega_completa,
@@ -46,6 +47,7 @@ __all__ = [
     'calcular_ganho_motoboy',
     'registrar_ganho_motoboy',
     'obter_ganhos_dia_motoboy',
+    'resumo_ganhos_dia_motoboy',
     'detectar_cidade_endereco',
     'atualizar_cidade_restaurante',
     'calcular_entrega_completa',
@@ -16,6 +16,8 @@ from pathlib import Path
 from typing import Optional, Tuple, Dict
 from datetime import datetime, date
 
+from sqlalchemy import func
+
 # Adiciona raiz do projeto ao path
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
@@ -313,24 +315,26 @@ def obter_ganhos_dia_motoboy(
         # Status que geram pagamento ao motoboy
         status_pagos = ['entregue', 'cliente_ausente', 'cancelado_cliente']
 
-        # Buscar entregas do dia (todos os status que geram pagamento)
-        entregas = session.query(Entrega).filter(
+        # Buscar entregas do dia (todos os status que geram pagamento) já com o
+        # endereço do pedido — uma única consulta, sem ida ao banco por entrega
+        entregas = session.query(Entrega, Pedido.endereco_entrega).outerjoin(
+            Pedido, Pedido.id == Entrega.pedido_id
+        ).filter(
             Entrega.motoboy_id == motoboy_id,
             Entrega.status.in_(status_pagos),
             Entrega.entregue_em >= datetime.combine(data, datetime.min.time()),
             Entrega.entregue_em < datetime.combine(data, datetime.max.time())
-        ).all()
+        ).order_by(Entrega.entregue_em.asc(), Entrega.id.asc()).all()
 
-        total_ganhos = sum(e.valor_motoboy or 0 for e in entregas)
-        total_km = sum(e.distancia_km or 0 for e in entregas)
+        total_ganhos = sum(e.valor_motoboy or 0 for e, _ in entregas)
+        total_km = sum(e.distancia_km or 0 for e, _ in entregas)
 
         entregas_lista = []
-        for e in entregas:
-            pedido = session.query(Pedido).filter(Pedido.id == e.pedido_id).first()
+        for e, endereco in entregas:
             entregas_lista.append({
                 'id': e.id,
                 'pedido_id': e.pedido_id,
-                'endereco': pedido.endereco_entrega if pedido else '',
+                'endereco': endereco or '',
                 'valor': e.valor_motoboy or 0,
                 'distancia_km': e.distancia_km or 0,
                 'horario': e.entregue_em.strftime('%H:%M') if e.entregue_em else '',
@@ -351,6 +355,51 @@ def obter_ganhos_dia_motoboy(
             session.close()
 
 
+def resumo_ganhos_dia_motoboy(
+    motoboy_id: int,
+    data: date = None,
+    session=None
+) -> Dict:
+    """
+    Totais do dia do motoboy calculados no banco (COUNT/SUM), sem carregar
+    as entregas. Mesmos status pagos de obter_ganhos_dia_motoboy.
+
+    Returns:
+        {'entregas': int, 'ganhos': float, 'km': float, 'data': str}
+    """
+    if data is None:
+        data = date.today()
+
+    close_session = session is None
+    if session is None:
+        session = get_db_session()
+
+    try:
+        status_pagos = ['entregue', 'cliente_ausente', 'cancelado_cliente']
+
+        entregas, ganhos, km = session.query(
+            func.count(Entrega.id),
+            func.coalesce(func.sum(Entrega.valor_motoboy), 0.0),
+            func.coalesce(func.sum(Entrega.distancia_km), 0.0),
+        ).filter(
+            Entrega.motoboy_id == motoboy_id,
+            Entrega.status.in_(status_pagos),
+            Entrega.entregue_em >= datetime.combine(data, datetime.min.time()),
+            Entrega.entregue_em < datetime.combine(data, datetime.max.time())
+        ).one()
+
+        return {
+            'entregas': entregas or 0,
+            'ganhos': round(float(ganhos or 0), 2),
+            'km': round(float(km or 0), 2),
+            'data': data.isoformat(),
+        }
+
+    finally:
+        if close_session:
+            session.close()
+
+
 # ==================== DETECÇÃO DE CIDADE ====================
 
 def detectar_cidade_endereco(endereco: str) -> Optional[Dict]:
@@ -810,6 +859,7 @@ __all__ = [
     'calcular_ganho_motoboy',
     'registrar_ganho_motoboy',
     'obter_ganhos_dia_motoboy',
+    'resumo_ganhos_dia_motoboy',
     'detectar_cidade_endereco',
     'atualizar_cidade_restaurante',
     'atualizar_coordenadas_restaurante',
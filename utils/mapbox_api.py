@@ -112,10 +112,24 @@ def autocomplete_address(query: str, proximity: Optional[Tuple[float, float]] =
     if not query or not MAPBOX_TOKEN:
         return []
 
+    url, params = _autocomplete_request(query, proximity, country)
+    try:
+        response = requests.get(url, params=params, timeout=10)
+        response.raise_for_status()
+        return _parse_autocomplete(response.json())
+
+    except Exception as e:
+        print(f"[WARNING] Falha no autocomplete: {e}")
+        return []
+
+
+def _autocomplete_request(query: str, proximity: Optional[Tuple[float, float]] = None,
+                          country: Optional[str] = None, limite: int = 5) -> Tuple[str, Dict]:
+    """URL + params do autocomplete (compartilhado entre a versão sync e a async)."""
     url = f"https://api.mapbox.com/geocoding/v5/mapbox.places/{quote(query)}.json"
     params = {
         "access_token": MAPBOX_TOKEN,
-        "limit": 5,
+        "limit": limite,
         "language": "pt",
         "types": "address,poi"  # Endereços e pontos de interesse
     }
@@ -125,25 +139,47 @@ def autocomplete_address(query: str, proximity: Optional[Tuple[float, float]] =
     # Prioriza resultados próximos ao restaurante
     if proximity:
         params["proximity"] = f"{proximity[1]},{proximity[0]}"  # lon,lat
+    return url, params
 
-    try:
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
 
-        sugestoes = []
-        for feature in data.get("features", []):
-            lng, lat = feature["center"]
-            sugestoes.append({
-                'place_name': feature['place_name'],
-                'coordinates': (lat, lng)
-            })
+def _parse_autocomplete(data: Dict) -> List[Dict]:
+    sugestoes = []
+    for feature in data.get("features", []):
+        lng, lat = feature["center"]
+        sugestoes.append({
+            'place_name': feature['place_name'],
+            'coordinates': (lat, lng)
+        })
+    return sugestoes
+
 
-        return sugestoes
+async def autocomplete_address_async(query: str, proximity: Optional[Tuple[float, float]] = None,
+                                     country: Optional[str] = None, limite: int = 5,
+                                     client=None) -> Optional[List[Dict]]:
+    """
+    Versão async (httpx) do autocomplete_address.
+
+    Diferente da sync, distingue falha de "sem resultados": retorna None se a
+    chamada falhar (quem cacheia não deve gravar) e [] se o Mapbox não achou nada.
+    client: httpx.AsyncClient reaproveitado (keep-alive); sem ele abre um por chamada.
+    """
+    import httpx
 
+    if not query or not MAPBOX_TOKEN:
+        return []
+
+    url, params = _autocomplete_request(query, proximity, country, limite)
+    try:
+        if client is not None:
+            response = await client.get(url, params=params, timeout=10.0)
+        else:
+            async with httpx.AsyncClient(timeout=10.0) as c:
+                response = await c.get(url, params=params)
+        response.raise_for_status()
+        return _parse_autocomplete(response.json())
     except Exception as e:
         print(f"[WARNING] Falha no autocomplete: {e}")
-        return []
+        return None
 
 
 def autocomplete_endereco_restaurante(
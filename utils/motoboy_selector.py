@@ -622,7 +622,8 @@ def listar_motoboys_disponiveis(
 
 def obter_estatisticas_motoboy(
     motoboy_id: int,
-    session=None
+    session=None,
+    resumo_dia: Optional[Dict] = None
 ) -> Dict:
     """
     Obtém estatísticas detalhadas de um motoboy.
@@ -630,6 +631,8 @@ def obter_estatisticas_motoboy(
     Args:
         motoboy_id: ID do motoboy
         session: Sessão SQLAlchemy (opcional)
+        resumo_dia: Totais do dia já calculados (resumo_ganhos_dia_motoboy),
+            ex.: vindos do cache — evita recalcular
 
     Returns:
         Dict com estatísticas completas
@@ -639,28 +642,17 @@ def obter_estatisticas_motoboy(
         session = get_db_session()
 
     try:
-        motoboy = session.query(Motoboy).filter(
-            Motoboy.id == motoboy_id
-        ).first()
+        # get() usa o identity map: se o motoboy já foi carregado nesta sessão
+        # (ex.: pela autenticação), não vai ao banco
+        motoboy = session.get(Motoboy, motoboy_id)
 
         if not motoboy:
             return None
 
-        # Calcular ganhos do dia
-        from datetime import date
-        hoje = date.today()
-
-        # Incluir todos os status que geram pagamento ao motoboy
-        status_pagos = ['entregue', 'cliente_ausente', 'cancelado_cliente']
-
-        entregas_hoje = session.query(Entrega).filter(
-            Entrega.motoboy_id == motoboy_id,
-            Entrega.status.in_(status_pagos),
-            Entrega.entregue_em >= datetime.combine(hoje, datetime.min.time())
-        ).all()
-
-        ganhos_hoje = sum(e.valor_motoboy or 0 for e in entregas_hoje)
-        km_hoje = sum(e.distancia_km or 0 for e in entregas_hoje)
+        # Ganhos do dia agregados no banco (inclui todos os status pagos)
+        if resumo_dia is None:
+            from utils.calculos import resumo_ganhos_dia_motoboy
+            resumo_dia = resumo_ganhos_dia_motoboy(motoboy_id, session=session)
 
         return {
             'id': motoboy.id,
@@ -675,9 +667,9 @@ def obter_estatisticas_motoboy(
             'total_ganhos': motoboy.total_ganhos or 0,
             'total_km': motoboy.total_km or 0,
             # Estatísticas do dia
-            'entregas_hoje': len(entregas_hoje),
-            'ganhos_hoje': round(ganhos_hoje, 2),
-            'km_hoje': round(km_hoje, 2),
+            'entregas_hoje': resumo_dia['entregas'],
+            'ganhos_hoje': resumo_dia['ganhos'],
+            'km_hoje': resumo_dia['km'],
             # Médias
             'media_por_entrega': round(
                 (motoboy.total_ganhos or 0) / max(1, motoboy.total_entregas or 1), 2